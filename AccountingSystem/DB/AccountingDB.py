@@ -8,15 +8,21 @@ import time
 import threading
 import random
 
+import numpy
+
 from DIRAC.Core.Base.DB import DB
 from DIRAC import S_OK, S_ERROR, gConfig
 from DIRAC.FrameworkSystem.Client.MonitoringClient import gMonitor
 from DIRAC.Core.Utilities import List, ThreadSafe, Time, DEncode
 from DIRAC.Core.Utilities.Plotting.TypeLoader import TypeLoader
 from DIRAC.Core.Utilities.ThreadPool import ThreadPool
+from DIRAC.AccountingSystem.private.BucketedDataCache import BucketedDataCache, getFieldColumn
 
 gSynchro = ThreadSafe.Synchronizer()
 
+# Maximum number of rows written by one statement of the bulk insertion of records
+ROWS_PER_STATEMENT = 1000
+
 
 class AccountingDB(DB):
 
@@ -35,6 +41,10 @@ class AccountingDB(DB):
     self.dbBucketsLength = {}
     self.__keysCache = {}
     maxParallelInsertions = self.getCSOption("ParallelRecordInsertions", 10)
+    self.__bulkInsertion = self.getCSOption("BulkRecordInsertion", True)
+    self.__bucketCache = BucketedDataCache(self.getCSOption("BucketCacheLifeTime", 3600),
+                                           self.getCSOption("BucketCacheMaxRows", 0))
+    self.__bucketSettleTime = self.getCSOption("BucketSettleTime", 3600)
     self.__threadPool = ThreadPool(1, maxParallelInsertions)
     self.__threadPool.daemonize()
     self.catalogTableName = _getTableName("catalog", "Types")
@@ -65,6 +75,16 @@ class AccountingDB(DB):
                               "Accounting",
                               "seconds",
                               gMonitor.OP_MEAN)
+    gMonitor.registerActivity("bucketcachehits",
+                              "Queries using cached buckets",
+                              "Accounting",
+                              "queries",
+                              gMonitor.OP_SUM)
+    gMonitor.registerActivity("bucketcachemisses",
+                              "Queries not using cached buckets",
+                              "Accounting",
+                              "queries",
+                              gMonitor.OP_SUM)
 
     self.__compactTime = datetime.time(hour=2,
                                        minute=random.randint(0, 59),
@@ -573,6 +593,55 @@ class AccountingDB(DB):
       bucketTimeLength = self.calculateBucketLengthForTime(typeName, nowEpoch, currentBucketStart)
     return buckets
 
+  def __getBucketLengthsForTimes(self, typeName, nowEpoch, times):
+    """
+    Vectorised calculateBucketLengthForTime: bucket length for each of an array of times
+    """
+    lengths = numpy.empty(len(times), dtype=numpy.int64)
+    lengths.fill(self.maxBucketTime)
+    undecided = numpy.ones(len(times), dtype=bool)
+    for granuT in self.dbBucketsLength[typeName]:
+      nowBucketed = nowEpoch - nowEpoch % granuT[1]
+      matching = undecided & (numpy.maximum(0, nowBucketed - times) <= granuT[0])
+      lengths[matching] = granuT[1]
+      undecided &= ~matching
+    return lengths
+
+  def calculateBucketsForRecords(self, typeName, startTimes, endTimes, nowEpoch=False):
+    """
+    Vectorised calculateBuckets: buckets of many records at once
+
+    :param str typeName: type of the records
+    :param list startTimes: start times of the records
+    :param list endTimes: end times of the records
+    :return: tuple of arrays (record index, bucket start, bucket length, proportion), one entry per
+             record and bucket in which the record falls
+    """
+    if not nowEpoch:
+      nowEpoch = int(Time.toEpoch(Time.dateTime()))
+    startTimes = numpy.asarray(startTimes, dtype=numpy.int64)
+    endTimes = numpy.asarray(endTimes, dtype=numpy.int64)
+    recordIndexes = numpy.arange(len(startTimes))
+    bucketLengths = self.__getBucketLengthsForTimes(typeName, nowEpoch, startTimes)
+    bucketStarts = startTimes - startTimes % bucketLengths
+    # A record without duration is entirely in its first bucket
+    instant = startTimes == endTimes
+    buckets = [(recordIndexes[instant], bucketStarts[instant], bucketLengths[instant],
+                numpy.ones(numpy.count_nonzero(instant)))]
+    totalLengths = (endTimes - startTimes).astype(float)
+    remaining = ~instant & (bucketStarts < endTimes)
+    while numpy.any(remaining):
+      recordIndexes, startTimes, endTimes, totalLengths, bucketStarts, bucketLengths = \
+          [values[remaining] for values in (recordIndexes, startTimes, endTimes, totalLengths,
+                                            bucketStarts, bucketLengths)]
+      starts = numpy.maximum(bucketStarts, startTimes)
+      ends = numpy.minimum(bucketStarts + bucketLengths, endTimes)
+      buckets.append((recordIndexes, bucketStarts, bucketLengths, (ends - starts) / totalLengths))
+      bucketStarts = bucketStarts + bucketLengths
+      bucketLengths = self.__getBucketLengthsForTimes(typeName, nowEpoch, bucketStarts)
+      remaining = bucketStarts < endTimes
+    return tuple(numpy.concatenate(values) for values in zip(*buckets))
+
   def __insertInQueueTable(self, typeName, startTime, endTime, valuesList):
     sqlFields = ['id', 'taken', 'takenSince'] + self.dbCatalog[typeName]['typeFields']
     sqlValues = ['0', '0', 'UTC_TIMESTAMP()'] + valuesList + [startTime, endTime]
@@ -631,6 +700,18 @@ class AccountingDB(DB):
     Do the real insert and delete from the in buffer table
     """
     self.log.verbose("Received bundle to process", "of %s elements" % len(recordTuples))
+    if self.__bulkInsertion:
+      recordsByType = {}
+      for record in recordTuples:
+        recordsByType.setdefault(record[1], []).append(record)
+      recordTuples = []
+      for typeName, typeRecords in recordsByType.iteritems():
+        result = self.__insertRecordsInBulk(typeName, typeRecords)
+        if not result['OK']:
+          # The records are inserted one by one, so that only the faulty ones are left in the IN table
+          self.log.warn("Can't insert records in bulk, inserting them one by one",
+                        "%s: %s" % (typeName, result['Message']))
+          recordTuples.extend(typeRecords)
     for record in recordTuples:
       iD, typeName, startTime, endTime, valuesList, insertionEpoch = record
       result = self.insertRecordDirectly(typeName, startTime, endTime, valuesList)
@@ -643,6 +724,100 @@ class AccountingDB(DB):
         self.log.error("Can't delete row from the IN table", result['Message'])
       gMonitor.addMark("insertiontime", Time.toEpoch() - insertionEpoch)
 
+  def __insertRecordsInBulk(self, typeName, recordTuples):
+    """
+    Insert records of the IN table of a type with a few statements: the raw records, the contributions
+    of all the records to each bucket, merged in memory, and the delete from the IN table, all in
+    one transaction
+    """
+    if self.__readOnly:
+      return S_ERROR("ReadOnly mode enabled. No modification allowed")
+    if typeName not in self.dbCatalog:
+      return S_ERROR("Type %s has not been defined in the db" % typeName)
+    numKeys = len(self.dbCatalog[typeName]['keys'])
+    numValues = len(self.dbCatalog[typeName]['values'])
+    typeRows = []
+    keyIds = []
+    for _iD, _typeName, startTime, endTime, valuesList, _insertionEpoch in recordTuples:
+      if len(valuesList) != numKeys + numValues:
+        return S_ERROR("Fields mismatch for record %s. %s fields and %s expected" % (typeName,
+                                                                                   len(valuesList) + 2,
+                                                                                   numKeys + numValues + 2))
+      recordKeyIds = []
+      for keyPos in range(numKeys):
+        retVal = self.__addKeyValue(typeName, self.dbCatalog[typeName]['keys'][keyPos], valuesList[keyPos])
+        if not retVal['OK']:
+          return retVal
+        recordKeyIds.append(retVal['Value'])
+      keyIds.append(recordKeyIds)
+      typeRows.append(recordKeyIds + list(valuesList[numKeys:]) + [startTime, endTime])
+
+    # Contributions of the records to the buckets: the entries and the values, in proportion of the
+    # time of each record in each bucket, summed per bucket and key values
+    recordIndexes, bucketStarts, bucketLengths, proportions = self.calculateBucketsForRecords(
+        typeName,
+        [record[2] for record in recordTuples],
+        [record[3] for record in recordTuples])
+    keyIds = numpy.array(keyIds, dtype=numpy.int64).reshape(len(recordTuples), numKeys)
+    values = numpy.array([record[4][numKeys:] for record in recordTuples],
+                         dtype=float).reshape(len(recordTuples), numValues)
+    bucketKeys = numpy.column_stack((bucketStarts, bucketLengths, keyIds[recordIndexes]))
+    contributions = numpy.column_stack((proportions, values[recordIndexes] * proportions[:, numpy.newaxis]))
+    bucketRows = []
+    if len(bucketKeys):
+      order = numpy.lexsort(bucketKeys.T[::-1])
+      bucketKeys = bucketKeys[order]
+      firstRows = numpy.flatnonzero(numpy.concatenate(([True],
+                                                       numpy.any(bucketKeys[1:] != bucketKeys[:-1], axis=1))))
+      contributions = numpy.add.reduceat(contributions[order], firstRows, axis=0)
+      bucketRows = [keys + contribution for keys, contribution in zip(bucketKeys[firstRows].tolist(),
+                                                                       contributions.tolist())]
+
+    typeTable = _getTableName("type", typeName)
+    typeFields = ", ".join("`%s`" % field for field in self.dbCatalog[typeName]['typeFields'])
+    bucketTable = _getTableName("bucket", typeName)
+    bucketFields = ['startTime', 'bucketLength'] + self.dbCatalog[typeName]['keys'] + \
+        ['entriesInBucket'] + self.dbCatalog[typeName]['values']
+    sqlUpData = ", ".join("`%s`=`%s`+VALUES(`%s`)" % (field, field, field)
+                          for field in ['entriesInBucket'] + self.dbCatalog[typeName]['values'])
+
+    retVal = self._getConnection()
+    if not retVal['OK']:
+      return retVal
+    connObj = retVal['Value']
+    retVal = self.__startTransaction(connObj)
+    if not retVal['OK']:
+      return retVal
+    for table, fields, rows, suffix in ((typeTable, typeFields, typeRows, ""),
+                                        (bucketTable, ", ".join("`%s`" % field for field in bucketFields),
+                                         bucketRows, " ON DUPLICATE KEY UPDATE %s" % sqlUpData)):
+      for start in xrange(0, len(rows), ROWS_PER_STATEMENT):
+        chunk = rows[start:start + ROWS_PER_STATEMENT]
+        rowValues = "(%s)" % ", ".join(["%s"] * len(chunk[0]))
+        cmd = "INSERT INTO `%s` ( %s ) VALUES %s%s" % (table, fields, ", ".join([rowValues] * len(chunk)), suffix)
+        retVal = self._update(cmd, conn=connObj, args=[value for row in chunk for value in row])
+        if not retVal['OK']:
+          self.__rollbackTransaction(connObj)
+          return retVal
+    retVal = self._updateInChunks("DELETE FROM `%s` WHERE id IN %%s" % _getTableName("in", typeName),
+                                  [[record[0] for record in recordTuples]], conn=connObj)
+    if not retVal['OK']:
+      self.__rollbackTransaction(connObj)
+      return retVal
+    retVal = self.__commitTransaction(connObj)
+    if not retVal['OK']:
+      self.__rollbackTransaction(connObj)
+      return retVal
+
+    gMonitor.addMark("registeradded", len(recordTuples))
+    gMonitor.addMark("registeradded:%s" % typeName, len(recordTuples))
+    now = Time.toEpoch()
+    for record in recordTuples:
+      gMonitor.addMark("insertiontime", now - record[-1])
+    self.log.info("Added records in bulk", "%s records of type %s in %s buckets" % (len(recordTuples),
+                                                                                   typeName, len(bucketRows)))
+    return S_OK(len(recordTuples))
+
   def insertRecordDirectly(self, typeName, startTime, endTime, valuesList):
     """
     Add an entry to the type contents
@@ -999,20 +1174,86 @@ class AccountingDB(DB):
     nowEpoch = Time.toEpoch(Time.dateTime())
     bucketTimeLength = self.calculateBucketLengthForTime(typeName, nowEpoch, startTime)
     startTime = startTime - startTime % bucketTimeLength
-    result = self.__queryType(
-        typeName,
-        startTime,
-        endTime,
-        selectFields,
-        condDict,
-        groupFields,
-        orderFields,
-        "bucket",
-        connObj=connObj
-    )
+    timeColumn = getFieldColumn(selectFields, 'startTime')
+    if self.__bucketCache.enabled and startTime and endTime and timeColumn is not None \
+            and groupFields and 'startTime' in groupFields[1] \
+            and (not orderFields or orderFields[1][:1] == ['startTime']):
+      result = self.__retrieveCachedBucketedData(typeName, startTime, endTime, bucketTimeLength, timeColumn,
+                                                 selectFields, condDict, groupFields, orderFields, connObj)
+    else:
+      result = self.__queryType(
+          typeName,
+          startTime,
+          endTime,
+          selectFields,
+          condDict,
+          groupFields,
+          orderFields,
+          "bucket",
+          connObj=connObj
+      )
     gMonitor.addMark("querytime", Time.toEpoch() - startQueryEpoch)
     return result
 
+  def __retrieveCachedBucketedData(self, typeName, startTime, endTime, bucketTimeLength, timeColumn,
+                                   selectFields, condDict, groupFields, orderFields, connObj):
+    """
+    Get data grouped by bucket from the DB, reusing the rows of the closed buckets retrieved by the previous queries
+
+    The rows of the buckets over for more than the settle time are kept per type, selected fields, conditions,
+    grouping and bucket length, and only the buckets starting after the ones kept are queried. The records are
+    inserted after they end, so the recent buckets still change. As the rows are grouped by bucket, the rows kept and
+    the ones queried are simply put one after the other.
+    """
+    # Same limits as the ones of the bucket queries
+    firstBucket, lastBucket = [self.calculateBuckets(typeName, epoch + 3600, epoch + 3600)[0][0]
+                               for epoch in (startTime, endTime)]
+    # The buckets ending after this one can still get records
+    settleEpoch = int(Time.toEpoch()) - self.__bucketSettleTime
+    settleBucket = self.calculateBuckets(typeName, settleEpoch, settleEpoch)[0][0]
+    cacheKey = (typeName, selectFields[0], tuple(selectFields[1]),
+                tuple(sorted((key, tuple(sorted(value)) if isinstance(value, (list, tuple)) else (value, ))
+                             for key, value in condDict.iteritems())),
+                groupFields[0], tuple(groupFields[1]),
+                orderFields[0] if orderFields else None, tuple(orderFields[1]) if orderFields else None,
+                bucketTimeLength)
+    cached = self.__bucketCache.get(cacheKey, firstBucket)
+    if cached:
+      gMonitor.addMark("bucketcachehits", 1)
+      cachedRows, queryStart = cached
+      rows = [row for row in cachedRows if firstBucket <= row[timeColumn] <= lastBucket]
+    else:
+      gMonitor.addMark("bucketcachemisses", 1)
+      rows = []
+      queryStart = firstBucket
+    if queryStart > lastBucket:
+      return S_OK(tuple(rows))
+    # The query changes the fields and conditions it is given
+    result = self.__queryType(typeName, queryStart, lastBucket,
+                              (selectFields[0], list(selectFields[1])),
+                              dict((key, list(value) if isinstance(value, (list, tuple)) else value)
+                                   for key, value in condDict.iteritems()),
+                              (groupFields[0], list(groupFields[1])),
+                              (orderFields[0], list(orderFields[1])) if orderFields else orderFields,
+                              "bucket", connObj=connObj, bucketLimits=True)
+    if not result['OK']:
+      return result
+    closedEnd = min(settleBucket, lastBucket + 1)
+    if closedEnd > queryStart:
+      self.__bucketCache.add(cacheKey, queryStart if cached else firstBucket, closedEnd,
+                             [row for row in result['Value'] if row[timeColumn] < closedEnd])
+    rows.extend(result['Value'])
+    self.log.verbose("Bucket cache", str(self.__bucketCache.getStats()))
+    return S_OK(tuple(rows))
+
+  def getBucketCacheStats(self):
+    """
+    Get the counters of the cache of the closed buckets of the queries
+
+    :return: S_OK(dict) with the number of queries and rows kept, of hits, misses and evictions, and the hit rate
+    """
+    return S_OK(self.__bucketCache.getStats())
+
   def __queryType(
           self,
           typeName,
@@ -1023,9 +1264,12 @@ class AccountingDB(DB):
           groupFields,
           orderFields,
           tableType,
-          connObj=False):
+          connObj=False,
+          bucketLimits=False):
     """
     Execute a query over a main table
+
+    :param bool bucketLimits: if True, startTime and endTime of a bucket query are the first and last buckets
     """
 
     tableName = _getTableName(tableType, typeName)
@@ -1082,7 +1326,7 @@ class AccountingDB(DB):
     # Calculate time conditions
     sqlTimeCond = []
     if startTime:
-      if tableType == 'bucket':
+      if tableType == 'bucket' and not bucketLimits:
         # HACK because MySQL and UNIX do not start epoch at the same time
         startTime = startTime + 3600
         startTime = self.calculateBuckets(typeName, startTime, startTime)[0][0]
@@ -1090,8 +1334,9 @@ class AccountingDB(DB):
     if endTime:
       if tableType == "bucket":
         endTimeSQLVar = "startTime"
-        endTime = endTime + 3600
-        endTime = self.calculateBuckets(typeName, endTime, endTime)[0][0]
+        if not bucketLimits:
+          endTime = endTime + 3600
+          endTime = self.calculateBuckets(typeName, endTime, endTime)[0][0]
       else:
         endTimeSQLVar = "endTime"
       sqlTimeCond.append("`%s`.`%s` <= %s" % (tableName, endTimeSQLVar, endTime))
@@ -4,6 +4,9 @@
 # pylint: disable=protected-access
 
 # imports
+import re
+import time
+import random
 import unittest
 from mock import MagicMock
 
@@ -390,6 +393,194 @@ ORDER BY startTime" % (expectedStartTime, expectedEndTime)
     self.assertTrue(retVal)
     self.assertEqual(retVal, expectedQuery)
 
+
+class BulkInsertion(TestCase):
+  """ testing the bulk insertion of the records
+  """
+
+  typeName = "Setup_Job"
+  now = 1497964315
+
+  def setUp(self):
+    super(BulkInsertion, self).setUp()
+    self.module = self.testClass()
+    self.module.dbCatalog = {self.typeName: {'keys': ['User', 'Site'],
+                                             'values': ['CPUTime', 'NormCPUTime'],
+                                             'typeFields': ['User', 'Site', 'CPUTime', 'NormCPUTime',
+                                                            'startTime', 'endTime']}}
+    self.module.dbBucketsLength[self.typeName] = [(86400, 900), (604800, 3600), (15552000, 86400)]
+    # Records of a few users at a few sites, lasting up to a few days
+    random.seed(1)
+    self.records = []
+    for iD in xrange(300):
+      startTime = self.now - random.randint(0, 30 * 86400)
+      endTime = startTime + random.choice([0, random.randint(1, 600), random.randint(600, 4 * 86400)])
+      self.records.append((iD, self.typeName, startTime, endTime,
+                           ['user%d' % random.randint(0, 3), 'site%d' % random.randint(0, 2),
+                            random.randint(0, 1000), random.random() * 1000], self.now))
+
+  def test_calculateBucketsForRecords(self):
+    """ the buckets of many records are the ones of each record """
+    recordIndexes, bucketStarts, bucketLengths, proportions = self.module.calculateBucketsForRecords(
+        self.typeName, [record[2] for record in self.records], [record[3] for record in self.records], self.now)
+    buckets = sorted(zip(recordIndexes.tolist(), bucketStarts.tolist(), bucketLengths.tolist(), proportions.tolist()))
+    expected = sorted((index, bucket[0], bucket[2], bucket[1])
+                      for index, record in enumerate(self.records)
+                      for bucket in self.module.calculateBuckets(self.typeName, record[2], record[3], self.now))
+    self.assertEqual(len(buckets), len(expected))
+    for bucket, expectedBucket in zip(buckets, expected):
+      self.assertEqual(bucket[:3], expectedBucket[:3])
+      self.assertAlmostEqual(bucket[3], expectedBucket[3])
+
+  def test_insertRecordsInBulk(self):
+    """ the contributions of the records are summed per bucket and written with a few statements """
+    keyIds = {}
+    self.module._AccountingDB__addKeyValue = lambda _typeName, keyName, keyValue: \
+        {'OK': True, 'Value': keyIds.setdefault((keyName, keyValue), len(keyIds) + 1)}
+    self.module._getConnection = MagicMock(return_value={'OK': True, 'Value': MagicMock()})
+    self.module._query = MagicMock(return_value={'OK': True, 'Value': ()})
+    self.module._update = MagicMock(return_value={'OK': True, 'Value': 1})
+    self.module._updateInChunks = MagicMock(return_value={'OK': True, 'Value': 300})
+    self.module.calculateBucketsForRecords = \
+        lambda typeName, startTimes, endTimes: self.testClass.calculateBucketsForRecords(self.module, typeName,
+                                                                                          startTimes, endTimes,
+                                                                                          self.now)
+
+    result = self.module._AccountingDB__insertRecordsInBulk(self.typeName, self.records)
+    self.assertTrue(result['OK'], result)
+    self.assertEqual([call[0][0] for call in self.module._query.call_args_list], ["START TRANSACTION", "COMMIT"])
+    typeInserts = [call for call in self.module._update.call_args_list if '`ac_type_' in call[0][0]]
+    bucketInserts = [call for call in self.module._update.call_args_list if '`ac_bucket_' in call[0][0]]
+    self.assertEqual(len(typeInserts), 1)
+    self.assertEqual(len(typeInserts[0][1]['args']), 6 * len(self.records))
+    self.assertEqual(self.module._updateInChunks.call_args[0][1], [range(300)])
+
+    # Contributions of the records computed one by one
+    expected = {}
+    for record in self.records:
+      keys = (keyIds[('User', record[4][0])], keyIds[('Site', record[4][1])])
+      for bucketStart, proportion, bucketLength in self.module.calculateBuckets(self.typeName, record[2], record[3],
+                                                                                self.now):
+        bucket = expected.setdefault((bucketStart, bucketLength) + keys, [0., 0., 0.])
+        for pos, value in enumerate([1] + record[4][2:]):
+          bucket[pos] += value * proportion
+    written = {}
+    for call in bucketInserts:
+      self.assertIn("ON DUPLICATE KEY UPDATE", call[0][0])
+      args = call[1]['args']
+      for start in xrange(0, len(args), 7):
+        row = args[start:start + 7]
+        self.assertNotIn(tuple(row[:4]), written)
+        written[tuple(row[:4])] = row[4:]
+    self.assertEqual(sorted(written), sorted(expected))
+    for bucket, values in written.iteritems():
+      for value, expectedValue in zip(values, expected[bucket]):
+        self.assertAlmostEqual(value, expectedValue, places=6)
+
+  def test_insertRecordsInBulkFailure(self):
+    """ nothing is committed if a statement fails """
+    self.module._AccountingDB__addKeyValue = MagicMock(return_value={'OK': True, 'Value': 1})
+    self.module._getConnection = MagicMock(return_value={'OK': True, 'Value': MagicMock()})
+    self.module._query = MagicMock(return_value={'OK': True, 'Value': ()})
+    self.module._update = MagicMock(return_value={'OK': False, 'Message': 'Deadlock'})
+    result = self.module._AccountingDB__insertRecordsInBulk(self.typeName, self.records)
+    self.assertFalse(result['OK'])
+    self.assertEqual([call[0][0] for call in self.module._query.call_args_list], ["START TRANSACTION", "ROLLBACK"])
+
+class BucketCache(TestCase):
+  """ testing the reuse of the closed buckets of the queries
+  """
+
+  typeName = "Setup_Job"
+
+  def setUp(self):
+    super(BucketCache, self).setUp()
+    self.now = int(time.time())
+    # Rows of the bucket table: bucket start -> {site: CPU time}
+    random.seed(2)
+    self.buckets = {}
+    for bucketStart in xrange(self.now - self.now % 900 - 3 * 86400, self.now + 1, 900):
+      self.buckets[bucketStart] = dict(('site%d' % site, random.randint(0, 1000)) for site in xrange(3))
+    self.queries = []
+    self.module = self.__createDB(3600, 100000)
+    self.uncachedModule = self.__createDB(0, 0)
+
+  def __createDB(self, lifeTime, maxRows):
+    """ AccountingDB with a bucket table queried through the SQL time conditions """
+    module = self.testClass()
+    module.dbCatalog = {self.typeName: {'keys': ['User', 'Site'],
+                                        'values': ['CPUTime', 'NormCPUTime'],
+                                        'typeFields': ['User', 'Site', 'CPUTime', 'NormCPUTime',
+                                                       'startTime', 'endTime'],
+                                        'bucketFields': ['User', 'Site', 'CPUTime', 'NormCPUTime',
+                                                         'entriesInBucket', 'startTime', 'bucketLength']}}
+    module.dbBucketsLength[self.typeName] = [(86400, 900), (604800, 3600), (15552000, 86400)]
+    module._AccountingDB__bucketCache = moduleTested.BucketedDataCache(lifeTime, maxRows)
+    module._AccountingDB__bucketSettleTime = 3600
+    module._query = self.query
+    module._escapeString = lambda value: {'OK': True, 'Value': "'%s'" % value}
+    return module
+
+  def query(self, cmd, conn=None):  # pylint: disable=unused-argument
+    """ Rows of the buckets within the time conditions, grouped by start time and site """
+    first = int(re.search(r"`startTime` >= (\d+)", cmd).group(1))
+    last = int(re.search(r"`startTime` <= (\d+)", cmd).group(1))
+    self.queries.append((first, last))
+    return {'OK': True, 'Value': tuple((site, bucketStart, 900, self.buckets[bucketStart][site])
+                                       for bucketStart in sorted(self.buckets) if first <= bucketStart <= last
+                                       for site in sorted(self.buckets[bucketStart]))}
+
+  def retrieve(self, module, startTime, endTime):
+    """ Query of a timed report """
+    return module.retrieveBucketedData(self.typeName, startTime, endTime,
+                                       ('%s, %s, %s, SUM(%s)', ['Site', 'startTime', 'bucketLength', 'CPUTime']),
+                                       {'Site': ['site0', 'site1', 'site2']},
+                                       ('%s, %s', ['startTime', 'Site']),
+                                       ('%s', ['startTime']))
+
+  def test_slidingWindow(self):
+    """ the windows moved forward only query the buckets after the closed ones """
+    startTime = self.now - 86400
+    expected = self.retrieve(self.uncachedModule, startTime, self.now)
+    self.assertTrue(expected['OK'], expected)
+    del self.queries[:]
+    result = self.retrieve(self.module, startTime, self.now)
+    self.assertEqual(result, expected)
+    self.assertEqual(len(self.queries), 1)
+    firstBucket = self.queries[0][0]
+
+    # Records arrive late in the buckets of the last hour, the window moves by one bucket
+    settleBucket = self.now - 3600 - (self.now - 3600) % 900
+    for bucketStart in (settleBucket, max(self.buckets)):
+      self.buckets[bucketStart]['site0'] += 10
+    del self.queries[:]
+    result = self.retrieve(self.module, startTime + 900, self.now)
+    self.assertEqual(result, self.retrieve(self.uncachedModule, startTime + 900, self.now))
+    self.assertEqual([query[0] for query in self.queries[:1]], [settleBucket])
+    for bucketStart in (settleBucket, max(self.buckets)):
+      self.assertIn(('site0', bucketStart, 900, self.buckets[bucketStart]['site0']), result['Value'])
+
+    stats = self.module.getBucketCacheStats()['Value']
+    self.assertEqual((stats['Hits'], stats['Misses']), (1, 1))
+    self.assertEqual(stats['Rows'], 3 * len([bucket for bucket in self.buckets
+                                             if firstBucket <= bucket < settleBucket]))
+
+  def test_notCached(self):
+    """ the queries that are not grouped by bucket, and windows starting before the kept ones, are not reused """
+    result = self.module.retrieveBucketedData(self.typeName, self.now - 86400, self.now,
+                                              ('%s, SUM(%s)', ['Site', 'CPUTime']), {},
+                                              ('%s', ['Site']), [])
+    self.assertTrue(result['OK'], result)
+    self.assertEqual(self.module.getBucketCacheStats()['Value']['Hits'] +
+                     self.module.getBucketCacheStats()['Value']['Misses'], 0)
+
+    self.retrieve(self.module, self.now - 43200, self.now)
+    del self.queries[:]
+    result = self.retrieve(self.module, self.now - 86400, self.now)
+    self.assertEqual(result, self.retrieve(self.uncachedModule, self.now - 86400, self.now))
+    self.assertEqual(self.queries[0][1], self.queries[1][1])
+    self.assertEqual(self.module.getBucketCacheStats()['Value']['Hits'], 0)
+
 #############################################################################
 # Test Suite run
 #############################################################################
@@ -398,4 +589,6 @@ ORDER BY startTime" % (expectedStartTime, expectedEndTime)
 if __name__ == '__main__':
   suite = unittest.defaultTestLoader.loadTestsFromTestCase(TestCase)
   suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(MakeQuery))
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(BulkInsertion))
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(BucketCache))
   testResult = unittest.TextTestRunner(verbosity=2).run(suite)
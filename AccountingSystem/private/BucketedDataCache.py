@@ -0,0 +1,149 @@
+""" Cache of the rows of the closed buckets of the accounting queries
+
+    The reports over the last hours or days are refreshed every few minutes, each time for a window moved
+    by a few minutes. The rows of the buckets that are over do not change from one refresh to the next, so they
+    are kept per query (type, selected fields, conditions, grouping and bucket length), and only the buckets
+    that are not yet kept have to be retrieved from the DB.
+"""
+
+__RCSID__ = "$Id$"
+
+import time
+import threading
+from collections import OrderedDict
+
+
+def getFieldColumn(selectFields, fieldName):
+  """
+  Get the position, in the rows of a query, of the column that is exactly a field
+
+  :param tuple selectFields: selected fields, as ( "SUM(%s), %s", ( "field1name", "field2name" ) )
+  :param str fieldName: name of the field
+  :return: position of the column, or None if no column is the field alone
+  """
+  markers = ["\0%d\0" % pos for pos in range(len(selectFields[1]))]
+  try:
+    selectString = selectFields[0] % tuple(markers)
+  except TypeError:
+    return None
+  # Split the columns on the commas that are not within parentheses
+  columns = []
+  depth = 0
+  column = ''
+  for char in selectString:
+    if char == ',' and not depth:
+      columns.append(column.strip())
+      column = ''
+      continue
+    if char == '(':
+      depth += 1
+    elif char == ')':
+      depth -= 1
+    column += char
+  columns.append(column.strip())
+  for pos, field in enumerate(selectFields[1]):
+    if field == fieldName and markers[pos] in columns:
+      return columns.index(markers[pos])
+  return None
+
+
+class BucketedDataCache(object):
+  """
+  Rows of the buckets starting between a first bucket and an end time, per query.
+
+  The least recently used queries are evicted when the number of rows kept is over the maximum, and the rows of
+  a query are kept at most lifeTime seconds after their first retrieval, so that the records arriving late are
+  taken into account.
+  """
+
+  def __init__(self, lifeTime=3600, maxRows=100000):
+    """
+    :param int lifeTime: seconds during which the rows of a query are kept
+    :param int maxRows: maximum number of rows kept for all the queries; 0 disables the cache
+    """
+    self.lifeTime = lifeTime
+    self.maxRows = maxRows
+    self.__lock = threading.Lock()
+    self.__entries = OrderedDict()
+    self.__rows = 0
+    self.__hits = 0
+    self.__misses = 0
+    self.__evictions = 0
+
+  @property
+  def enabled(self):
+    """ Whether the rows are kept """
+    return self.lifeTime > 0 and self.maxRows > 0
+
+  def get(self, key, firstBucket):
+    """
+    Get the rows kept for a query, if they cover its first bucket
+
+    :param key: key of the query
+    :param int firstBucket: start of the first bucket of the query
+    :return: tuple (rows, end): the rows of the buckets starting from the first bucket of the entry and before end,
+             or None if there is no valid entry for this first bucket
+    """
+    with self.__lock:
+      entry = self.__entries.pop(key, None)
+      if entry and time.time() - entry['Created'] > self.lifeTime:
+        self.__rows -= len(entry['Rows'])
+        entry = None
+      if not entry or not entry['First'] <= firstBucket < entry['End']:
+        self.__misses += 1
+        if entry:
+          self.__entries[key] = entry
+        return None
+      self.__hits += 1
+      self.__entries[key] = entry
+      return entry['Rows'], entry['End']
+
+  def add(self, key, firstBucket, endTime, rows):
+    """
+    Keep the rows of a query, or add them to the ones already kept
+
+    :param key: key of the query
+    :param int firstBucket: start of the first bucket of the rows
+    :param int endTime: end of the buckets of the rows, the start of the first bucket which is not kept
+    :param list rows: rows of the buckets starting from firstBucket and before endTime
+    """
+    if not self.enabled:
+      return
+    with self.__lock:
+      entry = self.__entries.pop(key, None)
+      if entry and entry['End'] == firstBucket and time.time() - entry['Created'] <= self.lifeTime:
+        entry['Rows'] = entry['Rows'] + tuple(rows)
+        entry['End'] = endTime
+        self.__rows += len(rows)
+      else:
+        if entry:
+          self.__rows -= len(entry['Rows'])
+        entry = {'First': firstBucket, 'End': endTime, 'Rows': tuple(rows), 'Created': time.time()}
+        self.__rows += len(entry['Rows'])
+      self.__entries[key] = entry
+      # Evict the least recently used queries, the query just added last
+      while self.__rows > self.maxRows and self.__entries:
+        _key, entry = self.__entries.popitem(last=False)
+        self.__rows -= len(entry['Rows'])
+        self.__evictions += 1
+
+  def clear(self):
+    """ Forget all the rows """
+    with self.__lock:
+      self.__entries.clear()
+      self.__rows = 0
+
+  def getStats(self):
+    """
+    Get the counters of the cache
+
+    :return: dict with the number of queries and rows kept, of hits, misses and evictions, and the hit rate
+    """
+    with self.__lock:
+      requests = self.__hits + self.__misses
+      return {'Entries': len(self.__entries),
+              'Rows': self.__rows,
+              'Hits': self.__hits,
+              'Misses': self.__misses,
+              'Evictions': self.__evictions,
+              'HitRate': float(self.__hits) / requests if requests else 0.}
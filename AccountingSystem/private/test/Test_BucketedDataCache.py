@@ -0,0 +1,82 @@
+""" Test the cache of the rows of the closed buckets
+"""
+
+# pylint: disable=redefined-outer-name
+
+import mock
+import pytest
+
+from DIRAC.AccountingSystem.private import BucketedDataCache as moduleTested
+from DIRAC.AccountingSystem.private.BucketedDataCache import BucketedDataCache, getFieldColumn
+
+
+@pytest.mark.parametrize("selectFields, expected", [
+    (('%s, %s, %s, SUM(%s)', ['Site', 'startTime', 'bucketLength', 'CPUTime']), 1),
+    (('%s, %s, %s, SUM(%s)/SUM(%s)', ['startTime', 'Site', 'bucketLength', 'CPUTime', 'NormCPUTime']), 0),
+    (('IF(%s, %s, %s), %s, SUM(%s)', ['Site', 'User', 'startTime', 'startTime', 'CPUTime']), 1),
+    (('%s, SUM(%s)', ['Site', 'CPUTime']), None),
+    (('MAX(%s), SUM(%s)', ['startTime', 'CPUTime']), None),
+    (('%s, %s', ['startTime']), None),
+])
+def test_getFieldColumn(selectFields, expected):
+  assert getFieldColumn(selectFields, 'startTime') == expected
+
+
+@pytest.fixture
+def cache():
+  return BucketedDataCache(lifeTime=3600, maxRows=10)
+
+
+def test_extend(cache):
+  """ the rows of the next buckets are added to the ones kept """
+  assert cache.get('key', 0) is None
+  cache.add('key', 0, 2, [('a', 0), ('a', 1)])
+  assert cache.get('key', 1) == ((('a', 0), ('a', 1)), 2)
+  cache.add('key', 2, 3, [('a', 2)])
+  assert cache.get('key', 0) == ((('a', 0), ('a', 1), ('a', 2)), 3)
+  # The entry does not cover the buckets before its first one or after its end
+  assert cache.get('key', 3) is None
+  cache.add('otherKey', 5, 6, [('a', 5)])
+  assert cache.getStats() == {'Entries': 2, 'Rows': 4, 'Hits': 2, 'Misses': 2, 'Evictions': 0, 'HitRate': 0.5}
+
+
+def test_replace(cache):
+  """ rows not following the ones kept replace them """
+  cache.add('key', 2, 4, [('a', 2), ('a', 3)])
+  cache.add('key', 0, 1, [('a', 0)])
+  assert cache.get('key', 0) == ((('a', 0),), 1)
+  assert cache.getStats()['Rows'] == 1
+
+
+def test_expiration(cache):
+  """ the rows are not used after their life time, even if other rows were added """
+  with mock.patch.object(moduleTested.time, 'time', return_value=1000.):
+    cache.add('key', 0, 2, [('a', 0), ('a', 1)])
+  with mock.patch.object(moduleTested.time, 'time', return_value=4000.):
+    cache.add('key', 2, 3, [('a', 2)])
+    assert cache.get('key', 0) == ((('a', 0), ('a', 1), ('a', 2)), 3)
+  with mock.patch.object(moduleTested.time, 'time', return_value=4601.):
+    assert cache.get('key', 0) is None
+  assert cache.getStats()['Rows'] == 0
+
+
+def test_eviction(cache):
+  """ the least recently used queries are evicted when there are too many rows """
+  cache.add('first', 0, 4, [('a', bucket) for bucket in range(4)])
+  cache.add('second', 0, 4, [('b', bucket) for bucket in range(4)])
+  assert cache.get('first', 0)
+  cache.add('third', 0, 4, [('c', bucket) for bucket in range(4)])
+  assert cache.get('second', 0) is None
+  assert cache.get('first', 0) and cache.get('third', 0)
+  # Rows that do not fit at all are not kept
+  cache.add('fourth', 0, 11, [('d', bucket) for bucket in range(11)])
+  stats = cache.getStats()
+  assert (stats['Entries'], stats['Rows'], stats['Evictions']) == (0, 0, 4)
+
+
+def test_disabled():
+  """ nothing is kept without rows or life time """
+  for cache in (BucketedDataCache(lifeTime=0), BucketedDataCache(maxRows=0)):
+    assert not cache.enabled
+    cache.add('key', 0, 1, [('a', 0)])
+    assert cache.get('key', 0) is None
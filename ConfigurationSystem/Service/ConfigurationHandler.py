@@ -46,6 +46,25 @@ class ConfigurationHandler(RequestHandler):
       retDict['data'] = gServiceInterface.getCompressedConfigurationData()
     return S_OK(retDict)
 
+  types_getCompressedDeltaIfNewer = [basestring]
+
+  @classmethod
+  def export_getCompressedDeltaIfNewer(cls, sClientVersion):
+    """ Same as getCompressedDataIfNewer, but if the client version is recent enough
+        only the modifications since that version are sent ('delta' and 'checksum' keys)
+    """
+    sVersion = gServiceInterface.getVersion()
+    retDict = {'newestVersion': sVersion}
+    if sClientVersion < sVersion:
+      sVersion, delta, checksum = gServiceInterface.getCompressedConfigurationDelta(sClientVersion)
+      retDict['newestVersion'] = sVersion
+      if delta is None:
+        retDict['data'] = gServiceInterface.getCompressedConfigurationData()
+      else:
+        retDict['delta'] = delta
+        retDict['checksum'] = checksum
+    return S_OK(retDict)
+
   types_publishSlaveServer = [basestring]
 
   @classmethod
@@ -3,6 +3,7 @@
 
 from __future__ import print_function
 import os.path
+import hashlib
 import zlib
 import zipfile
 import thread
@@ -10,7 +11,7 @@ import time
 import DIRAC
 
 from DIRAC.Core.Utilities.File import mkDir
-from DIRAC.Core.Utilities import List, Time
+from DIRAC.Core.Utilities import List, Time, DEncode
 from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR
 from DIRAC.Core.Utilities.CFG import CFG
 from DIRAC.Core.Utilities.LockRing import LockRing
@@ -19,6 +20,31 @@ from DIRAC.FrameworkSystem.Client.Logger import gLogger
 __RCSID__ = "$Id$"
 
 
+class ConfigurationSnapshot(object):
+  """ A merged CFG together with the results of the lookups done in it.
+
+      The CFG of a snapshot is never modified: a new snapshot is created every time
+      the configuration changes, so the cached lookups never need to be invalidated
+      and can be read without locking.
+  """
+
+  # Do not let lookups of random paths grow the caches forever
+  MAX_CACHED_PATHS = 100000
+
+  def __init__(self, cfg):
+    self.cfg = cfg
+    self.options = {}
+    self.keyLists = {}
+
+  def cacheOption(self, path, value):
+    if len(self.options) < self.MAX_CACHED_PATHS:
+      self.options[path] = value
+
+  def cacheKeyList(self, key, keyList):
+    if len(self.keyLists) < self.MAX_CACHED_PATHS:
+      self.keyLists[key] = keyList
+
+
 class ConfigurationData(object):
 
   def __init__(self, loadDefaultCFG=True):
@@ -31,9 +57,9 @@ class ConfigurationData(object):
     self.configurationPath = "/DIRAC/Configuration"
     self.backupsDir = os.path.join(DIRAC.rootPath, "etc", "csbackup")
     self._isService = False
+    self.__snapshot = ConfigurationSnapshot(CFG())
     self.localCFG = CFG()
     self.remoteCFG = CFG()
-    self.mergedCFG = CFG()
     self.remoteServerList = []
     if loadDefaultCFG:
       defaultCFGFile = os.path.join(DIRAC.rootPath, "etc", "dirac.cfg")
@@ -43,6 +69,15 @@ class ConfigurationData(object):
         gLogger.warn("Can't load %s file" % defaultCFGFile)
     self.sync()
 
+  @property
+  def mergedCFG(self):
+    return self.__snapshot.cfg
+
+  @mergedCFG.setter
+  def mergedCFG(self, cfg):
+    # Swapping the snapshot is atomic, readers keep using the previous one until they are done
+    self.__snapshot = ConfigurationSnapshot(cfg)
+
   def getBackupDir(self):
     return self.backupsDir
 
@@ -88,6 +123,33 @@ class ConfigurationData(object):
     sUncompressedData = zlib.decompress(data)
     self.loadRemoteCFGFromMem(sUncompressedData)
 
+  def loadRemoteCFGFromCompressedDelta(self, data, checksum):
+    """ Update the remote CFG by applying a compressed list of modifications
+        as generated by CFG.getModifications
+
+        :param str data: zlib compressed and DEncoded list of modifications
+        :param str checksum: md5 checksum of the expected resulting CFG
+        :return: S_OK/S_ERROR
+    """
+    try:
+      modList = DEncode.decode(zlib.decompress(data))[0]
+    except Exception as e:
+      return S_ERROR("Cannot decode configuration delta: %s" % str(e))
+    newCFG = self.remoteCFG.clone()
+    try:
+      result = newCFG.applyModifications(modList)
+    except Exception as e:
+      result = S_ERROR("Cannot apply configuration delta: %s" % str(e))
+    if not result['OK']:
+      return result
+    if hashlib.md5(str(newCFG)).hexdigest() != checksum:
+      return S_ERROR("Configuration delta does not produce the expected data")
+    self.lock()
+    self.remoteCFG = newCFG
+    self.unlock()
+    self.sync()
+    return S_OK()
+
   def loadRemoteCFGFromMem(self, data):
     self.lock()
     self.remoteCFG.loadFromBuffer(data)
@@ -122,34 +184,50 @@ class ConfigurationData(object):
     return self.dangerZoneEnd(None)
 
   def getSectionsFromCFG(self, path, cfg=False, ordered=False):
-    if not cfg:
-      cfg = self.mergedCFG
-    self.dangerZoneStart()
-    try:
-      levelList = [level.strip() for level in path.split("/") if level.strip() != ""]
-      for section in levelList:
-        cfg = cfg[section]
-      return self.dangerZoneEnd(cfg.listSections(ordered))
-    except Exception:
-      pass
-    return self.dangerZoneEnd(None)
+    snapshot = self.__snapshot
+    if not cfg or cfg is snapshot.cfg:
+      key = ('sections', path, bool(ordered))
+      if key not in snapshot.keyLists:
+        snapshot.cacheKeyList(key, self.__getKeyListFromCFG(path, snapshot.cfg, False, ordered))
+      sectionList = snapshot.keyLists.get(key)
+      return list(sectionList) if sectionList is not None else None
+    return self.__getKeyListFromCFG(path, cfg, False, ordered)
 
   def getOptionsFromCFG(self, path, cfg=False, ordered=False):
-    if not cfg:
-      cfg = self.mergedCFG
+    snapshot = self.__snapshot
+    if not cfg or cfg is snapshot.cfg:
+      key = ('options', path, bool(ordered))
+      if key not in snapshot.keyLists:
+        snapshot.cacheKeyList(key, self.__getKeyListFromCFG(path, snapshot.cfg, True, ordered))
+      optionList = snapshot.keyLists.get(key)
+      return list(optionList) if optionList is not None else None
+    return self.__getKeyListFromCFG(path, cfg, True, ordered)
+
+  def __getKeyListFromCFG(self, path, cfg, options, ordered):
     self.dangerZoneStart()
     try:
       levelList = [level.strip() for level in path.split("/") if level.strip() != ""]
       for section in levelList:
         cfg = cfg[section]
-      return self.dangerZoneEnd(cfg.listOptions(ordered))
+      if options:
+        return self.dangerZoneEnd(cfg.listOptions(ordered))
+      return self.dangerZoneEnd(cfg.listSections(ordered))
     except Exception:
       pass
     return self.dangerZoneEnd(None)
 
   def extractOptionFromCFG(self, path, cfg=False, disableDangerZones=False):
-    if not cfg:
-      cfg = self.mergedCFG
+    snapshot = self.__snapshot
+    if not cfg or cfg is snapshot.cfg:
+      try:
+        return snapshot.options[path]
+      except KeyError:
+        value = self.__extractOptionFromCFG(path, snapshot.cfg, disableDangerZones)
+        snapshot.cacheOption(path, value)
+        return value
+    return self.__extractOptionFromCFG(path, cfg, disableDangerZones)
+
+  def __extractOptionFromCFG(self, path, cfg, disableDangerZones):
     if not disableDangerZones:
       self.dangerZoneStart()
     try:
@@ -237,6 +315,12 @@ class ConfigurationData(object):
     except BaseException:
       return 600
 
+  def getDeltaHistorySize(self):
+    try:
+      return int(self.extractOptionFromCFG("%s/DeltaHistorySize" % self.configurationPath, self.mergedCFG))
+    except BaseException:
+      return 10
+
   def mergingEnabled(self):
     try:
       val = self.extractOptionFromCFG("%s/EnableAutoMerge" % self.configurationPath, self.mergedCFG)
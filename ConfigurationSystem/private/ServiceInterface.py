@@ -5,12 +5,15 @@ __RCSID__ = "$Id$"
 
 import os
 import time
+import hashlib
 import re
 import threading
 import zipfile
 import zlib
+from collections import OrderedDict
 
 import DIRAC
+from DIRAC.Core.Utilities import DEncode
 from DIRAC.Core.Utilities.File import mkDir
 from DIRAC.ConfigurationSystem.Client.ConfigurationData import gConfigurationData, ConfigurationData
 from DIRAC.ConfigurationSystem.private.Refresher import gRefresher
@@ -26,6 +29,10 @@ class ServiceInterface(threading.Thread):
     self.sURL = sURL
     gLogger.info("Initializing Configuration Service", "URL is %s" % sURL)
     self.__modificationsIgnoreMask = ['/DIRAC/Configuration/Servers', '/DIRAC/Configuration/Version']
+    # Recently served versions (version -> (CFG, checksum)) and deltas between them
+    self.__versionHistory = OrderedDict()
+    self.__deltaCache = {}
+    self.__historyLock = threading.Lock()
     gConfigurationData.setAsService()
     if not gConfigurationData.isMaster():
       gLogger.info("Starting configuration service as slave")
@@ -160,6 +167,51 @@ class ServiceInterface(threading.Thread):
   def getVersion(self):
     return gConfigurationData.getVersion()
 
+  def __recordCurrentVersion(self):
+    """ Keep a copy of the current remote CFG in the version history
+
+        :return: version of the current remote CFG
+    """
+    sVersion = gConfigurationData.getVersion()
+    with self.__historyLock:
+      if sVersion in self.__versionHistory:
+        return sVersion
+    remoteCFG = gConfigurationData.getRemoteCFG().clone()
+    sVersion = gConfigurationData.getVersion(remoteCFG)
+    with self.__historyLock:
+      if sVersion not in self.__versionHistory:
+        self.__versionHistory[sVersion] = (remoteCFG, hashlib.md5(str(remoteCFG)).hexdigest())
+        while len(self.__versionHistory) > max(1, gConfigurationData.getDeltaHistorySize()):
+          sOldVersion = self.__versionHistory.popitem(last=False)[0]
+          for versionPair in [vp for vp in self.__deltaCache if sOldVersion in vp]:
+            del self.__deltaCache[versionPair]
+    return sVersion
+
+  def getCompressedConfigurationDelta(self, sClientVersion):
+    """ Get the modifications needed to go from a client version to the current one
+
+        :param str sClientVersion: version the client has
+        :return: tuple (newest version, compressed delta, checksum of the newest CFG).
+                 Delta and checksum are None if the client is up to date, if its version
+                 is not in the history or if the delta would not be smaller than the full configuration
+    """
+    sVersion = self.__recordCurrentVersion()
+    versionPair = (sClientVersion, sVersion)
+    with self.__historyLock:
+      if sClientVersion == sVersion or sClientVersion not in self.__versionHistory:
+        return sVersion, None, None
+      newCFG, checksum = self.__versionHistory[sVersion]
+      if versionPair not in self.__deltaCache:
+        oldCFG = self.__versionHistory[sClientVersion][0]
+        delta = zlib.compress(DEncode.encode(oldCFG.getModifications(newCFG)), 9)
+        if len(delta) >= len(gConfigurationData.getCompressedData()):
+          delta = None
+        self.__deltaCache[versionPair] = delta
+      delta = self.__deltaCache[versionPair]
+    if delta is None:
+      return sVersion, None, None
+    return sVersion, delta, checksum
+
   def getCommitHistory(self):
     files = self.__getCfgBackups(gConfigurationData.getBackupDir())
     backups = [".".join(fileName.split(".")[1:-1]).split("@") for fileName in files]
@@ -0,0 +1,46 @@
+""" Test the lookups in the merged configuration snapshot
+"""
+
+import mock
+
+from DIRAC.ConfigurationSystem.private.ConfigurationData import ConfigurationData
+from DIRAC.ConfigurationSystem.private import ConfigurationClient as ConfigurationClientModule
+
+
+def test_snapshotLookups():
+  confData = ConfigurationData(False)
+  confData.loadRemoteCFGFromMem("Section\n{\n  Option = remote\n  Sub\n  {\n    A = 1\n  }\n}\n")
+  assert confData.extractOptionFromCFG('/Section/Option') == 'remote'
+  assert confData.extractOptionFromCFG('Section//Option/') == 'remote'
+  assert confData.extractOptionFromCFG('/Section/Sub') is None
+  assert confData.extractOptionFromCFG('/Section/Missing') is None
+  assert confData.getSectionsFromCFG('/Section') == ['Sub']
+
+  # Modifications are seen by the next lookups
+  oldCFG = confData.mergedCFG
+  confData.setOptionInCFG('/Section/Option', 'local')
+  confData.setOptionInCFG('/Section/Missing', 'there')
+  assert confData.mergedCFG is not oldCFG
+  assert confData.extractOptionFromCFG('/Section/Option') == 'local'
+  assert confData.extractOptionFromCFG('/Section/Missing') == 'there'
+  assert confData.getOptionsFromCFG('/Section', ordered=True) == ['Option', 'Missing']
+  # Except when looking explicitly at another CFG
+  assert confData.extractOptionFromCFG('/Section/Option', oldCFG) == 'remote'
+
+  # Cached lists cannot be modified by the callers
+  confData.getOptionsFromCFG('/Section', ordered=True).append('Other')
+  assert confData.getOptionsFromCFG('/Section', ordered=True) == ['Option', 'Missing']
+  assert confData.getOptionsFromCFG('/Missing') is None
+
+
+def test_listOrderedAsList():
+  """ the callers can give any value as listOrdered, as a list in getSections('Resources/Sites/', []) """
+  confData = ConfigurationData(False)
+  confData.loadRemoteCFGFromMem("Section\n{\n  B = 1\n  A = 2\n  Sub\n  {\n  }\n}\n")
+  with mock.patch.object(ConfigurationClientModule, 'gConfigurationData', confData), \
+          mock.patch.object(ConfigurationClientModule, 'gRefresher'):
+    client = ConfigurationClientModule.ConfigurationClient()
+    assert client.getSections('/Section', [])['Value'] == ['Sub']
+    assert client.getOptions('/Section', [])['Value'] == sorted(['B', 'A'])
+    assert client.getOptions('/Section', [1])['Value'] == ['B', 'A']
+    assert client.getOptions('/Section', True)['Value'] == ['B', 'A']
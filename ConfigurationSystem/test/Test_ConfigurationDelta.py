@@ -0,0 +1,90 @@
+""" Test the delta based refresh of the configuration
+"""
+
+# pylint: disable=protected-access,redefined-outer-name
+
+import mock
+import pytest
+
+from DIRAC.ConfigurationSystem.private.ConfigurationData import ConfigurationData
+import DIRAC.ConfigurationSystem.private.ServiceInterface as moduleTested
+
+CFG_V1 = """
+DIRAC
+{
+  Configuration
+  {
+    Name = Test
+    Version = 2018-01-01 00:00:00.000001
+  }
+}
+Resources
+{
+  # The sites
+  Sites
+  {
+    A = 1
+    B = 2
+  }
+}
+"""
+
+
+def _newVersion(confData, version):
+  """ Modify the remote configuration and give it a new version """
+  remoteCFG = confData.getRemoteCFG()
+  remoteCFG['Resources']['Sites'].setOption('C', version, 'new site\n')
+  remoteCFG['Resources']['Sites'].deleteKey('A')
+  remoteCFG['Resources'].createNewSection('StorageElements', 'The SEs\n')
+  remoteCFG['Resources']['StorageElements'].setOption('SE', 'x' * 100)
+  confData.setVersion(version)
+  confData.sync()
+
+
+@pytest.fixture
+def serverData():
+  """ The configuration data of a slave server """
+  confData = ConfigurationData(False)
+  confData.loadRemoteCFGFromMem(CFG_V1 + "\n".join("Opt%s = %s" % (i, "v" * 50) for i in range(200)))
+  with mock.patch.object(moduleTested, 'gConfigurationData', confData), \
+          mock.patch.object(moduleTested, 'gRefresher'):
+    yield confData, moduleTested.ServiceInterface('dips://server:9135/Configuration/Server')
+
+
+def test_delta(serverData):
+  confData, serviceInterface = serverData
+  clientData = ConfigurationData(False)
+  clientData.loadRemoteCFGFromCompressedMem(confData.getCompressedData())
+  oldVersion = clientData.getVersion()
+
+  # The client is up to date, no delta
+  assert serviceInterface.getCompressedConfigurationDelta(oldVersion) == (oldVersion, None, None)
+
+  _newVersion(confData, '2018-01-02 00:00:00.000001')
+  newVersion, delta, checksum = serviceInterface.getCompressedConfigurationDelta(oldVersion)
+  assert newVersion == '2018-01-02 00:00:00.000001'
+  assert len(delta) < len(confData.getCompressedData())
+
+  res = clientData.loadRemoteCFGFromCompressedDelta(delta, checksum)
+  assert res['OK'], res['Message']
+  assert clientData.getVersion() == newVersion
+  assert str(clientData.getRemoteCFG()) == str(confData.getRemoteCFG())
+
+  # Unknown version or bad checksum
+  assert serviceInterface.getCompressedConfigurationDelta('2017')[1] is None
+  res = clientData.loadRemoteCFGFromCompressedDelta(delta, checksum)
+  assert not res['OK']
+  assert clientData.getVersion() == newVersion
+
+
+def test_deltaHistorySize(serverData):
+  confData, serviceInterface = serverData
+  confData.setOptionInCFG('/DIRAC/Configuration/DeltaHistorySize', '2')
+  oldVersion = confData.getVersion()
+  serviceInterface.getCompressedConfigurationDelta(oldVersion)
+  _newVersion(confData, '2018-01-02 00:00:00.000001')
+  assert serviceInterface.getCompressedConfigurationDelta(oldVersion)[1] is not None
+  # The oldest version is dropped from the history
+  confData.setVersion('2018-01-03 00:00:00.000001')
+  assert serviceInterface.getCompressedConfigurationDelta(oldVersion)[1] is None
+  assert serviceInterface.getCompressedConfigurationDelta('2018-01-02 00:00:00.000001')[1] is not None
@@ -19,6 +19,8 @@ from DIRAC.Core.Utilities.File import mkDir
 from DIRAC.Core.Utilities import Time, MemStat
 from DIRAC.Core.Utilities.Shifter import setupShifterProxyInEnv
 from DIRAC.Core.Utilities.ReturnValues import isReturnStructure
+from DIRAC.Core.Utilities.ThreadResources import releaseThreadResources
+from DIRAC.Core.DISET.private.TransportPool import getGlobalTransportPool
 from DIRAC.FrameworkSystem.Client.MonitoringClient import gMonitor
 from DIRAC.ConfigurationSystem.Client import PathFinder
 from DIRAC.FrameworkSystem.Client.MonitoringClient import MonitoringClient
@@ -361,8 +363,11 @@ class AgentModule(object):
       signal.signal(signal.SIGALRM, signal.SIG_DFL)
       signal.alarm(watchdogInt)
     elapsedTime = time.time()
+    connectionStats = getGlobalTransportPool().getConnectionStats()
     cpuStats = self._startReportToMonitoring()
     cycleResult = self.__executeModuleCycle()
+    # Give back the resources held during the cycle (e.g. the MySQL connection) while the agent sleeps
+    releaseThreadResources()
     if cpuStats:
       self._endReportToMonitoring(*cpuStats)
     # Increment counters
@@ -379,6 +384,13 @@ class AgentModule(object):
     elapsedPollingRate = averageElapsedTime * 100 / self.am_getOption('PollingTime')
     self.log.notice(" Polling time: %s seconds" % self.am_getOption('PollingTime'))
     self.log.notice(" Average execution/polling time: %.2f%%" % elapsedPollingRate)
+    newConnectionStats = getGlobalTransportPool().getConnectionStats()
+    handshakesAvoided = newConnectionStats['handshakesAvoided'] - connectionStats['handshakesAvoided']
+    if handshakesAvoided:
+      self.log.notice(" Kept connections reused %s times, %s pipelined calls, %s handshakes avoided" %
+                      (newConnectionStats['reuseHits'] - connectionStats['reuseHits'],
+                       newConnectionStats['pipelinedCalls'] - connectionStats['pipelinedCalls'],
+                       handshakesAvoided))
     if cycleResult['OK']:
       self.log.notice(" Cycle was successful")
     else:
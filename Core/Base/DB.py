@@ -3,12 +3,59 @@
 """
 
 from DIRAC import gLogger, gConfig
-from DIRAC.Core.Utilities.MySQL import MySQL
+from DIRAC.Core.Utilities.MySQL import MySQL, MAXCONNECTIONS, CONNECTIONWAITTIME, PINGINTERVAL
+from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
+from DIRAC.FrameworkSystem.Client.MonitoringClient import gMonitor
 from DIRAC.ConfigurationSystem.Client.Utilities import getDBParameters
 from DIRAC.ConfigurationSystem.Client.PathFinder import getDatabaseSection
 
 __RCSID__ = "$Id$"
 
+gPoolMonitoringTask = None
+gPoolActivitiesRegistered = False
+gLastPoolStatistics = {}
+
+
+def registerConnectionPoolActivities():
+  """ Register the monitoring activities of the MySQL connection pools, once
+  """
+  global gPoolActivitiesRegistered
+  if gPoolActivitiesRegistered:
+    return
+  gMonitor.registerActivity('MySQLCheckouts', "MySQL connections checked out",
+                            'MySQL', "checkouts", gMonitor.OP_SUM)
+  gMonitor.registerActivity('MySQLWaitTime', "Mean time waiting for a MySQL connection",
+                            'MySQL', "secs", gMonitor.OP_MEAN)
+  gMonitor.registerActivity('MySQLPings', "MySQL connections pinged",
+                            'MySQL', "pings", gMonitor.OP_SUM)
+  gMonitor.registerActivity('MySQLReconnects', "MySQL connections lost",
+                            'MySQL', "connections", gMonitor.OP_SUM)
+  gMonitor.registerActivity('MySQLConnections', "MySQL connections opened",
+                            'MySQL', "connections", gMonitor.OP_MEAN)
+  gMonitor.registerActivity('MySQLConnectionsInUse', "MySQL connections in use",
+                            'MySQL', "connections", gMonitor.OP_MEAN)
+  gPoolActivitiesRegistered = True
+
+
+def sendConnectionPoolMarks():
+  """ Send to the monitoring the activity of the MySQL connection pools since the last call
+  """
+  total = dict.fromkeys(('Checkouts', 'WaitTime', 'Pings', 'Reconnects', 'Connections', 'InUse'), 0)
+  for stats in MySQL.getConnectionPoolStatistics().values():
+    for key in total:
+      total[key] += stats[key]
+  delta = dict((key, total[key] - gLastPoolStatistics.get(key, 0))
+               for key in ('Checkouts', 'WaitTime', 'Pings', 'Reconnects'))
+  gLastPoolStatistics.update(total)
+
+  gMonitor.addMark('MySQLCheckouts', delta['Checkouts'])
+  if delta['Checkouts']:
+    gMonitor.addMark('MySQLWaitTime', delta['WaitTime'] / delta['Checkouts'])
+  gMonitor.addMark('MySQLPings', delta['Pings'])
+  gMonitor.addMark('MySQLReconnects', delta['Reconnects'])
+  gMonitor.addMark('MySQLConnections', total['Connections'])
+  gMonitor.addMark('MySQLConnectionsInUse', total['InUse'])
+
 
 class DB(MySQL):
   """ All DIRAC DB classes should inherit from this one (unless using sqlalchemy)
@@ -36,11 +83,21 @@ class DB(MySQL):
                              passwd=self.dbPass,
                              dbName=self.dbName,
                              port=self.dbPort,
-                             debug=debug)
+                             debug=debug,
+                             maxConnections=gConfig.getValue('/Systems/Databases/MaxConnections', MAXCONNECTIONS),
+                             connectionWaitTime=gConfig.getValue('/Systems/Databases/ConnectionWaitTime',
+                                                                 CONNECTIONWAITTIME),
+                             pingInterval=gConfig.getValue('/Systems/Databases/PingInterval', PINGINTERVAL))
 
     if not self._connected:
       raise RuntimeError("Can not connect to DB '%s', exiting..." % self.dbName)
 
+    global gPoolMonitoringTask
+    if gPoolMonitoringTask is None:
+      registerConnectionPoolActivities()
+      result = gThreadScheduler.addPeriodicTask(60, sendConnectionPoolMarks)
+      gPoolMonitoringTask = result.get('Value')
+
     self.log.info("===================== MySQL ======================")
     self.log.info("User:           " + self.dbUser)
     self.log.info("Host:           " + self.dbHost)
@@ -28,6 +28,7 @@ from DIRAC.Core.DISET.MessageClient import MessageClient
 from DIRAC.ConfigurationSystem.Client import PathFinder
 from DIRAC.Core.Base.private.ModuleLoader import ModuleLoader
 from DIRAC.Core.Base.ExecutorModule import ExecutorModule
+from DIRAC.Core.Utilities.ThreadResources import releaseThreadResources
 
 __RCSID__ = "$Id$"
 
@@ -154,6 +155,8 @@ class ExecutorReactor( object ):
       taskStub = msgObj.taskStub
 
       result = self.__moduleProcess( eType, taskId, taskStub )
+      # Give back the resources held for the task (e.g. the MySQL connection) before waiting for the next one
+      releaseThreadResources()
       if not result[ 'OK' ]:
         return self.__sendExecutorError( eType, taskId, result[ 'Message' ] )
       msgName, taskStub, extra = result[ 'Value' ]
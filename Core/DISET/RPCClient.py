@@ -64,6 +64,11 @@ class RPCClient( object ):
         # Here we call the method __call__ of the MagicMethod
         func()
 
+      Several calls can be sent without waiting for each answer on a connection kept by the server::
+
+        rpc = RPCClient('DataManagement/FileCatalog', keepConnection=True)
+        results = rpc.executePipelinedRPC([('exists', (lfn, )) for lfn in lfns])
+
   """
 
 
@@ -89,6 +94,16 @@ class RPCClient( object ):
     """
     return self.__innerRPCClient.executeRPC( sFunctionName, args )
 
+  def executePipelinedRPC( self, callList ):
+    """
+      Execute several RPC calls in order, pipelined over a kept connection when the client
+      keeps its connections (see InnerRPCClient.executePipelinedRPC)
+
+      :param callList: list of tuples ( remote function name, tuple of arguments )
+
+      :return: list with the result of each call, in the same order
+    """
+    return self.__innerRPCClient.executePipelinedRPC( callList )
 
 
   def __getattr__( self, attrName ):
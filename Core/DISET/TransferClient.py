@@ -111,6 +111,37 @@ class TransferClient( BaseClient ):
     finally:
       self._disconnect( trid )
 
+  def receiveIterable( self, fileId, token = "" ):
+    """
+    Receive a file from the server as a stream, without writing it to a file
+
+    :type fileId: any
+    :param fileId: Identification of the file being received
+    :type token: string
+    :param token: Optional token for the file
+    :return: generator of S_OK( data ) for each packet received. The transfer failed
+             if the last value is an S_ERROR
+    """
+    fileHelper = FileHelper()
+    if "NoCheckSum" in token:
+      fileHelper.disableCheckSum()
+    retVal = self._sendTransferHeader( "ToClient", ( fileId, token ) )
+    if not retVal[ 'OK' ]:
+      yield retVal
+      return
+    trid, transport = retVal[ 'Value' ]
+    try:
+      fileHelper.setTransport( transport )
+      for retVal in fileHelper.networkToIterable():
+        yield retVal
+        if not retVal[ 'OK' ]:
+          return
+      retVal = transport.receiveData()
+      if not retVal[ 'OK' ]:
+        yield retVal
+    finally:
+      self._disconnect( trid )
+
   def __checkFileList( self, fileList ):
     bogusEntries = []
     for entry in fileList:
@@ -6,6 +6,8 @@ __RCSID__ = "$Id$"
 
 import time
 import thread
+from hashlib import md5
+
 import DIRAC
 from DIRAC.Core.DISET.private.Protocols import gProtocolDict
 from DIRAC.FrameworkSystem.Client.Logger import gLogger
@@ -15,7 +17,8 @@ from DIRAC.ConfigurationSystem.Client.Config import gConfig
 from DIRAC.ConfigurationSystem.Client.PathFinder import getServiceURL, getServiceFailoverURL
 from DIRAC.ConfigurationSystem.Client.Helpers import Registry
 from DIRAC.ConfigurationSystem.Client.Helpers.CSGlobals import skipCACheck
-from DIRAC.Core.DISET.private.TransportPool import getGlobalTransportPool
+from DIRAC.Core.Security import Locations
+from DIRAC.Core.DISET.private.TransportPool import getGlobalTransportPool, MAX_IDLE_TIME
 from DIRAC.Core.DISET.ThreadConfig import ThreadConfig
 
 
@@ -39,6 +42,12 @@ class BaseClient(object):
   KW_PROXY_CHAIN = "proxyChain"
   KW_SKIP_CA_CHECK = "skipCACheck"
   KW_KEEP_ALIVE_LAPSE = "keepAliveLapse"
+  KW_KEEP_CONNECTION = "keepConnection"
+  KW_KEEP_CONNECTION_IDLE = "keepConnectionIdle"
+
+  # Pooled connections are not reused after this many seconds,
+  # so that renewed proxies end up being used
+  KEEP_CONNECTION_MAX_LIFETIME = 300
 
   __threadConfig = ThreadConfig()
 
@@ -58,6 +67,10 @@ class BaseClient(object):
       :param proxyChain: Specify the proxy chain
       :param skipCACheck: Do not check the CA
       :param keepAliveLapse: Duration for keepAliveLapse (heartbeat like)
+      :param keepConnection: Ask the server to keep the connection opened after the call,
+                             and reuse it for the next calls with the same credentials
+      :param keepConnectionIdle: Seconds an idle kept connection can be reused (default and maximum
+                                 TransportPool.MAX_IDLE_TIME, after which the pool closes it)
     """
 
     if not isinstance(serviceName, basestring):
@@ -84,7 +97,7 @@ class BaseClient(object):
     for initFunc in (self.__discoverSetup, self.__discoverVO, self.__discoverTimeout,
                      self.__discoverURL, self.__discoverCredentialsToUse,
                      self.__checkTransportSanity,
-                     self.__setKeepAliveLapse):
+                     self.__setKeepAliveLapse, self.__discoverKeepConnection):
       result = initFunc()
       if not result['OK'] and self.__initStatus['OK']:
         self.__initStatus = result
@@ -415,13 +428,19 @@ and this is thread %s
       gLogger.error("DISET client thread safety error", msgTxt)
       # raise Exception( msgTxt )
 
-  def _connect(self):
+  def _connect(self, reuseConnection=True):
     """ Establish the connection.
         It uses the URL discovered in __discoverURL.
         In case the connection cannot be established, __discoverURL
         is called again, and _connect calls itself.
         We stop after trying self.__nbOfRetry * self.__nbOfUrls
 
+        If connections are kept (see KW_KEEP_CONNECTION) and reuseConnection is True,
+        an idle connection with the same credentials is taken from the transport pool instead,
+        and the returned structure has 'Reused' set to True.
+
+        :param bool reuseConnection: whether an idle connection can be reused
+
     """
     # Check if the useServerCertificate configuration changed
     # Note: I am not really sure that  all this block makes
@@ -443,6 +462,14 @@ and this is thread %s
     if self.__enableThreadCheck:
       self.__checkThreadID()
 
+    if self.__keepConnection and reuseConnection:
+      idleConnection = self._getIdleConnection()
+      if idleConnection:
+        gLogger.debug("Reusing connection to: %s" % self.serviceURL)
+        result = S_OK(idleConnection)
+        result['Reused'] = True
+        return result
+
     gLogger.debug("Trying to connect to: %s" % self.serviceURL)
     try:
       # Calls the transport method of the apropriate protocol.
@@ -478,7 +505,7 @@ and this is thread %s
           # rediscover the URL
           self.__discoverURL()
           # try to reconnect
-          return self._connect()
+          return self._connect(reuseConnection=reuseConnection)
         else:
           return retVal
     except Exception as e:
@@ -519,16 +546,39 @@ and this is thread %s
        :return: whatever the server sent back
 
     """
+    retVal = self._sendProposal(transport, action)
+    if not retVal['OK']:
+      return retVal
+    return self._receiveProposalAnswer(transport)
+
+  def _sendProposal(self, transport, action):
+    """ Send the proposal of _proposeAction without waiting for the answer.
+        Used directly to pipeline several calls on a kept connection.
+
+        :param transport: the Transport object returned by _connect
+        :param action: tuple (<action type>, <action name>)
+    """
     if not self.__initStatus['OK']:
       return self.__initStatus
     stConnectionInfo = ((self.__URLTuple[3], self.setup, self.vo),
                         action,
                         self.__extraCredentials)
+    # Only send the connection options when needed, to talk with older servers as before
+    if self.__keepConnection:
+      stConnectionInfo += ({self.KW_KEEP_CONNECTION: True}, )
 
-    # Send the connection info and get the answer back
-    retVal = transport.sendData(S_OK(stConnectionInfo))
-    if not retVal['OK']:
-      return retVal
+    # Send the connection info
+    return transport.sendData(S_OK(stConnectionInfo))
+
+  def _receiveProposalAnswer(self, transport):
+    """ Get the answer of the server to a proposal sent with _sendProposal,
+        and do the delegation if the server requires it.
+
+        :param transport: the Transport object returned by _connect
+
+        :return: whatever the server sent back. If the server agreed to keep the connection
+                 opened after the action, KW_KEEP_CONNECTION is set to True in it
+    """
     serverReturn = transport.receiveData()
 
     # TODO: Check if delegation is required. This seems to be used only for the GatewayService
@@ -586,6 +636,58 @@ and this is thread %s
     self.kwargs[self.KW_KEEP_ALIVE_LAPSE] = kaa
     return S_OK()
 
+  def __discoverKeepConnection(self):
+    """ Discover whether connections should be kept opened and reused.
+        It can be set in kwargs (see KW_KEEP_CONNECTION), which includes the
+        /DIRAC/ConnConf/<host>:<port> options, so it can be enabled per server.
+        The result is stored in self.__keepConnection and self.__keepConnectionIdle
+    """
+    self.__keepConnection = str(self.kwargs.get(self.KW_KEEP_CONNECTION, False)).lower() in ("true", "yes", "y", "1")
+    try:
+      self.__keepConnectionIdle = max(0, min(MAX_IDLE_TIME, int(self.kwargs.get(self.KW_KEEP_CONNECTION_IDLE,
+                                                                                 MAX_IDLE_TIME))))
+    except ValueError:
+      self.__keepConnectionIdle = MAX_IDLE_TIME
+    return S_OK()
+
+  def _isKeepingConnection(self):
+    """ Whether this client asks for connections to be kept opened
+    """
+    return self.__keepConnection
+
+  def __getConnectionKey(self):
+    """ Key identifying the connections that can be reused for this client:
+        destination, everything that determines the credentials presented at the handshake,
+        and the extra credentials sent with the calls (host or delegated identity)
+    """
+    proxyString = self.kwargs.get(self.KW_PROXY_STRING)
+    if proxyString:
+      proxyString = md5(proxyString).hexdigest()
+    proxyLocation = self.kwargs.get(self.KW_PROXY_LOCATION)
+    if not proxyLocation and not proxyString and not self.__useCertificates:
+      # The default proxy may change between calls (e.g. X509_USER_PROXY set per request owner)
+      proxyLocation = Locations.getProxyLocation()
+    return (tuple(self.__URLTuple[:3]), bool(self.__useCertificates), proxyLocation, proxyString,
+            self.kwargs.get(self.KW_SKIP_CA_CHECK), self.__extraCredentials)
+
+  def _getIdleConnection(self):
+    """ Take from the transport pool a kept connection usable by this client
+
+        :return: tuple (trid, transport) or None
+    """
+    if not self.__initStatus['OK']:
+      return None
+    return getGlobalTransportPool().getIdleConnection(self.__getConnectionKey(),
+                                                      self.__keepConnectionIdle,
+                                                      self.KEEP_CONNECTION_MAX_LIFETIME)
+
+  def _releaseConnection(self, trid):
+    """ Give back a connection the server agreed to keep opened, so that it is reused
+
+        :param trid: Transport ID in the transportPool
+    """
+    getGlobalTransportPool().putIdleConnection(self.__getConnectionKey(), trid)
+
   def _getBaseStub(self):
     """ Returns a tuple with (self._destinationSrv, newKwargs)
         self._destinationSrv is what was given as first parameter of the init serviceName
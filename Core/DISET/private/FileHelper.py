@@ -175,6 +175,37 @@ class FileHelper(object):
     self.__fileBytes = receivedBytes
     return S_OK()
 
+  def networkToIterable( self, maxFileSize = 0 ):
+    """ Generator over the data received from a DISET peer, yielding S_OK( data ) as each packet
+        arrives instead of writing it to a data sink. The transfer failed if the last value is
+        an S_ERROR, the checksum being verified only after the last packet
+    """
+    self.__oMD5 = hashlib.md5()
+    self.bReceivedEOF = False
+    self.bErrorInMD5 = False
+    receivedBytes = 0
+    try:
+      while not self.receivedEOF():
+        result = self.receiveData( maxBufferSize = maxFileSize )
+        if not result[ 'OK' ]:
+          yield result
+          return
+        strBuffer = result[ 'Value' ]
+        receivedBytes += len( strBuffer )
+        if maxFileSize > 0 and receivedBytes > maxFileSize:
+          self.sendError( "Exceeded maximum file size" )
+          yield S_ERROR( "Received file exceeded maximum size of %s bytes" % ( maxFileSize ) )
+          return
+        if strBuffer:
+          yield S_OK( strBuffer )
+    except Exception as e:
+      yield S_ERROR( "Error while receiving file, %s" % str( e ) )
+      return
+    if self.errorInTransmission():
+      yield S_ERROR( "Error in the file CRC" )
+      return
+    self.__fileBytes = receivedBytes
+
   def stringToNetwork( self, stringVal ):
     """ Send a given string to the DISET client over the network
     """
@@ -260,6 +291,50 @@ class FileHelper(object):
     self.__fileBytes = sentBytes
     return S_OK()
 
+  def IterableToNetwork( self, iterable ):
+    """ Send the strings produced by an iterable, such as a generator of rows read from a DB,
+        grouped in packets of about packetSize bytes, so that the data is produced as it is sent.
+        If the iterable raises an exception, the error is sent to the receiving peer
+    """
+    self.__oMD5 = hashlib.md5()
+    iPacketSize = self.packetSize
+    self.__fileBytes = 0
+    sentBytes = 0
+    bufferList = []
+    bufferSize = 0
+    try:
+      for sData in iterable:
+        bufferList.append( sData )
+        bufferSize += len( sData )
+        if bufferSize < iPacketSize:
+          continue
+        sBuffer = "".join( bufferList )
+        bufferList = []
+        bufferSize = 0
+        dRetVal = self.sendData( sBuffer )
+        if not dRetVal[ 'OK' ]:
+          return dRetVal
+        if 'AbortTransfer' in dRetVal and dRetVal[ 'AbortTransfer' ]:
+          self.__log.verbose( "Transfer aborted" )
+          return S_OK()
+        sentBytes += len( sBuffer )
+      if bufferList:
+        sBuffer = "".join( bufferList )
+        dRetVal = self.sendData( sBuffer )
+        if not dRetVal[ 'OK' ]:
+          return dRetVal
+        if 'AbortTransfer' in dRetVal and dRetVal[ 'AbortTransfer' ]:
+          self.__log.verbose( "Transfer aborted" )
+          return S_OK()
+        sentBytes += len( sBuffer )
+      self.sendEOF()
+    except Exception as e:
+      gLogger.exception( "Error while sending data" )
+      self.sendError( "Error while sending data: %s" % str( e ) )
+      return S_ERROR( "Error while sending data: %s" % str( e ) )
+    self.__fileBytes = sentBytes
+    return S_OK()
+
   def getFileDescriptor( self, uFile, sFileMode ):
     closeAfter = True
     if isinstance( uFile, basestring ):
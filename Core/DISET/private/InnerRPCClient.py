@@ -4,7 +4,9 @@
 __RCSID__ = "$Id$"
 
 from DIRAC.Core.DISET.private.BaseClient import BaseClient
-from DIRAC.Core.Utilities.ReturnValues import S_OK
+from DIRAC.Core.DISET.private.TransportPool import getGlobalTransportPool
+from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR
+from DIRAC.Core.Utilities import DEncode
 from DIRAC.Core.Utilities.DErrno import cmpError, ENOAUTH
 
 class InnerRPCClient( BaseClient ):
@@ -16,12 +18,22 @@ class InnerRPCClient( BaseClient ):
         * sends the method parameters
         * retrieve the result
         * disconnect
+
+      If the connection is kept (see BaseClient.KW_KEEP_CONNECTION) and the server agrees,
+      the connection is given back to the transport pool instead of being closed,
+      and the next calls with the same credentials reuse it.
   """
 
   # Number of times we retry the call.
   # The connection retry is handled by BaseClient
   __retry = 0
 
+  # Maximum number of calls sent on a connection and not answered yet
+  PIPELINE_WINDOW = 10
+  # Maximum number of bytes of the calls sent and not answered yet. It is below the size of the socket
+  # buffers, so that sending does not block while the server waits for its answers to be read
+  PIPELINE_MAX_BYTES = 65536
+
   def executeRPC( self, functionName, args ):
     """ Perform the RPC call, connect before and disconnect after.
 
@@ -42,6 +54,8 @@ class InnerRPCClient( BaseClient ):
       return retVal
     # Get the transport connection ID as well as the Transport object
     trid, transport = retVal[ 'Value' ]
+    reusedConnection = retVal.get( 'Reused', False )
+    keepConnection = False
     try:
       # Handshake to perform the RPC call for functionName
       retVal = self._proposeAction( transport, ( "RPC", functionName ) )
@@ -49,6 +63,12 @@ class InnerRPCClient( BaseClient ):
         if cmpError( retVal, ENOAUTH ):  # This query is unauthorized
           retVal[ 'rpcStub' ] = stub
           return retVal
+        elif reusedConnection:
+          # The server closed the kept connection in the meantime: nothing was executed,
+          # so just try again on a new connection
+          self._disconnect( trid )
+          trid = None
+          return self.__executeOnNewConnection( functionName, args, stub )
         else:  # we have network problem or the service is not responding
           if self.__retry < 3:
             self.__retry += 1
@@ -56,6 +76,7 @@ class InnerRPCClient( BaseClient ):
           else:
             retVal[ 'rpcStub' ] = stub
             return retVal
+      serverKeepsConnection = retVal.get( self.KW_KEEP_CONNECTION, False )
 
       # Send the arguments to the function
       retVal = transport.sendData( S_OK( args ) )
@@ -66,6 +87,151 @@ class InnerRPCClient( BaseClient ):
       receivedData = transport.receiveData()
       if isinstance( receivedData, dict ):
         receivedData[ 'rpcStub' ] = stub
+        keepConnection = serverKeepsConnection and 'OK' in receivedData
+      return receivedData
+    finally:
+      if trid is not None:
+        if keepConnection:
+          self._releaseConnection( trid )
+        else:
+          self._disconnect( trid )
+
+  def __executeOnNewConnection( self, functionName, args, stub ):
+    """ Perform the RPC call on a connection opened for it
+    """
+    retVal = self._connect( reuseConnection = False )
+    if not retVal[ 'OK' ]:
+      retVal[ 'rpcStub' ] = stub
+      return retVal
+    trid, transport = retVal[ 'Value' ]
+    keepConnection = False
+    try:
+      retVal = self._proposeAction( transport, ( "RPC", functionName ) )
+      if not retVal[ 'OK' ]:
+        retVal[ 'rpcStub' ] = stub
+        return retVal
+      serverKeepsConnection = retVal.get( self.KW_KEEP_CONNECTION, False )
+      retVal = transport.sendData( S_OK( args ) )
+      if not retVal[ 'OK' ]:
+        return retVal
+      receivedData = transport.receiveData()
+      if isinstance( receivedData, dict ):
+        receivedData[ 'rpcStub' ] = stub
+        keepConnection = serverKeepsConnection and 'OK' in receivedData
       return receivedData
     finally:
-      self._disconnect( trid )
+      if keepConnection:
+        self._releaseConnection( trid )
+      else:
+        self._disconnect( trid )
+
+  def executePipelinedRPC( self, callList ):
+    """ Perform several RPC calls, sending them over a kept connection without waiting
+        for each answer before sending the next call.
+
+        At most PIPELINE_WINDOW calls and PIPELINE_MAX_BYTES bytes of calls are sent ahead of
+        the answers read. Calls are only pipelined on connections the server agreed to keep. Otherwise,
+        or if the client does not keep connections, they are executed one by one.
+        The calls are executed in order. If a kept connection turns out to be closed
+        before anything was executed on it, the calls are sent again on another connection.
+
+        :param callList: list of tuples ( functionName, args )
+
+        :return: list with the result of each call, in the same order
+    """
+    results = [ None ] * len( callList )
+    pendingCalls = list( enumerate( callList ) )
+    while pendingCalls:
+      idleConnection = self._getIdleConnection() if self._isKeepingConnection() else None
+      if idleConnection:
+        nbPending = len( pendingCalls )
+        pendingCalls = self.__executePipelinedOnConnection( idleConnection[0], idleConnection[1],
+                                                            pendingCalls, results )
+        if len( pendingCalls ) < nbPending or not pendingCalls:
+          continue
+      # No kept connection (yet), or it was not usable: a normal call, which keeps
+      # the connection for the next ones if the server agrees
+      index, ( functionName, args ) = pendingCalls.pop( 0 )
+      results[ index ] = self.executeRPC( functionName, args )
+    return results
+
+  def __executePipelinedOnConnection( self, trid, transport, pendingCalls, results ):
+    """ Send the calls on the transport, reading the answer of the oldest one whenever PIPELINE_WINDOW
+        calls or PIPELINE_MAX_BYTES bytes of calls are waiting for their answer
+
+        :return: the calls still to be executed
+    """
+    # ( index, functionName, args, bytes sent ) of the calls waiting for their answer
+    sentCalls = []
+    bytesInFlight = 0
+    nextCall = 0
+    doneCalls = 0
+    codedArgs = None
+    keepConnection = True
+    sendFailed = False
+    try:
+      while True:
+        while keepConnection and not sendFailed and nextCall < len( pendingCalls ):
+          index, ( functionName, args ) = pendingCalls[ nextCall ]
+          # Encoded once, to know its size before sending it, even if it waits for the window
+          if codedArgs is None:
+            codedArgs = DEncode.encode( S_OK( args ) )
+          if sentCalls and ( len( sentCalls ) >= self.PIPELINE_WINDOW or
+                             bytesInFlight + len( codedArgs ) > self.PIPELINE_MAX_BYTES ):
+            break
+          retVal = self._sendProposal( transport, ( "RPC", functionName ) )
+          if retVal[ 'OK' ]:
+            callSize = retVal[ 'Value' ]
+            retVal = transport.sendEncodedData( codedArgs )
+          if not retVal[ 'OK' ]:
+            sendFailed = True
+            break
+          callSize += retVal[ 'Value' ]
+          codedArgs = None
+          if sentCalls:
+            getGlobalTransportPool().countPipelinedCalls( 1 )
+          sentCalls.append( ( index, functionName, args, callSize ) )
+          bytesInFlight += callSize
+          nextCall += 1
+        if not sentCalls:
+          break
+
+        index, functionName, args, callSize = sentCalls.pop( 0 )
+        bytesInFlight -= callSize
+        stub = ( self._getBaseStub(), functionName, args )
+        retVal = self._receiveProposalAnswer( transport )
+        if not retVal[ 'OK' ]:
+          # Nothing answered at all: the kept connection was closed by the server,
+          # leave the calls for another connection. Otherwise the server refused the
+          # call and closed the connection, so the next ones were not executed.
+          if doneCalls or cmpError( retVal, ENOAUTH ):
+            retVal[ 'rpcStub' ] = stub
+            results[ index ] = retVal
+            doneCalls += 1
+          keepConnection = False
+          break
+        if not retVal.get( self.KW_KEEP_CONNECTION, False ):
+          keepConnection = False
+        receivedData = transport.receiveData()
+        if isinstance( receivedData, dict ):
+          receivedData[ 'rpcStub' ] = stub
+        results[ index ] = receivedData
+        doneCalls += 1
+        if not isinstance( receivedData, dict ) or 'OK' not in receivedData:
+          keepConnection = False
+        if not keepConnection:
+          # The calls sent after this one are not executed by the server
+          break
+      return pendingCalls[ doneCalls: ]
+    except Exception as e:
+      for index, ( functionName, args ) in pendingCalls[ doneCalls: ]:
+        results[ index ] = S_ERROR( "Exception while executing pipelined calls: %s" % repr( e ) )
+        results[ index ][ 'rpcStub' ] = ( self._getBaseStub(), functionName, args )
+      doneCalls = len( pendingCalls )
+      keepConnection = False
+      return []
+    finally:
+      if keepConnection and not sendFailed and doneCalls == len( pendingCalls ):
+        self._releaseConnection( trid )
+      else:
+        self._disconnect( trid )
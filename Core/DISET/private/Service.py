@@ -10,6 +10,7 @@
 
 import os
 import time
+import select
 import threading
 
 import DIRAC
@@ -24,6 +25,7 @@ from DIRAC.Core.DISET.private.TransportPool import getGlobalTransportPool
 from DIRAC.Core.DISET.private.MessageBroker import MessageBroker, MessageSender
 from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
 from DIRAC.Core.Utilities.ThreadPool import ThreadPool
+from DIRAC.Core.Utilities.ThreadResources import releaseThreadResources
 from DIRAC.Core.Utilities.ReturnValues import isReturnStructure
 from DIRAC.Core.DISET.AuthManager import AuthManager
 from DIRAC.FrameworkSystem.Client.SecurityLogClient import SecurityLogClient
@@ -71,6 +73,11 @@ class Service(object):
     self._transportPool = getGlobalTransportPool()
     self.__cloneId = 0
     self.__maxFD = 0
+    # Connections kept for their client, watched without a thread until its next call: { trid : deadline }
+    self.__keptConnections = {}
+    self.__keptLock = threading.Lock()
+    self.__keptListener = None
+    self.__keptWakeUp = None
 
   def setCloneProcessId(self, cloneId):
     self.__cloneId = cloneId
@@ -351,31 +358,133 @@ class Service(object):
       trid = self._transportPool.add(clientTransport)
       if not trid:
         return
-      # Receive and check proposal
-      result = self._receiveAndCheckProposal(trid)
-      if not result['OK']:
-        self._transportPool.sendAndClose(trid, result)
-        return
-      proposalTuple = result['Value']
-      # Instantiate handler
-      result = self._instantiateHandler(trid, proposalTuple)
-      if not result['OK']:
-        self._transportPool.sendAndClose(trid, result)
-        return
-      handlerObj = result['Value']
-      # Execute the action
-      result = self._processProposal(trid, proposalTuple, handlerObj)
-      # Close the connection if required
-      if result['closeTransport'] or not result['OK']:
-        if not result['OK']:
-          gLogger.error("Error processing proposal", result['Message'])
-        self._transportPool.close(trid)
-      return result
+      return self.__processRequest(trid)
     finally:
+      releaseThreadResources()
       self._lockManager.unlockGlobal()
       if monReport:
         self.__endReportToMonitoring(*monReport)
 
+  def _processKeptConnection(self, trid):
+    """
+    Handle the next request received on a connection kept for its client
+
+    :param trid: Transport ID in the transport pool
+    """
+    self._lockManager.lockGlobal()
+    try:
+      monReport = self.__startReportToMonitoring()
+    except Exception:
+      monReport = False
+    try:
+      return self.__processRequest(trid)
+    finally:
+      releaseThreadResources()
+      self._lockManager.unlockGlobal()
+      if monReport:
+        self.__endReportToMonitoring(*monReport)
+
+  def __processRequest(self, trid):
+    """
+    Receive, check and execute a proposal. The connection is then closed, given to the message broker,
+    or watched until the next request if the client keeps it
+    """
+    # Receive and check proposal
+    result = self._receiveAndCheckProposal(trid)
+    if not result['OK']:
+      self._transportPool.sendAndClose(trid, result)
+      return
+    proposalTuple = result['Value']
+    # Instantiate handler
+    result = self._instantiateHandler(trid, proposalTuple)
+    if not result['OK']:
+      self._transportPool.sendAndClose(trid, result)
+      return
+    handlerObj = result['Value']
+    # Execute the action
+    result = self._processProposal(trid, proposalTuple, handlerObj)
+    # Close the connection if required
+    if result['closeTransport'] or not result['OK']:
+      if not result['OK']:
+        gLogger.error("Error processing proposal", result['Message'])
+      self._transportPool.close(trid)
+      return result
+    if result.get('keepConnection'):
+      self.__keepConnection(trid)
+    return result
+
+  # Connections kept for their client
+
+  def __keepConnection(self, trid):
+    """
+    Watch a kept connection until the client sends its next request, which is then queued to the thread
+    pool like a new connection. The connection is closed if nothing comes within KeepConnectionTime.
+    No thread is held meanwhile.
+
+    :param trid: Transport ID in the transport pool
+    """
+    transport = self._transportPool.get(trid)
+    if not transport:
+      return
+    # The next pipelined request may already have been read
+    if transport.waitForData(0):
+      self.__queueKeptConnection(trid)
+      return
+    with self.__keptLock:
+      self.__keptConnections[trid] = time.time() + self._cfg.getKeepConnectionTime()
+      if not self.__keptListener or not self.__keptListener.isAlive():
+        if not self.__keptWakeUp:
+          self.__keptWakeUp = os.pipe()
+        self.__keptListener = threading.Thread(target=self.__listenKeptConnections, name="KeptConnections")
+        self.__keptListener.setDaemon(True)
+        self.__keptListener.start()
+      # Select the new connection too
+      os.write(self.__keptWakeUp[1], 'k')
+
+  def __queueKeptConnection(self, trid):
+    self._stats['connections'] += 1
+    self._monitor.setComponentExtraParam('queries', self._stats['connections'])
+    self._threadPool.generateJobAndQueueIt(self._processKeptConnection, args=(trid, ))
+
+  def __listenKeptConnections(self):
+    """
+    Wait for the next request on the kept connections and close the ones idle for too long
+    """
+    while True:
+      now = time.time()
+      with self.__keptLock:
+        expired = [trid for trid, deadline in self.__keptConnections.items() if deadline <= now]
+        for trid in expired:
+          del self.__keptConnections[trid]
+        socketDict = {}
+        for trid in self.__keptConnections:
+          transport = self._transportPool.get(trid)
+          if transport:
+            socketDict[transport.getSocket()] = trid
+        timeout = None
+        if self.__keptConnections:
+          timeout = max(0, min(self.__keptConnections.values()) - now)
+        wakeUp = self.__keptWakeUp[0]
+      for trid in expired:
+        self._transportPool.close(trid)
+      try:
+        inList = select.select([wakeUp] + list(socketDict), [], [], timeout)[0]
+      except Exception as e:
+        # A connection was closed in the meantime, it is removed from the list on the next loop
+        gLogger.debug("Error while selecting the kept connections", repr(e))
+        time.sleep(0.001)
+        continue
+      if wakeUp in inList:
+        os.read(wakeUp, 4096)
+      for sock in inList:
+        trid = socketDict.get(sock)
+        if trid is None:
+          continue
+        with self.__keptLock:
+          if self.__keptConnections.pop(trid, None) is None:
+            continue
+        self.__queueKeptConnection(trid)
+
   def _createIdentityString(self, credDict, clientTransport=None):
     if 'username' in credDict:
       if 'group' in credDict:
@@ -394,20 +503,18 @@ class Service(object):
 
   def _receiveAndCheckProposal(self, trid):
     clientTransport = self._transportPool.get(trid)
-    # Get the peer credentials
-    credDict = clientTransport.getConnectingCredentials()
     # Receive the action proposal
     retVal = clientTransport.receiveData(1024)
     if not retVal['OK']:
-      gLogger.error("Invalid action proposal", "%s %s" % (self._createIdentityString(credDict,
-                                                                                     clientTransport),
-                                                          retVal['Message']))
+      gLogger.error("Invalid action proposal", "%s %s" % (self._createIdentityString(
+          clientTransport.getConnectingCredentials(), clientTransport), retVal['Message']))
       return S_ERROR("Invalid action proposal")
     proposalTuple = retVal['Value']
     gLogger.debug("Received action from client", "/".join(list(proposalTuple[1])))
-    # Check if there are extra credentials
-    if proposalTuple[2]:
-      clientTransport.setExtraCredentials(proposalTuple[2])
+    # Get the peer credentials, with the extra credentials of this call: on a kept connection,
+    # the ones of the previous call must not be used
+    clientTransport.resetCredentials(proposalTuple[2])
+    credDict = clientTransport.getConnectingCredentials()
     # Check if this is the requested service
     requestedService = proposalTuple[0][0]
     if requestedService not in self._validNames:
@@ -501,8 +608,18 @@ class Service(object):
     return S_OK(handlerInstance)
 
   def _processProposal(self, trid, proposalTuple, handlerObj):
+    # RPC clients may ask to keep the connection opened for their next calls
+    keepConnection = False
+    if proposalTuple[1][0] == 'RPC' and len(proposalTuple) > 3 and isinstance(proposalTuple[3], dict):
+      keepConnection = bool(proposalTuple[3].get('keepConnection')) and self._cfg.getKeepConnectionTime() > 0
+
     # Notify the client we're ready to execute the action
-    retVal = self._transportPool.send(trid, S_OK())
+    readyMessage = S_OK()
+    if keepConnection:
+      readyMessage['keepConnection'] = True
+      # The next calls may be pipelined: do not delay the small answers
+      self._transportPool.get(trid).setNoDelay()
+    retVal = self._transportPool.send(trid, readyMessage)
     if not retVal['OK']:
       return retVal
 
@@ -530,7 +647,8 @@ class Service(object):
       if not result['OK']:
         self._msgBroker.removeTransport(trid)
 
-    result['closeTransport'] = not messageConnection or not result['OK']
+    result['closeTransport'] = not (messageConnection or keepConnection) or not result['OK']
+    result['keepConnection'] = keepConnection
     return result
 
   def _mbConnect(self, trid, handlerObj=None):
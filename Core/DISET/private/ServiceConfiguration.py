@@ -80,6 +80,15 @@ class ServiceConfiguration:
     except:
       return 15
 
+  def getKeepConnectionTime( self ):
+    """ Seconds to wait for the next call of a client that asked to keep its connection,
+        without holding a thread. 0 (default) means that the connection is closed after every call.
+    """
+    try:
+      return max( 0, int( self.getOption( "KeepConnectionTime" ) ) )
+    except:
+      return 0
+
   def getCloneProcesses( self ):
     try:
       return int( self.getOption( "CloneProcesses" ) )
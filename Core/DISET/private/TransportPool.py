@@ -4,6 +4,9 @@ import threading
 from DIRAC import gLogger, S_ERROR
 from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
 
+# Seconds after which an idle client connection is closed, it cannot be reused for longer
+MAX_IDLE_TIME = 10
+
 class TransportPool( object ):
 
   def __init__( self, logger = False ):
@@ -15,6 +18,13 @@ class TransportPool( object ):
     self.__transports = {}
     self.__listenPersistConn = False
     self.__msgCounter = 0
+    # Idle client connections that can be reused: { connectionKey : [ ( trid, idleSince, openedSince ) ] }
+    self.__idleConnections = {}
+    self.__connectionStats = { 'reuseHits' : 0,
+                               'reuseMisses' : 0,
+                               'handshakesAvoided' : 0,
+                               'pipelinedCalls' : 0,
+                               'idleClosed' : 0 }
     result = gThreadScheduler.addPeriodicTask( 5, self.__sendKeepAlives )
     if not result[ 'OK' ]:
       self.log.fatal( "Cannot add task to thread scheduler", result[ 'Message' ] )
@@ -45,6 +55,113 @@ class TransportPool( object ):
         continue
       except:
         gLogger.exception( "Cannot send keep alive" )
+    self.closeExpiredIdleConnections()
+
+  #
+  # Idle client connections
+  #
+
+  def getIdleConnection( self, connKey, maxIdleTime, maxLifeTime ):
+    """ Take an idle client connection opened with connKey, if there is a usable one
+
+        :param connKey: identifier of the destination and credentials of the connection
+        :param int maxIdleTime: connections idle for longer are not reused
+        :param int maxLifeTime: connections opened for longer are not reused
+
+        :return: tuple ( trid, transport ) or None
+    """
+    now = time.time()
+    toClose = []
+    found = None
+    self.__modLock.acquire()
+    try:
+      idleList = self.__idleConnections.get( connKey, [] )
+      while idleList:
+        trid, idleSince, openedSince = idleList.pop()
+        if trid not in self.__transports:
+          continue
+        if now - idleSince > maxIdleTime or now - openedSince > maxLifeTime:
+          toClose.append( trid )
+          continue
+        found = ( trid, self.__transports[ trid ][0] )
+        break
+      if not idleList:
+        self.__idleConnections.pop( connKey, None )
+      if found:
+        self.__connectionStats[ 'reuseHits' ] += 1
+        self.__connectionStats[ 'handshakesAvoided' ] += 1
+      else:
+        self.__connectionStats[ 'reuseMisses' ] += 1
+      self.__connectionStats[ 'idleClosed' ] += len( toClose )
+    finally:
+      self.__modLock.release()
+    for trid in toClose:
+      self.close( trid )
+    return found
+
+  def putIdleConnection( self, connKey, trid ):
+    """ Keep an opened client connection for later reuse with the same connKey
+
+        :param connKey: identifier of the destination and credentials of the connection
+        :param trid: transport id of the connection
+    """
+    now = time.time()
+    self.__modLock.acquire()
+    try:
+      if trid not in self.__transports:
+        return
+      openedSince = self.__transports[ trid ][1].setdefault( 'openedSince', now )
+      self.__idleConnections.setdefault( connKey, [] ).append( ( trid, now, openedSince ) )
+    finally:
+      self.__modLock.release()
+
+  def countPipelinedCalls( self, numCalls ):
+    """ Account for calls sent over a connection without waiting for the previous answer
+    """
+    self.__modLock.acquire()
+    try:
+      self.__connectionStats[ 'pipelinedCalls' ] += numCalls
+      self.__connectionStats[ 'handshakesAvoided' ] += numCalls
+    finally:
+      self.__modLock.release()
+
+  def closeExpiredIdleConnections( self, maxIdleTime = MAX_IDLE_TIME ):
+    """ Close the client connections that have been waiting for too long
+    """
+    now = time.time()
+    toClose = []
+    self.__modLock.acquire()
+    try:
+      for connKey in list( self.__idleConnections ):
+        stillIdle = []
+        for idleTuple in self.__idleConnections[ connKey ]:
+          if now - idleTuple[1] > maxIdleTime:
+            toClose.append( idleTuple[0] )
+          else:
+            stillIdle.append( idleTuple )
+        if stillIdle:
+          self.__idleConnections[ connKey ] = stillIdle
+        else:
+          del self.__idleConnections[ connKey ]
+      self.__connectionStats[ 'idleClosed' ] += len( toClose )
+    finally:
+      self.__modLock.release()
+    for trid in toClose:
+      self.close( trid )
+
+  def getConnectionStats( self ):
+    """ Counters about the reuse of client connections
+
+        :return: dict with reuseHits, reuseMisses, handshakesAvoided, pipelinedCalls,
+                 idleClosed and idleConnections (number of connections currently idle)
+    """
+    self.__modLock.acquire()
+    try:
+      stats = dict( self.__connectionStats )
+      stats[ 'idleConnections' ] = sum( [ len( idleList ) for idleList in self.__idleConnections.values() ] )
+    finally:
+      self.__modLock.release()
+    return stats
 
   # exists
 
@@ -22,7 +22,7 @@ __RCSID__ = "$Id$"
 
 import time
 import select
-import cStringIO
+import socket
 from hashlib import md5
 
 from DIRAC.Core.Utilities.ReturnValues import S_ERROR, S_OK
@@ -49,6 +49,7 @@ class BaseTransport(object):
     self.packetSize = 1048576  # 1MiB
     self.stServerAddress = stServerAddress
     self.peerCredentials = {}
+    self.handshakeCredentials = None
     self.remoteAddress = False
     self.appData = ""
     self.startedKeepAlives = set()
@@ -121,6 +122,19 @@ class BaseTransport(object):
   def setExtraCredentials(self, group):
     self.peerCredentials['extraCredentials'] = group
 
+  def resetCredentials(self, extraCredentials=None):
+    """ Start the credentials of a new call on this connection from the ones of the handshake,
+        which are kept aside at the first call. The credentials of a call are modified when it is
+        authorized, the next call on a kept connection must not inherit them.
+
+    :param extraCredentials: extra credentials sent with the call, if any
+    """
+    if self.handshakeCredentials is None:
+      self.handshakeCredentials = dict(self.peerCredentials)
+    self.peerCredentials = dict(self.handshakeCredentials)
+    if extraCredentials:
+      self.peerCredentials['extraCredentials'] = extraCredentials
+
   def serverMode(self):
     return self.bServerMode
 
@@ -141,6 +155,34 @@ class BaseTransport(object):
       return True
     return False
 
+  def waitForData(self, timeout):
+    """ Wait until there is something to receive on this transport
+
+        :param timeout: maximum number of seconds to wait
+
+        :returns: True if data can be received
+    """
+    if self.byteStream or self.receivedMessages:
+      return True
+    # Data may already have been read from the socket by the SSL layer
+    pending = getattr(self.oSocket, 'pending', None)
+    try:
+      if pending and pending():
+        return True
+      inList, _outList, _exList = select.select([self.oSocket], [], [], timeout)
+    except Exception:
+      return False
+    return self.oSocket in inList
+
+  def setNoDelay(self):
+    """ Disable Nagle's algorithm, so that small messages written one after the other
+        (e.g. answers to pipelined calls) are not held until the previous one is acknowledged
+    """
+    try:
+      self.oSocket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except Exception as e:
+      gLogger.debug("Cannot set TCP_NODELAY", repr(e))
+
   def _read(self, bufSize=4096, skipReadyCheck=False):
     try:
       if skipReadyCheck or self._readReady():
@@ -158,8 +200,17 @@ class BaseTransport(object):
     return S_OK(self.oSocket.send(buf))
 
   def sendData(self, uData, prefix=False):
+    return self.sendEncodedData(DEncode.encode(uData), prefix)
+
+  def sendEncodedData(self, sCodedData, prefix=False):
+    """ Send data already encoded with DEncode, e.g. to know its size before sending it
+
+    :param str sCodedData: encoded data
+    :param prefix: prefix of the message, if any
+
+    :return: S_OK(number of bytes sent)
+    """
     self.__updateLastActionTimestamp()
-    sCodedData = DEncode.encode(uData)
     if prefix:
       dataToSend = "%s%s:%s" % (prefix, len(sCodedData), sCodedData)
     else:
@@ -178,9 +229,8 @@ class BaseTransport(object):
         if sentBytes == 0:
           return S_ERROR("Connection closed by peer")
         packSentBytes += sentBytes
-    del sCodedData
-    sCodedData = None
-    return S_OK()
+    # Number of bytes sent
+    return S_OK(len(dataToSend))
 
   def receiveData(self, maxBufferSize=0, blockAfterKeepAlive=True, idleReceive=False):
     self.__updateLastActionTimestamp()
@@ -225,10 +275,17 @@ class BaseTransport(object):
         # If we already have all the data we need
         data = pkgData[:pkgSize]
         self.byteStream = pkgData[pkgSize:]
+        try:
+          data = DEncode.decode(data)[0]
+        except Exception as e:
+          return S_ERROR("Could not decode received data: %s" % str(e))
       else:
-        # If we still need to read stuff
-        pkgMem = cStringIO.StringIO()
-        pkgMem.write(pkgData)
+        # If we still need to read stuff, decode it while it arrives
+        decoder = DEncode.StreamDecoder()
+        try:
+          decoder.feed(pkgData)
+        except Exception as e:
+          return S_ERROR("Could not decode received data: %s" % str(e))
         # Receive while there's still data to be received
         while readSize < pkgSize:
           retVal = self._read(pkgSize - readSize, skipReadyCheck=True)
@@ -237,22 +294,25 @@ class BaseTransport(object):
           if not retVal['Value']:
             return S_ERROR("Peer closed connection")
           rcvData = retVal['Value']
+          pkgLeft = pkgSize - readSize
           readSize += len(rcvData)
-          pkgMem.write(rcvData)
           if maxBufferSize and readSize > maxBufferSize:
             return S_ERROR("Read limit exceeded (%s chars)" % maxBufferSize)
-        # Data is here! take it out from the bytestream, dencode and return
-        if readSize == pkgSize:
-          data = pkgMem.getvalue()
-          self.byteStream = ""
-        else:  # readSize > pkgSize:
-          pkgMem.seek(0, 0)
-          data = pkgMem.read(pkgSize)
-          self.byteStream = pkgMem.read()
-      try:
-        data = DEncode.decode(data)[0]
-      except Exception as e:
-        return S_ERROR("Could not decode received data: %s" % str(e))
+          # Anything after the end of the package belongs to the next message
+          if len(rcvData) > pkgLeft:
+            self.byteStream = rcvData[pkgLeft:]
+            rcvData = rcvData[:pkgLeft]
+          else:
+            self.byteStream = ""
+          try:
+            decoder.feed(rcvData)
+          except Exception as e:
+            return S_ERROR("Could not decode received data: %s" % str(e))
+        # Data is here! take it out from the decoder and return
+        try:
+          data = decoder.getResult()[0]
+        except Exception as e:
+          return S_ERROR("Could not decode received data: %s" % str(e))
       if idleReceive:
         self.receivedMessages.append(data)
         return S_OK()
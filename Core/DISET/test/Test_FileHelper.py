@@ -0,0 +1,68 @@
+""" Test the streaming of iterables through the FileHelper
+"""
+
+# pylint: disable=protected-access
+
+import Queue
+import threading
+
+from DIRAC import S_OK
+from DIRAC.Core.DISET.private.FileHelper import FileHelper
+
+
+class QueueTransport(object):
+  """ One end of an in-memory transport, the messages being exchanged through two queues """
+
+  def __init__(self, sendQueue, receiveQueue):
+    self.sendQueue = sendQueue
+    self.receiveQueue = receiveQueue
+
+  def sendData(self, data):
+    self.sendQueue.put(data)
+    return S_OK()
+
+  def receiveData(self, maxBufferSize=0):  # pylint: disable=unused-argument
+    return self.receiveQueue.get(timeout=10)
+
+
+def transportPair():
+  """ Get the two connected ends of a transport """
+  toReceiver = Queue.Queue()
+  toSender = Queue.Queue()
+  return QueueTransport(toReceiver, toSender), QueueTransport(toSender, toReceiver)
+
+
+def sendAndReceive(iterable, packetSize):
+  """ Send an iterable from a thread, return the send result and the values received """
+  senderTransport, receiverTransport = transportPair()
+  sender = FileHelper(senderTransport)
+  sender.packetSize = packetSize
+  sendResult = []
+  thread = threading.Thread(target=lambda: sendResult.append(sender.IterableToNetwork(iterable)))
+  thread.start()
+  received = list(FileHelper(receiverTransport).networkToIterable())
+  thread.join()
+  return sendResult[0], received
+
+
+def test_iterableToNetwork():
+  lines = ['line %d\n' % i for i in xrange(100)]
+  sendResult, received = sendAndReceive(iter(lines), packetSize=64)
+  assert sendResult['OK']
+  assert all(result['OK'] for result in received)
+  # The lines are grouped in packets
+  assert 1 < len(received) < len(lines)
+  assert ''.join(result['Value'] for result in received) == ''.join(lines)
+
+
+def test_iterableError():
+  def failingLines():
+    yield 'first line\n'
+    raise RuntimeError('DB error')
+
+  sendResult, received = sendAndReceive(failingLines(), packetSize=1)
+  assert not sendResult['OK']
+  assert received[0]['Value'] == 'first line\n'
+  # The receiver gets the error as the last value
+  assert not received[-1]['OK']
+  assert 'DB error' in received[-1]['Message']
@@ -0,0 +1,237 @@
+""" Unit tests for the connections kept between the RPC calls: kept connections watched by the service
+    without holding a thread, credentials of each call, retry of the calls on a stale kept connection,
+    and pipelined calls
+"""
+
+# pylint: disable=redefined-outer-name, protected-access
+
+import socket
+import threading
+import time
+
+import mock
+import pytest
+
+from DIRAC import S_OK, S_ERROR
+from DIRAC.Core.DISET.private import Service as ServiceModule
+from DIRAC.Core.DISET.private.BaseClient import BaseClient
+from DIRAC.Core.DISET.private.InnerRPCClient import InnerRPCClient
+from DIRAC.Core.DISET.private.TransportPool import TransportPool
+from DIRAC.Core.DISET.private.Transports.PlainTransport import PlainTransport
+
+__RCSID__ = "$Id$"
+
+
+def socketPair(bufferSize=0):
+  """ Connected client and server TCP sockets, with small buffers if bufferSize is given """
+  listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  if bufferSize:
+    for sock in (listener, client):
+      sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, bufferSize)
+      sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, bufferSize)
+  listener.bind(('127.0.0.1', 0))
+  listener.listen(1)
+  client.connect(listener.getsockname())
+  server, _address = listener.accept()
+  listener.close()
+  return client, server
+
+
+def newTransport(sock):
+  """ Plain transport on a connected socket """
+  transport = PlainTransport(sock.getpeername())
+  transport.oSocket = sock
+  transport.remoteAddress = sock.getpeername()
+  return transport
+
+
+def waitFor(condition, timeout=5):
+  start = time.time()
+  while not condition() and time.time() - start < timeout:
+    time.sleep(0.01)
+  return condition()
+
+
+@pytest.fixture
+def service():
+  with mock.patch.object(ServiceModule, 'ServiceConfiguration'), \
+          mock.patch.object(ServiceModule, 'AuthManager'), \
+          mock.patch.object(ServiceModule, 'MonitoringClient'), \
+          mock.patch.object(ServiceModule.PathFinder, 'getServiceSection', return_value='/Systems/Test/Services'):
+    service = ServiceModule.Service({'modName': 'Test/Service', 'loadName': 'Test/Service', 'standalone': False})
+  service._cfg.getKeepConnectionTime.return_value = 0.5
+  service._threadPool = mock.MagicMock()
+  service._transportPool = TransportPool()
+  return service
+
+
+def test_keptConnectionWatched(service):
+  """ A kept connection does not hold a thread: it is queued again when the next request arrives """
+  clientSock, serverSock = socketPair()
+  trid = service._transportPool.add(newTransport(serverSock))
+  service._Service__keepConnection(trid)
+  time.sleep(0.1)
+  assert not service._threadPool.generateJobAndQueueIt.called
+
+  clientSock.sendall("5:s2:ok")
+  assert waitFor(lambda: service._threadPool.generateJobAndQueueIt.called)
+  service._threadPool.generateJobAndQueueIt.assert_called_once_with(service._processKeptConnection, args=(trid, ))
+  # It is still open for the thread processing the request
+  assert service._transportPool.exists(trid)
+  assert service._transportPool.receive(trid) == 'ok'
+  clientSock.close()
+
+
+def test_keptConnectionBuffered(service):
+  """ A request already read with the previous one is queued at once """
+  _clientSock, serverSock = socketPair()
+  transport = newTransport(serverSock)
+  transport.byteStream = "5:s2:ok"
+  trid = service._transportPool.add(transport)
+  service._Service__keepConnection(trid)
+  service._threadPool.generateJobAndQueueIt.assert_called_once_with(service._processKeptConnection, args=(trid, ))
+
+
+def test_keptConnectionExpired(service):
+  """ A kept connection without request for KeepConnectionTime is closed """
+  clientSock, serverSock = socketPair()
+  trid = service._transportPool.add(newTransport(serverSock))
+  service._Service__keepConnection(trid)
+  assert waitFor(lambda: not service._transportPool.exists(trid))
+  assert not service._threadPool.generateJobAndQueueIt.called
+  # The client sees the connection closed
+  clientSock.settimeout(5)
+  assert clientSock.recv(10) == ''
+
+
+def test_credentialsPerCall(service):
+  """ A call on a kept connection is authorized with its own credentials, not the ones of the previous call """
+  hostDN = '/DC=org/CN=client.example.org'
+  userDN = '/DC=org/CN=user'
+  clientSock, serverSock = socketPair()
+  transport = newTransport(serverSock)
+  transport.peerCredentials = {'DN': hostDN, 'CN': 'client.example.org'}
+  trid = service._transportPool.add(transport)
+  service._actions = {'auth': {}}
+  authorized = []
+
+  def authQuery(_csAuthPath, credDict, _hardcodedMethodAuth):
+    # As the AuthManager, which replaces the identity of the connection by the forwarded one
+    if isinstance(credDict.get('extraCredentials'), tuple):
+      credDict['DN'], credDict['group'] = credDict['extraCredentials']
+    else:
+      credDict.setdefault('group', 'hosts')
+    authorized.append(dict(credDict))
+    return True
+  service._authMgr.authQuery.side_effect = authQuery
+
+  clientTransport = newTransport(clientSock)
+  for extraCredentials in ((userDN, 'user'), ''):
+    clientTransport.sendData(S_OK((('Test/Service', 'Setup', 'VO'), ('RPC', 'ping'), extraCredentials,
+                                   {'keepConnection': True})))
+  assert service._receiveAndCheckProposal(trid)['OK']
+  assert service._receiveAndCheckProposal(trid)['OK']
+  assert [(credDict['DN'], credDict['group'], credDict.get('extraCredentials')) for credDict in authorized] == \
+      [(userDN, 'user', (userDN, 'user')), (hostDN, 'hosts', None)]
+  assert transport.getConnectingCredentials()['DN'] == hostDN
+  clientSock.close()
+
+
+def test_connectionKey():
+  """ The connections are only reused by clients sending the same extra credentials """
+  client = BaseClient.__new__(BaseClient)
+  client.kwargs = {BaseClient.KW_PROXY_LOCATION: '/tmp/x509up_u1000'}
+  client._BaseClient__URLTuple = ('dips', 'server.example.org', 9130, 'Test/Service')
+  client._BaseClient__useCertificates = False
+  keys = set()
+  for extraCredentials in ('', BaseClient.VAL_EXTRA_CREDENTIALS_HOST, ('/DC=org/CN=user', 'user'),
+                           ('/DC=org/CN=user', 'admin')):
+    client._BaseClient__extraCredentials = extraCredentials
+    keys.add(client._BaseClient__getConnectionKey())
+  assert len(keys) == 4
+
+
+def newClient(transport=None):
+  """ RPC client without configuration, pipelining the calls on the given transport """
+  client = InnerRPCClient.__new__(InnerRPCClient)
+  client._getBaseStub = lambda: ('Test/Service', {})
+  client._isKeepingConnection = lambda: True
+  client._releaseConnection = mock.MagicMock()
+  client._disconnect = mock.MagicMock()
+  client._getIdleConnection = mock.MagicMock(side_effect=[(1, transport), None])
+  client._sendProposal = lambda transport, action: transport.sendData(S_OK((('Test/Service', 'Setup', 'VO'),
+                                                                            action, '', {'keepConnection': True})))
+  client._receiveProposalAnswer = lambda transport: transport.receiveData()
+  return client
+
+
+def test_staleConnectionRetried():
+  """ A call on a kept connection closed by the server is sent again on a new connection """
+  staleTransport = mock.MagicMock()
+  newTransport_ = mock.MagicMock()
+  newTransport_.sendData.return_value = S_OK(10)
+  newTransport_.receiveData.return_value = S_OK('done')
+  reused = S_OK((1, staleTransport))
+  reused['Reused'] = True
+  client = newClient()
+  client._connect = mock.MagicMock(side_effect=[reused, S_OK((2, newTransport_))])
+  ready = S_OK()
+  ready['keepConnection'] = True
+  client._proposeAction = mock.MagicMock(side_effect=[S_ERROR("Peer closed connection"), ready])
+
+  result = client.executeRPC('ping', ())
+  assert result['Value'] == 'done'
+  assert not staleTransport.sendData.called
+  client._connect.assert_called_with(reuseConnection=False)
+  client._disconnect.assert_called_once_with(1)
+  client._releaseConnection.assert_called_once_with(2)
+
+
+def serveCalls(transport, numCalls, answerSize, received):
+  """ Answer the calls one after the other, as the service does on a kept connection """
+  for _call in range(numCalls):
+    proposal = transport.receiveData()
+    if not proposal['OK']:
+      return
+    ready = S_OK()
+    ready['keepConnection'] = True
+    transport.sendData(ready)
+    args = transport.receiveData()
+    received.append((proposal['Value'][1][1], len(args['Value'][0])))
+    transport.sendData(S_OK('a' * answerSize))
+
+
+@pytest.mark.parametrize("numCalls, argSize, answerSize, pipelined", [
+    (20, 10, 10, 19),
+    # The calls and answers do not fit in the socket buffers: one call at a time
+    (5, 500000, 500000, 0),
+])
+def test_pipelinedCalls(numCalls, argSize, answerSize, pipelined):
+  """ The calls are pipelined, without blocking when they do not fit in the socket buffers """
+  clientSock, serverSock = socketPair(bufferSize=16384)
+  clientTransport = newTransport(clientSock)
+  received = []
+  server = threading.Thread(target=serveCalls, args=(newTransport(serverSock), numCalls, answerSize, received))
+  server.setDaemon(True)
+  server.start()
+
+  client = newClient(clientTransport)
+  results = []
+  with mock.patch('DIRAC.Core.DISET.private.InnerRPCClient.getGlobalTransportPool') as poolMock:
+    caller = threading.Thread(target=lambda: results.extend(
+        client.executePipelinedRPC([('call%d' % call, ('x' * argSize, )) for call in range(numCalls)])))
+    caller.setDaemon(True)
+    caller.start()
+    caller.join(30)
+    if caller.isAlive():
+      clientSock.close()
+      serverSock.close()
+      pytest.fail("The pipelined calls are blocked")
+  server.join(5)
+
+  assert [result['Value'] for result in results] == ['a' * answerSize] * numCalls
+  assert received == [('call%d' % call, argSize) for call in range(numCalls)]
+  assert sum(call[0][0] for call in poolMock.return_value.countPipelinedCalls.call_args_list) == pipelined
+  client._releaseConnection.assert_called_once_with(1)
+  assert not client._disconnect.called
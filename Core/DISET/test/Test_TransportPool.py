@@ -0,0 +1,85 @@
+""" Unit tests for the reuse of client connections in the TransportPool
+"""
+
+import time
+
+from mock import MagicMock
+
+from DIRAC.Core.DISET.private.TransportPool import TransportPool
+
+__RCSID__ = "$Id$"
+
+
+def newTransport(pool, port):
+  """ Add a fake client transport to the pool """
+  transport = MagicMock()
+  transport.getRemoteAddress.return_value = ('server.example.org', 9130)
+  transport.getLocalAddress.return_value = ('client.example.org', port)
+  transport.getKeepAliveLapse.return_value = 0
+  return pool.add(transport), transport
+
+
+def test_reuseIdleConnection():
+  """ A kept connection is given back only for the same key, and only once """
+  pool = TransportPool()
+  trid, transport = newTransport(pool, 40000)
+  pool.putIdleConnection('key', trid)
+
+  assert pool.getIdleConnection('otherKey', 10, 300) is None
+  assert pool.getIdleConnection('key', 10, 300) == (trid, transport)
+  assert pool.getIdleConnection('key', 10, 300) is None
+
+  stats = pool.getConnectionStats()
+  assert stats['reuseHits'] == 1
+  assert stats['handshakesAvoided'] == 1
+  assert stats['reuseMisses'] == 2
+  assert stats['idleConnections'] == 0
+
+
+def test_expiredIdleConnection():
+  """ Connections idle for too long are closed instead of being reused """
+  pool = TransportPool()
+  trid, transport = newTransport(pool, 40001)
+  pool.putIdleConnection('key', trid)
+  time.sleep(0.01)
+
+  assert pool.getIdleConnection('key', 0, 300) is None
+  assert transport.close.called
+  assert not pool.exists(trid)
+  assert pool.getConnectionStats()['idleClosed'] == 1
+
+
+def test_closeExpiredIdleConnections():
+  """ The periodic cleaning closes only the connections idle for too long """
+  pool = TransportPool()
+  oldTrid, oldTransport = newTransport(pool, 40002)
+  pool.putIdleConnection('key', oldTrid)
+  time.sleep(0.01)
+  newTrid, newTransport_ = newTransport(pool, 40003)
+  pool.putIdleConnection('key', newTrid)
+
+  pool.closeExpiredIdleConnections(maxIdleTime=0.005)
+
+  assert oldTransport.close.called
+  assert not newTransport_.close.called
+  assert pool.getConnectionStats()['idleConnections'] == 1
+  assert pool.getIdleConnection('key', 10, 300) == (newTrid, newTransport_)
+
+
+def test_closedConnectionNotReused():
+  """ A connection closed while idle is skipped """
+  pool = TransportPool()
+  trid, _transport = newTransport(pool, 40004)
+  pool.putIdleConnection('key', trid)
+  pool.close(trid)
+
+  assert pool.getIdleConnection('key', 10, 300) is None
+
+
+def test_pipelinedCalls():
+  """ Pipelined calls count as avoided handshakes """
+  pool = TransportPool()
+  pool.countPipelinedCalls(4)
+  stats = pool.getConnectionStats()
+  assert stats['pipelinedCalls'] == 4
+  assert stats['handshakesAvoided'] == 4
@@ -376,28 +376,390 @@ g_dEncodeFunctions[types.DictType] = encodeDict
 g_dDecodeFunctions["d"] = decodeDict
 
 
+# The functions above are the reference implementation: one function per type,
+# looked up in g_dEncodeFunctions/g_dDecodeFunctions for every single element.
+# The engine below produces exactly the same stream, but handles the common
+# types inline (no function call per element), converts small numbers (string
+# lengths, counters, statuses) through precomputed tables instead of str()/int(),
+# and decodes containers with an explicit stack, which also allows to resume
+# decoding when more data arrives.
+# Types it does not know are delegated to the reference functions, so anything
+# registered in the dictionaries above keeps working.
+
+_STR = types.StringType
+_INT = types.IntType
+_LONG = types.LongType
+_FLOAT = types.FloatType
+_BOOL = types.BooleanType
+_UNICODE = types.UnicodeType
+_NONE = types.NoneType
+_LIST = types.ListType
+_TUPLE = types.TupleType
+_DICT = types.DictType
+
+# Numbers below this value are converted with the tables
+_CACHED_NUMBERS = 4096
+_NUMBER_TO_STR = [str(number) for number in xrange(_CACHED_NUMBERS)]
+_STR_TO_NUMBER = dict((numberStr, number) for number, numberStr in enumerate(_NUMBER_TO_STR))
+
+_DATETIME_BUILDERS = {'a': lambda args: datetime.datetime(*args),
+                      'd': lambda args: datetime.date(*args),
+                      't': lambda args: datetime.time(*args)}
+
+
+def _encodeFast(uObject, eList):
+  """ Encode uObject into eList, handling the common types inline """
+
+  extend = eList.extend
+  numberToStr = _NUMBER_TO_STR
+  oType = type(uObject)
+  if oType is _STR:
+    size = len(uObject)
+    extend(("s", numberToStr[size] if size < _CACHED_NUMBERS else str(size), ":", uObject))
+  elif oType is _INT:
+    extend(("i", numberToStr[uObject] if 0 <= uObject < _CACHED_NUMBERS else str(uObject), "e"))
+  elif oType is _DICT:
+    eList.append("d")
+    for key in sorted(uObject):
+      value = uObject[key]
+      kType = type(key)
+      if kType is _STR:
+        size = len(key)
+        extend(("s", numberToStr[size] if size < _CACHED_NUMBERS else str(size), ":", key))
+      elif kType is _INT:
+        extend(("i", numberToStr[key] if 0 <= key < _CACHED_NUMBERS else str(key), "e"))
+      else:
+        _encodeFast(key, eList)
+      vType = type(value)
+      if vType is _STR:
+        size = len(value)
+        extend(("s", numberToStr[size] if size < _CACHED_NUMBERS else str(size), ":", value))
+      elif vType is _INT:
+        extend(("i", numberToStr[value] if 0 <= value < _CACHED_NUMBERS else str(value), "e"))
+      else:
+        _encodeFast(value, eList)
+    eList.append("e")
+  elif oType is _LIST or oType is _TUPLE:
+    eList.append("l" if oType is _LIST else "t")
+    for value in uObject:
+      vType = type(value)
+      if vType is _STR:
+        size = len(value)
+        extend(("s", numberToStr[size] if size < _CACHED_NUMBERS else str(size), ":", value))
+      elif vType is _INT:
+        extend(("i", numberToStr[value] if 0 <= value < _CACHED_NUMBERS else str(value), "e"))
+      else:
+        _encodeFast(value, eList)
+    eList.append("e")
+  elif oType is _NONE:
+    eList.append("n")
+  elif oType is _BOOL:
+    eList.append("b1" if uObject else "b0")
+  elif oType is _FLOAT:
+    extend(("f", str(uObject), "e"))
+  elif oType is _dateTimeType:
+    extend(("zat", "i", str(uObject.year), "e", "i", str(uObject.month), "e", "i", str(uObject.day), "e",
+            "i", str(uObject.hour), "e", "i", str(uObject.minute), "e", "i", str(uObject.second), "e",
+            "i", str(uObject.microsecond), "e"))
+    if uObject.tzinfo is None:
+      extend(("n", "e"))
+    else:
+      _encodeFast(uObject.tzinfo, eList)
+      eList.append("e")
+  elif oType is _LONG:
+    extend(("I", str(uObject), "e"))
+  elif oType is _UNICODE:
+    valueStr = uObject.encode('utf-8')
+    extend(("u", str(len(valueStr)), ":", valueStr))
+  else:
+    g_dEncodeFunctions[oType](uObject, eList)
+
+
+# Marker used in the decoding stack for a dictionary waiting for its next key
+_NO_KEY = object()
+
+
+def _decodeFast(data, i, stack, final):
+  """ Decode data starting at position i, without recursion.
+
+      The containers being filled are kept in stack as [container, isDict, builder, pendingKey],
+      builder being what turns the list into the final object (tuple, datetime), if anything.
+      This way decoding can be suspended at any token boundary and resumed later.
+
+      :param str data: encoded data
+      :param int i: position of the next token
+      :param list stack: containers opened and not yet closed
+      :param bool final: if True, no more data will come and truncated data is an error
+
+      :returns: tuple (complete, value, position). If the data is truncated and final is False,
+                complete is False, value is None and position is where decoding has to resume
+  """
+  dataLen = len(data)
+  find = data.find
+  strToNumber = _STR_TO_NUMBER
+  # The innermost container is kept in local variables, and only written back
+  # to the stack when another container is opened or when we have to suspend
+  if stack:
+    container, isDict, _builder, key = stack[-1]
+  else:
+    container, isDict, key = None, False, _NO_KEY
+  while True:
+    if i < dataLen:
+      token = data[i]
+    else:
+      token = None
+    if token == "s":
+      # Strings come in runs (dictionary keys and values, list items): while inside
+      # a container, decode the whole run here instead of going around the main loop
+      while True:
+        colon = find(":", i + 1)
+        if colon == -1:
+          token = None
+          break
+        sizeStr = data[i + 1:colon]
+        size = strToNumber.get(sizeStr)
+        end = colon + 1 + (int(sizeStr) if size is None else size)
+        if end > dataLen:
+          token = None
+          break
+        value = data[colon + 1:end]
+        i = end
+        if container is None or i >= dataLen or data[i] != "s":
+          break
+        if isDict:
+          if key is _NO_KEY:
+            key = value
+          else:
+            container[key] = value
+            key = _NO_KEY
+        else:
+          container.append(value)
+    elif token == "i":
+      end = find("e", i + 1)
+      if end == -1:
+        token = None
+      else:
+        valueStr = data[i + 1:end]
+        value = strToNumber.get(valueStr)
+        if value is None:
+          value = int(valueStr)
+        i = end + 1
+    elif token == "e":
+      if not stack:
+        raise KeyError(token)
+      if key is not _NO_KEY:
+        raise ValueError("Dictionary key without value in DEncode data")
+      builder = stack.pop()[2]
+      value = builder(container) if builder else container
+      i += 1
+      if stack:
+        container, isDict, _builder, key = stack[-1]
+      else:
+        container, isDict, key = None, False, _NO_KEY
+    elif token == "d" or token == "l" or token == "t" or token == "z":
+      if token == "z":
+        # Datetimes are a type letter followed by a tuple of the constructor arguments
+        if i + 2 >= dataLen:
+          token = None
+        elif data[i + 1] not in _DATETIME_BUILDERS or data[i + 2] != "t":
+          raise Exception("Unexpected type %s while decoding a datetime object" % data[i + 1])
+        else:
+          builder = _DATETIME_BUILDERS[data[i + 1]]
+          i += 3
+      else:
+        builder = tuple if token == "t" else None
+        i += 1
+      if token is not None:
+        if stack:
+          stack[-1][3] = key
+        isDict = token == "d"
+        container = {} if isDict else []
+        key = _NO_KEY
+        stack.append([container, isDict, builder, key])
+        continue
+    elif token == "n":
+      value = None
+      i += 1
+    elif token == "b":
+      if i + 1 >= dataLen:
+        token = None
+      else:
+        value = data[i + 1] != "0"
+        i += 2
+    elif token == "I":
+      end = find("e", i + 1)
+      if end == -1:
+        token = None
+      else:
+        value = long(data[i + 1:end])
+        i = end + 1
+    elif token == "u":
+      colon = find(":", i + 1)
+      end = colon + 1 + int(data[i + 1:colon]) if colon != -1 else dataLen + 1
+      if end > dataLen:
+        token = None
+      else:
+        value = unicode(data[colon + 1:end], 'utf-8')
+        i = end
+    elif token == "f":
+      end = find("e", i + 1)
+      # We need to see the character following the 'e' to know whether it is an exponent
+      if end == -1 or (end + 1 >= dataLen and not final):
+        token = None
+      elif end + 1 < dataLen and data[end + 1] in ('+', '-'):
+        eI = end
+        end = find("e", end + 1)
+        if end == -1:
+          token = None
+        else:
+          value = float(data[i + 1:eI]) * 10 ** int(data[eI + 1:end])
+          i = end + 1
+      else:
+        value = float(data[i + 1:end])
+        i = end + 1
+    elif token is not None:
+      # Whatever has been registered by someone else: use the reference decoders.
+      # We can not tell how long the token is, so on a truncated stream we just try again later
+      try:
+        value, i = g_dDecodeFunctions[token](data, i)
+      except (IndexError, ValueError):
+        if final:
+          raise
+        token = None
+
+    # Truncated data: either an error, or we wait for more
+    if token is None:
+      if final:
+        raise ValueError("Truncated DEncode data")
+      if stack:
+        stack[-1][3] = key
+      return False, None, i
+
+    # We have a value: either it is the result, or it goes into the current container
+    if isDict:
+      if key is _NO_KEY:
+        key = value
+      else:
+        container[key] = value
+        key = _NO_KEY
+    elif container is not None:
+      container.append(value)
+    else:
+      return True, value, i
+
+
+class StreamDecoder(object):
+  """ Incremental decoder: data can be fed as it comes off the transport,
+      and decoding progresses with every chunk instead of waiting for the whole message.
+
+      Usage::
+
+        decoder = StreamDecoder()
+        for chunk in chunks:
+          decoder.feed(chunk)
+        value, length = decoder.getResult()
+  """
+
+  def __init__(self):
+    # Data not yet decoded
+    self.__buffer = ""
+    # Chunks received but not yet appended to the buffer
+    self.__pending = []
+    self.__pendingLen = 0
+    # Minimum buffer length before it makes sense to try decoding again
+    self.__needed = 0
+    # Number of characters already consumed from the stream
+    self.__consumed = 0
+    self.__stack = []
+    self.__complete = False
+    self.__value = None
+
+  def feed(self, data):
+    """ Add data to the stream and decode as much as possible
+
+        :param str data: next chunk of encoded data
+
+        :returns: True if a complete object has been decoded
+    """
+    if self.__complete:
+      self.__buffer += data
+      return True
+    self.__pending.append(data)
+    self.__pendingLen += len(data)
+    # A long string may span many chunks: do not join and rescan before it is all there
+    if len(self.__buffer) + self.__pendingLen < self.__needed:
+      return False
+    self.__pending.insert(0, self.__buffer)
+    self.__buffer = "".join(self.__pending)
+    self.__pending = []
+    self.__pendingLen = 0
+    return self.__decode(final=False)
+
+  def __decode(self, final):
+    """ Run the decoder on the buffer """
+    complete, value, position = _decodeFast(self.__buffer, 0, self.__stack, final)
+    self.__consumed += position
+    self.__buffer = self.__buffer[position:]
+    if complete:
+      self.__complete = True
+      self.__value = value
+      self.__needed = 0
+    else:
+      self.__needed = self.__getNeededLength()
+    return complete
+
+  def __getNeededLength(self):
+    """ Length the buffer should reach before the current token can be decoded """
+    if self.__buffer[:1] in ("s", "u"):
+      colon = self.__buffer.find(":")
+      if colon > 1:
+        return colon + 1 + int(self.__buffer[1:colon])
+    return len(self.__buffer) + 1
+
+  def isComplete(self):
+    """ Whether a full object has been decoded """
+    return self.__complete
+
+  def getResult(self):
+    """ Get the decoded object. Call it once all the data has been fed.
+
+        :returns: tuple (decoded object, number of characters it used), like decode()
+    """
+    if not self.__complete:
+      if self.__pending:
+        self.__pending.insert(0, self.__buffer)
+        self.__buffer = "".join(self.__pending)
+        self.__pending = []
+        self.__pendingLen = 0
+      self.__decode(final=True)
+    return (self.__value, self.__consumed)
+
+  def getRemainingData(self):
+    """ Data received after the end of the decoded object """
+    if not self.__complete:
+      return ""
+    return self.__buffer + "".join(self.__pending)
+
+
 # Encode function
 def encode(uObject):
   """ Generic encoding function """
 
-  try:
-    eList = []
-    # print "ENCODE FUNCTION : %s" % g_dEncodeFunctions[ type( uObject ) ]
+  eList = []
+  if DIRAC_DEBUG_DENCODE_CALLSTACK:
     g_dEncodeFunctions[type(uObject)](uObject, eList)
-    return "".join(eList)
-  except Exception:
-    raise
+  else:
+    _encodeFast(uObject, eList)
+  return "".join(eList)
 
 
 def decode(data):
   """ Generic decoding function """
   if not data:
     return data
-  try:
-    # print "DECODE FUNCTION : %s" % g_dDecodeFunctions[ sStream [ iIndex ] ]
+  if DIRAC_DEBUG_DENCODE_CALLSTACK:
     return g_dDecodeFunctions[data[0]](data, 0)
-  except Exception:
-    raise
+  return _decodeFast(data, 0, [], True)[1:]
 
 
 if __name__ == "__main__":
@@ -5,14 +5,13 @@
     These are the coded methods:
 
 
-    __init__( host, user, passwd, name, [maxConnsInQueue=10] )
+    __init__( host, user, passwd, name, [port, maxConnections, connectionWaitTime, pingInterval] )
 
-    Initializes the Queue and tries to connect to the DB server,
-    using the _connect method.
-    "maxConnsInQueue" defines the size of the Queue of open connections
-    that are kept for reuse. It also defined the maximum number of open
-    connections available from the object.
-    maxConnsInQueue = 0 means unlimited and it is not supported.
+    Gets the pool of connections shared with the other objects using the same server
+    and credentials and tries to connect to the DB server, using the _connect method.
+    "maxConnections" is the maximum number of connections opened by the pool, a thread
+    waits at most "connectionWaitTime" seconds for one of them when they are all in use.
+    A connection is pinged before being used only when it was idle for "pingInterval" seconds.
 
 
     _except( methodName, exception, errorMessage )
@@ -49,6 +48,22 @@
     Returns S_OK with number of updated registers in Value or S_ERROR upon failure.
 
 
+    _query( cmd, [conn, args] ) and _update( cmd, [conn, args] )
+
+    When "args" is given, "cmd" is a parametrised command: the arguments are bound
+    by the driver to its %s placeholders, a tuple being bound as the list of
+    values of an IN condition. No escaping is needed for them.
+
+
+    _queryInChunks( cmd, args, [conn] ) and _updateInChunks( cmd, args, [conn] )
+
+    Same as _query and _update with arguments, but the longest list of values in "args"
+    is split in chunks of at most MAXINLISTSIZE values and the command is executed once
+    per chunk. Only for the commands giving the same result when split this way. The
+    chunks are not executed in a transaction: if one of them fails, the previous ones
+    are applied.
+
+
     _createTables( tableDict )
 
     Create a new Table in the DB
@@ -82,6 +97,13 @@
       invalid arguments
 
 
+    buildParametrizedCondition( same arguments as buildCondition ):
+
+      Same as buildCondition, but returns a tuple ( condition, args ) of a parametrised
+      condition and the values to bind to it. It is used by the methods below, which
+      execute their statements by chunks when given long lists of values.
+
+
     insertFields( self, tableName, inFields = None, inValues = None, conn = None, inDict = None ):
 
       Insert a new row in "tableName" assigning the values "inValues" to the
@@ -157,6 +179,7 @@ from DIRAC import gLogger
 from DIRAC import S_OK, S_ERROR
 from DIRAC.Core.Utilities.Time import fromString
 from DIRAC.Core.Utilities import DErrno
+from DIRAC.Core.Utilities.ThreadResources import registerReleaseCallback
 
 # This is for proper initialization of embedded server, it should only be called once
 try:
@@ -169,6 +192,18 @@ gInstancesCount = 0
 __RCSID__ = "$Id$"
 
 MAXCONNECTRETRY = 10
+# Maximum number of connections opened to a server with the same credentials
+MAXCONNECTIONS = 100
+# Time to wait for a connection when all of them are in use
+CONNECTIONWAITTIME = 60
+# Connections unused for longer are pinged before being used
+PINGINTERVAL = 30
+# MySQL client errors meaning that the connection is lost
+CONNECTIONLOSTERRORS = (2006, 2013)
+# Maximum number of values bound to an IN condition, the statements with longer lists are executed per chunk
+MAXINLISTSIZE = 1000
+# Units of the TIMESTAMPDIFF and TIMESTAMPADD functions accepted in the values
+TIMEUNITS = ['MICROSECOND', 'SECOND', 'MINUTE', 'HOUR', 'DAY', 'WEEK', 'MONTH', 'QUARTER', 'YEAR']
 
 
 def _checkFields(inFields, inValues):
@@ -187,6 +222,39 @@ def _checkFields(inFields, inValues):
   return S_OK()
 
 
+def _toArgument(value):
+  """
+    Convert a value to the argument bound to a statement: strings and numbers are bound as they are,
+    lists and tuples as tuples, as needed for the IN conditions, and any other value as its string
+    representation, as it was when escaped
+  """
+  if isinstance(value, (basestring, int, long, float)):
+    return value
+  if isinstance(value, (list, tuple, set)):
+    return tuple(_toArgument(val) for val in value)
+  return str(value)
+
+
+def _chunkArguments(args, chunkSize=MAXINLISTSIZE):
+  """
+    Generator of the arguments of the executions of a statement bound to a list of values longer
+    than chunkSize: the longest one is split in chunks, the other arguments are the same.
+    The repeated values are removed before splitting, so that the chunks select disjoint rows
+    as the whole list would
+  """
+  sizes = [len(arg) if isinstance(arg, (list, tuple)) else 0 for arg in args]
+  if not sizes or max(sizes) <= chunkSize:
+    yield args
+    return
+  index = sizes.index(max(sizes))
+  seen = set()
+  values = [value for value in args[index] if not (value in seen or seen.add(value))]
+  for start in xrange(0, len(values), chunkSize):
+    chunkArgs = list(args)
+    chunkArgs[index] = tuple(values[start:start + chunkSize])
+    yield chunkArgs
+
+
 def _quotedList(fieldList=None):
   """
     Quote a list of MySQL Field Names with "`"
@@ -216,19 +284,43 @@ class MySQL(object):
 
   class ConnectionPool(object):
     """
-    Management of connections per thread
+    Management of the connections shared by the MySQL objects using the same server and credentials
+
+    A thread checks out a connection with its first query and keeps it, with its session state
+    (LAST_INSERT_ID, locks, transactions...), until it checks it in with release(): at the end of
+    each service request, agent cycle, executor task, ThreadPool job or scheduled task (see
+    ThreadResources), or when the thread dies. The connection of a live thread is never taken from it,
+    it may be running a long statement.
+    At most maxConnections are open at once and the threads waiting for one are served in order.
+    The connections are checked by a background thread, they are only pinged before being used
+    if they were neither used nor checked for pingInterval seconds.
     """
 
-    def __init__(self, host, user, passwd, port=3306, graceTime=600):
+    def __init__(self, host, user, passwd, port=3306, graceTime=600, maxConnections=MAXCONNECTIONS,
+                 waitTime=CONNECTIONWAITTIME, pingInterval=PINGINTERVAL):
       self.__host = host
       self.__user = user
       self.__passwd = passwd
       self.__port = port
       self.__graceTime = graceTime
+      self.__maxConnections = maxConnections
+      self.__waitTime = waitTime
+      self.__pingInterval = pingInterval
+      self.__minSpares = 10
+      # Connections are kept as [ connection, dbName, lastUsedTime, lastCheckedTime ]
       self.__spares = collections.deque()
-      self.__maxSpares = 10
-      self.__lastClean = 0
       self.__assigned = {}
+      self.__inTransaction = set()
+      self.__numConnections = 0
+      self.__waiters = collections.deque()
+      self.__lock = threading.Lock()
+      self.__available = threading.Condition(self.__lock)
+      self.__stats = dict.fromkeys(('Checkouts', 'Checkins', 'Waits', 'WaitTime', 'MaxWaitTime', 'Timeouts',
+                                    'Pings', 'FailedPings', 'Connects', 'Reconnects', 'Closed'), 0)
+      registerReleaseCallback(self.release)
+      healthThread = threading.Thread(target=self.__healthCheckLoop, name="MySQLHealthCheck")
+      healthThread.setDaemon(True)
+      healthThread.start()
 
     @property
     def __thid(self):
@@ -251,98 +343,239 @@ class MySQL(object):
       return res
 
     def get(self, dbName, retries=10):
+      """ Get the connection of the current thread, checking one out if it has none
+      """
       retries = max(0, min(MAXCONNECTRETRY, retries))
-      self.clean()
-      return self.__getWithRetry(dbName, retries, retries)
-
-    def __getWithRetry(self, dbName, totalRetries, retriesLeft):
-      sleepTime = 5 * (totalRetries - retriesLeft)
-      if sleepTime > 0:
-        time.sleep(sleepTime)
-      try:
-        conn, lastName, thid = self.__innerGet()
-      except MySQLdb.MySQLError as excp:
-        if retriesLeft >= 0:
-          return self.__getWithRetry(dbName, totalRetries, retriesLeft - 1)
-        return S_ERROR(DErrno.EMYSQL, "Could not connect: %s" % excp)
+      thid = self.__thid
+      now = time.time()
+      with self.__lock:
+        data = self.__assigned.get(thid)
+        if data:
+          data[2] = now
+      if not data:
+        self.__reclaimIfFull()
+        result = self.__checkout(thid, retries)
+        if not result['OK']:
+          return result
+        data = result['Value']
+
+      if now - data[3] > self.__pingInterval:
+        if not self.__ping(data[0]):
+          self.__discard(thid)
+          if retries > 0:
+            return self.get(dbName, retries - 1)
+          return S_ERROR(DErrno.EMYSQL, "Could not connect")
+        data[3] = now
 
-      if not self.__ping(conn):
-        try:
-          self.__assigned.pop(thid)
-        except KeyError:
-          pass
-        if retriesLeft >= 0:
-          return self.__getWithRetry(dbName, totalRetries, retriesLeft)
-        return S_ERROR(DErrno.EMYSQL, "Could not connect")
-
-      if lastName != dbName:
+      if data[1] != dbName:
         try:
-          conn.select_db(dbName)
+          data[0].select_db(dbName)
         except MySQLdb.MySQLError as excp:
-          if retriesLeft >= 0:
-            return self.__getWithRetry(dbName, totalRetries, retriesLeft - 1)
+          self.__discard(thid)
+          if retries > 0:
+            return self.get(dbName, retries - 1)
           return S_ERROR(DErrno.EMYSQL, "Could not select db %s: %s" % (dbName, excp))
+        data[1] = dbName
+      # Used successfully, no need to ping it for a while
+      data[3] = now
+      return S_OK(data[0])
+
+    def __checkout(self, thid, retries):
+      """ Assign a spare connection to the thread, or a new one if the pool is not full.
+          Otherwise wait for a connection to be checked in, the first thread waiting is served first
+      """
+      start = time.time()
+      waiter = None
+      with self.__lock:
+        while True:
+          if not self.__waiters or self.__waiters[0] is waiter:
+            if self.__spares:
+              data = self.__spares.pop()
+              break
+            if not self.__maxConnections or self.__numConnections < self.__maxConnections:
+              self.__numConnections += 1
+              data = None
+              break
+          if waiter is None:
+            waiter = object()
+            self.__waiters.append(waiter)
+            self.__stats['Waits'] += 1
+          remaining = start + self.__waitTime - time.time()
+          if remaining <= 0:
+            self.__waiters.remove(waiter)
+            self.__stats['Timeouts'] += 1
+            self.__available.notify_all()
+            return S_ERROR(DErrno.EMYSQL, "Could not get a connection in %s seconds, %s connections in use" %
+                           (self.__waitTime, len(self.__assigned)))
+          self.__available.wait(remaining)
+        if waiter is not None:
+          self.__waiters.popleft()
+          waitTime = time.time() - start
+          self.__stats['WaitTime'] += waitTime
+          self.__stats['MaxWaitTime'] = max(self.__stats['MaxWaitTime'], waitTime)
+          # The next thread waiting may be served as well
+          self.__available.notify_all()
+        self.__stats['Checkouts'] += 1
+        if data:
+          data[2] = time.time()
+          self.__assigned[thid] = data
+          return S_OK(data)
+
+      result = self.__connect(retries)
+      if not result['OK']:
+        with self.__lock:
+          self.__numConnections -= 1
+          self.__available.notify_all()
+        return result
+      now = time.time()
+      data = [result['Value'], "", now, now]
+      with self.__lock:
+        self.__assigned[thid] = data
+      return S_OK(data)
+
+    def __reclaimIfFull(self):
+      """ Check in the connections of the dead threads when none is available, without waiting
+          for the health check thread
+      """
+      with self.__lock:
+        if self.__spares or not self.__maxConnections or self.__numConnections < self.__maxConnections:
+          return
+        reclaimed = [(thid, self.__assigned.pop(thid)) for thid in list(self.__assigned) if not thid.isAlive()]
+      for thid, data in reclaimed:
+        self.__checkin(thid, data)
+
+    def __connect(self, retries):
+      error = None
+      for attempt in range(retries + 1):
+        if attempt:
+          time.sleep(5 * attempt)
         try:
-          self.__assigned[thid][1] = dbName
-        except KeyError:
-          if retriesLeft >= 0:
-            return self.__getWithRetry(dbName, totalRetries, retriesLeft - 1)
-          return S_ERROR(DErrno.EMYSQL, "Could not connect")
-      return S_OK(conn)
+          conn = self.__newConn()
+        except MySQLdb.MySQLError as excp:
+          error = excp
+          continue
+        with self.__lock:
+          self.__stats['Connects'] += 1
+        return S_OK(conn)
+      return S_ERROR(DErrno.EMYSQL, "Could not connect: %s" % error)
 
     def __ping(self, conn):
       try:
         conn.ping(True)
-        return True
+        result = True
       except BaseException:
-        return False
-
-    def __innerGet(self):
+        result = False
+      with self.__lock:
+        self.__stats['Pings'] += 1
+        if not result:
+          self.__stats['FailedPings'] += 1
+      return result
+
+    def release(self):
+      """ Check in the connection of the current thread, if it has one
+      """
       thid = self.__thid
-      now = time.time()
-      if thid in self.__assigned:
-        data = self.__assigned[thid]
-        conn = data[0]
-        data[2] = now
-        return data[0], data[1], thid
-      # Not cached
-      try:
-        conn, dbName = self.__spares.pop()
-      except IndexError:
-        conn = self.__newConn()
-        dbName = ""
-
-      self.__assigned[thid] = [conn, dbName, now]
-      return conn, dbName, thid
-
-    def __pop(self, thid):
+      with self.__lock:
+        data = self.__assigned.pop(thid, None)
+      if data:
+        self.__checkin(thid, data)
+
+    def __checkin(self, thid, data):
+      with self.__lock:
+        inTransaction = thid in self.__inTransaction
+        self.__inTransaction.discard(thid)
+      if inTransaction:
+        gLogger.warn("Rolling back the transaction left open by thread", thid.name)
+        try:
+          self.__execute(data[0], "ROLLBACK")
+        except MySQLdb.MySQLError:
+          self.__close(data)
+          return
+      with self.__lock:
+        self.__spares.append(data)
+        self.__stats['Checkins'] += 1
+        self.__available.notify_all()
+
+    def __close(self, data):
       try:
-        data = self.__assigned.pop(thid)
-        if len(self.__spares) < self.__maxSpares:
-          self.__spares.append((data[0], data[1]))
-        else:
-          try:
-            data[0].close()
-          except MySQLdb.ProgrammingError as exc:
-            gLogger.warn("ProgrammingError exception while closing MySQL connection: %s" % exc)
-          except BaseException as exc:
-            gLogger.warn("Exception while closing MySQL connection: %s" % exc)
-      except KeyError:
-        pass
+        data[0].close()
+      except MySQLdb.ProgrammingError as exc:
+        gLogger.warn("ProgrammingError exception while closing MySQL connection: %s" % exc)
+      except BaseException as exc:
+        gLogger.warn("Exception while closing MySQL connection: %s" % exc)
+      with self.__lock:
+        self.__numConnections -= 1
+        self.__stats['Closed'] += 1
+        self.__available.notify_all()
+
+    def __discard(self, thid):
+      with self.__lock:
+        data = self.__assigned.pop(thid, None)
+        self.__inTransaction.discard(thid)
+        self.__stats['Reconnects'] += 1
+      if data:
+        self.__close(data)
+
+    def discardConnection(self):
+      """ Close the connection of the current thread after an error, a new one is used for the next query
+      """
+      self.__discard(self.__thid)
 
     def clean(self, now=False):
+      """ Check in the connections of the dead threads and close the spare connections unused
+          for graceTime, keeping a few of them
+      """
       if not now:
         now = time.time()
-      self.__lastClean = now
-      for thid in list(self.__assigned):
-        if not thid.isAlive():
-          self.__pop(thid)
+      expired = []
+      with self.__lock:
+        reclaimed = [(thid, self.__assigned.pop(thid)) for thid in list(self.__assigned) if not thid.isAlive()]
+        while len(self.__spares) > self.__minSpares and now - self.__spares[0][2] > self.__graceTime:
+          expired.append(self.__spares.popleft())
+      for thid, data in reclaimed:
+        self.__checkin(thid, data)
+      for data in expired:
+        self.__close(data)
+
+    def __checkSpares(self):
+      """ Ping the spare connections neither used nor checked for pingInterval, close the broken ones
+      """
+      now = time.time()
+      with self.__lock:
+        toCheck = [data for data in self.__spares if now - data[3] > self.__pingInterval]
+        for data in toCheck:
+          self.__spares.remove(data)
+      checked = []
+      for data in toCheck:
+        if self.__ping(data[0]):
+          data[3] = time.time()
+          checked.append(data)
+        else:
+          self.__close(data)
+      with self.__lock:
+        # They are the least recently used ones
+        self.__spares.extendleft(reversed(checked))
+        self.__available.notify_all()
+
+    def __healthCheckLoop(self):
+      while True:
+        time.sleep(self.__pingInterval)
         try:
-          data = self.__assigned[thid]
-        except KeyError:
-          continue
-        if now - data[2] > self.__graceTime:
-          self.__pop(thid)
+          self.clean()
+          self.__checkSpares()
+        except Exception:
+          gLogger.exception("Exception while checking the MySQL connections")
+
+    def getStatistics(self):
+      """ Counters of the connection pool activity and current state
+      """
+      with self.__lock:
+        stats = dict(self.__stats)
+        stats['Connections'] = self.__numConnections
+        stats['InUse'] = len(self.__assigned)
+        stats['Spares'] = len(self.__spares)
+        stats['Waiting'] = len(self.__waiters)
+      return stats
 
     def transactionStart(self, dbName):
       result = self.get(dbName)
@@ -350,9 +583,12 @@ class MySQL(object):
         return result
       conn = result['Value']
       try:
-        return S_OK(self.__execute(conn, "START TRANSACTION WITH CONSISTENT SNAPSHOT"))
+        result = S_OK(self.__execute(conn, "START TRANSACTION WITH CONSISTENT SNAPSHOT"))
       except MySQLdb.MySQLError as excp:
         return S_ERROR(DErrno.EMYSQL, "Could not begin transaction: %s" % excp)
+      with self.__lock:
+        self.__inTransaction.add(self.__thid)
+      return result
 
     def transactionCommit(self, dbName):
       result = self.get(dbName)
@@ -364,6 +600,9 @@ class MySQL(object):
         return S_OK(result)
       except MySQLdb.MySQLError as excp:
         return S_ERROR(DErrno.EMYSQL, "Could not commit transaction: %s" % excp)
+      finally:
+        with self.__lock:
+          self.__inTransaction.discard(self.__thid)
 
     def transactionRollback(self, dbName):
       result = self.get(dbName)
@@ -375,14 +614,22 @@ class MySQL(object):
         return S_OK(result)
       except MySQLdb.MySQLError as excp:
         return S_ERROR(DErrno.EMYSQL, "Could not rollback transaction: %s" % excp)
+      finally:
+        with self.__lock:
+          self.__inTransaction.discard(self.__thid)
 
   __connectionPools = {}
 
-  def __init__(self, hostName='localhost', userName='dirac', passwd='dirac', dbName='', port=3306, debug=False):
+  def __init__(self, hostName='localhost', userName='dirac', passwd='dirac', dbName='', port=3306, debug=False,
+               maxConnections=MAXCONNECTIONS, connectionWaitTime=CONNECTIONWAITTIME, pingInterval=PINGINTERVAL):
     """
     set MySQL connection parameters and try to connect
 
     :param debug: unused
+    :param int maxConnections: maximum number of connections of the pool, only used by the first
+                               object created for the server and credentials
+    :param int connectionWaitTime: seconds to wait for a connection when they are all in use
+    :param int pingInterval: seconds of inactivity after which a connection is pinged before being used
     """
     global gInstancesCount
     gInstancesCount += 1
@@ -404,7 +651,9 @@ class MySQL(object):
     self.__port = port
     cKey = (self.__hostName, self.__userName, self.__passwd, self.__port)
     if cKey not in MySQL.__connectionPools:
-      MySQL.__connectionPools[cKey] = MySQL.ConnectionPool(*cKey)
+      MySQL.__connectionPools[cKey] = MySQL.ConnectionPool(*cKey, maxConnections=maxConnections,
+                                                           waitTime=connectionWaitTime,
+                                                           pingInterval=pingInterval)
     self.__connectionPool = MySQL.__connectionPools[cKey]
 
     self.__initialized = True
@@ -412,6 +661,15 @@ class MySQL(object):
     if not result['OK']:
       gLogger.error("Cannot connect to to DB", " %s" % result['Message'])
 
+  @classmethod
+  def getConnectionPoolStatistics(cls):
+    """ Get the statistics of the connection pools of the process
+
+        :return: dict { user@host:port : statistics dictionary }
+    """
+    return dict(('%s@%s:%s' % (cKey[1], cKey[0], cKey[3]), pool.getStatistics())
+                for cKey, pool in cls.__connectionPools.items())
+
   def __del__(self):
     global gInstancesCount
     try:
@@ -448,6 +706,32 @@ class MySQL(object):
     except BaseException:
       return False
 
+  def __checkTimeFunction(self, myString):
+    """
+    Check if the string is a call to one of the MySQL time functions allowed in the values,
+    to be passed as it is to the DB
+
+    :return: S_OK( bool ) or S_ERROR if it is a call with invalid arguments
+    """
+    myString = myString.strip()
+    if myString == 'UTC_TIMESTAMP()':
+      return S_OK(True)
+
+    for func in ['TIMESTAMPDIFF', 'TIMESTAMPADD']:
+      if myString.startswith('%s(' % func) and myString.endswith(')'):
+        try:
+          args = myString[:-1].replace('%s(' % func, '').strip().split(',')
+          arg1, arg2, arg3 = [x.strip() for x in args]
+        except ValueError:
+          return S_ERROR(DErrno.EMYSQL, '__escape_string: Could not escape string')
+        if arg1 in TIMEUNITS:
+          if self.__isDateTime(arg2) or arg2.isalnum():
+            if self.__isDateTime(arg3) or arg3.isalnum():
+              return S_OK(True)
+        # self.log.debug('__escape_string: Could not escape string', '"%s"' % myString)
+        return S_ERROR(DErrno.EMYSQL, '__escape_string: Could not escape string')
+    return S_OK(False)
+
   def __escapeString(self, myString):
     """
     To be used for escaping any MySQL string before passing it to the DB
@@ -465,24 +749,14 @@ class MySQL(object):
     except ValueError:
       return S_ERROR(DErrno.EMYSQL, "Cannot escape value!")
 
-    timeUnits = ['MICROSECOND', 'SECOND', 'MINUTE', 'HOUR', 'DAY', 'WEEK', 'MONTH', 'QUARTER', 'YEAR']
-
     try:
       # Check datetime functions first
-      if myString.strip() == 'UTC_TIMESTAMP()':
+      result = self.__checkTimeFunction(myString)
+      if not result['OK']:
+        return result
+      if result['Value']:
         return S_OK(myString)
 
-      for func in ['TIMESTAMPDIFF', 'TIMESTAMPADD']:
-        if myString.strip().startswith('%s(' % func) and myString.strip().endswith(')'):
-          args = myString.strip()[:-1].replace('%s(' % func, '').strip().split(',')
-          arg1, arg2, arg3 = [x.strip() for x in args]
-          if arg1 in timeUnits:
-            if self.__isDateTime(arg2) or arg2.isalnum():
-              if self.__isDateTime(arg3) or arg3.isalnum():
-                return S_OK(myString)
-          # self.log.debug('__escape_string: Could not escape string', '"%s"' % myString)
-          return S_ERROR(DErrno.EMYSQL, '__escape_string: Could not escape string')
-
       escape_string = connection.escape_string(str(myString))
       # self.log.debug('__escape_string: returns', '"%s"' % escape_string)
       return S_OK('"%s"' % escape_string)
@@ -584,11 +858,13 @@ class MySQL(object):
     except Exception as x:
       return self._except('_connect', x, 'Could not connect to DB.')
 
-  def _query(self, cmd, conn=None, debug=False):
+  def _query(self, cmd, conn=None, debug=False, args=None):
     """
     execute MySQL query command
 
     :param debug: unused
+    :param list args: arguments bound by the driver to the %s placeholders of a parametrised command,
+                      a list or tuple is bound as the list of values of an IN condition
 
     return S_OK structure with fetchall result as tuple
     it returns an empty tuple if no matching rows are found
@@ -602,9 +878,12 @@ class MySQL(object):
       return retDict
     connection = retDict['Value']
 
+    if args:
+      args = [_toArgument(arg) for arg in args]
+
     try:
       cursor = connection.cursor()
-      if cursor.execute(cmd):
+      if cursor.execute(cmd, args or None):
         res = cursor.fetchall()
       else:
         res = ()
@@ -620,6 +899,7 @@ class MySQL(object):
     except BaseException as x:
       # self.log.debug('_query: %s' % self._safeCmd(cmd))
       retDict = self._except('_query', x, 'Execution failed.')
+      self.__checkConnectionLost(x)
 
     try:
       cursor.close()
@@ -628,10 +908,11 @@ class MySQL(object):
 
     return retDict
 
-  def _update(self, cmd, conn=None, debug=False):
+  def _update(self, cmd, conn=None, debug=False, args=None):
     """ execute MySQL update command
 
         :param debug: unused
+        :param list args: arguments bound by the driver to the %s placeholders of a parametrised command
 
         return S_OK with number of updated registers upon success
         return S_ERROR upon error
@@ -644,9 +925,12 @@ class MySQL(object):
       return retDict
     connection = retDict['Value']
 
+    if args:
+      args = [_toArgument(arg) for arg in args]
+
     try:
       cursor = connection.cursor()
-      res = cursor.execute(cmd)
+      res = cursor.execute(cmd, args or None)
       # connection.commit()
       # self.log.debug('_update:', res)
       retDict = S_OK(res)
@@ -655,6 +939,7 @@ class MySQL(object):
     except Exception as x:
       # self.log.debug('_update: %s: %s' % (self._safeCmd(cmd), str(x)))
       retDict = self._except('_update', x, 'Execution failed.')
+      self.__checkConnectionLost(x)
 
     try:
       cursor.close()
@@ -663,11 +948,48 @@ class MySQL(object):
 
     return retDict
 
+  def _queryInChunks(self, cmd, args, conn=None):
+    """ execute a parametrised MySQL query with a list of values for an IN condition, longer lists
+        are split and the query is executed once per chunk of MAXINLISTSIZE values. It is only
+        suitable for the plain selections (no LIMIT, ORDER BY or aggregation over the list)
+
+        :param str cmd: query with %s placeholders
+        :param list args: arguments of the query, including the tuple of values of the IN condition
+
+        return S_OK with the rows of all the chunks or S_ERROR upon error
+    """
+    rows = []
+    for chunkArgs in _chunkArguments([_toArgument(arg) for arg in args]):
+      result = self._query(cmd, conn, args=chunkArgs)
+      if not result['OK']:
+        return result
+      rows.extend(result['Value'])
+    return S_OK(tuple(rows))
+
+  def _updateInChunks(self, cmd, args, conn=None):
+    """ execute a parametrised MySQL update command with a list of values for an IN condition,
+        once per chunk of MAXINLISTSIZE values of the list (no LIMIT). The chunks are not executed
+        in a transaction: if one of them fails, the updates of the previous ones are kept
+
+        :param str cmd: command with %s placeholders
+        :param list args: arguments of the command, including the tuple of values of the IN condition
+
+        return S_OK with the total number of updated registers or S_ERROR upon error
+    """
+    updated = 0
+    for chunkArgs in _chunkArguments([_toArgument(arg) for arg in args]):
+      result = self._update(cmd, conn, args=chunkArgs)
+      if not result['OK']:
+        return result
+      updated += result['Value']
+    return S_OK(updated)
+
   def _transaction(self, cmdList, conn=None):
     """ dummy transaction support
 
     :param self: self reference
-    :param list cmdList: list of queries to be executed within the transaction
+    :param list cmdList: list of queries to be executed within the transaction, or of ( query, args )
+                         tuples for the parametrised ones
     :param MySQLDB.Connection conn: connection
 
     :return: S_OK( [ ( cmd1, ret1 ), ... ] ) or S_ERROR
@@ -688,10 +1010,16 @@ class MySQL(object):
     try:
       cursor = connection.cursor()
       for cmd in cmdList:
-        cmdRet.append((cmd, cursor.execute(cmd)))
+        args = None
+        if isinstance(cmd, tuple):
+          cmd, args = cmd
+          args = [_toArgument(arg) for arg in args]
+        cmdRet.append((cmd, cursor.execute(cmd, args or None)))
       connection.commit()
     except Exception as error:
       self.logger.exception(error)
+      if self.__checkConnectionLost(error):
+        return S_ERROR(DErrno.EMYSQL, error)
       # # rollback, put back connection to the pool
       connection.rollback()
       return S_ERROR(DErrno.EMYSQL, error)
@@ -699,6 +1027,17 @@ class MySQL(object):
     cursor.close()
     return S_OK(cmdRet)
 
+  def __checkConnectionLost(self, error):
+    """ Discard the connection of the thread if the error means that it is lost,
+        a new one is used by the next query
+
+        :return: True if the connection was discarded
+    """
+    if isinstance(error, MySQLdb.OperationalError) and error.args and error.args[0] in CONNECTIONLOSTERRORS:
+      self.__connectionPool.discardConnection()
+      return True
+    return False
+
   def _createViews(self, viewsDict, force=False):
     """ create view based on query
 
@@ -933,11 +1272,11 @@ class MySQL(object):
     return param[0].tostring()
 
   def _getConnection(self):
-    """ Return  a new connection to the DB,
+    """ Return the connection of the current thread to the DB,
 
-        Try the Queue, if it is empty add a newConnection to the Queue and retry
-        it will retry MAXCONNECTRETRY to open a new connection and will return
-        an error if it fails.
+        It is taken from the connection pool, a new one is opened if none is available
+        and the pool is not full, retrying MAXCONNECTRETRY times. An error is returned
+        if it fails or if no connection becomes available within the connection wait time.
     """
     # self.log.debug('_getConnection:')
 
@@ -981,17 +1320,17 @@ class MySQL(object):
       return S_ERROR(DErrno.EMYSQL, error)
 
     try:
-      cond = self.buildCondition(condDict=condDict, older=older, newer=newer, timeStamp=timeStamp,
-                                 greater=greater, smaller=smaller)
+      cond, args = self.buildParametrizedCondition(condDict=condDict, older=older, newer=newer, timeStamp=timeStamp,
+                                                   greater=greater, smaller=smaller)
     except Exception as x:
       return S_ERROR(DErrno.EMYSQL, x)
 
     cmd = 'SELECT COUNT(*) FROM %s %s' % (table, cond)
-    res = self._query(cmd, connection)
+    res = self._queryInChunks(cmd, args, connection)
     if not res['OK']:
       return res
 
-    return S_OK(res['Value'][0][0])
+    return S_OK(sum(row[0] for row in res['Value']))
 
 ########################################################################################
   def getCounters(self, table, attrList, condDict, older=None, newer=None, timeStamp=None, connection=False,
@@ -1013,13 +1352,13 @@ class MySQL(object):
       return S_ERROR(DErrno.EMYSQL, error)
 
     try:
-      cond = self.buildCondition(condDict=condDict, older=older, newer=newer, timeStamp=timeStamp,
-                                 greater=greater, smaller=smaller)
+      cond, args = self.buildParametrizedCondition(condDict=condDict, older=older, newer=newer, timeStamp=timeStamp,
+                                                   greater=greater, smaller=smaller)
     except Exception as x:
       return S_ERROR(DErrno.EMYSQL, x)
 
     cmd = 'SELECT %s, COUNT(*) FROM %s %s GROUP BY %s ORDER BY %s' % (attrNames, table, cond, attrNames, attrNames)
-    res = self._query(cmd, connection)
+    res = self._query(cmd, connection, args=args)
     if not res['OK']:
       return res
 
@@ -1052,13 +1391,13 @@ class MySQL(object):
       return S_ERROR(DErrno.EMYSQL, error)
 
     try:
-      cond = self.buildCondition(condDict=condDict, older=older, newer=newer, timeStamp=timeStamp,
-                                 greater=greater, smaller=smaller)
+      cond, args = self.buildParametrizedCondition(condDict=condDict, older=older, newer=newer, timeStamp=timeStamp,
+                                                   greater=greater, smaller=smaller)
     except Exception as exc:
       return S_ERROR(DErrno.EMYSQL, exc)
 
     cmd = 'SELECT  DISTINCT( %s ) FROM %s %s ORDER BY %s' % (attributeName, table, cond, attributeName)
-    res = self._query(cmd, connection)
+    res = self._query(cmd, connection, args=args)
     if not res['OK']:
       return res
     attr_list = [x[0] for x in res['Value']]
@@ -1186,6 +1525,13 @@ class MySQL(object):
                                           escapeInValue)
           conjunction = "AND"
 
+    return condition + self.__buildOrderAndLimit(orderAttribute, limit, offset)
+
+  def __buildOrderAndLimit(self, orderAttribute=None, limit=False, offset=None):
+    """ Build the ORDER BY and LIMIT clauses of buildCondition and buildParametrizedCondition
+    """
+    condition = ''
+
     orderList = []
     orderAttrList = orderAttribute
     if not isinstance(orderAttrList, list):
@@ -1226,6 +1572,95 @@ class MySQL(object):
 
     return condition
 
+  def _bindValues(self, inValues):
+    """ Get the SQL expressions of a list of values to be used in a parametrised statement:
+        the %s placeholder for the values to be bound, or the MySQL time functions and booleans as they are.
+
+        :return: S_OK( ( list of SQL expressions, list of arguments to bind ) ) / S_ERROR
+    """
+    sqlList = []
+    args = []
+    for value in inValues:
+      if isinstance(value, bool):
+        sqlList.append(str(value))
+        continue
+      if isinstance(value, (tuple, list)):
+        sqlList.append('%s')
+        args.append(_toArgument(value))
+        continue
+      if not isinstance(value, basestring):
+        value = str(value)
+      result = self.__checkTimeFunction(value)
+      if not result['OK']:
+        return result
+      if result['Value']:
+        sqlList.append(value.strip())
+      else:
+        sqlList.append('%s')
+        args.append(value)
+    return S_OK((sqlList, args))
+
+  def buildParametrizedCondition(self, condDict=None, older=None, newer=None,
+                                 timeStamp=None, orderAttribute=None, limit=False,
+                                 greater=None, smaller=None, offset=None):
+    """ Same as buildCondition, but the values are not escaped and inserted in the condition:
+        they are returned as arguments to be bound by the driver when executing the statement,
+        e.g. with _query( cmd, args = args ). A list of values is bound to a single placeholder
+        of an IN condition.
+
+        :return: tuple ( condition string, list of arguments )
+    """
+    condList = []
+    args = []
+
+    for aName, attrValue in (condDict or {}).iteritems():
+      attrName = None
+      if isinstance(aName, basestring):
+        attrName = _quotedList([aName])
+      elif isinstance(aName, tuple):
+        attrName = '(' + _quotedList(list(aName)) + ')'
+      if not attrName:
+        raise Exception('Invalid condDict argument')
+      if isinstance(attrValue, list):
+        condList.append('%s IN %%s' % attrName)
+        args.append(_toArgument(attrValue))
+      else:
+        condList.append(self.__bindCondition(attrName, '=', attrValue, args))
+
+    if timeStamp:
+      timeStamp = _quotedList([timeStamp])
+      if not timeStamp:
+        raise Exception('Invalid timeStamp argument')
+      if newer:
+        condList.append(self.__bindCondition(timeStamp, '>=', newer, args))
+      if older:
+        condList.append(self.__bindCondition(timeStamp, '<', older, args))
+
+    for operator, valueDict in (('>=', greater), ('<', smaller)):
+      if not isinstance(valueDict, dict):
+        continue
+      for attrName, attrValue in valueDict.iteritems():
+        attrName = _quotedList([attrName])
+        if not attrName:
+          raise Exception('Invalid %s argument' % ('greater' if operator == '>=' else 'smaller'))
+        condList.append(self.__bindCondition(attrName, operator, attrValue, args))
+
+    condition = ''
+    if condList:
+      condition = 'WHERE %s' % ' AND '.join(condList)
+    condition += self.__buildOrderAndLimit(orderAttribute, limit, offset)
+    return condition, args
+
+  def __bindCondition(self, attrName, operator, value, args):
+    """ Get the condition comparing an attribute to a value, adding the value to the arguments to bind
+    """
+    result = self._bindValues([value])
+    if not result['OK']:
+      raise Exception(result['Message'])
+    sqlList, valueArgs = result['Value']
+    args.extend(valueArgs)
+    return '%s %s %s' % (attrName, operator, sqlList[0])
+
 #############################################################################
   def getFields(self, tableName, outFields=None,
                 condDict=None,
@@ -1239,7 +1674,8 @@ class MySQL(object):
       return S_OK( tuple(Field,Value) )
       if outFields is None all fields in "tableName" are returned
       if limit is not False, the given limit is set
-      inValues are properly escaped using the _escape_string method, they can be single values or lists of values.
+      inValues are bound as arguments of the query, they can be single values or lists of values.
+      Without limit and orderAttribute, the query is executed by chunks of the long lists of values.
     """
     table = _quotedList([tableName])
     if not table:
@@ -1267,14 +1703,17 @@ class MySQL(object):
       except TypeError:
         mylimit = limit
         myoffset = None
-      condition = self.buildCondition(condDict=condDict, older=older, newer=newer,
-                                      timeStamp=timeStamp, orderAttribute=orderAttribute, limit=mylimit,
-                                      greater=greater, smaller=smaller, offset=myoffset)
+      condition, args = self.buildParametrizedCondition(condDict=condDict, older=older, newer=newer,
+                                                        timeStamp=timeStamp, orderAttribute=orderAttribute,
+                                                        limit=mylimit, greater=greater, smaller=smaller,
+                                                        offset=myoffset)
     except Exception as x:
       return S_ERROR(DErrno.EMYSQL, x)
 
-    return self._query('SELECT %s FROM %s %s' %
-                       (quotedOutFields, table, condition), conn)
+    cmd = 'SELECT %s FROM %s %s' % (quotedOutFields, table, condition)
+    if mylimit or orderAttribute:
+      return self._query(cmd, conn, args=args)
+    return self._queryInChunks(cmd, args, conn)
 
 #############################################################################
   def deleteEntries(self, tableName,
@@ -1288,6 +1727,8 @@ class MySQL(object):
       N records can match the condition
       if limit is not False, the given limit is set
       String type values will be appropriately escaped, they can be single values or lists of values.
+      Without limit, a list of more than MAXINLISTSIZE values is deleted by chunks, which is not atomic:
+      if a chunk fails, the rows of the previous ones are deleted.
     """
     table = _quotedList([tableName])
     if not table:
@@ -1298,13 +1739,16 @@ class MySQL(object):
     # self.log.debug('deleteEntries:', 'deleting rows from table %s.' % table)
 
     try:
-      condition = self.buildCondition(condDict=condDict, older=older, newer=newer,
-                                      timeStamp=timeStamp, orderAttribute=orderAttribute, limit=limit,
-                                      greater=greater, smaller=smaller)
+      condition, args = self.buildParametrizedCondition(condDict=condDict, older=older, newer=newer,
+                                                        timeStamp=timeStamp, orderAttribute=orderAttribute,
+                                                        limit=limit, greater=greater, smaller=smaller)
     except Exception as x:
       return S_ERROR(DErrno.EMYSQL, x)
 
-    return self._update('DELETE FROM %s %s' % (table, condition), conn)
+    cmd = 'DELETE FROM %s %s' % (table, condition)
+    if limit:
+      return self._update(cmd, conn, args=args)
+    return self._updateInChunks(cmd, args, conn)
 
 #############################################################################
   def updateFields(self, tableName, updateFields=None, updateValues=None,
@@ -1320,7 +1764,9 @@ class MySQL(object):
       N records can match the condition
       return S_OK( number of updated rows )
       if limit is not False, the given limit is set
-      String type values will be appropriately escaped.
+      The values are bound as arguments of the update.
+      Without limit, a list of more than MAXINLISTSIZE values in the condition is updated by chunks,
+      which is not atomic: if a chunk fails, the rows of the previous ones are updated.
 
     """
     if not updateFields and not updateDict:
@@ -1355,26 +1801,28 @@ class MySQL(object):
         # self.log.debug('updateFields:', error)
         return S_ERROR(DErrno.EMYSQL, error)
 
-    updateValues = self._escapeValues(updateValues)
-    if not updateValues['OK']:
-      # self.log.debug('updateFields:', updateValues['Message'])
-      return updateValues
-    updateValues = updateValues['Value']
+    retDict = self._bindValues(updateValues)
+    if not retDict['OK']:
+      # self.log.debug('updateFields:', retDict['Message'])
+      return retDict
+    updateValues, args = retDict['Value']
 
     # self.log.debug('updateFields:', 'updating fields %s from table %s.' % (', '.join(updateFields), table))
 
     try:
-      condition = self.buildCondition(condDict=condDict, older=older, newer=newer,
-                                      timeStamp=timeStamp, orderAttribute=orderAttribute, limit=limit,
-                                      greater=greater, smaller=smaller)
+      condition, condArgs = self.buildParametrizedCondition(condDict=condDict, older=older, newer=newer,
+                                                            timeStamp=timeStamp, orderAttribute=orderAttribute,
+                                                            limit=limit, greater=greater, smaller=smaller)
     except Exception as x:
       return S_ERROR(DErrno.EMYSQL, x)
 
     updateString = ','.join(['%s = %s' % (_quotedList([updateFields[k]]),
                                           updateValues[k]) for k in range(len(updateFields))])
 
-    return self._update('UPDATE %s SET %s %s' %
-                        (table, updateString, condition), conn)
+    cmd = 'UPDATE %s SET %s %s' % (table, updateString, condition)
+    if limit:
+      return self._update(cmd, conn, args=args + condArgs)
+    return self._updateInChunks(cmd, args + condArgs, conn)
 
 #############################################################################
   def insertFields(self, tableName, inFields=None, inValues=None, conn=None, inDict=None):
@@ -1419,18 +1867,18 @@ class MySQL(object):
 
     inFieldString = '(  %s )' % inFieldString
 
-    retDict = self._escapeValues(inValues)
+    retDict = self._bindValues(inValues)
     if not retDict['OK']:
       # self.log.debug('insertFields:', retDict['Message'])
       return retDict
-    inValueString = ', '.join(retDict['Value'])
-    inValueString = '(  %s )' % inValueString
+    inValueList, args = retDict['Value']
+    inValueString = '(  %s )' % ', '.join(inValueList)
 
     # self.log.debug('insertFields:', 'inserting %s into table %s'
     #               % (inFieldString, table))
 
     return self._update('INSERT INTO %s %s VALUES %s' %
-                        (table, inFieldString, inValueString), conn)
+                        (table, inFieldString, inValueString), conn, args=args)
 
   def executeStoredProcedure(self, packageName, parameters, outputIds):
     conDict = self._getConnection()
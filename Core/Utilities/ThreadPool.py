@@ -83,6 +83,7 @@ try:
 except:
   gLogger = False
 from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR
+from DIRAC.Core.Utilities.ThreadResources import releaseThreadResources
 
 
 class WorkingThread( threading.Thread ):
@@ -110,6 +111,8 @@ class WorkingThread( threading.Thread ):
         break
       self.__working = True
       oJob.process()
+      # Give back the resources held for the job (e.g. the MySQL connection) before waiting for the next one
+      releaseThreadResources()
       self.__working = False
       if oJob.hasCallback():
         self.__resultsQueue.put( oJob, block = True )
@@ -0,0 +1,32 @@
+""" Release of the resources held by a thread between two units of work
+
+    The pools of resources shared by the threads (e.g. the MySQL connections) register the
+    function giving back what the current thread holds. The components running their units of
+    work in pooled threads (e.g. the DISET services after each request) call releaseThreadResources
+    when the thread is done with one.
+"""
+
+__RCSID__ = "$Id$"
+
+from DIRAC import gLogger
+
+gReleaseCallbackList = []
+
+
+def registerReleaseCallback(function):
+  """
+  Adds a new callback to the list, it is called without arguments in the releasing thread
+  """
+  if function not in gReleaseCallbackList:
+    gReleaseCallbackList.append(function)
+
+
+def releaseThreadResources():
+  """
+  Executes the callback list
+  """
+  for callback in gReleaseCallbackList:
+    try:
+      callback()
+    except Exception:
+      gLogger.exception("Exception while releasing the thread resources")
@@ -9,6 +9,7 @@ import time
 
 from DIRAC import S_ERROR, S_OK, gLogger
 from DIRAC.Core.Utilities.ThreadSafe import Synchronizer
+from DIRAC.Core.Utilities.ThreadResources import releaseThreadResources
 
 gSchedulerLock = Synchronizer()
 
@@ -187,6 +188,8 @@ class ThreadScheduler(object):
     except Exception as lException:
       gLogger.exception( "Exception while executing scheduled task", lException = lException )
       return False
+    finally:
+      releaseThreadResources()
     return True
 
   def __scheduleIfNeeded( self, taskId, elapsedTime = 0 ):
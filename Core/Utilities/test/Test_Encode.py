@@ -13,7 +13,8 @@ import datetime
 import sys
 
 
-from DIRAC.Core.Utilities.DEncode import encode as disetEncode, decode as disetDecode, g_dEncodeFunctions
+from DIRAC.Core.Utilities.DEncode import encode as disetEncode, decode as disetDecode, g_dEncodeFunctions, \
+    g_dDecodeFunctions, StreamDecoder
 from DIRAC.Core.Utilities.JEncode import encode as jsonEncode, decode as jsonDecode, JSerializable
 
 from hypothesis import given
@@ -286,3 +287,60 @@ def test_nestedSerializable(data):
   subObj = Serializable(instAttr=data)
   objData = Serializable(instAttr=subObj)
   agnosticTestFunction(jsonTuple, objData)
+
+
+def referenceEncode(data):
+  """ Encode with the per type functions of DEncode """
+  eList = []
+  g_dEncodeFunctions[type(data)](data, eList)
+  return "".join(eList)
+
+
+@given(data=nestedStrategy)
+def test_sameAsReference(data):
+  """ The fast codec must produce and read exactly the same stream as the per type functions """
+  encodedData = disetEncode(data)
+  assert encodedData == referenceEncode(data)
+  assert disetDecode(encodedData) == g_dDecodeFunctions[encodedData[0]](encodedData, 0)
+
+
+@given(data=nestedStrategy, chunkSize=integers(min_value=1, max_value=50))
+def test_streamDecoder(data, chunkSize):
+  """ Feeding the data in chunks gives the same result as decoding it in one go """
+  encodedData = disetEncode(data)
+  decoder = StreamDecoder()
+  for index in range(0, len(encodedData), chunkSize):
+    decoder.feed(encodedData[index:index + chunkSize])
+  assert decoder.isComplete()
+  assert decoder.getResult() == (data, len(encodedData))
+
+
+@parametrize('data', [1.5, 2.0 * 10 ** 20, 2.0 * 10 ** -10, -3.25])
+def test_streamDecoderFloat(data):
+  """ A float is only complete once we know whether an exponent follows """
+  encodedData = disetEncode([data, data])
+  decoder = StreamDecoder()
+  for char in encodedData:
+    decoder.feed(char)
+  decodedData, lenData = decoder.getResult()
+  assert decodedData == approx([data, data])
+  assert lenData == len(encodedData)
+
+
+def test_streamDecoderRemainingData():
+  """ Data after the end of the object is kept aside """
+  decoder = StreamDecoder()
+  assert not decoder.feed("ls3:ab")
+  assert decoder.feed("cei1e")
+  assert decoder.getResult() == (['abc'], 8)
+  assert decoder.getRemainingData() == "i1e"
+
+
+def test_truncatedData():
+  """ Incomplete data can not be decoded """
+  with raises(ValueError):
+    disetDecode("ls5:abc")
+  decoder = StreamDecoder()
+  decoder.feed("ls5:abc")
+  with raises(ValueError):
+    decoder.getResult()
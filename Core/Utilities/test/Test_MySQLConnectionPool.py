@@ -0,0 +1,129 @@
+""" Test the pool of MySQL connections shared by the threads
+"""
+
+# pylint: disable=redefined-outer-name, protected-access
+
+import threading
+import time
+
+import mock
+import pytest
+
+from DIRAC.Core.Utilities.MySQL import MySQL
+from DIRAC.Core.Utilities.ThreadPool import ThreadPool
+from DIRAC.Core.Utilities.ThreadResources import gReleaseCallbackList
+
+__RCSID__ = "$Id$"
+
+
+@pytest.fixture
+def connect():
+  with mock.patch('DIRAC.Core.Utilities.MySQL.MySQLdb.connect',
+                  side_effect=lambda **kwargs: mock.MagicMock()) as connectMock:
+    yield connectMock
+  del gReleaseCallbackList[:]
+
+
+def inThread(function, *args):
+  """ Run a function in another thread and return its result
+  """
+  results = []
+  thread = threading.Thread(target=lambda: results.append(function(*args)))
+  thread.start()
+  thread.join()
+  return results[0]
+
+
+def test_reuse(connect):
+  pool = MySQL.ConnectionPool('host', 'user', 'passwd', pingInterval=1000)
+  conn = pool.get('myDB')['Value']
+  assert pool.get('myDB')['Value'] is conn
+  assert pool.getStatistics()['InUse'] == 1
+  pool.release()
+  stats = pool.getStatistics()
+  assert (stats['InUse'], stats['Spares'], stats['Checkins']) == (0, 1, 1)
+
+  # The spare connection is used by the next thread, without being pinged
+  assert inThread(pool.get, 'myDB')['Value'] is conn
+  assert connect.call_count == 1
+  assert not conn.ping.called
+  conn.select_db.assert_called_once_with('myDB')
+  assert pool.getStatistics()['Checkouts'] == 2
+
+
+def test_bound(connect):
+  pool = MySQL.ConnectionPool('host', 'user', 'passwd', maxConnections=1, waitTime=0.2, pingInterval=1000)
+  conn = pool.get('myDB')['Value']
+  result = inThread(pool.get, 'myDB')
+  assert not result['OK']
+  stats = pool.getStatistics()
+  assert (stats['Timeouts'], stats['Connections'], stats['Waiting']) == (1, 1, 0)
+
+  # A waiting thread gets the connection as soon as it is checked in
+  pool = MySQL.ConnectionPool('host', 'user', 'passwd', maxConnections=1, waitTime=10, pingInterval=1000)
+  conn = pool.get('myDB')['Value']
+  results = []
+  thread = threading.Thread(target=lambda: results.append(pool.get('myDB')))
+  thread.start()
+  time.sleep(0.1)
+  assert pool.getStatistics()['Waiting'] == 1
+  pool.release()
+  thread.join()
+  assert results[0]['Value'] is conn
+  assert pool.getStatistics()['Waits'] == 1
+
+
+def test_ping(connect):
+  pool = MySQL.ConnectionPool('host', 'user', 'passwd', pingInterval=0.05)
+  conn = pool.get('myDB')['Value']
+  time.sleep(0.1)
+  # The connection idle for longer than the ping interval is checked, and replaced if lost
+  conn.ping.side_effect = Exception("MySQL server has gone away")
+  newConn = pool.get('myDB')['Value']
+  assert newConn is not conn
+  assert conn.close.called
+  stats = pool.getStatistics()
+  assert stats['FailedPings'] >= 1
+  assert (stats['Reconnects'], stats['Connections']) == (1, 1)
+
+  pool.discardConnection()
+  assert pool.getStatistics()['Connections'] == 0
+
+
+def test_reclaimDead(connect):
+  pool = MySQL.ConnectionPool('host', 'user', 'passwd', maxConnections=1, waitTime=0.2, pingInterval=1000)
+  # The connection of a thread that ended without checking it in is reused at once when the pool is full
+  conn = inThread(pool.get, 'myDB')['Value']
+  assert pool.get('myDB')['Value'] is conn
+  stats = pool.getStatistics()
+  assert (stats['Checkins'], stats['Waits'], stats['Connections']) == (1, 0, 1)
+
+
+def test_releasedByThreadPool(connect):
+  pool = MySQL.ConnectionPool('host', 'user', 'passwd', maxConnections=1, waitTime=0.2, pingInterval=1000)
+  threadPool = ThreadPool(1, 1)
+  results = []
+  threadPool.generateJobAndQueueIt(lambda: results.append(pool.get('myDB')))
+  threadPool.processAllResults()
+  # The worker thread is still alive but checked its connection in at the end of the job
+  conn = results[0]['Value']
+  assert threadPool.numWaitingThreads() == 1
+  assert pool.get('myDB')['Value'] is conn
+  assert pool.getStatistics()['Waits'] == 0
+
+
+def test_cleanKeepsLiveThreads(connect):
+  pool = MySQL.ConnectionPool('host', 'user', 'passwd', graceTime=0, pingInterval=1000)
+  conn = pool.get('myDB')['Value']
+  assert pool.transactionStart('myDB')['OK']
+  # The connection of a live thread is kept however long it is used, without its transaction rolled back
+  pool.clean(time.time() + 3600)
+  assert pool.get('myDB')['Value'] is conn
+  assert pool.getStatistics()['Checkins'] == 0
+  assert not any(call[0][0] == 'ROLLBACK' for call in conn.cursor.return_value.execute.call_args_list)
+
+  # The connection of a dead thread is checked in
+  inThread(pool.get, 'myDB')
+  pool.clean()
+  stats = pool.getStatistics()
+  assert (stats['InUse'], stats['Checkins']) == (1, 1)
@@ -0,0 +1,84 @@
+""" Test the parametrised statements built by the MySQL helper methods
+"""
+
+# pylint: disable=redefined-outer-name, protected-access
+
+import mock
+import pytest
+
+from DIRAC import S_OK
+from DIRAC.Core.Utilities.MySQL import MySQL, MAXINLISTSIZE
+from DIRAC.Core.Utilities.ThreadResources import gReleaseCallbackList
+
+__RCSID__ = "$Id$"
+
+
+@pytest.fixture
+def db():
+  """ MySQL object whose connection records the executed statements and their arguments
+  """
+  executed = []
+
+  def execute(cmd, args=None):
+    executed.append((cmd, args))
+    return 1
+
+  connection = mock.MagicMock()
+  connection.cursor.return_value.execute.side_effect = execute
+  connection.cursor.return_value.fetchall.side_effect = lambda: ((len(executed[-1][1][-1]),),)
+  connection.cursor.return_value.lastrowid = None
+  with mock.patch('DIRAC.Core.Utilities.MySQL.MySQLdb.connect', return_value=connection):
+    mysql = MySQL('host', 'user', 'passwd', 'myDB')
+  with mock.patch.object(MySQL, '_getConnection', return_value=S_OK(connection)):
+    yield mysql, executed
+  del gReleaseCallbackList[:]
+
+
+def test_condition(db):
+  mysql, _executed = db
+  condition, args = mysql.buildParametrizedCondition(condDict={'Status': ['Waiting', 'Running'], 'JobID': 5},
+                                                     older='UTC_TIMESTAMP()', timeStamp='LastUpdate',
+                                                     orderAttribute='JobID:DESC', limit=10)
+  assert 'WHERE ' in condition
+  assert '`Status` IN %s' in condition
+  assert '`JobID` = %s' in condition
+  assert '`LastUpdate` < UTC_TIMESTAMP()' in condition
+  assert condition.endswith(' ORDER BY `JobID` DESC LIMIT 10')
+  assert sorted(args) == sorted([('Waiting', 'Running'), '5'])
+
+  # The values are not escaped in the condition anymore
+  condition, args = mysql.buildParametrizedCondition(condDict={'LFN': "/a/b'c"})
+  assert condition == 'WHERE `LFN` = %s'
+  assert args == ["/a/b'c"]
+
+
+def test_chunks(db):
+  mysql, executed = db
+  jobIDs = range(MAXINLISTSIZE * 2 + 10)
+  result = mysql.getFields('Jobs', ['Status'], condDict={'JobID': jobIDs})
+  assert result['OK']
+  assert [cmd for cmd, _args in executed] == ['SELECT `Status` FROM `Jobs` WHERE `JobID` IN %s'] * 3
+  assert [len(args[0]) for _cmd, args in executed] == [MAXINLISTSIZE, MAXINLISTSIZE, 10]
+  # The counts of the chunks are added up
+  assert mysql.countEntries('Jobs', {'JobID': jobIDs})['Value'] == len(jobIDs)
+
+  # The repeated values are selected once, as with a single statement
+  del executed[:]
+  assert mysql.countEntries('Jobs', {'JobID': jobIDs + jobIDs[:MAXINLISTSIZE]})['Value'] == len(jobIDs)
+  assert [len(args[0]) for _cmd, args in executed] == [MAXINLISTSIZE, MAXINLISTSIZE, 10]
+
+  # The limit applies to the whole list, which is not split
+  del executed[:]
+  assert mysql.getFields('Jobs', ['Status'], condDict={'JobID': jobIDs}, limit=5)['OK']
+  assert len(executed) == 1
+  assert executed[0][0].endswith('LIMIT 5')
+
+
+def test_insert(db):
+  mysql, executed = db
+  assert mysql.insertFields('Jobs', ['Status', 'SubmissionTime', 'Site'],
+                            ['Received', 'UTC_TIMESTAMP()', "Site's"])['OK']
+  cmd, args = executed[0]
+  assert cmd == 'INSERT INTO `Jobs` (  `Status`, `SubmissionTime`, `Site` ) VALUES (  %s, UTC_TIMESTAMP(), %s )'
+  assert args == ['Received', "Site's"]
+  assert not mysql.insertFields('Jobs', ['SubmissionTime'], ['TIMESTAMPDIFF(SECOND, Foo)'])['OK']
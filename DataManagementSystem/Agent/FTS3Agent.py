@@ -68,7 +68,8 @@ class FTS3Agent(AgentModule):
 
     srvDict = res['Value']
     serverPolicyType = opHelper().getValue('DataManagement/FTSPlacement/FTS3/ServerPolicy', 'Random')
-    self._serverPolicy = FTS3Utilities.FTS3ServerPolicy(srvDict, serverPolicy=serverPolicyType)
+    self._serverPolicy = FTS3Utilities.FTS3ServerPolicy(srvDict, serverPolicy=serverPolicyType,
+                                                        linkModel=self._linkModel)
 
     # List of third party protocols for transfers
     self.thirdPartyProtocols = DMSHelpers().getThirdPartyProtocols()
@@ -79,12 +80,20 @@ class FTS3Agent(AgentModule):
     self.operationBulkSize = self.am_getOption("OperationBulkSize", 20)
     # Number of Jobs we treat in one loop
     self.jobBulkSize = self.am_getOption("JobBulkSize", 20)
+    # Monitor the jobs of a server with a single query per group of jobs
+    self.bulkMonitoring = self.am_getOption("BulkMonitoring", False)
+    # Number of Jobs monitored in one query
+    self.monitoringBulkSize = self.am_getOption("MonitoringBulkSize", 50)
     self.maxFilesPerJob = self.am_getOption("MaxFilesPerJob", 100)
     self.maxAttemptsPerFile = self.am_getOption("MaxAttemptsPerFile", 256)
     self.kickDelay = self.am_getOption("KickAssignedHours", 1)
     self.maxKick = self.am_getOption("KickLimitPerCycle", 100)
     self.deleteDelay = self.am_getOption("DeleteGraceDays", 180)
     self.maxDelete = self.am_getOption("DeleteLimitPerCycle", 100)
+    # Choose the sources and the size of the jobs from the observed throughput of the links
+    self.throughputOptimization = self.am_getOption("ThroughputOptimization", False)
+    self._linkModel.targetJobDuration = self.am_getOption("TargetJobDuration", 3600)
+    self._linkModel.halfLife = self.am_getOption("LinkHistoryHalfLife", 3600)
 
     return S_OK()
 
@@ -93,6 +102,9 @@ class FTS3Agent(AgentModule):
 
     self._globalContextCache = {}
 
+    # Throughput of the links and load of the servers, fed by the monitoring
+    self._linkModel = FTS3Utilities.FTS3LinkModel()
+
     # name that will be used in DB for assignment tag
     self.assignmentTag = gethostname().split('.')[0]
 
@@ -215,6 +227,7 @@ class FTS3Agent(AgentModule):
       res = self.fts3db.updateJobStatus(upDict)
 
       if ftsJob.status in ftsJob.FINAL_STATES:
+        self._linkModel.addJob(ftsJob)
         self.__sendAccounting(ftsJob)
 
       return ftsJob, res
@@ -236,10 +249,98 @@ class FTS3Agent(AgentModule):
     else:
       log.debug("Successfully updated job status")
 
+  def _monitorJobsBulk(self, ftsJobs):
+    """
+        * query the FTS server for the status of all the jobs at once
+        * update the status of the FTSFiles that changed
+        * update the status of the FTSJobs
+
+        The jobs are expected to have the same user, group and fts server.
+    """
+    # General try catch to avoid that the tread dies
+    try:
+      threadID = current_process().name
+      ftsJob = ftsJobs[0]
+      log = gLogger.getSubLogger("_monitorJobsBulk/%s" % ftsJob.ftsServer, child=True)
+
+      res = self.getFTS3Context(
+          ftsJob.username, ftsJob.userGroup, ftsJob.ftsServer, threadID=threadID)
+
+      if not res['OK']:
+        log.error("Error getting context", res)
+        return ftsJobs, res
+
+      context = res['Value']
+
+      res = FTS3Job.monitorJobs(ftsJobs, context)
+
+      if not res['OK']:
+        log.error("Error monitoring jobs", res)
+        return ftsJobs, res
+
+      jobsStatus = res['Value']
+
+      # { ftsGUID : { fileID : { Status, Error } } }
+      filesStatus = {}
+      upDict = {}
+      monitoredJobs = []
+      for ftsJob in ftsJobs:
+        res = jobsStatus.get(ftsJob.ftsGUID, S_ERROR("FTSGUID not set, FTS job not submitted?"))
+        if not res['OK']:
+          log.error("Error monitoring job", "%s: %s" % (ftsJob.jobID, res['Message']))
+          continue
+
+        filesStatus[ftsJob.ftsGUID] = res['Value']
+        upDict[ftsJob.jobID] = {
+            'status': ftsJob.status,
+            'error': ftsJob.error,
+            'completeness': ftsJob.completeness,
+        }
+        monitoredJobs.append(ftsJob)
+
+      # The files are only updated if they are still attached to the job ftsGUID
+      res = self.fts3db.updateFileStatusBulk(filesStatus)
+
+      if not res['OK']:
+        log.error("Error updating file fts status", res)
+        return ftsJobs, res
+
+      log.debug("%s files updated" % res['Value'])
+
+      res = self.fts3db.updateJobStatusBulk(upDict)
+
+      if not res['OK']:
+        log.error("Error updating job status", res)
+        return ftsJobs, res
+
+      for ftsJob in monitoredJobs:
+        if ftsJob.status in ftsJob.FINAL_STATES:
+          self._linkModel.addJob(ftsJob)
+          self.__sendAccounting(ftsJob)
+
+      return ftsJobs, S_OK(len(monitoredJobs))
+
+    except Exception as e:
+      return ftsJobs, S_ERROR(0, "Exception %s" % repr(e))
+
+  @staticmethod
+  def _monitorJobsBulkCallback(returnedValue):
+    """ Callback when jobs have been monitored in bulk
+        :param returnedValue: value returned by the _monitorJobsBulk method
+                              (list of ftsJobs, standard dirac return struct)
+    """
+
+    ftsJobs, res = returnedValue
+    log = gLogger.getSubLogger("_monitorJobsBulkCallback/%s" % ftsJobs[0].ftsServer, child=True)
+    if not res['OK']:
+      log.error("Error updating jobs status", res)
+    else:
+      log.debug("Successfully updated jobs status", "%s/%s" % (res['Value'], len(ftsJobs)))
+
   def monitorJobsLoop(self):
     """
         * fetch the active FTSJobs from the DB
-        * spawn a thread to monitor each of them
+        * spawn a thread to monitor each of them, or each group of them in bulk mode
     """
 
     log = gLogger.getSubLogger("monitorJobs", child=True)
@@ -260,19 +361,33 @@ class FTS3Agent(AgentModule):
     applyAsyncResults = []
 
     # Starting the monitoring threads
-    for ftsJob in activeJobs:
-      log.debug("Queuing executing of ftsJob %s" % ftsJob.jobID)
-      # queue the execution of self._monitorJob( ftsJob ) in the thread pool
-      # The returned value is passed to _monitorJobCallback
-      applyAsyncResults.append(self.jobsThreadPool.apply_async(
-          self._monitorJob, (ftsJob, ), callback=self._monitorJobCallback))
+    if self.bulkMonitoring:
+      # Group the jobs sharing the same context
+      jobsByContext = {}
+      for ftsJob in activeJobs:
+        jobsByContext.setdefault((ftsJob.username, ftsJob.userGroup, ftsJob.ftsServer), []).append(ftsJob)
+
+      for ftsJobs in jobsByContext.itervalues():
+        for i in xrange(0, len(ftsJobs), self.monitoringBulkSize):
+          log.debug("Queuing executing of %s ftsJobs" % len(ftsJobs[i:i + self.monitoringBulkSize]))
+          # queue the execution of self._monitorJobsBulk( ftsJobs ) in the thread pool
+          # The returned value is passed to _monitorJobsBulkCallback
+          applyAsyncResults.append(self.jobsThreadPool.apply_async(
+              self._monitorJobsBulk, (ftsJobs[i:i + self.monitoringBulkSize], ),
+              callback=self._monitorJobsBulkCallback))
+    else:
+      for ftsJob in activeJobs:
+        log.debug("Queuing executing of ftsJob %s" % ftsJob.jobID)
+        # queue the execution of self._monitorJob( ftsJob ) in the thread pool
+        # The returned value is passed to _monitorJobCallback
+        applyAsyncResults.append(self.jobsThreadPool.apply_async(
+            self._monitorJob, (ftsJob, ), callback=self._monitorJobCallback))
 
     log.debug("All execution queued")
 
     # Waiting for all the monitoring to finish
-    while not all([r.ready() for r in applyAsyncResults]):
-      log.debug("Not all the tasks are finished")
-      time.sleep(0.5)
+    for applyAsyncResult in applyAsyncResults:
+      applyAsyncResult.wait()
 
     log.debug("All the tasks have completed")
     return S_OK()
@@ -324,7 +439,8 @@ class FTS3Agent(AgentModule):
         log.debug("FTS3Operation %s is not totally processed yet" % operation.operationID)
 
         res = operation.prepareNewJobs(
-            maxFilesPerJob=self.maxFilesPerJob, maxAttemptsPerFile=self.maxAttemptsPerFile)
+            maxFilesPerJob=self.maxFilesPerJob, maxAttemptsPerFile=self.maxAttemptsPerFile,
+            linkModel=self._linkModel if self.throughputOptimization else None)
 
         if not res['OK']:
           log.error("Cannot prepare new Jobs", "FTS3Operation %s : %s" %
@@ -365,6 +481,7 @@ class FTS3Agent(AgentModule):
           operation.ftsJobs.append(ftsJob)
 
           submittedFileIds = res['Value']
+          self._linkModel.addSubmission(ftsServer, len(submittedFileIds))
           log.info("FTS3Operation %s: Submitted job for %s transfers" %
                    (operation.operationID, len(submittedFileIds)))
 
@@ -5,6 +5,7 @@ __RCSID__ = "$Id $"
 
 import datetime
 import errno
+import json
 
 # Requires at least version 3.3.3
 import fts3.rest.client.easy as fts3
@@ -24,6 +25,9 @@ from DIRAC.DataManagementSystem.Client.FTS3File import FTS3File
 # 3 days in seconds
 BRING_ONLINE_TIMEOUT = 259200
 
+# Fields of the files needed from the job status (monitoring and accounting)
+MONITORED_FILE_FIELDS = ['file_state', 'file_metadata', 'reason', 'filesize', 'tx_duration']
+
 
 class FTS3Job(FTS3Serializable):
   """ Abstract class to represent a job to be executed by FTS. It belongs
@@ -114,6 +118,55 @@ class FTS3Job(FTS3Serializable):
     except FTS3ClientException as e:
       return S_ERROR("Error getting the job status %s" % e)
 
+    return self._processJobStatus(jobStatusDict)
+
+  @staticmethod
+  def monitorJobs(ftsJobs, context):
+    """ Queries the fts server to monitor several jobs in a single call.
+        All the jobs are expected to be on the server of the context.
+
+        :param ftsJobs: list of FTS3Job, with their ftsGUID set
+        :param context: fts3 context
+
+        :returns: S_OK( { ftsGUID : result of the monitoring of the job, like for monitor } )
+    """
+
+    jobsByGUID = dict((ftsJob.ftsGUID, ftsJob) for ftsJob in ftsJobs if ftsJob.ftsGUID)
+    if not jobsByGUID:
+      return S_OK({})
+
+    try:
+      # The bulk query of the REST interface returns a list, or a dictionary for a single job
+      jobStatusDicts = json.loads(context.get("/jobs/%s?files=%s" % (','.join(jobsByGUID),
+                                                                      ','.join(MONITORED_FILE_FIELDS))))
+    except (FTS3ClientException, ValueError) as e:
+      return S_ERROR("Error getting the jobs status %s" % e)
+    if isinstance(jobStatusDicts, dict):
+      jobStatusDicts = [jobStatusDicts]
+
+    jobsStatus = dict((ftsGUID, S_ERROR(errno.ENOENT, "Job %s not returned by the server" % ftsGUID))
+                      for ftsGUID in jobsByGUID)
+    for jobStatusDict in jobStatusDicts:
+      ftsGUID = jobStatusDict.get('job_id')
+      if ftsGUID not in jobsByGUID:
+        continue
+      # Unknown or forbidden jobs are reported individually
+      httpStatus = str(jobStatusDict.get('http_status', '200'))
+      if not httpStatus.startswith('200'):
+        jobsStatus[ftsGUID] = S_ERROR("Error getting the job status %s" % httpStatus)
+        continue
+      jobsStatus[ftsGUID] = jobsByGUID[ftsGUID]._processJobStatus(jobStatusDict)
+
+    return S_OK(jobsStatus)
+
+  def _processJobStatus(self, jobStatusDict):
+    """ Updates the job from the status returned by the fts server
+
+        :param jobStatusDict: status of the job, as returned by fts3.get_job_status
+
+        :returns {FileID: { status, error } }
+    """
+
     now = datetime.datetime.utcnow().replace(microsecond=0)
     self.lastMonitor = now
 
@@ -244,11 +244,12 @@ class FTS3Operation(FTS3Serializable):
 
     return res
 
-  def prepareNewJobs(self, maxFilesPerJob=100, maxAttemptsPerFile=10):
+  def prepareNewJobs(self, maxFilesPerJob=100, maxAttemptsPerFile=10, linkModel=None):
     """ Prepare the new jobs that have to be submitted
 
         :param maxFilesPerJob: maximum number of files assigned to a job
         :param maxAttemptsPerFile: maximum number of retry after an fts failure
+        :param linkModel: if given, FTS3LinkModel used to choose the sources and the size of the jobs
 
         :return: list of jobs
     """
@@ -370,7 +371,7 @@ class FTS3TransferOperation(FTS3Operation):
   """ Class to be used for a Replication operation
   """
 
-  def prepareNewJobs(self, maxFilesPerJob=100, maxAttemptsPerFile=10):
+  def prepareNewJobs(self, maxFilesPerJob=100, maxAttemptsPerFile=10, linkModel=None):
 
     log = self._log.getSubLogger("_prepareNewJobs", child=True)
 
@@ -401,7 +402,10 @@ class FTS3TransferOperation(FTS3Operation):
 
       sourceSEs = self.sourceSEs.split(',') if self.sourceSEs is not None else []
       # { sourceSE : [FTSFiles] }
-      res = FTS3Utilities.selectUniqueRandomSource(ftsFiles, allowedSources=sourceSEs)
+      if linkModel:
+        res = FTS3Utilities.selectSourceByThroughput(ftsFiles, linkModel, allowedSources=sourceSEs)
+      else:
+        res = FTS3Utilities.selectUniqueRandomSource(ftsFiles, allowedSources=sourceSEs)
 
       if not res['OK']:
         return res
@@ -411,7 +415,12 @@ class FTS3TransferOperation(FTS3Operation):
       # We don't need to check the source, since it is already filtered by the DataManager
       for sourceSE, ftsFiles in uniqueTransfersBySource.iteritems():
 
-        for ftsFilesChunk in breakListIntoChunks(ftsFiles, maxFilesPerJob):
+        if linkModel:
+          ftsFilesChunks = FTS3Utilities.packFilesInJobs(ftsFiles, sourceSE, targetSE, linkModel, maxFilesPerJob)
+        else:
+          ftsFilesChunks = breakListIntoChunks(ftsFiles, maxFilesPerJob)
+
+        for ftsFilesChunk in ftsFilesChunks:
 
           newJob = self._createNewJob('Transfer', ftsFilesChunk, targetSE, sourceSE=sourceSE)
 
@@ -509,7 +518,7 @@ class FTS3StagingOperation(FTS3Operation):
   """ Class to be used for a Staging operation
   """
 
-  def prepareNewJobs(self, maxFilesPerJob=100, maxAttemptsPerFile=10):
+  def prepareNewJobs(self, maxFilesPerJob=100, maxAttemptsPerFile=10, linkModel=None):
 
     log = gLogger.getSubLogger("_prepareNewJobs", child=True)
 
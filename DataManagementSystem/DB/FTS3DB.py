@@ -15,7 +15,7 @@ from sqlalchemy.sql.expression import and_
 from sqlalchemy.orm import relationship, sessionmaker, mapper
 from sqlalchemy.sql import update, delete
 from sqlalchemy import create_engine, Table, Column, MetaData, ForeignKey, \
-    Integer, String, DateTime, Enum, BigInteger, SmallInteger, Float, func, text
+    Integer, String, DateTime, Enum, BigInteger, SmallInteger, Float, func, text, case
 
 # # from DIRAC
 from DIRAC import S_OK, S_ERROR, gLogger
@@ -443,6 +443,122 @@ class FTS3DB(object):
     finally:
       session.close()
 
+  def updateFileStatusBulk(self, fileStatusDict):
+    """ Update the status of the files monitored in several jobs, in a single transaction.
+        Only the files whose status, error or ftsGUID changed are written, with one
+        multi-row statement per set of new values.
+        As in updateFileStatus, the files in a final state and the files taken by
+        another job are not updated.
+
+       :param fileStatusDict: { ftsGUID of the job : { fileID : { status , error, ftsGUID } } }
+
+       :returns: S_OK with the number of files updated
+    """
+
+    allFileIDs = set()
+    for filesStatus in fileStatusDict.itervalues():
+      allFileIDs.update(filesStatus)
+    if not allFileIDs:
+      return S_OK(0)
+
+    session = self.dbSession()
+    try:
+
+      currentFiles = dict((fileID, (status, error, ftsGUID)) for fileID, status, error, ftsGUID in
+                          session.query(FTS3File.fileID, FTS3File.status, FTS3File.error, FTS3File.ftsGUID)
+                          .filter(FTS3File.fileID.in_(allFileIDs)))
+
+      # { (job ftsGUID, sorted tuple of the new values) : [fileIDs] }
+      filesToUpdate = {}
+      for jobGUID, filesStatus in fileStatusDict.iteritems():
+        for fileID, valueDict in filesStatus.iteritems():
+          if fileID not in currentFiles:
+            continue
+          status, error, ftsGUID = currentFiles[fileID]
+          if status in FTS3File.FINAL_STATES or ftsGUID != jobGUID:
+            continue
+
+          # Replace empty strings with None, and keep only the changed values
+          newValues = {'status': valueDict['status']}
+          if 'error' in valueDict:
+            newValues['error'] = valueDict['error'] or None
+          if 'ftsGUID' in valueDict:
+            newValues['ftsGUID'] = valueDict['ftsGUID'] or None
+          current = {'status': status, 'error': error, 'ftsGUID': ftsGUID}
+          if all(current[key] == value for key, value in newValues.iteritems()):
+            continue
+
+          filesToUpdate.setdefault((jobGUID, tuple(sorted(newValues.items()))), []).append(fileID)
+
+      rowCount = 0
+      for (jobGUID, newValues), fileIDs in filesToUpdate.iteritems():
+        result = session.execute(update(FTS3File)
+                                 .where(and_(FTS3File.fileID.in_(fileIDs),
+                                             ~ FTS3File.status.in_(FTS3File.FINAL_STATES),
+                                             FTS3File.ftsGUID == jobGUID
+                                             )
+                                        )
+                                 .values(dict((getattr(FTS3File, key), value) for key, value in newValues))
+                                 )
+        rowCount += result.rowcount
+
+      session.commit()
+
+      return S_OK(rowCount)
+
+    except SQLAlchemyError as e:
+      session.rollback()
+      self.log.exception("updateFileStatusBulk: unexpected exception", lException=e)
+      return S_ERROR("updateFileStatusBulk: unexpected exception %s" % e)
+    finally:
+      session.close()
+
+  def updateJobStatusBulk(self, jobStatusDict):
+    """ Update the status of several jobs in a single statement.
+        As in updateJobStatus, the update is only done if the job is not in a final state,
+        the monitoring time is set and the assignment flag is released
+
+       :param jobStatusDict: { jobID : { status , error, completeness } }
+    """
+
+    if not jobStatusDict:
+      return S_OK()
+
+    session = self.dbSession()
+    try:
+
+      jobIDs = list(jobStatusDict)
+      updateDict = {FTS3Job.status: case(dict((jobID, valueDict['status'])
+                                              for jobID, valueDict in jobStatusDict.iteritems()),
+                                         value=FTS3Job.jobID),
+                    # Replace empty string with None
+                    FTS3Job.error: case(dict((jobID, valueDict.get('error') or None)
+                                             for jobID, valueDict in jobStatusDict.iteritems()),
+                                        value=FTS3Job.jobID),
+                    FTS3Job.completeness: case(dict((jobID, valueDict.get('completeness'))
+                                                    for jobID, valueDict in jobStatusDict.iteritems()),
+                                               value=FTS3Job.jobID),
+                    FTS3Job.lastMonitor: func.utc_timestamp(),
+                    FTS3Job.assignment: None}
+
+      session.execute(update(FTS3Job)
+                      .where(and_(FTS3Job.jobID.in_(jobIDs),
+                                  ~ FTS3Job.status.in_(FTS3Job.FINAL_STATES)
+                                  )
+                             )
+                      .values(updateDict)
+                      )
+      session.commit()
+
+      return S_OK()
+
+    except SQLAlchemyError as e:
+      session.rollback()
+      self.log.exception("updateJobStatusBulk: unexpected exception", lException=e)
+      return S_ERROR("updateJobStatusBulk: unexpected exception %s" % e)
+    finally:
+      session.close()
+
   def getNonFinishedOperations(self, limit=20, operationAssignmentTag="Assigned"):
     """ Get all the non assigned FTS3Operations that are not yet finished, so either Active or Processed.
         An operation won't be picked if it is already assigned, or one of its job is.
@@ -1,4 +1,11 @@
 """ DIRAC FileCatalog plug-in class to manage dynamic datasets defined by a metadata query
+
+    The files of the datasets are materialised in the FC_MetaDatasetFiles table, together with
+    their number, total size and digest in FC_MetaDatasetCounters. The contents of the dynamic
+    datasets are updated when files are added, removed or get their metadata changed, so that
+    the metadata query of a dataset is only evaluated in full when it is created or updated.
+    Only the datasets the path of which can contain the changes are evaluated for them, and the
+    queries are always evaluated with the credentials of the owner of the dataset.
 """
 
 __RCSID__ = "$Id$"
@@ -7,7 +14,28 @@ import hashlib
 import os
 
 from DIRAC import S_OK, S_ERROR, gLogger
-from DIRAC.Core.Utilities.List import stringListToString
+from DIRAC.ConfigurationSystem.Client.Helpers.Registry import getPropertiesForGroup
+from DIRAC.Core.Utilities.List import stringListToString, breakListIntoChunks
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.FileManagerBase import FILESPAGESIZE
+
+
+def getFilesDigest( fileIDs, digest = 0 ):
+  """ Digest of a set of files independent of their order: the XOR of the MD5 digests of their IDs,
+      so that it is updated for files added to or removed from the set by XORing their digests
+
+      :param fileIDs: iterable of file IDs
+      :param int digest: digest of the set the files are added to or removed from
+      :return: int
+  """
+  for fileID in fileIDs:
+    digest ^= int( hashlib.md5( str( fileID ) ).hexdigest(), 16 )
+  return digest
+
+
+def _isInPath( path, parent ):
+  """ Check if the path is the parent directory or one of its descendants """
+  return parent == '/' or path == parent or path.startswith( parent.rstrip( '/' ) + '/' )
+
 
 class DatasetManager( object ):
 
@@ -36,6 +64,15 @@ class DatasetManager( object ):
                                                },
                                      "UniqueIndexes": {"DatasetID_FileID":["DatasetID","FileID"]}
                                    }
+  _tables["FC_MetaDatasetCounters"] = { "Fields": {
+                                                   "DatasetID": "INT NOT NULL",
+                                                   "NumberOfFiles": "INT NOT NULL DEFAULT 0",
+                                                   "TotalSize": "BIGINT NOT NULL DEFAULT 0",
+                                                   "DatasetHash": "CHAR(36) NOT NULL DEFAULT ''",
+                                                   "LastUpdate": "DATETIME"
+                                                  },
+                                        "PrimaryKey": "DatasetID"
+                                      }
   _tables["FC_DatasetAnnotations"] = { "Fields": {
                                                   "DatasetID": "INT NOT NULL",
                                                   "Annotation": "VARCHAR(512)"
@@ -103,13 +140,6 @@ class DatasetManager( object ):
 
   def __addDataset( self, datasetName, metaQuery, credDict, uid, gid ):
 
-    result = self.__getMetaQueryParameters( metaQuery, credDict )
-    if not result['OK']:
-      return result
-    totalSize = result['Value']['TotalSize']
-    datasetHash = result['Value']['DatasetHash']
-    numberOfFiles = result['Value']['NumberOfFiles']
-
     result = self.db.fileManager._getStatusInt( 'Dynamic' )
     if not result['OK']:
       return result
@@ -130,18 +160,18 @@ class DatasetManager( object ):
         return result
       dirID = result['Value']
 
-    # Add the new dataset entry now
+    # Add the new dataset entry now, its parameters are set once its contents are materialised
     inDict = {
                'DatasetName': dsName,
                'MetaQuery': str(metaQuery),
                'DirID': dirID,
-               'TotalSize': totalSize,
-               'NumberOfFiles': numberOfFiles,
+               'TotalSize': 0,
+               'NumberOfFiles': 0,
                'UID': uid,
                'GID': gid,
                'CreationDate': 'UTC_TIMESTAMP()',
                'ModificationDate': 'UTC_TIMESTAMP()',
-               'DatasetHash': datasetHash,
+               'DatasetHash': '',
                'Status': intStatus
              }
     result = self.db.insertFields( 'FC_MetaDatasets', inDict = inDict )
@@ -151,8 +181,16 @@ class DatasetManager( object ):
       else:
         return result
     datasetID = result['lastRowId']
+
+    result = self.__materialiseDataset( datasetID, metaQuery )
+    if result['OK']:
+      result = self.__recordParameters( datasetID )
+    if not result['OK']:
+      gLogger.error( 'Failed to materialise dataset', '%s: %s' % ( datasetName, result['Message'] ) )
+      self.__deleteDataset( datasetID )
+      return S_ERROR( 'Failed to apply the metaQuery' )
     return S_OK( datasetID )
-  
+
   def _getDatasetDirectories( self, datasets ):
     dirDict = {}
     for path in datasets:
@@ -309,39 +347,414 @@ class DatasetManager( object ):
       
     return S_OK( {'Successful':successful, 'Failed':failed} )  
 
-  def __getMetaQueryParameters( self, metaQuery, credDict ):
-    """ Get parameters ( hash, total size, number of files ) for the given metaquery
+  def __inTransaction( self, function, *args ):
+    """ Execute a function in a transaction, committed if it returns S_OK, rolled back otherwise
+    """
+    result = self.db.transactionStart()
+    if not result['OK']:
+      return result
+    result = function( *args )
+    if not result['OK']:
+      self.db.transactionRollback()
+      return result
+    commitResult = self.db.transactionCommit()
+    if not commitResult['OK']:
+      return commitResult
+    return result
+
+  def __lockCounters( self, datasetID, create = False ):
+    """ Get the counters of the materialised contents of a dataset, locking them until the end of
+        the transaction so that the changes of the contents of a dataset are serialised
+
+        :param bool create: create the counters if the contents are not materialised yet
+        :return: S_OK( [ number of files, total size, digest ] ), S_OK( None ) if not materialised
     """
+    if create:
+      req = "INSERT IGNORE INTO FC_MetaDatasetCounters (DatasetID,LastUpdate) VALUES (%s,UTC_TIMESTAMP())"
+      result = self.db._update( req, args = ( datasetID, ) )
+      if not result['OK']:
+        return result
+    req = "SELECT NumberOfFiles,TotalSize,DatasetHash FROM FC_MetaDatasetCounters WHERE DatasetID=%s FOR UPDATE"
+    result = self.db._query( req, args = ( datasetID, ) )
+    if not result['OK']:
+      return result
+    if not result['Value']:
+      return S_OK( None )
+    numberOfFiles, totalSize, datasetHash = result['Value'][0]
+    return S_OK( [ int( numberOfFiles ), int( totalSize ), int( datasetHash, 16 ) if datasetHash else 0 ] )
+
+  def __getFileSizes( self, fileIDs ):
+    """ Get the sizes of the given files, { fileID : size } """
+    if not fileIDs:
+      return S_OK( {} )
+    result = self.db._queryInChunks( "SELECT FileID,Size FROM FC_Files WHERE FileID IN %s", [ list( fileIDs ) ] )
+    if not result['OK']:
+      return result
+    return S_OK( dict( ( fileID, int( size ) ) for fileID, size in result['Value'] ) )
+
+  def __changeContents( self, datasetID, counters, added, removed ):
+    """ Add files to and remove files from the materialised contents of a dataset and update its
+        counters, to be called in a transaction with the counters locked
+
+        :param list counters: current counters as returned by __lockCounters, None if not materialised
+        :param dict added: { fileID : size } of the files to add
+        :param dict removed: { fileID : size } of the files to remove
+    """
+    for chunk in breakListIntoChunks( sorted( added ), 1000 ):
+      req = "INSERT IGNORE INTO FC_MetaDatasetFiles (DatasetID,FileID) VALUES %s" % \
+            ','.join( ['(%s,%s)'] * len( chunk ) )
+      args = []
+      for fileID in chunk:
+        args.extend( [ datasetID, fileID ] )
+      result = self.db._update( req, args = args )
+      if not result['OK']:
+        return result
+    if removed:
+      req = "DELETE FROM FC_MetaDatasetFiles WHERE DatasetID=%s AND FileID IN %s"
+      result = self.db._updateInChunks( req, [ datasetID, sorted( removed ) ] )
+      if not result['OK']:
+        return result
+    if counters is None or ( not added and not removed ):
+      return S_OK()
+
+    numberOfFiles, totalSize, digest = counters
+    numberOfFiles += len( added ) - len( removed )
+    totalSize += sum( added.values() ) - sum( removed.values() )
+    digest = getFilesDigest( added.keys() + removed.keys(), digest )
+    return self.__setCounters( datasetID, numberOfFiles, totalSize, digest )
+
+  def __setCounters( self, datasetID, numberOfFiles, totalSize, digest ):
+    """ Set the counters of the materialised contents of a dataset """
+    req = "UPDATE FC_MetaDatasetCounters SET NumberOfFiles=%s, TotalSize=%s, DatasetHash=%s, "
+    req += "LastUpdate=UTC_TIMESTAMP() WHERE DatasetID=%s"
+    return self.db._update( req, args = ( numberOfFiles, totalSize, '%032X' % digest, datasetID ) )
+
+  def __syncContents( self, datasetID, selected, scopeFileIDs = None, scopeDirID = 0 ):
+    """ Synchronise the materialised contents of a dataset with the files selected by its metadata
+        query within a scope: the given files, the subtree of a directory or the whole dataset.
+        Within a scope limited to files or to a subtree, the contents are only updated if they are
+        already materialised. For the whole dataset they are created if needed and counted anew
+
+        :param dict selected: { fileID : lfn } of the files of the scope selected by the query
+        :param list scopeFileIDs: files the scope is limited to
+        :param int scopeDirID: directory to the subtree of which the scope is limited
+    """
+    fullScope = scopeFileIDs is None and not scopeDirID
+    result = self.__lockCounters( datasetID, create = fullScope )
+    if not result['OK']:
+      return result
+    counters = result['Value']
+    if counters is None:
+      return S_OK()
+
+    if scopeFileIDs is not None:
+      req = "SELECT FileID FROM FC_MetaDatasetFiles WHERE DatasetID=%s AND FileID IN %s FOR UPDATE"
+      result = self.db._queryInChunks( req, [ datasetID, scopeFileIDs ] )
+    elif scopeDirID:
+      result = self.db.dtree.getSubdirectoriesByID( scopeDirID, requestString = True, includeParent = True )
+      if not result['OK']:
+        return result
+      req = "SELECT D.FileID FROM FC_MetaDatasetFiles D INNER JOIN FC_Files F USING( FileID ) "
+      req += "WHERE D.DatasetID=%d AND F.DirID IN ( %s ) FOR UPDATE" % ( datasetID, result['Value'] )
+      result = self.db._query( req )
+    else:
+      req = "SELECT FileID FROM FC_MetaDatasetFiles WHERE DatasetID=%s FOR UPDATE"
+      result = self.db._query( req, args = ( datasetID, ) )
+    if not result['OK']:
+      return result
+    members = set( row[0] for row in result['Value'] )
+
+    addedIDs = set( selected ) - members
+    removedIDs = members - set( selected )
+    if fullScope:
+      # The contents of the whole dataset are counted anew
+      result = self.__getFileSizes( selected )
+      if not result['OK']:
+        return result
+      sizes = result['Value']
+      result = self.__changeContents( datasetID, None, dict.fromkeys( addedIDs ), dict.fromkeys( removedIDs ) )
+      if not result['OK']:
+        return result
+      return self.__setCounters( datasetID, len( selected ), sum( sizes.values() ), getFilesDigest( selected ) )
+
+    result = self.__getFileSizes( addedIDs | removedIDs )
+    if not result['OK']:
+      return result
+    sizes = result['Value']
+    added = dict( ( fileID, sizes.get( fileID, 0 ) ) for fileID in addedIDs )
+    removed = dict( ( fileID, sizes.get( fileID, 0 ) ) for fileID in removedIDs )
+    return self.__changeContents( datasetID, counters, added, removed )
+
+  def __getOwnerCredentials( self, datasetID, uid = None, gid = None ):
+    """ Get the credentials of the owner of a dataset: its metadata query is evaluated with them, so that
+        its contents do not depend on the user whose operation triggers the evaluation
+
+        :param int datasetID: dataset ID
+        :param int uid: user ID of the owner, looked up if not given
+        :param int gid: group ID of the owner, looked up if not given
+        :return: S_OK( credDict )
+    """
+    if uid is None or gid is None:
+      req = "SELECT UID,GID FROM FC_MetaDatasets WHERE DatasetID=%s"
+      result = self.db._query( req, args = ( datasetID, ) )
+      if not result['OK']:
+        return result
+      if not result['Value']:
+        return S_ERROR( 'Dataset %s not found' % datasetID )
+      uid, gid = result['Value'][0]
+    result = self.db.ugManager.getUserName( uid )
+    if not result['OK']:
+      return result
+    userName = result['Value']
+    result = self.db.ugManager.getGroupName( gid )
+    if not result['OK']:
+      return result
+    groupName = result['Value']
+    return S_OK( { 'username': userName,
+                   'group': groupName,
+                   'properties': getPropertiesForGroup( groupName, [] ) } )
+
+  def __materialiseDataset( self, datasetID, metaQuery, path = None, fileIDs = None, ownerDict = None ):
+    """ Evaluate the metadata query of a dataset and update its materialised contents with the result,
+        for the whole dataset or only within the subtree of a path, or for given files
+
+        :param int datasetID: dataset ID
+        :param dict metaQuery: metadata query of the dataset
+        :param str path: directory the evaluation is limited to
+        :param list fileIDs: files the evaluation is limited to
+        :param dict ownerDict: credentials of the owner of the dataset, looked up if not given
+    """
+    if ownerDict is None:
+      result = self.__getOwnerCredentials( datasetID )
+      if not result['OK']:
+        return result
+      ownerDict = result['Value']
+
     findMetaQuery = dict( metaQuery )
+    queryPath = findMetaQuery.pop( 'Path', '/' )
+    scopePath = queryPath
+    scopeDirID = 0
+    if path:
+      if _isInPath( path, queryPath ):
+        scopePath = path
+      elif not _isInPath( queryPath, path ):
+        # The change is outside of the dataset
+        return S_OK()
+      if fileIDs is None:
+        result = self.db.dtree.findDir( path )
+        if not result['OK']:
+          return result
+        if not result['Value']:
+          return S_OK()
+        scopeDirID = result['Value']
+
+    result = self.db.fmeta.findFilesByMetadata( findMetaQuery, scopePath, ownerDict, fileIDs = fileIDs )
+    if not result['OK']:
+      return result
+    return self.__inTransaction( self.__syncContents, datasetID, result['Value'], fileIDs, scopeDirID )
 
-    path = '/'
-    if "Path" in findMetaQuery:
-      path = findMetaQuery['Path']
-      findMetaQuery.pop( 'Path' )
+  def __getContentCounters( self, datasetID, status, metaQuery ):
+    """ Get the counters of the contents of a dataset, materialising them first if needed: from the
+        metadata query for a dynamic dataset, from the stored snapshot for a frozen one
 
-    result = self.db.fmeta.findFilesByMetadata(findMetaQuery, path, credDict)
+        :return: S_OK( { 'NumberOfFiles' : int, 'TotalSize' : int, 'DatasetHash' : str } )
+    """
+    req = "SELECT NumberOfFiles,TotalSize,DatasetHash FROM FC_MetaDatasetCounters WHERE DatasetID=%s"
+    result = self.db._query( req, args = ( datasetID, ) )
     if not result['OK']:
-      return S_ERROR( 'Failed to apply the metaQuery' )
+      return result
+    if not result['Value']:
+      if status in ["Frozen", "Static"]:
+        # Snapshot taken before the contents were counted, the files removed since are dropped
+        req = "SELECT FileID FROM FC_MetaDatasetFiles WHERE DatasetID=%s"
+        result = self.db._query( req, args = ( datasetID, ) )
+        if not result['OK']:
+          return result
+        result = self.__getFileSizes( [ row[0] for row in result['Value'] ] )
+        if not result['OK']:
+          return result
+        result = self.__inTransaction( self.__syncContents, datasetID, dict.fromkeys( result['Value'] ) )
+      else:
+        result = self.__materialiseDataset( datasetID, metaQuery )
+      if not result['OK']:
+        return result
+      return self.__getContentCounters( datasetID, status, metaQuery )
+    numberOfFiles, totalSize, datasetHash = result['Value'][0]
+    return S_OK( { 'NumberOfFiles': int( numberOfFiles ),
+                   'TotalSize': int( totalSize ),
+                   'DatasetHash': datasetHash } )
+
+  def __recordParameters( self, datasetID ):
+    """ Record the current counters of the contents of a dataset as its parameters
+    """
+    req = "UPDATE FC_MetaDatasets D INNER JOIN FC_MetaDatasetCounters C USING( DatasetID ) "
+    req += "SET D.NumberOfFiles=C.NumberOfFiles, D.TotalSize=C.TotalSize, D.DatasetHash=C.DatasetHash, "
+    req += "D.ModificationDate=UTC_TIMESTAMP() WHERE D.DatasetID=%s"
+    return self.db._update( req, args = ( datasetID, ) )
+
+  def __getLiveDatasets( self, metaNames, credDict, inScope ):
+    """ Get the materialised dynamic datasets the path of which can contain the changes, and the query of which
+        uses some of the given metadata, with the credentials of their owner
+
+        :param list metaNames: metadata names, None for all the datasets
+        :param dict credDict: dictionary of the caller credentials
+        :param inScope: function telling if the changes can be in the dataset, given the path of its query
+        :return: S_OK( { datasetID : ( metaQuery, ownerDict ) } )
+    """
+    result = self.db.fileManager._getStatusInt( 'Dynamic' )
+    if not result['OK']:
+      return result
+    req = "SELECT D.DatasetID,D.MetaQuery,D.UID,D.GID FROM FC_MetaDatasets D INNER JOIN FC_MetaDatasetCounters C "
+    req += "USING( DatasetID ) WHERE D.Status=%s"
+    result = self.db._query( req, args = ( result['Value'], ) )
+    if not result['OK']:
+      return result
+    # The datasets out of the path of the changes are skipped before anything is evaluated for them
+    datasets = {}
+    for datasetID, metaQuery, uid, gid in result['Value']:
+      metaQuery = eval( metaQuery )
+      if inScope( metaQuery.get( 'Path', '/' ) ):
+        datasets[datasetID] = ( metaQuery, uid, gid )
+    if not datasets:
+      return S_OK( {} )
+
+    metaTypes = {}
+    if metaNames is not None:
+      result = self.db.dmeta.getMetadataFields( credDict )
+      if not result['OK']:
+        return result
+      metaTypes = result['Value']
+      metaNames = set( metaNames )
+    owners = {}
+    liveDatasets = {}
+    for datasetID, ( metaQuery, uid, gid ) in datasets.items():
+      if ( uid, gid ) not in owners:
+        result = self.__getOwnerCredentials( datasetID, uid, gid )
+        if not result['OK']:
+          return result
+        owners[( uid, gid )] = result['Value']
+      ownerDict = owners[( uid, gid )]
+      if metaNames is not None:
+        queryNames = set( metaQuery )
+        for meta, value in metaQuery.items():
+          if metaTypes.get( meta ) == 'MetaSet':
+            result = self.db.dmeta.getMetadataSet( value, True, ownerDict )
+            if not result['OK']:
+              return result
+            queryNames.update( result['Value'] )
+        if not queryNames & metaNames:
+          continue
+      liveDatasets[datasetID] = ( metaQuery, ownerDict )
+    return S_OK( liveDatasets )
+
+  def updateDatasetsForFiles( self, lfns, credDict, metaNames = None ):
+    """ Update the contents of the dynamic datasets for files added or modified: the metadata
+        queries are evaluated for these files only, for the datasets the path of which contains them.
+        The datasets which fail to be updated are invalidated, the others are still updated
+
+        :param list lfns: files added or modified
+        :param dict credDict: dictionary of the caller credentials
+        :param list metaNames: metadata modified, None if the files are new
+    """
+    dirPaths = set( os.path.dirname( lfn ) for lfn in lfns )
+    inScope = lambda queryPath: any( _isInPath( dirPath, queryPath ) for dirPath in dirPaths )
+    result = self.__getLiveDatasets( metaNames, credDict, inScope )
+    if not result['OK'] or not result['Value']:
+      return result
+    liveDatasets = result['Value']
 
-    idLfnDict = result['Value']
-    lfnIDList = idLfnDict.keys()
-    lfnList = idLfnDict.values()
-    lfnList.sort()
-    myMd5 = hashlib.md5()
-    myMd5.update( str( lfnList ) )
-    datasetHash = myMd5.hexdigest().upper()
-    numberOfFiles = len( lfnList )
-    result = self.db.fileManager.getFileSize( lfnList )
-    totalSize = 0
-    if result['OK']:
-      totalSize = result['TotalSize']
+    result = self.db.fileManager._findFiles( list( lfns ), ['FileID'] )
+    if not result['OK']:
+      return result
+    dirFileIDs = {}
+    for lfn, fileDict in result['Value']['Successful'].items():
+      dirFileIDs.setdefault( os.path.dirname( lfn ), [] ).append( fileDict['FileID'] )
 
-    result = S_OK( { 'DatasetHash': datasetHash,
-                     'NumberOfFiles': numberOfFiles,
-                     'TotalSize': totalSize,
-                     'LFNList': lfnList,
-                     'LFNIDList': lfnIDList } )
-    return result
+    failed = {}
+    for datasetID in sorted( liveDatasets ):
+      metaQuery, ownerDict = liveDatasets[datasetID]
+      queryPath = metaQuery.get( 'Path', '/' )
+      for dirPath, fileIDs in dirFileIDs.items():
+        if not _isInPath( dirPath, queryPath ):
+          continue
+        result = self.__materialiseDataset( datasetID, metaQuery, path = dirPath, fileIDs = fileIDs,
+                                            ownerDict = ownerDict )
+        if not result['OK']:
+          failed[datasetID] = result['Message']
+          break
+    return self.__invalidateDatasets( failed )
+
+  def updateDatasetsForDirectory( self, path, credDict, metaNames = None ):
+    """ Update the contents of the dynamic datasets after a change of the metadata of a directory:
+        the metadata queries are evaluated in the subtree of the directory only, for the datasets
+        the path of which is in this subtree or contains it. The datasets which fail to be updated
+        are invalidated, the others are still updated
+
+        :param str path: directory
+        :param dict credDict: dictionary of the caller credentials
+        :param list metaNames: metadata modified, None for all
+    """
+    inScope = lambda queryPath: _isInPath( path, queryPath ) or _isInPath( queryPath, path )
+    result = self.__getLiveDatasets( metaNames, credDict, inScope )
+    if not result['OK']:
+      return result
+    liveDatasets = result['Value']
+    failed = {}
+    for datasetID in sorted( liveDatasets ):
+      metaQuery, ownerDict = liveDatasets[datasetID]
+      result = self.__materialiseDataset( datasetID, metaQuery, path = path, ownerDict = ownerDict )
+      if not result['OK']:
+        failed[datasetID] = result['Message']
+    return self.__invalidateDatasets( failed )
+
+  def __invalidateDatasets( self, failed ):
+    """ Drop the materialised counters of the datasets the contents of which could not be updated,
+        so that their contents are evaluated anew by the metadata query at the next access
+
+        :param dict failed: { datasetID : error message } of the datasets which failed to be updated
+        :return: S_OK, S_ERROR if the contents of some datasets could not be invalidated
+    """
+    notInvalidated = []
+    for datasetID, message in sorted( failed.items() ):
+      gLogger.warn( 'Failed to update the dataset contents, invalidated', '%s: %s' % ( datasetID, message ) )
+      req = "DELETE FROM FC_MetaDatasetCounters WHERE DatasetID=%s"
+      result = self.db._update( req, args = ( datasetID, ) )
+      if not result['OK']:
+        gLogger.error( 'Failed to invalidate the dataset contents', '%s: %s' % ( datasetID, result['Message'] ) )
+        notInvalidated.append( str( datasetID ) )
+    if notInvalidated:
+      return S_ERROR( 'Failed to update the contents of datasets %s' % ','.join( notInvalidated ) )
+    return S_OK()
+
+  def __removeFilesFromDataset( self, datasetID, files ):
+    """ Remove files from the contents of a dataset, within a transaction """
+    result = self.__lockCounters( datasetID )
+    if not result['OK']:
+      return result
+    counters = result['Value']
+    req = "SELECT FileID FROM FC_MetaDatasetFiles WHERE DatasetID=%s AND FileID IN %s FOR UPDATE"
+    result = self.db._queryInChunks( req, [ datasetID, sorted( files ) ] )
+    if not result['OK']:
+      return result
+    removed = dict( ( row[0], files[row[0]] ) for row in result['Value'] )
+    return self.__changeContents( datasetID, counters, {}, removed )
+
+  def removeFilesFromDatasets( self, files ):
+    """ Remove files removed from the catalog from the contents of all the datasets
+
+        :param dict files: { fileID : size } of the files removed
+    """
+    if not files:
+      return S_OK()
+    req = "SELECT DISTINCT DatasetID FROM FC_MetaDatasetFiles WHERE FileID IN %s"
+    result = self.db._queryInChunks( req, [ sorted( files ) ] )
+    if not result['OK']:
+      return result
+    for datasetID in sorted( set( row[0] for row in result['Value'] ) ):
+      result = self.__inTransaction( self.__removeFilesFromDataset, datasetID, files )
+      if not result['OK']:
+        return result
+    return S_OK()
 
   def removeDataset( self, datasets, credDict ):
     """ Remove the requested datasets
@@ -374,8 +787,12 @@ class DatasetManager( object ):
       # No requested dataset
       return S_OK( 'Dataset %s does not exist' % datasetName  )
     datasetID = result['Value'][0][0]
+    return self.__deleteDataset( datasetID )
 
-    for table in ["FC_MetaDatasetFiles","FC_MetaDatasets","FC_DatasetAnnotations"]:
+  def __deleteDataset( self, datasetID ):
+    """ Delete the dataset entry with its contents and annotation
+    """
+    for table in ["FC_MetaDatasetFiles","FC_MetaDatasetCounters","FC_MetaDatasets","FC_DatasetAnnotations"]:
       req = "DELETE FROM %s WHERE DatasetID=%s" % (table, datasetID)
       result = self.db._update( req )
 
@@ -400,9 +817,10 @@ class DatasetManager( object ):
     return S_OK( { "Successful": successful, "Failed": failed } )
 
   def __checkDataset( self, datasetName, credDict ):
-    """ Check that the dataset parameters correspond to the actual state
+    """ Check that the dataset parameters correspond to the actual state, that is to its
+        materialised contents, without evaluating its metadata query
     """
-    req = "SELECT MetaQuery,DatasetHash,TotalSize,NumberOfFiles FROM FC_MetaDatasets"
+    req = "SELECT DatasetID,MetaQuery,Status,DatasetHash,TotalSize,NumberOfFiles FROM FC_MetaDatasets"
     req += " WHERE DatasetName='%s'" % datasetName
     result = self.db._query( req )
     if not result['OK']:
@@ -411,27 +829,28 @@ class DatasetManager( object ):
       return S_ERROR( 'Unknown MetaDataset %s' % datasetName )
 
     row = result['Value'][0]
-    metaQuery = eval( row[0] )
-    datasetHashOld = row[1]
-    totalSizeOld = int( row[2] )
-    numberOfFilesOld = int( row[3] )
-
-    result = self.__getMetaQueryParameters( metaQuery, credDict )
+    datasetID = int( row[0] )
+    metaQuery = eval( row[1] )
+    result = self.db.fileManager._getIntStatus( int( row[2] ) )
     if not result['OK']:
       return result
-    totalSize = result['Value']['TotalSize']
-    datasetHash = result['Value']['DatasetHash']
-    numberOfFiles = result['Value']['NumberOfFiles']
+    status = result['Value']
+    oldDict = { 'DatasetHash': row[3],
+                'TotalSize': int( row[4] ),
+                'NumberOfFiles': int( row[5] ) }
 
+    result = self.__getContentCounters( datasetID, status, metaQuery )
+    if not result['OK']:
+      return result
     changeDict = {}
-    if totalSize != totalSizeOld:
-      changeDict['TotalSize'] = ( totalSizeOld, totalSize )
-    if datasetHash != datasetHashOld:
-      changeDict['DatasetHash'] = ( datasetHashOld, datasetHash )
-    if numberOfFiles != numberOfFilesOld:
-      changeDict['NumberOfFiles'] = ( numberOfFilesOld, numberOfFiles )
+    for parameter, value in result['Value'].items():
+      if value != oldDict[parameter]:
+        changeDict[parameter] = ( oldDict[parameter], value )
 
     result = S_OK( changeDict )
+    result['DatasetID'] = datasetID
+    result['MetaQuery'] = metaQuery
+    result['Status'] = status
     return result
 
   def updateDataset( self, datasets, credDict ):
@@ -454,26 +873,26 @@ class DatasetManager( object ):
     return S_OK( { "Successful": successful, "Failed": failed } )
 
   def __updateDataset( self, datasetName, credDict ):
-    """ Update the dataset parameters
+    """ Update the dataset parameters. The contents of a dynamic dataset are synchronised
+        with its metadata query first, this is the only case the query is evaluated in full
     """
 
-    changeDict = {}
     result = self.__checkDataset( datasetName, credDict )
     if not result['OK']:
       return result
+    datasetID = result['DatasetID']
+    if result['Status'] not in ["Frozen", "Static"]:
+      result = self.__materialiseDataset( datasetID, result['MetaQuery'] )
+      if not result['OK']:
+        return result
+      result = self.__checkDataset( datasetName, credDict )
+      if not result['OK']:
+        return result
     if not result['Value']:
       # The dataset is not changed
       return S_OK()
-    else:
-      changeDict = result['Value']
 
-    req = "UPDATE FC_MetaDatasets SET "
-    for field in changeDict:
-      req += "%s='%s', " % ( field, str( changeDict[field][1] ) )
-    req += "ModificationDate=UTC_TIMESTAMP() "
-    req += "WHERE DatasetName='%s'" % datasetName
-    result = self.db._update( req )
-    return result
+    return self.__recordParameters( datasetID )
 
   def getDatasets( self, datasets, credDict ):
     """ Get dataset definitions
@@ -674,28 +1093,8 @@ class DatasetManager( object ):
     status = result['Value']['Status']
     return S_OK( status )
 
-  def __getDynamicDatasetFiles( self, datasetID, credDict ):
-    """ Get dataset lfns from a dynamic meta query
-    """
-    req = "SELECT MetaQuery FROM FC_MetaDatasets WHERE DatasetID=%d" % datasetID
-    result = self.db._query( req )
-    if not result['OK']:
-      return result
-    if not result['Value']:
-      return S_ERROR( 'Unknown MetaDataset ID %d' % datasetID )
-
-    metaQuery = eval( result['Value'][0][0] )
-    result = self.__getMetaQueryParameters( metaQuery, credDict )
-    if not result['OK']:
-      return result
-
-    lfnList = result['Value']['LFNList']
-    finalResult = S_OK(lfnList)
-    finalResult['FileIDList'] = result['Value']['LFNIDList']
-    return finalResult
-
-  def __getFrozenDatasetFiles( self, datasetID, credDict ):
-    """ Get dataset lfns from a frozen snapshot
+  def __getMaterialisedFiles( self, datasetID ):
+    """ Get dataset lfns from its materialised contents
     """
 
     req = "SELECT FileID FROM FC_MetaDatasetFiles WHERE DatasetID=%d" % datasetID
@@ -704,13 +1103,14 @@ class DatasetManager( object ):
       return result
 
     fileIDList = [ row[0] for row in result['Value'] ]
-    result = self.db.fileManager._getFileLFNs( fileIDList )
-    if not result['OK']:
-      return result
+    lfnDict = {}
+    for chunk in breakListIntoChunks( fileIDList, 10000 ):
+      result = self.db.fileManager._getFileLFNs( chunk )
+      if not result['OK']:
+        return result
+      lfnDict.update( result['Value']['Successful'] )
 
-    lfnDict = result['Value']['Successful']
-    lfnList = [ lfnDict[i] for i in lfnDict.keys() ]
-    result = S_OK( lfnList )
+    result = S_OK( lfnDict.values() )
     result['FileIDList'] = lfnDict.keys()
     return result
 
@@ -738,12 +1138,47 @@ class DatasetManager( object ):
     result = self.__getDatasetParameters( datasetName, credDict )
     if not result['OK']:
       return result
-    status = result['Value']['Status']
-    datasetID = result['Value']['DatasetID']
-    if status in ["Frozen","Static"]:
-      return self.__getFrozenDatasetFiles( datasetID, credDict )
-    else:
-      return self.__getDynamicDatasetFiles( datasetID, credDict )
+    parameters = result['Value']
+    result = self.__getContentCounters( parameters['DatasetID'], parameters['Status'], parameters['MetaQuery'] )
+    if not result['OK']:
+      return result
+    return self.__getMaterialisedFiles( parameters['DatasetID'] )
+
+  def getDatasetFilesPage( self, datasetName, credDict, startAfter = 0, maxFiles = FILESPAGESIZE ):
+    """ Get a page of the files of a dataset, ordered by file ID, from its materialised contents
+
+    :param str datasetName: dataset name
+    :param credDict:  dictionary of the caller credentials
+    :param int startAfter: cursor returned with the previous page, 0 for the first page
+    :param int maxFiles: maximum number of files in the page
+    :return: S_OK with a dictionary with the LFNs of the page in "Files", the counters of the dataset
+             "NumberOfFiles", "TotalSize" and "DatasetHash", and "Cursor", the cursor to give to get
+             the next page, 0 after the last page
+    """
+    result = self.__getDatasetParameters( datasetName, credDict )
+    if not result['OK']:
+      return result
+    parameters = result['Value']
+    datasetID = parameters['DatasetID']
+    result = self.__getContentCounters( datasetID, parameters['Status'], parameters['MetaQuery'] )
+    if not result['OK']:
+      return result
+    pageDict = result['Value']
+
+    req = "SELECT FileID FROM FC_MetaDatasetFiles WHERE DatasetID=%s AND FileID>%s ORDER BY FileID LIMIT %s"
+    result = self.db._query( req, args = ( datasetID, startAfter, maxFiles ) )
+    if not result['OK']:
+      return result
+    fileIDList = [ row[0] for row in result['Value'] ]
+    lfnDict = {}
+    if fileIDList:
+      result = self.db.fileManager._getFileLFNs( fileIDList )
+      if not result['OK']:
+        return result
+      lfnDict = result['Value']['Successful']
+    pageDict['Files'] = [ lfnDict[fileID] for fileID in fileIDList if fileID in lfnDict ]
+    pageDict['Cursor'] = fileIDList[-1] if len( fileIDList ) >= maxFiles else 0
+    return S_OK( pageDict )
 
   def freezeDataset( self, datasets, credDict ):
     """ Freeze the contents of datasets
@@ -773,21 +1208,9 @@ class DatasetManager( object ):
     if status == "Frozen":
       return S_OK()
 
+    # The snapshot is the result of the metadata query at the time of freezing
     datasetID = result['Value']['DatasetID']
-    req = "DELETE FROM FC_MetaDatasetFiles WHERE DatasetID=%d" % datasetID
-    result = self.db._update( req )
-
-    result = self.__getDynamicDatasetFiles( datasetID, credDict )
-
-    if not result['OK']:
-      return result
-    fileIDList = result['FileIDList']
-    valueList = []
-    for fileID in fileIDList:
-      valueList.append( '(%d,%d)' % (datasetID,fileID) )
-    valueString = ','.join( valueList )
-    req = "INSERT INTO FC_MetaDatasetFiles (DatasetID,FileID) VALUES %s" % valueString
-    result = self.db._update( req )
+    result = self.__materialiseDataset( datasetID, result['Value']['MetaQuery'] )
     if not result['OK']:
       return result
 
@@ -824,9 +1247,11 @@ class DatasetManager( object ):
       return S_OK()
 
     datasetID = result['Value']['DatasetID']
-    req = "DELETE FROM FC_MetaDatasetFiles WHERE DatasetID=%d" % datasetID
-    result = self.db._update( req )
-
+    metaQuery = result['Value']['MetaQuery']
     result = self.setDatasetStatus( datasetName, 'Dynamic' )
-    return result
+    if not result['OK']:
+      return result
+
+    # The contents follow the metadata query again, with the changes made while the dataset was frozen
+    return self.__materialiseDataset( datasetID, metaQuery )
 
@@ -0,0 +1,147 @@
+""" DIRAC FileCatalog component caching the directory path <-> directory ID mapping
+
+    The cache is held by the DirectoryTree objects: the entries are added when a directory is
+    found or created and invalidated when it is removed. The least recently used entries are
+    evicted when the cache is full, and the entries expire after a lifetime to bound the time
+    another catalog service sharing the DB may see a removed directory.
+"""
+
+__RCSID__ = "$Id$"
+
+import time
+import threading
+from collections import OrderedDict
+
+# Default maximum number of directories in the cache
+DIRECTORYCACHESIZE = 100000
+# Default lifetime of the entries in seconds
+DIRECTORYCACHELIFETIME = 600
+
+
+class DirectoryCache(object):
+  """ Bounded LRU cache of the directory IDs by path and of the directory paths by ID
+  """
+
+  def __init__(self, maxSize=DIRECTORYCACHESIZE, lifetime=DIRECTORYCACHELIFETIME):
+    """ c'tor
+
+        :param int maxSize: maximum number of directories, 0 disables the cache
+        :param int lifetime: seconds after which an entry is looked up again in the DB
+    """
+    self.maxSize = maxSize
+    self.lifetime = lifetime
+    self.__lock = threading.Lock()
+    # path -> ( dirID, level, expiration time ), in least recently used order
+    self.__idByPath = OrderedDict()
+    self.__pathByID = {}
+    self.__stats = {'Hits': 0, 'Misses': 0, 'Evictions': 0, 'Invalidations': 0}
+
+  def configure(self, maxSize=None, lifetime=None):
+    """ Change the size and lifetime of the cache, emptying it
+    """
+    with self.__lock:
+      if maxSize is not None:
+        self.maxSize = int(maxSize)
+      if lifetime is not None:
+        self.lifetime = lifetime
+      self.__idByPath.clear()
+      self.__pathByID.clear()
+
+  def getIDs(self, paths):
+    """ Get the cached IDs of directories
+
+        :param list paths: normalised directory paths
+        :return: dict { path : ( dirID, level ) } for the directories found in the cache
+    """
+    found = {}
+    now = time.time()
+    with self.__lock:
+      for path in paths:
+        entry = self.__idByPath.pop(path, None)
+        if entry is None:
+          self.__stats['Misses'] += 1
+          continue
+        if entry[2] < now:
+          self.__pathByID.pop(entry[0], None)
+          self.__stats['Misses'] += 1
+          continue
+        # Put it back as the most recently used
+        self.__idByPath[path] = entry
+        found[path] = entry[:2]
+        self.__stats['Hits'] += 1
+    return found
+
+  def getID(self, path):
+    """ Get the cached ( dirID, level ) of a directory, or None
+    """
+    return self.getIDs([path]).get(path)
+
+  def getPaths(self, dirIDs):
+    """ Get the cached paths of directories
+
+        :param list dirIDs: directory IDs
+        :return: dict { dirID : path } for the directories found in the cache
+    """
+    found = {}
+    now = time.time()
+    with self.__lock:
+      for dirID in dirIDs:
+        path = self.__pathByID.get(dirID)
+        entry = self.__idByPath.get(path) if path is not None else None
+        if entry is None or entry[2] < now:
+          self.__stats['Misses'] += 1
+          continue
+        found[dirID] = path
+        self.__stats['Hits'] += 1
+    return found
+
+  def getPath(self, dirID):
+    """ Get the cached path of a directory, or None
+    """
+    return self.getPaths([dirID]).get(dirID)
+
+  def add(self, path, dirID, level=None):
+    """ Add a directory to the cache
+    """
+    if not self.maxSize or not dirID:
+      return
+    with self.__lock:
+      oldEntry = self.__idByPath.pop(path, None)
+      if oldEntry is not None:
+        self.__pathByID.pop(oldEntry[0], None)
+      self.__idByPath[path] = (dirID, level, time.time() + self.lifetime)
+      self.__pathByID[dirID] = path
+      while len(self.__idByPath) > self.maxSize:
+        _path, entry = self.__idByPath.popitem(last=False)
+        self.__pathByID.pop(entry[0], None)
+        self.__stats['Evictions'] += 1
+
+  def invalidate(self, path=None, dirID=None):
+    """ Remove a directory, given by path and/or ID, from the cache
+    """
+    with self.__lock:
+      if path is None and dirID is not None:
+        path = self.__pathByID.get(dirID)
+      entry = self.__idByPath.pop(path, None) if path is not None else None
+      if entry is not None:
+        self.__pathByID.pop(entry[0], None)
+      if dirID is not None:
+        self.__pathByID.pop(dirID, None)
+      self.__stats['Invalidations'] += 1
+
+  def clear(self):
+    """ Empty the cache
+    """
+    with self.__lock:
+      self.__idByPath.clear()
+      self.__pathByID.clear()
+
+  def getStatistics(self):
+    """ Get the hit/miss counters and the size of the cache
+    """
+    with self.__lock:
+      stats = dict(self.__stats)
+      stats['Size'] = len(self.__idByPath)
+    lookups = stats['Hits'] + stats['Misses']
+    stats['HitRatio'] = float(stats['Hits']) / lookups if lookups else 0.
+    return stats
@@ -29,40 +29,44 @@ class DirectoryLevelTree(DirectoryTreeBase):
   def findDir(self, path, connection=False):
     """  Find directory ID for the given path
     """
+    dpath = os.path.normpath(path)
+    cached = self.dirCache.getID(dpath)
+    if cached:
+      res = S_OK(cached[0])
+      res['Level'] = cached[1]
+      return res
 
-    dpath = self.db._escapeString(os.path.normpath(path))
-    if not dpath['OK']:
-      return dpath
-    dpath = dpath['Value']
-    req = "SELECT DirID,Level from FC_DirectoryLevelTree WHERE DirName=%s" % dpath
-    result = self.db._query(req, connection)
+    req = "SELECT DirID,Level from FC_DirectoryLevelTree WHERE DirName=%s"
+    result = self.db._query(req, connection, args=[dpath])
     if not result['OK']:
       return result
 
     if not result['Value']:
       return S_OK('')
 
-    res = S_OK(result['Value'][0][0])
-    res['Level'] = result['Value'][0][1]
+    dirID = result['Value'][0][0]
+    level = result['Value'][0][1]
+    self.dirCache.add(dpath, dirID, level)
+    res = S_OK(dirID)
+    res['Level'] = level
     return res
 
   def findDirs(self, paths, connection=False):
-    """ Find DirIDs for the given path list
+    """ Find DirIDs for the given path list, each distinct directory not in the cache is looked up once
     """
-    dpathList = []
-    for path in paths:
-      dpath = self.db._escapeString(os.path.normpath(path))
-      if not dpath['OK']:
-        return dpath
-      dpathList.append(dpath['Value'])
-    dpaths = ','.join(dpathList)
-    req = "SELECT DirName,DirID from FC_DirectoryLevelTree WHERE DirName in (%s)" % dpaths
-    result = self.db._query(req, connection)
+    dpaths = set(os.path.normpath(path) for path in paths)
+    dirDict = dict((dpath, cached[0]) for dpath, cached in self.dirCache.getIDs(dpaths).iteritems())
+    missing = list(dpaths - set(dirDict))
+    if not missing:
+      return S_OK(dirDict)
+
+    req = "SELECT DirName,DirID,Level from FC_DirectoryLevelTree WHERE DirName in %s"
+    result = self.db._queryInChunks(req, [missing], connection)
     if not result['OK']:
       return result
-    dirDict = {}
-    for dirName, dirID in result['Value']:
+    for dirName, dirID, level in result['Value']:
       dirDict[dirName] = dirID
+      self.dirCache.add(dirName, dirID, level)
 
     return S_OK(dirDict)
 
@@ -81,6 +85,7 @@ class DirectoryLevelTree(DirectoryTreeBase):
     dirID = result['Value']
     req = "DELETE FROM FC_DirectoryLevelTree WHERE DirID=%d" % dirID
     result = self.db._update(req)
+    self.dirCache.invalidate(os.path.normpath(path), dirID)
     result['DirID'] = dirID
     return result
 
@@ -188,6 +193,7 @@ class DirectoryLevelTree(DirectoryTreeBase):
     else:
       result = self.db._query("ROLLBACK;", conn)
 
+    self.dirCache.add(os.path.normpath(path), dirID, level)
     result = S_OK(dirID)
     result['NewDirectory'] = True
     return result
@@ -235,14 +241,20 @@ class DirectoryLevelTree(DirectoryTreeBase):
   def getDirectoryPath(self, dirID):
     """ Get directory name by directory ID
     """
-    req = "SELECT DirName FROM FC_DirectoryLevelTree WHERE DirID=%d" % int(dirID)
+    dirPath = self.dirCache.getPath(int(dirID))
+    if dirPath:
+      return S_OK(dirPath)
+
+    req = "SELECT DirName,Level FROM FC_DirectoryLevelTree WHERE DirID=%d" % int(dirID)
     result = self.db._query(req)
     if not result['OK']:
       return result
     if not result['Value']:
       return S_ERROR('Directory with id %d not found' % int(dirID))
 
-    return S_OK(result['Value'][0][0])
+    dirPath, level = result['Value'][0]
+    self.dirCache.add(dirPath, int(dirID), level)
+    return S_OK(dirPath)
 
   def getDirectoryPaths(self, dirIDList):
     """ Get directory name by directory ID list
@@ -254,17 +266,22 @@ class DirectoryLevelTree(DirectoryTreeBase):
     if not dirs:
       return S_OK({})
 
-    dirListString = ','.join([str(d) for d in dirs])
-    req = "SELECT DirID,DirName FROM FC_DirectoryLevelTree WHERE DirID in ( %s )" % dirListString
-    result = self.db._query(req)
+    dirs = set(int(d) for d in dirs)
+    resultDict = self.dirCache.getPaths(dirs)
+    missing = list(dirs - set(resultDict))
+    if not missing:
+      return S_OK(resultDict)
+
+    req = "SELECT DirID,DirName,Level FROM FC_DirectoryLevelTree WHERE DirID in %s"
+    result = self.db._queryInChunks(req, [missing])
     if not result['OK']:
       return result
-    if not result['Value']:
-      return S_ERROR('Directories not found: %s' % dirListString)
+    if not result['Value'] and not resultDict:
+      return S_ERROR('Directories not found: %s' % ','.join(str(d) for d in missing))
 
-    resultDict = {}
-    for row in result['Value']:
-      resultDict[int(row[0])] = row[1]
+    for dirID, dirName, level in result['Value']:
+      resultDict[int(dirID)] = dirName
+      self.dirCache.add(dirName, int(dirID), level)
 
     return S_OK(resultDict)
 
@@ -291,15 +308,13 @@ class DirectoryLevelTree(DirectoryTreeBase):
       pelements.append(dPath)
     pelements.append('/')
 
-    pathString = ["'" + p + "'" for p in pelements]
-    req = "SELECT DirID FROM FC_DirectoryLevelTree WHERE DirName in (%s) ORDER BY DirID" % ','.join(pathString)
-    result = self.db._query(req)
+    result = self.findDirs(pelements)
     if not result['OK']:
       return result
     if not result['Value']:
       return S_ERROR('Directory %s not found' % path)
 
-    return S_OK([x[0] for x in result['Value']])
+    return S_OK(sorted(result['Value'].values()))
 
   def getPathIDsByID_old(self, dirID):
     """ Get IDs of all the directories in the parent hierarchy for a directory
@@ -318,6 +333,18 @@ class DirectoryLevelTree(DirectoryTreeBase):
     """ Get IDs of all the directories in the parent hierarchy for a directory
         specified by its ID
     """
+    # When the path is cached, the parent directories are usually cached as well
+    dirPath = self.dirCache.getPath(dirID)
+    if dirPath:
+      parentPaths = ['/']
+      for el in dirPath.split('/')[1:-1]:
+        parentPaths.append(os.path.join(parentPaths[-1], el))
+      if dirPath == '/':
+        parentPaths = []
+      cached = self.dirCache.getIDs(parentPaths)
+      if len(cached) == len(parentPaths):
+        return S_OK([cached[parentPath][0] for parentPath in parentPaths] + [dirID])
+
     result = self.__getNumericPath(dirID)
     if not result['OK']:
       return result
@@ -407,6 +434,20 @@ class DirectoryLevelTree(DirectoryTreeBase):
 
     return S_OK(resDict)
 
+  def _getSubtreeParents(self, dirID):
+    """ Get the parent of a directory and of all its subdirectories with a single query
+
+        :return: S_OK( { dirID : parentID } )
+    """
+    result = self.getSubdirectoriesByID(dirID, requestString=True, includeParent=True)
+    if not result['OK']:
+      return result
+    req = result['Value'].replace('SELECT DirID FROM', 'SELECT DirID, Parent FROM', 1)
+    result = self.db._query(req)
+    if not result['OK']:
+      return result
+    return S_OK(dict(result['Value']))
+
   def countSubdirectories(self, dirId, includeParent=True):
     result = self.getSubdirectoriesByID(dirId, requestString=True, includeParent=includeParent)
     if not result['OK']:
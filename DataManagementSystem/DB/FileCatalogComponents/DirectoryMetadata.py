@@ -8,6 +8,7 @@ __RCSID__ = "$Id$"
 import os
 from DIRAC import S_OK, S_ERROR
 from DIRAC.Core.Utilities.Time import queryTime
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.MetaQueryPlanner import isMissing
 
 
 class DirectoryMetadata:
@@ -559,6 +560,135 @@ class DirectoryMetadata:
     else:
       return S_OK(result['Value'][0][0])
 
+  def __planQuery(self, metaDict):
+    """ Order the conditions on the directory metadata, the most selective first
+    """
+    conditions = [(meta, value, 'FC_Meta_%s' % meta, 'Value') for meta, value in metaDict.items()]
+    result = self.db.metaQueryPlanner.planConditions(conditions)
+    if not result['OK']:
+      return result
+    steps = result['Value']
+    for i, step in enumerate(steps):
+      if isMissing(step['Value']):
+        step['Strategy'] = 'Exclude'
+      elif i == 0:
+        step['Strategy'] = 'Scan'
+      elif steps[0]['EstimatedRows'] <= step['EstimatedRows']:
+        step['Strategy'] = 'SemiJoin'
+      else:
+        step['Strategy'] = 'Scan'
+    return S_OK(steps)
+
+  def __findDirsByPlan(self, metaDict, pathSelection):
+    """ Find the directories satisfying all the metadata conditions. The conditions are evaluated
+        in the order of the plan on the directories where the metadata are defined, the roots
+        of the selection, and the subdirectories inheriting them are only added at the end.
+    """
+    result = self.__planQuery(metaDict)
+    if not result['OK']:
+      return result
+    roots = None
+    missingMeta = []
+    for step in result['Value']:
+      meta, value = step['Meta'], step['Value']
+      if isMissing(value):
+        missingMeta.append(meta)
+        continue
+      if roots is None:
+        result = self.__findSubdirByMeta(meta, value, pathSelection, subdirFlag=False)
+      else:
+        result = self.__restrictRoots(roots, meta, value, step['EstimatedRows'])
+      if not result['OK']:
+        return result
+      roots = set(result['Value'])
+      if not roots:
+        return S_OK([])
+
+    if roots is None:
+      result = self.__findSubdirMissingMeta(missingMeta.pop(0), pathSelection)
+      if not result['OK']:
+        return result
+      dirSet = set(result['Value'])
+    else:
+      result = self.db.dtree.getAllSubdirectoriesByID(list(roots))
+      if not result['OK']:
+        return result
+      dirSet = roots.union(result['Value'])
+    for meta in missingMeta:
+      result = self.__findSubdirByMeta(meta, 'Any', pathSelection)
+      if not result['OK']:
+        return result
+      dirSet.difference_update(result['Value'])
+
+    return S_OK(list(dirSet))
+
+  def __restrictRoots(self, roots, meta, value, estimatedRows):
+    """ Select the directories satisfying the meta condition under the given roots: the roots
+        inheriting the metadata from their parent hierarchy and the directories defining it below them.
+        These are searched in the subtree of each root with a semi-join or, when the condition is
+        estimated to select fewer directories than the roots, once in the whole metadata table.
+    """
+    result = self.__createMetaSelection(meta, value, "M.")
+    if not result['OK']:
+      return result
+    condition = ''
+    if result['Value']:
+      condition = " AND %s" % result['Value']
+
+    ancestors = {}
+    for root in roots:
+      result = self.db.dtree.getPathIDsByID(root)
+      if not result['OK']:
+        return result
+      ancestors[root] = result['Value']
+    allAncestors = set()
+    for pathIDs in ancestors.values():
+      allAncestors.update(pathIDs)
+    req = "SELECT M.DirID FROM FC_Meta_%s AS M WHERE M.DirID IN %%s%s" % (meta, condition.replace('%', '%%'))
+    result = self.db._queryInChunks(req, [list(allAncestors)])
+    if not result['OK']:
+      return result
+    matched = set(row[0] for row in result['Value'])
+    newRoots = set(root for root in roots if matched.intersection(ancestors[root]))
+    remaining = [root for root in roots if root not in newRoots]
+    if not remaining:
+      return S_OK(newRoots)
+
+    if len(remaining) <= estimatedRows:
+      for root in remaining:
+        result = self.db.dtree.getSubdirectoriesByID(root, requestString=True, includeParent=False)
+        if not result['OK']:
+          return result
+        req = "SELECT M.DirID FROM FC_Meta_%s AS M WHERE M.DirID IN ( %s )%s" % (meta, result['Value'], condition)
+        result = self.db._query(req)
+        if not result['OK']:
+          return result
+        newRoots.update(row[0] for row in result['Value'])
+    else:
+      result = self.__findSubdirByMeta(meta, value, subdirFlag=False)
+      if not result['OK']:
+        return result
+      remaining = set(remaining)
+      for dirID in set(result['Value']) - matched:
+        result = self.db.dtree.getPathIDsByID(dirID)
+        if not result['OK']:
+          return result
+        if remaining.intersection(result['Value'][:-1]):
+          newRoots.add(dirID)
+
+    return S_OK(newRoots)
+
+  def planDirectoryQuery(self, queryDict, credDict):
+    """ Get the plan of the evaluation of the directory metadata conditions of a query
+
+        :return: S_OK( list of steps, each a dict with the condition, its estimated number
+                       of selected rows and the evaluation strategy )
+    """
+    result = self.__expandMetaDictionary(queryDict, credDict)
+    if not result['OK']:
+      return result
+    return self.__planQuery(result['Value'])
+
   @queryTime
   def findDirIDsByMetadata(self, queryDict, path, credDict):
     """ Find Directories satisfying the given metadata and being subdirectories of
@@ -600,25 +730,10 @@ class DirectoryMetadata:
         if not result['OK']:
           return result
         pathSelection = result['Value']
-      dirList = []
-      first = True
-      for meta, value in finalMetaDict.items():
-        if value == "Missing":
-          result = self.__findSubdirMissingMeta(meta, pathSelection)
-        else:
-          result = self.__findSubdirByMeta(meta, value, pathSelection)
-        if not result['OK']:
-          return result
-        mList = result['Value']
-        if first:
-          dirList = mList
-          first = False
-        else:
-          newList = []
-          for d in dirList:
-            if d in mList:
-              newList.append(d)
-          dirList = newList
+      result = self.__findDirsByPlan(finalMetaDict, pathSelection)
+      if not result['OK']:
+        return result
+      dirList = result['Value']
     else:
       if pathDirID:
         result = self.db.dtree.getSubdirectoriesByID(pathDirID, includeParent=True)
@@ -9,6 +9,8 @@ import stat
 
 from DIRAC import S_OK, S_ERROR, gLogger
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.Utilities import getIDSelectString
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryCache import DirectoryCache
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.FileManagerBase import FILESPAGESIZE
 
 DEBUG = 0
 
@@ -17,10 +19,16 @@ DEBUG = 0
 
 class DirectoryTreeBase(object):
 
+  # The usage counters of a directory include the usage of all its subdirectories
+  recursiveUsage = True
+
   def __init__(self, database=None):
     self.db = database
     self.lock = threading.Lock()
     self.treeTable = ''
+    # Path <-> ID cache, to be filled by the derived classes when finding and creating
+    # the directories, and invalidated when removing them
+    self.dirCache = DirectoryCache()
 
 ############################################################################
 #
@@ -34,9 +42,18 @@ class DirectoryTreeBase(object):
     return S_ERROR("To be implemented on derived class")
 
   def findDirs(self, paths, connection=False):
-    """ Find DirIDs for the given path list
+    """ Find DirIDs for the given path list, one at a time if not implemented in the derived class
+
+        :return: S_OK( { normalised path : dirID } ) for the directories found
     """
-    return S_ERROR("To be implemented on derived class")
+    dirDict = {}
+    for path in set(os.path.normpath(path) for path in paths):
+      result = self.findDir(path)
+      if not result['OK']:
+        return result
+      if result['Value']:
+        dirDict[path] = result['Value']
+    return S_OK(dirDict)
 
   def makeDir(self, path):
 
@@ -160,16 +177,18 @@ class DirectoryTreeBase(object):
 
 #####################################################################
   def exists(self, lfns):
+    """ Check which of the given paths are directories, looking them all up at once
+    """
     successful = {}
     failed = {}
-    for lfn in lfns:
-      res = self.findDir(lfn)
-      if not res['OK']:
+    res = self.findDirs(lfns)
+    if not res['OK']:
+      for lfn in lfns:
         failed[lfn] = res['Message']
-      if not res['Value']:
-        successful[lfn] = False
-      else:
-        successful[lfn] = lfn
+      return S_OK({'Successful': successful, 'Failed': failed})
+    dirDict = res['Value']
+    for lfn in lfns:
+      successful[lfn] = lfn if dirDict.get(os.path.normpath(lfn)) else False
     return S_OK({'Successful': successful, 'Failed': failed})
 
   def existsDir(self, path):
@@ -696,6 +715,74 @@ class DirectoryTreeBase(object):
 
     return S_OK({'Successful': successful, 'Failed': failed})
 
+  def listDirectoryPage(self, path, verbose=False, startAfter='', maxFiles=FILESPAGESIZE):
+    """ Get a page of the listing of a directory, with at most maxFiles files in name order.
+        The subdirectories and datasets are returned with the first page only
+
+        :param str path: directory path
+        :param bool verbose: if True, get the details of the entries
+        :param str startAfter: cursor returned with the previous page, '' for the first page
+        :param int maxFiles: maximum number of files in the page
+
+        :return: S_OK with a dictionary with the keys "Files", "SubDirs", "Links", "Datasets" and "Cursor",
+                 the cursor to get the next page, '' after the last page
+    """
+    result = self.findDir(path)
+    if not result['OK']:
+      return result
+    directoryID = result['Value']
+    if not directoryID:
+      return S_ERROR('Directory %s not found' % path)
+    directories = {}
+    datasets = {}
+    if not startAfter:
+      result = self.getChildren(path)
+      if not result['OK']:
+        return result
+      for dirID in result['Value']:
+        result = self.getDirectoryPath(dirID)
+        if not result['OK']:
+          return result
+        dirName = result['Value']
+        if verbose:
+          result = self.getDirectoryParameters(dirID)
+          directories[dirName] = result['Value'] if result['OK'] else False
+        else:
+          directories[dirName] = True
+      result = self.db.datasetManager.getDatasetsInDirectory(directoryID, verbose=verbose)
+      if not result['OK']:
+        return result
+      datasets = result['Value']
+    result = self.db.fileManager.getFilesInDirectoryPage(directoryID, verbose=verbose,
+                                                         startAfter=startAfter, maxFiles=maxFiles)
+    if not result['OK']:
+      return result
+    return S_OK({'Files': result['Value'], 'SubDirs': directories, 'Links': {}, 'Datasets': datasets,
+                 'Cursor': result['Cursor']})
+
+  def getDirectoryReplicasPage(self, path, allStatus=False, startAfter='', maxFiles=FILESPAGESIZE):
+    """ Get the replicas of a page of the files of a directory, with at most maxFiles files in name order
+
+        :param str path: directory path
+        :param bool allStatus: whether all replicas and file status are considered
+        :param str startAfter: cursor returned with the previous page, '' for the first page
+        :param int maxFiles: maximum number of files in the page
+
+        :return: S_OK with a dictionary with the keys "Replicas", { fileName : { SE : PFN } },
+                 and "Cursor", the cursor to get the next page, '' after the last page
+    """
+    result = self.findDir(path)
+    if not result['OK']:
+      return result
+    directoryID = result['Value']
+    if not directoryID:
+      return S_ERROR('Directory %s not found' % path)
+    result = self.db.fileManager.getDirectoryReplicasPage(directoryID, allStatus=allStatus,
+                                                          startAfter=startAfter, maxFiles=maxFiles)
+    if not result['OK']:
+      return result
+    return S_OK({'Replicas': result['Value'], 'Cursor': result['Cursor']})
+
   def getDirectoryReplicas(self, lfns, allStatus=False):
     """ Get replicas for files in the given directories
     """
@@ -772,37 +859,51 @@ class DirectoryTreeBase(object):
 
     return S_OK(resultDict)
 
-  def _getDirectoryLogicalSizeFromUsage(self, lfns, connection):
-    """ Get the total "logical" size of the requested directories
+  def _findUsageDirectories(self, paths, connection=False):
+    """ Find the IDs of the directories whose usage is requested
+
+        :return: S_OK( ( { path : dirID }, { path : error } ) )
     """
-    paths = lfns.keys()
-    successful = {}
+    result = self.findDirs(paths, connection)
+    if not result['OK']:
+      return result
+    dirIDs = {}
     failed = {}
     for path in paths:
-      result = self.findDir(path)
-      if not result['OK']:
-        failed[path] = "Directory not found"
-        continue
-      if not result['Value']:
+      dirID = result['Value'].get(os.path.normpath(path))
+      if dirID:
+        dirIDs[path] = dirID
+      else:
         failed[path] = "Directory not found"
-        continue
-      dirID = result['Value']
-      req = "SELECT SESize, SEFiles FROM FC_DirectoryUsage WHERE SEID=0 AND DirID=%d" % dirID
+    return S_OK((dirIDs, failed))
 
-      result = self.db._query(req, connection)
-      if not result['OK']:
-        failed[path] = result['Message']
-      elif not result['Value']:
-        successful[path] = {"LogicalSize": 0, "LogicalFiles": 0, 'LogicalDirectories': 0}
-      elif result['Value'][0][0]:
-        successful[path] = {"LogicalSize": int(result['Value'][0][0]),
-                            "LogicalFiles": int(result['Value'][0][1])}
+  def _getDirectoryLogicalSizeFromUsage(self, lfns, connection):
+    """ Get the total "logical" size of the requested directories, all read with a single query
+    """
+    result = self._findUsageDirectories(lfns.keys(), connection)
+    if not result['OK']:
+      return result
+    dirIDs, failed = result['Value']
+    successful = {}
+    if not dirIDs:
+      return S_OK({'Successful': successful, 'Failed': failed})
+
+    req = "SELECT DirID, SESize, SEFiles FROM FC_DirectoryUsage WHERE SEID=0 AND DirID IN %s"
+    result = self.db._queryInChunks(req, [dirIDs.values()], connection)
+    if not result['OK']:
+      return result
+    usageDict = dict((row[0], row[1:]) for row in result['Value'])
+
+    for path, dirID in dirIDs.iteritems():
+      seSize, seFiles = usageDict.get(dirID, (0, 0))
+      if seSize:
+        successful[path] = {"LogicalSize": int(seSize),
+                            "LogicalFiles": int(seFiles)}
         result = self.countSubdirectories(dirID, includeParent=False)
         if result['OK']:
           successful[path]['LogicalDirectories'] = result['Value']
         else:
           successful[path]['LogicalDirectories'] = -1
-
       else:
         successful[path] = {"LogicalSize": 0, "LogicalFiles": 0, 'LogicalDirectories': 0}
 
@@ -858,47 +959,46 @@ class DirectoryTreeBase(object):
     return S_OK({'Successful': successful, 'Failed': failed})
 
   def _getDirectoryPhysicalSizeFromUsage(self, lfns, connection):
-    """ Get the total size of the requested directories
+    """ Get the total size of the requested directories, all read with a single query
     """
-    paths = lfns.keys()
+    result = self._findUsageDirectories(lfns.keys(), connection)
+    if not result['OK']:
+      return result
+    dirIDs, failed = result['Value']
     successful = {}
-    failed = {}
-    for path in paths:
-      result = self.findDir(path)
-      if not result['OK']:
-        failed[path] = "Directory not found"
-        continue
-      if not result['Value']:
-        failed[path] = "Directory not found"
-        continue
-      dirID = result['Value']
+    if not dirIDs:
+      return S_OK({'Successful': successful, 'Failed': failed})
 
-      req = "SELECT S.SEID, S.SEName, D.SESize, D.SEFiles FROM FC_DirectoryUsage as D, FC_StorageElements as S"
-      req += "  WHERE S.SEID=D.SEID AND D.DirID=%d" % dirID
-      result = self.db._query(req, connection)
-      if not result['OK']:
-        failed[path] = result['Message']
-      elif not result['Value']:
-        successful[path] = {}
-      elif result['Value'][0][0]:
-        seDict = {}
-        totalSize = 0
-        totalFiles = 0
-        for seID, seName, seSize, seFiles in result['Value']:
-          if seSize or seFiles:
-            seDict[seName] = {'Size': seSize, 'Files': seFiles}
-            totalSize += seSize
-            totalFiles += seFiles
-          else:
-            req = 'DELETE FROM FC_DirectoryUsage WHERE SEID=%d AND DirID=%d' % (seID, dirID)
-            result = self.db._update(req)
-            if not result['OK']:
-              gLogger.error('Failed to delete entry from FC_DirectoryUsage', result['Message'])
-        seDict['TotalSize'] = int(totalSize)
-        seDict['TotalFiles'] = int(totalFiles)
-        successful[path] = seDict
+    req = "SELECT D.DirID, S.SEName, D.SESize, D.SEFiles FROM FC_DirectoryUsage as D, FC_StorageElements as S"
+    req += "  WHERE S.SEID=D.SEID AND D.DirID IN %s"
+    result = self.db._queryInChunks(req, [dirIDs.values()], connection)
+    if not result['OK']:
+      return result
+    usageDict = {}
+    emptyDirIDs = set()
+    for dirID, seName, seSize, seFiles in result['Value']:
+      if seSize or seFiles:
+        usageDict.setdefault(dirID, {})[seName] = {'Size': seSize, 'Files': seFiles}
       else:
+        emptyDirIDs.add(dirID)
+
+    if emptyDirIDs:
+      # Clean up the counters left empty by the removal of all the replicas
+      req = "DELETE FROM FC_DirectoryUsage WHERE SESize=0 AND SEFiles=0 AND SEID>0 AND DirID IN %s"
+      result = self.db._updateInChunks(req, [list(emptyDirIDs)])
+      if not result['OK']:
+        gLogger.error('Failed to delete entries from FC_DirectoryUsage', result['Message'])
+
+    for path, dirID in dirIDs.iteritems():
+      if dirID not in usageDict and dirID not in emptyDirIDs:
         successful[path] = {}
+        continue
+      seDict = usageDict.get(dirID, {})
+      totalSize = sum(usage['Size'] for usage in seDict.itervalues())
+      totalFiles = sum(usage['Files'] for usage in seDict.itervalues())
+      seDict['TotalSize'] = int(totalSize)
+      seDict['TotalFiles'] = int(totalFiles)
+      successful[path] = seDict
 
     return S_OK({'Successful': successful, 'Failed': failed})
 
@@ -1145,6 +1245,147 @@ class DirectoryTreeBase(object):
 
     return S_OK(resultDict)
 
+  def _getSubtreeParents(self, dirID):
+    """ Get the parent of a directory and of all its subdirectories
+
+        :return: S_OK( { dirID : parentID } )
+    """
+    return S_ERROR("To be implemented on derived class")
+
+  def _getLogicalUsageSEID(self):
+    """ Get the SE ID under which the logical usage is stored in FC_DirectoryUsage
+    """
+    return S_OK(0)
+
+  def verifyDirectoryUsage(self, path, repair=False):
+    """ Compare the usage counters of a directory and of its subdirectories with the content of
+        the file and replica tables. The tables are read in one consistent snapshot, and the
+        counters are repaired by adding the differences found, so that the changes made
+        concurrently to the verification are not lost.
+
+        :param str path: top directory of the subtree to verify
+        :param bool repair: correct the counters found different
+        :return: S_OK( { 'Directories' : number of directories verified,
+                         'Differences' : list of { 'Path', 'SE', 'StoredSize', 'StoredFiles', 'Size', 'Files' },
+                         'Repaired' : bool } )
+    """
+    result = self.findDir(path)
+    if not result['OK']:
+      return result
+    if not result['Value']:
+      return S_ERROR('Directory %s not found' % path)
+    rootID = result['Value']
+    result = self._getLogicalUsageSEID()
+    if not result['OK']:
+      return result
+    logicalSEID = result['Value']
+
+    result = self.db.transactionStart()
+    if not result['OK']:
+      return result
+    result = self.__readSubtreeUsage(rootID, logicalSEID)
+    self.db.transactionCommit()
+    if not result['OK']:
+      return result
+    parents, ownUsage, storedUsage = result['Value']
+
+    if self.recursiveUsage:
+      # The counters of a directory include the usage of all its subdirectories
+      expectedUsage = {}
+      for (dirID, seID), usage in ownUsage.iteritems():
+        while dirID in parents:
+          counter = expectedUsage.setdefault((dirID, seID), [0, 0])
+          counter[0] += usage[0]
+          counter[1] += usage[1]
+          dirID = parents[dirID] if dirID != rootID else None
+    else:
+      expectedUsage = ownUsage
+
+    usageDeltas = {}
+    for key in set(expectedUsage) | set(storedUsage):
+      expected = expectedUsage.get(key, [0, 0])
+      stored = storedUsage.get(key, [0, 0])
+      if list(expected) != list(stored):
+        usageDeltas[key] = [expected[0] - stored[0], expected[1] - stored[1]]
+
+    differences = []
+    if usageDeltas:
+      result = self.getDirectoryPaths(list(set(dirID for dirID, _seID in usageDeltas)))
+      if not result['OK']:
+        return result
+      dirPaths = result['Value']
+      for dirID, seID in sorted(usageDeltas):
+        if seID == logicalSEID:
+          seName = 'Logical'
+        else:
+          result = self.db.seManager.getSEName(seID)
+          seName = result['Value'] if result['OK'] else str(seID)
+        stored = storedUsage.get((dirID, seID), [0, 0])
+        expected = expectedUsage.get((dirID, seID), [0, 0])
+        differences.append({'Path': dirPaths.get(dirID, str(dirID)), 'SE': seName,
+                            'StoredSize': int(stored[0]), 'StoredFiles': int(stored[1]),
+                            'Size': int(expected[0]), 'Files': int(expected[1])})
+
+    if repair and usageDeltas:
+      if self.recursiveUsage:
+        # The parents of the subtree are corrected by the differences of its top directory
+        result = self.getPathIDsByID(rootID)
+        if not result['OK']:
+          return result
+        rootDeltas = [(seID, delta) for (dirID, seID), delta in usageDeltas.items() if dirID == rootID]
+        for parentID in result['Value'][:-1]:
+          for seID, delta in rootDeltas:
+            usageDeltas[(parentID, seID)] = list(delta)
+      result = self.db.fileManager.addDirectoryUsage(usageDeltas)
+      if not result['OK']:
+        return result
+
+    return S_OK({'Directories': len(parents), 'Differences': differences,
+                 'Repaired': bool(repair and usageDeltas)})
+
+  def __readSubtreeUsage(self, rootID, logicalSEID):
+    """ Read the own usage of each directory of a subtree and its stored usage counters
+
+        :return: S_OK( ( { dirID : parentID }, { ( dirID, seID ) : [ size, files ] } for the own usage,
+                         { ( dirID, seID ) : [ size, files ] } for the stored counters ) )
+    """
+    result = self._getSubtreeParents(rootID)
+    if not result['OK']:
+      return result
+    parents = result['Value']
+    dirIDs = [list(parents)]
+
+    ownUsage = {}
+    req = "SELECT DirID, SUM(Size), COUNT(*) FROM FC_Files WHERE DirID IN %s GROUP BY DirID"
+    result = self.db._queryInChunks(req, dirIDs)
+    if not result['OK']:
+      return result
+    for dirID, size, files in result['Value']:
+      ownUsage[(dirID, logicalSEID)] = [int(size or 0), int(files)]
+    req = "SELECT F.DirID, R.SEID, SUM(F.Size), COUNT(*) FROM FC_Files AS F JOIN FC_Replicas AS R "
+    req += "ON F.FileID = R.FileID WHERE F.DirID IN %s GROUP BY F.DirID, R.SEID"
+    result = self.db._queryInChunks(req, dirIDs)
+    if not result['OK']:
+      return result
+    for dirID, seID, size, files in result['Value']:
+      ownUsage[(dirID, seID)] = [int(size or 0), int(files)]
+
+    storedUsage = {}
+    req = "SELECT DirID, SEID, SESize, SEFiles FROM FC_DirectoryUsage WHERE DirID IN %s"
+    result = self.db._queryInChunks(req, dirIDs)
+    if not result['OK']:
+      return result
+    for dirID, seID, size, files in result['Value']:
+      if size or files:
+        storedUsage[(dirID, seID)] = [int(size), int(files)]
+
+    return S_OK((parents, ownUsage, storedUsage))
+
+  def getDirectoryCacheStatistics(self):
+    """ Get the hit/miss counters of the directory path <-> ID cache
+    """
+    return S_OK(self.dirCache.getStatistics())
+
   def getDirectoryCounters(self, connection=False):
     """ Get the total number of directories
     """
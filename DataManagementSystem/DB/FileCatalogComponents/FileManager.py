@@ -254,7 +254,6 @@ class FileManager(FileManagerBase):
     if res['OK']:
       statusID = res['Value']
 
-    directorySESizeDict = {}
     for lfn in lfns.keys():
       dirID = lfns[lfn]['DirID']
       fileName = os.path.basename(lfn)
@@ -267,10 +266,6 @@ class FileManager(FileManagerBase):
         if result['OK']:
           s_uid, s_gid = result['Value']
       insertTuples.append("(%d,%d,%d,%d,%d,'%s')" % (dirID, size, s_uid, s_gid, statusID, fileName))
-      directorySESizeDict.setdefault(dirID, {})
-      directorySESizeDict[dirID].setdefault(0, {'Files': 0, 'Size': 0})
-      directorySESizeDict[dirID][0]['Size'] += lfns[lfn]['Size']
-      directorySESizeDict[dirID][0]['Files'] += 1
 
     req = "INSERT INTO FC_Files (DirID,Size,UID,GID,Status,FileName) VALUES %s" % (','.join(insertTuples))
     res = self.db._update(req, connection)
@@ -290,10 +285,15 @@ class FileManager(FileManagerBase):
         lfns[lfn]['FileID'] = fileDict['FileID']
     insertTuples = []
     toDelete = []
+    directorySESizeDict = {}
     for lfn in lfns.keys():
       fileInfo = lfns[lfn]
       fileID = fileInfo['FileID']
       dirID = fileInfo['DirID']
+      directorySESizeDict.setdefault(dirID, {})
+      directorySESizeDict[dirID].setdefault(0, {'Files': 0, 'Size': 0})
+      directorySESizeDict[dirID][0]['Size'] += fileInfo['Size']
+      directorySESizeDict[dirID][0]['Files'] += 1
       checksum = fileInfo['Checksum']
       checksumtype = fileInfo.get('ChecksumType', 'Adler32')
       guid = fileInfo.get('GUID', '')
@@ -305,17 +305,14 @@ class FileManager(FileManagerBase):
     if insertTuples:
       fields = 'FileID,GUID,Checksum,ChecksumType,CreationDate,ModificationDate,Mode'
       req = "INSERT INTO FC_FileInfo (%s) VALUES %s" % (fields, ','.join(insertTuples))
-      res = self.db._update(req)
+      # The files are only complete, and accounted in the directory usage, together
+      res = self._updateWithDirectoryUsage(lambda: self.db._update(req, connection),
+                                           directorySESizeDict, '+', connection=connection)
       if not res['OK']:
         self._deleteFiles(toDelete, connection=connection)
         for lfn in lfns.keys():
           failed[lfn] = res['Message']
           lfns.pop(lfn)
-      else:
-        # Update the directory usage
-        result = self._updateDirectoryUsage(directorySESizeDict, '+', connection=connection)
-        if not result['OK']:
-          gLogger.warn("Failed to insert FC_DirectoryUsage", result['Message'])
 
     return S_OK({'Successful': lfns, 'Failed': failed})
 
@@ -387,7 +384,7 @@ class FileManager(FileManagerBase):
 
   def __deleteFileReplicas(self, fileIDs, connection=False):
     connection = self._getConnection(connection)
-    res = self.__getFileIDReplicas(fileIDs, connection=connection)
+    res = self.__getFileIDReplicas(fileIDs, allStatus=True, connection=connection)
     if not res['OK']:
       return res
     repIDs = res['Value'].keys()
@@ -492,14 +489,13 @@ class FileManager(FileManagerBase):
     if insertReplicas:
       req = "INSERT INTO FC_ReplicaInfo (RepID,RepType,CreationDate,ModificationDate,PFN) VALUES %s" % (
           ','.join(insertReplicas))
-      res = self.db._update(req, connection)
+      res = self._updateWithDirectoryUsage(lambda: self.db._update(req, connection),
+                                           directorySESizeDict, '+', connection=connection)
       if not res['OK']:
         for lfn in lfns.keys():
           failed[lfn] = res['Message']
         self.__deleteReplicas(toDelete, connection=connection)
       else:
-        # Update the directory usage
-        self._updateDirectoryUsage(directorySESizeDict, '+', connection=connection)
         for lfn in lfns.keys():
           successful[lfn] = True
     return S_OK({'Successful': successful, 'Failed': failed})
@@ -540,6 +536,7 @@ class FileManager(FileManagerBase):
 
     lfnFileIDDict = res['Value']['Successful']
     toRemove = []
+    fileIDDicts = {}
     directorySESizeDict = {}
     for lfn, fileDict in lfnFileIDDict.items():
       fileID = fileDict['FileID']
@@ -550,12 +547,7 @@ class FileManager(FileManagerBase):
           return res
       seID = res['Value']
       toRemove.append((fileID, seID))
-      # Now prepare the storage usage update
-      dirID = fileDict['DirID']
-      directorySESizeDict.setdefault(dirID, {})
-      directorySESizeDict[dirID].setdefault(seID, {'Files': 0, 'Size': 0})
-      directorySESizeDict[dirID][seID]['Size'] += fileDict['Size']
-      directorySESizeDict[dirID][seID]['Files'] += 1
+      fileIDDicts[fileID] = fileDict
     res = self._getRepIDsForReplica(toRemove, connection)
     if not res['OK']:
       for lfn in lfnFileIDDict.keys():
@@ -563,15 +555,20 @@ class FileManager(FileManagerBase):
     else:
       repIDs = []
       for fileID, seDict in res['Value'].items():
+        # Only the replicas actually removed are taken out of the storage usage
+        dirID = fileIDDicts[fileID]['DirID']
+        directorySESizeDict.setdefault(dirID, {})
         for seID, repID in seDict.items():
           repIDs.append(repID)
-      res = self.__deleteReplicas(repIDs, connection=connection)
+          directorySESizeDict[dirID].setdefault(seID, {'Files': 0, 'Size': 0})
+          directorySESizeDict[dirID][seID]['Size'] += fileIDDicts[fileID]['Size']
+          directorySESizeDict[dirID][seID]['Files'] += 1
+      res = self._updateWithDirectoryUsage(lambda: self.__deleteReplicas(repIDs, connection=connection),
+                                           directorySESizeDict, '-', connection=connection)
       if not res['OK']:
         for lfn in lfnFileIDDict.keys():
           failed[lfn] = res['Message']
       else:
-        # Update the directory usage
-        self._updateDirectoryUsage(directorySESizeDict, '-', connection=connection)
         for lfn in lfnFileIDDict.keys():
           successful[lfn] = True
     return S_OK({"Successful": successful, "Failed": failed})
@@ -625,14 +622,30 @@ class FileManager(FileManagerBase):
     if not res['OK']:
       return res
     newSE = res['Value']
+    oldSE = se
+    if isinstance(se, str):
+      res = self.db.seManager.findSE(se)
+      if not res['OK']:
+        return res
+      oldSE = res['Value']
     res = self.__getRepIDForReplica(fileID, se, connection=connection)
     if not res['OK']:
       return res
     if not res['Value']:
       return res
     repID = res['Value']
+    res = self.db._query("SELECT DirID, Size FROM FC_Files WHERE FileID = %s", connection, args=(fileID,))
+    if not res['OK']:
+      return res
+    if not res['Value']:
+      return S_ERROR("No such file or directory")
+    dirID, size = res['Value'][0]
+    # The usage of the replica moves from the old to the new SE
+    directorySESizeDict = {dirID: {oldSE: {'Files': -1, 'Size': -size},
+                                   newSE: {'Files': 1, 'Size': size}}}
     req = "UPDATE FC_Replicas SET SEID=%d WHERE RepID = %d;" % (newSE, repID)
-    return self.db._update(req, connection)
+    return self._updateWithDirectoryUsage(lambda: self.db._update(req, connection),
+                                          directorySESizeDict, '+', connection=connection)
 
   def _setReplicaParameter(self, fileID, se, paramName, paramValue, connection=False):
     connection = self._getConnection(connection)
@@ -9,9 +9,13 @@ import os
 import stat
 
 from DIRAC import S_OK, S_ERROR, gLogger
-from DIRAC.Core.Utilities.List import intListToString
+from DIRAC.Core.Utilities.List import intListToString, breakListIntoChunks
 from DIRAC.Core.Utilities.Pfn import pfnunparse
 
+# Default number of files per page of a directory listing
+FILESPAGESIZE = 10000
+# Default number of replicas per page of an SE dump
+SEDUMPPAGESIZE = 50000
 
 class FileManagerBase(object):
   """ Base class for all the specific File Managers
@@ -176,6 +180,29 @@ class FileManagerBase(object):
 
     return S_ERROR("To be implemented on derived class")
 
+  def _getDirectoryFileNamesPage(self, dirID, startAfter, maxFiles, connection=False):
+    """ Get the names of the files of a directory following a given name, in name order
+
+        :param int dirID: directory ID
+        :param str startAfter: name after which the page starts, '' for the first page
+        :param int maxFiles: maximum number of names returned
+
+        :returns: S_OK with the list of file names
+    """
+    req = "SELECT FileName FROM FC_Files WHERE DirID = %s AND FileName > %s ORDER BY FileName LIMIT %s"
+    result = self.db._query(req, connection, args=(dirID, startAfter, maxFiles))
+    if not result['OK']:
+      return result
+    return S_OK([row[0] for row in result['Value']])
+
+  def _getSEDumpPage(self, seID, lastRepID, pageSize):
+    """ To be implemented on derived class
+
+    Should return the replicas at the SE following the replica ID lastRepID, in replica ID order,
+    as a list of tuples (RepID, lfn, checksum, size)
+    """
+    return S_ERROR("To be implemented on derived class")
+
   def countFilesInDir(self, dirId):
     """ Count how many files there is in a given Directory
 
@@ -385,30 +412,71 @@ class FileManagerBase(object):
     return S_OK({'Successful': successful, 'Failed': failed})
 
   def _updateDirectoryUsage(self, directorySEDict, change, connection=False):
-    connection = self._getConnection(connection)
-    for directoryID in directorySEDict.keys():
+    """ Update the usage counters of the given directories and of all their parents
+
+        :param dict directorySEDict: { dirID : { seID : { 'Files' : n, 'Size' : size } } }, the SE ID 0
+                                     standing for the logical usage
+        :param str change: '+' or '-'
+    """
+    sign = -1 if change == '-' else 1
+    usageDeltas = {}
+    for directoryID, dirDict in directorySEDict.iteritems():
       result = self.db.dtree.getPathIDsByID(directoryID)
       if not result['OK']:
         return result
-      parentIDs = result['Value']
-      dirDict = directorySEDict[directoryID]
-      for seID in dirDict.keys():
-        seDict = dirDict[seID]
-        files = seDict['Files']
-        size = seDict['Size']
-        insertTuples = []
-        for dirID in parentIDs:
-          insertTuples.append('(%d,%d,%d,%d,UTC_TIMESTAMP())' % (dirID, seID, size, files))
-
-        req = "INSERT INTO FC_DirectoryUsage (DirID,SEID,SESize,SEFiles,LastUpdate) "
-        req += "VALUES %s" % ','.join(insertTuples)
-        req += " ON DUPLICATE KEY UPDATE SESize=SESize%s%d, SEFiles=SEFiles%s%d, LastUpdate=UTC_TIMESTAMP() " \
-            % (change, size, change, files)
-        res = self.db._update(req)
-        if not res['OK']:
-          gLogger.warn("Failed to update FC_DirectoryUsage", res['Message'])
+      for dirID in result['Value']:
+        for seID, seDict in dirDict.iteritems():
+          delta = usageDeltas.setdefault((dirID, seID), [0, 0])
+          delta[0] += sign * seDict['Size']
+          delta[1] += sign * seDict['Files']
+    return self.addDirectoryUsage(usageDeltas, connection=connection)
+
+  def addDirectoryUsage(self, usageDeltas, connection=False):
+    """ Add changes to the usage counters of directories. The counters are updated with one statement
+        per chunk, each counter once, in the order of the keys to avoid deadlocks between bulk operations
+
+        :param dict usageDeltas: { ( dirID, seID ) : [ size change, number of files change ] }
+    """
+    connection = self._getConnection(connection)
+    counters = sorted(key for key, delta in usageDeltas.iteritems() if delta[0] or delta[1])
+    for chunk in breakListIntoChunks(counters, 1000):
+      args = []
+      for dirID, seID in chunk:
+        args.extend([dirID, seID] + list(usageDeltas[(dirID, seID)]))
+      req = "INSERT INTO FC_DirectoryUsage (DirID,SEID,SESize,SEFiles,LastUpdate) VALUES %s" % \
+            ','.join(['(%s,%s,%s,%s,UTC_TIMESTAMP())'] * len(chunk))
+      req += " ON DUPLICATE KEY UPDATE SESize=SESize+VALUES(SESize), SEFiles=SEFiles+VALUES(SEFiles), "
+      req += "LastUpdate=UTC_TIMESTAMP()"
+      result = self.db._update(req, connection, args=args)
+      if not result['OK']:
+        return result
     return S_OK()
 
+  def _updateWithDirectoryUsage(self, updateFunction, directorySEDict, change, connection=False):
+    """ Execute a change of the files or replicas and the corresponding update of the directory
+        usage in one transaction, so that the usage counters do not drift when either of them fails
+
+        :param updateFunction: callable without argument executing the change, returning S_OK/S_ERROR
+        :param dict directorySEDict: usage change as for _updateDirectoryUsage
+        :param str change: '+' or '-'
+    """
+    result = self.db.transactionStart()
+    if not result['OK']:
+      return result
+    result = updateFunction()
+    if result['OK']:
+      usageResult = self._updateDirectoryUsage(directorySEDict, change, connection=connection)
+      if not usageResult['OK']:
+        gLogger.error("Failed to update FC_DirectoryUsage", usageResult['Message'])
+        result = usageResult
+    if not result['OK']:
+      self.db.transactionRollback()
+      return result
+    commitResult = self.db.transactionCommit()
+    if not commitResult['OK']:
+      return commitResult
+    return result
+
   def _populateFileAncestors(self, lfns, connection=False):
     connection = self._getConnection(connection)
     successful = {}
@@ -662,14 +730,13 @@ class FileManagerBase(object):
       return res
     directorySESizeDict = res['Value']
 
-    # Now do removal
-    res = self._deleteFiles(fileIDLfns.keys(), connection=connection)
+    # Now do removal, together with the update of the directory usage
+    res = self._updateWithDirectoryUsage(lambda: self._deleteFiles(fileIDLfns.keys(), connection=connection),
+                                         directorySESizeDict, '-', connection=connection)
     if not res['OK']:
       for lfn in fileIDLfns.values():
         failed[lfn] = res['Message']
     else:
-      # Update the directory usage
-      self._updateDirectoryUsage(directorySESizeDict, '-', connection=connection)
       for lfn in fileIDLfns.values():
         successful[lfn] = True
     return S_OK({"Successful": successful, "Failed": failed})
@@ -679,7 +746,8 @@ class FileManagerBase(object):
     fileIDLfns = {}
     for lfn, lfnDict in lfns.items():
       fileIDLfns[lfnDict['FileID']] = lfn
-    res = self._getFileReplicas(fileIDLfns.keys(), connection=connection)
+    # All the replicas are removed with the files, whatever their status
+    res = self._getFileReplicas(fileIDLfns.keys(), allStatus=True, connection=connection)
     if not res['OK']:
       return res
     directorySESizeDict = {}
@@ -1132,10 +1200,16 @@ class FileManagerBase(object):
     """
     return self._getDirectoryFileIDs(dirID, requestString=requestString)
 
-  def getFilesInDirectory(self, dirID, verbose=False, connection=False):
+  def getFilesInDirectory(self, dirID, verbose=False, connection=False, fileNames=None):
+    """ Get the metadata, and the replicas if verbose, of the files in a directory
+
+        :param int dirID: directory ID
+        :param bool verbose: if True, get also the replicas
+        :param list fileNames: names of the files to consider, all of them by default
+    """
     connection = self._getConnection(connection)
     files = {}
-    res = self._getDirectoryFiles(dirID, [], ['FileID', 'Size', 'GUID',
+    res = self._getDirectoryFiles(dirID, fileNames or [], ['FileID', 'Size', 'GUID',
                                               'Checksum', 'ChecksumType',
                                               'Type', 'UID',
                                               'GID', 'CreationDate',
@@ -1189,6 +1263,96 @@ class FileManagerBase(object):
 
     return S_OK(resultDict)
 
+  def getFilesInDirectoryPage(self, dirID, verbose=False, startAfter='', maxFiles=FILESPAGESIZE,
+                              connection=False):
+    """ Get a page of the files in a directory, the files being ordered by name. The next page
+        starts after the name returned in the 'Cursor' key of the result, '' after the last page
+
+        :param int dirID: directory ID
+        :param bool verbose: if True, get also the replicas
+        :param str startAfter: cursor returned with the previous page, '' for the first page
+        :param int maxFiles: maximum number of files in the page
+    """
+    connection = self._getConnection(connection)
+    result = self._getDirectoryFileNamesPage(dirID, startAfter, maxFiles, connection=connection)
+    if not result['OK']:
+      return result
+    fileNames = result['Value']
+    files = {}
+    if fileNames:
+      result = self.getFilesInDirectory(dirID, verbose=verbose, connection=connection, fileNames=fileNames)
+      if not result['OK']:
+        return result
+      files = result['Value']
+    result = S_OK(files)
+    result['Cursor'] = fileNames[-1] if len(fileNames) >= maxFiles else ''
+    return result
+
+  def getDirectoryReplicasPage(self, dirID, allStatus=False, startAfter='', maxFiles=FILESPAGESIZE,
+                               connection=False):
+    """ Get the replicas of a page of the files in a directory, the files being ordered by name.
+        The next page starts after the name returned in the 'Cursor' key of the result
+
+        :param int dirID: directory ID
+        :param bool allStatus: whether all replicas and file status are considered
+        :param str startAfter: cursor returned with the previous page, '' for the first page
+        :param int maxFiles: maximum number of files in the page
+
+        :returns: S_OK with a dictionary { fileName : { SE : PFN } }
+    """
+    connection = self._getConnection(connection)
+    result = self._getDirectoryFileNamesPage(dirID, startAfter, maxFiles, connection=connection)
+    if not result['OK']:
+      return result
+    fileNames = result['Value']
+    resultDict = {}
+    fileIDNames = {}
+    if fileNames:
+      result = self._getDirectoryFiles(dirID, fileNames, ['FileID'], allStatus=allStatus, connection=connection)
+      if not result['OK']:
+        return result
+      fileIDNames = dict((fileDict['FileID'], fileName) for fileName, fileDict in result['Value'].iteritems())
+    if fileIDNames:
+      result = self._getFileReplicas(fileIDNames.keys(), allStatus=allStatus, connection=connection)
+      if not result['OK']:
+        return result
+      withPFN = not self.db.lfnPfnConvention or self.db.lfnPfnConvention == "Weak"
+      for fileID, seDict in result['Value'].iteritems():
+        if seDict:
+          resultDict[fileIDNames[fileID]] = dict((se, repDict.get('PFN', '') if withPFN else '')
+                                                 for se, repDict in seDict.iteritems())
+    result = S_OK(resultDict)
+    result['Cursor'] = fileNames[-1] if len(fileNames) >= maxFiles else ''
+    return result
+
+  def iterSEDump(self, seName, pageSize=SEDUMPPAGESIZE):
+    """ Generator over the files at a given SE, together with checksum and size, read from
+        the DB by pages so that the whole dump is never held in memory
+
+        :param seName: name of the StorageElement
+        :param int pageSize: number of replicas read per query
+
+        :returns: generator of S_OK with a list of tuples (lfn, checksum, size) per page,
+                  stopping after yielding an S_ERROR if a query fails
+    """
+    res = self.db.seManager.findSE(seName)
+    if not res['OK']:
+      yield res
+      return
+    seID = res['Value']
+    lastRepID = 0
+    while True:
+      result = self._getSEDumpPage(seID, lastRepID, pageSize)
+      if not result['OK']:
+        yield result
+        return
+      rows = result['Value']
+      if rows:
+        yield S_OK([row[1:] for row in rows])
+      if len(rows) < pageSize:
+        return
+      lastRepID = rows[-1][0]
+
   def _getFileDirectories(self, lfns):
     """ For a list of lfn, returns a dictionary with key the directory, and value
         the files in that directory. It does not make any query, just splits the names
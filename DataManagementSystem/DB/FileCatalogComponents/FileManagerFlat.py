@@ -337,7 +337,9 @@ class FileManagerFlat(FileManagerBase):
   # _getFileReplicas related methods
   #
 
-  def _getFileReplicas(self, fileIDs, fields=['PFN'], connection=False):
+  def _getFileReplicas(self, fileIDs, fields=['PFN'], connection=False,
+                       allStatus=True):  # pylint: disable=unused-argument
+    """ Get the replicas of the files, whatever their status """
     connection = self._getConnection(connection)
     if not fileIDs:
       return S_ERROR("No such file or directory")
@@ -10,6 +10,7 @@ from DIRAC.Core.Utilities.List import intListToString
 from DIRAC.DataManagementSystem.Client.MetaQuery import FILE_STANDARD_METAKEYS, \
     FILES_TABLE_METAKEYS, \
     FILEINFO_TABLE_METAKEYS
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.MetaQueryPlanner import isMissing
 
 
 class FileMetadata:
@@ -493,9 +494,75 @@ class FileMetadata:
 
     return S_OK(resultList)
 
-  def __findFilesByMetadata(self, metaDict, dirList, credDict):
+  def __planMetaTables(self, userMetaDict, storageElements):
+    """ Estimate the number of rows selected in each of the metadata tables of a query
+
+        :return: S_OK( { table : estimated rows } )
+    """
+    conditions = [(meta, value, 'FC_FileMeta_%s' % meta, 'Value') for meta, value in userMetaDict.items()]
+    if storageElements:
+      conditions.append(('SE', storageElements, 'FC_Replicas', 'SEID'))
+    result = self.db.metaQueryPlanner.planConditions(conditions)
+    if not result['OK']:
+      return result
+    return S_OK(dict((step['Table'], step['EstimatedRows']) for step in result['Value']))
+
+  def __estimateDirectoryFiles(self, dirList):
+    """ Estimate the number of files in the given directories, in the whole catalog if none
+    """
+    result = self.db.metaQueryPlanner.getTableStatistics('FC_Files', 'FileID')
+    if not result['OK']:
+      return result
+    files = result['Value']['Rows']
+    if not dirList:
+      return S_OK(files)
+    result = self.db.metaQueryPlanner.getTableStatistics(self.db.dtree.getTreeTable(), 'DirID')
+    if not result['OK']:
+      return result
+    return S_OK(files * len(dirList) // max(1, result['Value']['Rows']))
+
+  def planFileQuery(self, metaDict, credDict):
+    """ Get the plan of the evaluation of the file metadata conditions of a query
+
+        :return: S_OK( list of steps, each a dict with the condition, its estimated number
+                       of selected rows and the evaluation strategy )
+    """
+    result = self.getFileMetadataFields(credDict)
+    if not result['OK']:
+      return result
+    userMetaKeys = result['Value']
+    conditions = []
+    for meta, value in metaDict.items():
+      if meta == 'SE':
+        conditions.append((meta, value, 'FC_Replicas', 'SEID'))
+      elif meta in FILES_TABLE_METAKEYS:
+        conditions.append((meta, value, 'FC_Files', FILES_TABLE_METAKEYS[meta]))
+      elif meta in FILEINFO_TABLE_METAKEYS:
+        conditions.append((meta, value, 'FC_FileInfo', FILEINFO_TABLE_METAKEYS[meta]))
+      elif meta in userMetaKeys:
+        conditions.append((meta, value, 'FC_FileMeta_%s' % meta, 'Value'))
+    result = self.db.metaQueryPlanner.planConditions(conditions)
+    if not result['OK']:
+      return result
+    steps = result['Value']
+    result = self.__estimateDirectoryFiles([])
+    if not result['OK']:
+      return result
+    files = result['Value']
+    driving = True
+    for step in steps:
+      if step['Table'] in ['FC_Files', 'FC_FileInfo']:
+        step['Strategy'] = 'Filter'
+      elif driving and step['EstimatedRows'] < files and not isMissing(step['Value']):
+        step['Strategy'] = 'Drive'
+        driving = False
+      else:
+        step['Strategy'] = 'Join'
+    return S_OK(steps)
+
+  def __findFilesByMetadata(self, metaDict, dirList, credDict, fileIDs=None):
     """ Find a list of file IDs meeting the metaDict requirements and belonging
-        to directories in dirList
+        to directories in dirList, and to fileIDs if given
     """
     # 1.- classify Metadata keys
     storageElements = None
@@ -535,32 +602,52 @@ class FileMetadata:
         return result
       tablesAndConditions.extend(result['Value'])
 
-    query = 'SELECT F.FileID FROM FC_Files F '
+    # 5.- order the joins of the metadata tables, the most selective first
+    result = self.__planMetaTables(userMetaDict, storageElements)
+    if not result['OK']:
+      return result
+    tableRows = result['Value']
+    tablesAndConditions.sort(key=lambda tc: (tc[0] in leftJoinTables, tableRows.get(tc[0], -1)))
+
     conditions = []
-    tables = []
+    fileInfoJoin = ''
+    joins = []
 
     if dirList:
       dirString = intListToString(dirList)
       conditions.append("F.DirID in (%s)" % dirString)
+    if fileIDs:
+      conditions.append("F.FileID in (%s)" % intListToString(fileIDs))
 
     counter = 0
     for table, condition in tablesAndConditions:
       if table == 'FC_FileInfo':
-        query += 'INNER JOIN FC_FileInfo FI USING( FileID ) '
+        fileInfoJoin = 'INNER JOIN FC_FileInfo FI USING( FileID ) '
         condition = condition.replace('%%', '%')
       elif table == 'FC_Files':
         condition = condition.replace('%%', '%')
       else:
         counter += 1
-        if table in leftJoinTables:
-          tables.append('LEFT JOIN %s M%d USING( FileID )' % (table, counter))
-        else:
-          tables.append('INNER JOIN %s M%d USING( FileID )' % (table, counter))
-        table = 'M%d' % counter
-        condition = condition % table
+        alias = 'M%d' % counter
+        joins.append(('LEFT JOIN' if table in leftJoinTables else 'INNER JOIN', table, alias))
+        condition = condition % alias
       conditions.append(condition)
 
-    query += ' '.join(tables)
+    # The most selective metadata table drives the join when it is estimated to select fewer rows
+    # than there are files in the directories, the other tables being joined by their primary key
+    straightJoin = False
+    if joins and joins[0][0] == 'INNER JOIN' and not fileIDs:
+      result = self.__estimateDirectoryFiles(dirList)
+      if not result['OK']:
+        return result
+      straightJoin = tableRows[joins[0][1]] < result['Value']
+    if straightJoin:
+      _joinType, table, alias = joins.pop(0)
+      query = 'SELECT STRAIGHT_JOIN F.FileID FROM %s %s INNER JOIN FC_Files F USING( FileID ) ' % (table, alias)
+    else:
+      query = 'SELECT F.FileID FROM FC_Files F '
+    query += fileInfoJoin
+    query += ' '.join(['%s %s %s USING( FileID )' % join for join in joins])
     if conditions:
       query += ' WHERE %s' % ' AND '.join(conditions)
 
@@ -579,17 +666,20 @@ class FileMetadata:
     return S_OK(fileList)
 
   @queryTime
-  def findFilesByMetadata(self, metaDict, path, credDict):
+  def findFilesByMetadata(self, metaDict, path, credDict, fileIDs=None):
     """ Find Files satisfying the given metadata
 
         :param dict metaDict: dictionary with the metaquery parameters
         :param str path: Path to search into
         :param dict credDict: Dictionary with the user credentials
+        :param list fileIDs: if given, only these files are considered
 
         :return: S_OK/S_ERROR, Value ID:LFN dictionary of selected files
     """
     if not path:
       path = '/'
+    if fileIDs is not None and not fileIDs:
+      return S_OK({})
 
     # 1.- Get Directories matching the metadata query
     result = self.db.dmeta.findDirIDsByMetadata(metaDict, path, credDict)
@@ -617,10 +707,17 @@ class FileMetadata:
 
       if fileMetaDict:
         # 3.- Do search in File Metadata
-        result = self.__findFilesByMetadata(fileMetaDict, dirList, credDict)
+        result = self.__findFilesByMetadata(fileMetaDict, dirList, credDict, fileIDs=fileIDs)
         if not result['OK']:
           return result
         fileList = result['Value']
+      elif dirList and fileIDs:
+        # 4.- if not File Metadata, keep the given files which are in the given directories
+        result = self.db._queryInChunks("SELECT FileID, DirID FROM FC_Files WHERE FileID IN %s", [fileIDs])
+        if not result['OK']:
+          return result
+        dirSet = set(dirList)
+        fileList = [fileID for fileID, dirID in result['Value'] if dirID in dirSet]
       elif dirList:
         # 4.- if not File Metadata, return the list of files in given directories
         result = self.db.dtree.getFileLFNsInDirectoryByDirectory(dirList, credDict)
@@ -0,0 +1,137 @@
+""" DIRAC FileCatalog component planning the evaluation of metadata queries
+
+    The selectivity of each metadata condition is estimated from the statistics the server
+    keeps for the metadata tables (number of rows and cardinality of the Value index), so that
+    the most selective conditions are evaluated first and the others only on their result.
+"""
+
+__RCSID__ = "$Id$"
+
+import time
+import threading
+
+from DIRAC import S_OK
+
+# Lifetime in seconds of the table statistics
+STATISTICSLIFETIME = 600
+# Fraction of the rows estimated to be selected by a range or pattern condition
+RANGESELECTIVITY = 1. / 3
+
+
+def isMissing(value):
+  """ Check if the query value selects the entries without the metadata """
+  return isinstance(value, basestring) and value.lower() == 'missing'
+
+
+def isAny(value):
+  """ Check if the query value selects all the entries with the metadata """
+  return isinstance(value, basestring) and value.lower() == 'any'
+
+
+def estimateSelectivity(value, distinct):
+  """ Estimate the fraction of the rows of a metadata table selected by a query value
+
+      :param value: query value, as in the metadata query dictionaries
+      :param int distinct: number of distinct values in the table
+      :return: float between 0 and 1
+  """
+  distinct = max(1, distinct)
+  if isAny(value) or isMissing(value):
+    return 1.
+  if isinstance(value, list):
+    return min(1., float(len(value)) / distinct)
+  if isinstance(value, dict):
+    selectivity = 1.
+    for operation, operand in value.items():
+      if operation in ['>', '<', '>=', '<=']:
+        selectivity *= RANGESELECTIVITY
+      else:
+        fraction = min(1., float(len(operand) if isinstance(operand, list) else 1) / distinct)
+        if operation in ['nin', '!=']:
+          fraction = 1. - fraction
+        selectivity *= fraction
+    return selectivity
+  if isinstance(value, basestring) and ('*' in value or '?' in value):
+    return RANGESELECTIVITY
+  return 1. / distinct
+
+
+class MetaQueryPlanner(object):
+  """ Order the conditions of the metadata queries by their estimated number of selected rows
+  """
+
+  def __init__(self, database=None, lifetime=STATISTICSLIFETIME):
+    self.db = database
+    self.lifetime = lifetime
+    self.__lock = threading.Lock()
+    self.__statistics = {}
+    self.__expiration = 0
+
+  def setDatabase(self, database):
+    self.db = database
+
+  def __loadStatistics(self):
+    """ Get the estimated number of rows and the cardinality of the indexed columns of
+        all the catalog tables, with two queries on the server statistics
+    """
+    req = "SELECT TABLE_NAME, TABLE_ROWS FROM information_schema.TABLES "
+    req += "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME LIKE 'FC\\_%'"
+    result = self.db._query(req)
+    if not result['OK']:
+      return result
+    statistics = dict((table, {'Rows': int(rows or 0), 'Distinct': {}}) for table, rows in result['Value'])
+
+    req = "SELECT TABLE_NAME, COLUMN_NAME, MAX(CARDINALITY) FROM information_schema.STATISTICS "
+    req += "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME LIKE 'FC\\_%' AND SEQ_IN_INDEX = 1 "
+    req += "GROUP BY TABLE_NAME, COLUMN_NAME"
+    result = self.db._query(req)
+    if not result['OK']:
+      return result
+    for table, column, cardinality in result['Value']:
+      if table in statistics:
+        statistics[table]['Distinct'][column] = int(cardinality or 0)
+    return S_OK(statistics)
+
+  def getTableStatistics(self, table, column='Value'):
+    """ Get the estimated number of rows of a table and of distinct values of one of its
+        indexed columns, the statistics are cached for the lifetime of the planner
+
+        :return: S_OK( { 'Rows' : rows, 'Distinct' : distinct values } ), zeros for unknown tables
+    """
+    with self.__lock:
+      if time.time() > self.__expiration:
+        result = self.__loadStatistics()
+        if not result['OK']:
+          return result
+        self.__statistics = result['Value']
+        self.__expiration = time.time() + self.lifetime
+      tableStats = self.__statistics.get(table, {'Rows': 0, 'Distinct': {}})
+    rows = tableStats['Rows']
+    return S_OK({'Rows': rows, 'Distinct': tableStats['Distinct'].get(column, rows)})
+
+  def clearStatistics(self):
+    """ Force reloading the statistics, e.g. after a metadata field is added
+    """
+    with self.__lock:
+      self.__expiration = 0
+
+  def planConditions(self, conditions):
+    """ Estimate the rows selected by each condition and order them, the most selective
+        first and the conditions on missing metadata last
+
+        :param list conditions: ( meta, value, table, column ) tuples
+        :return: S_OK( list of dicts with keys Meta, Value, Table, Rows, Distinct, Selectivity, EstimatedRows )
+    """
+    steps = []
+    for meta, value, table, column in conditions:
+      result = self.getTableStatistics(table, column)
+      if not result['OK']:
+        return result
+      stats = result['Value']
+      selectivity = estimateSelectivity(value, stats['Distinct'])
+      steps.append({'Meta': meta, 'Value': value, 'Table': table,
+                    'Rows': stats['Rows'], 'Distinct': stats['Distinct'],
+                    'Selectivity': selectivity,
+                    'EstimatedRows': int(round(stats['Rows'] * selectivity))})
+    steps.sort(key=lambda step: (isMissing(step['Value']), step['EstimatedRows']))
+    return S_OK(steps)
@@ -40,6 +40,13 @@ class DirectoryClosure( DirectoryTreeBase ):
     """
 
     dpath = os.path.normpath( path )
+    cached = self.dirCache.getID( dpath )
+    # The level is not known for the directories cached by findDirs or getDirectoryPath(s)
+    if cached and cached[1] is not None:
+      res = S_OK( cached[0] )
+      res['Level'] = cached[1]
+      return res
+
     result = self.db.executeStoredProcedure( 'ps_find_dir', ( dpath, 'ret1', 'ret2' ), outputIds = [1, 2] )
     if not result['OK']:
       return result
@@ -47,6 +54,7 @@ class DirectoryClosure( DirectoryTreeBase ):
     if not result['Value']:
       return S_OK( 0 )
 
+    self.dirCache.add( dpath, result['Value'][0], result['Value'][1] )
     res = S_OK( result['Value'][0] )
     res['Level'] = result['Value'][1]
     return res
@@ -63,12 +71,18 @@ class DirectoryClosure( DirectoryTreeBase ):
     dirDict = {}
     if not paths:
       return S_OK( dirDict )
-    dpaths = stringListToString( [os.path.normpath( path ) for path in paths ] )
+    normPaths = set( os.path.normpath( path ) for path in paths )
+    dirDict = dict( ( dpath, cached[0] ) for dpath, cached in self.dirCache.getIDs( normPaths ).iteritems() )
+    missing = normPaths - set( dirDict )
+    if not missing:
+      return S_OK( dirDict )
+    dpaths = stringListToString( list( missing ) )
     result = self.db.executeStoredProcedureWithCursor( 'ps_find_dirs', ( dpaths, ) )
     if not result['OK']:
       return result
     for dirName, dirID in result['Value']:
       dirDict[dirName] = dirID
+      self.dirCache.add( dirName, dirID )
 
     return S_OK( dirDict )
 
@@ -95,6 +109,7 @@ class DirectoryClosure( DirectoryTreeBase ):
 
     dirId = result['Value']
     result = self.db.executeStoredProcedure( 'ps_remove_dir', ( dirId, ), outputIds = [] )
+    self.dirCache.invalidate( os.path.normpath( path ), dirId )
     if not result['OK']:
       return result
 
@@ -130,6 +145,10 @@ class DirectoryClosure( DirectoryTreeBase ):
 
     """
 
+    dirName = self.dirCache.getPath( dirID )
+    if dirName:
+      return S_OK( dirName )
+
     result = self.db.executeStoredProcedure( 'ps_get_dirName_from_id', ( dirID, 'out' ), outputIds = [1] )
     if not result['OK']:
       return result
@@ -139,6 +158,7 @@ class DirectoryClosure( DirectoryTreeBase ):
     if not dirName:
       return S_ERROR( 'Directory with id %d not found' % int( dirID ) )
 
+    self.dirCache.add( dirName, dirID )
     return S_OK( dirName )
 
   def getDirectoryPaths( self, dirIDList ):
@@ -153,16 +173,20 @@ class DirectoryClosure( DirectoryTreeBase ):
       dirs = [dirIDList]
 
 
-    dirDict = {}
+    dirDict = self.dirCache.getPaths( dirs )
+    missing = [dirId for dirId in dirs if dirId not in dirDict]
+    if not missing:
+      return S_OK( dirDict )
 
     # Format the list
-    dIds = intListToString( dirs )
+    dIds = intListToString( missing )
     result = self.db.executeStoredProcedureWithCursor( 'ps_get_dirNames_from_ids', ( dIds, ) )
     if not result['OK']:
       return result
 
     for dirId, dirName in result['Value']:
       dirDict[dirId] = dirName
+      self.dirCache.add( dirName, dirId )
 
     return S_OK( dirDict )
 
@@ -392,6 +416,7 @@ class DirectoryClosure( DirectoryTreeBase ):
         return result
 
       dirId = result['Value'][0][0]
+      self.dirCache.add( dpath, dirId )
 
       result = S_OK( dirId )
       result['NewDirectory'] = True
@@ -668,6 +693,28 @@ class DirectoryClosure( DirectoryTreeBase ):
     """
     return self.__getPhysicalSize( lfns, 'ps_calculate_dir_physical_size', connection )
 
+  # The usage of each directory is stored on its own and summed over the closure table when read
+  recursiveUsage = False
+
+  def _getSubtreeParents( self, dirID ):
+    """ Get the parent of a directory and of all its subdirectories
+
+        :param dirID: id of the top directory
+
+        :returns: S_OK( { dirID : parentID } )
+    """
+    req = "SELECT c.ChildID, p.ParentID FROM FC_DirectoryClosure c LEFT JOIN FC_DirectoryClosure p"
+    req += " ON p.ChildID = c.ChildID AND p.Depth = 1 WHERE c.ParentID = %s"
+    result = self.db._query( req, args = ( dirID, ) )
+    if not result['OK']:
+      return result
+    return S_OK( dict( result['Value'] ) )
+
+  def _getLogicalUsageSEID( self ):
+    """ The logical usage is stored under the FakeSE
+    """
+    return self.db.seManager.findSE( 'FakeSE' )
+
   def _changeDirectoryParameter( self, paths,
                                  directoryFunction,
                                  _fileFunction,
@@ -7,7 +7,7 @@ import os
 import datetime
 
 from DIRAC import S_OK, S_ERROR
-from DIRAC.DataManagementSystem.DB.FileCatalogComponents.FileManagerBase import FileManagerBase
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.FileManagerBase import FileManagerBase, FILESPAGESIZE
 from DIRAC.Core.Utilities.List import stringListToString, \
     intListToString, \
     breakListIntoChunks
@@ -853,6 +853,10 @@ class FileManagerPs(FileManagerBase):
     """ This updates the directory usage, but is now done by triggers in the DB"""
     return S_OK()
 
+  def _updateWithDirectoryUsage(self, updateFunction, directorySEDict, change, connection=False):
+    """ The stored procedures update the directory usage in their own transaction """
+    return updateFunction()
+
   def _computeStorageUsageOnRemoveFile(self, lfns, connection=False):
     """Again nothing to compute, all done by the triggers"""
     directorySESizeDict = {}
@@ -922,6 +926,63 @@ class FileManagerPs(FileManagerBase):
 
     return S_OK({'Successful': successful, 'Failed': failed})
 
+  def _getDirectoryFileNamesPage(self, dirID, startAfter, maxFiles, connection=False):
+    """ Get the names of the files of a directory following a given name, in name order
+
+        :param int dirID: directory ID
+        :param str startAfter: name after which the page starts, '' for the first page
+        :param int maxFiles: maximum number of names returned
+
+        :returns: S_OK with the list of file names
+    """
+    result = self.db.executeStoredProcedureWithCursor('ps_get_file_names_in_dir_page',
+                                                      (dirID, startAfter, maxFiles))
+    if not result['OK']:
+      return result
+    return S_OK([row[0] for row in result['Value']])
+
+  def getDirectoryReplicasPage(self, dirID, allStatus=False, startAfter='', maxFiles=FILESPAGESIZE,
+                               connection=False):
+    """ Get the replicas of a page of the files in a directory, the files being ordered by name.
+        The next page starts after the name returned in the 'Cursor' key of the result.
+        As for getDirectoryReplicas, the SE names are resolved in the query
+
+        :param int dirID: directory ID
+        :param bool allStatus: whether all replicas and file status are considered
+        :param str startAfter: cursor returned with the previous page, '' for the first page
+        :param int maxFiles: maximum number of files in the page
+
+        :returns: S_OK with a dictionary { fileName : { SE : PFN } }
+    """
+    result = self._getDirectoryFileNamesPage(dirID, startAfter, maxFiles)
+    if not result['OK']:
+      return result
+    fileNames = result['Value']
+
+    resultDict = {}
+    if fileNames:
+      fStatus = stringListToString(self.db.visibleFileStatus)
+      rStatus = stringListToString(self.db.visibleReplicaStatus)
+      # The replicas of the files of the page are those in the range of names it covers
+      result = self.db.executeStoredProcedureWithCursor('ps_get_replicas_for_files_in_dir_range',
+                                                        (dirID, allStatus, fStatus, rStatus,
+                                                         startAfter, fileNames[-1]))
+      if not result['OK']:
+        return result
+      for fileName, _fileID, seName, pfn in result['Value']:
+        resultDict.setdefault(fileName, {})[seName] = pfn
+
+    result = S_OK(resultDict)
+    result['Cursor'] = fileNames[-1] if len(fileNames) >= maxFiles else ''
+    return result
+
+  def _getSEDumpPage(self, seID, lastRepID, pageSize):
+    """ Get the replicas at the SE following the replica ID lastRepID, in replica ID order
+
+        :returns: S_OK with list of tuples (RepID, lfn, checksum, size)
+    """
+    return self.db.executeStoredProcedureWithCursor('ps_get_se_dump_page', (seID, lastRepID, pageSize))
+
   def getSEDump(self, seName):
     """
          Return all the files at a given SE, together with checksum and size
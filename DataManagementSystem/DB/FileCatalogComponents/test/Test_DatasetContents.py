@@ -0,0 +1,229 @@
+""" Test the materialised contents of the FileCatalog datasets
+"""
+
+# pylint: disable=protected-access,redefined-outer-name
+
+import sqlite3
+
+import pytest
+from mock import MagicMock
+
+from DIRAC import S_OK, S_ERROR
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DatasetManager import DatasetManager, getFilesDigest
+
+
+class SQLiteCatalog(object):
+  """ Catalog DB with the file and dataset tables in SQLite, the metadata query of the dataset
+      selecting the files of the 'selected' set
+  """
+
+  def __init__(self):
+    self.conn = sqlite3.connect(':memory:')
+    self.conn.execute("CREATE TABLE FC_Files (FileID INTEGER PRIMARY KEY, DirID INTEGER, Size INTEGER)")
+    self.conn.execute("CREATE TABLE FC_MetaDatasets (DatasetID INTEGER PRIMARY KEY, DatasetName VARCHAR(128), "
+                      "MetaQuery VARCHAR(512), DirID INTEGER, TotalSize INTEGER, NumberOfFiles INTEGER, "
+                      "UID INTEGER, GID INTEGER, Status INTEGER, CreationDate DATETIME, "
+                      "ModificationDate DATETIME, DatasetHash CHAR(36), Mode INTEGER)")
+    self.conn.execute("CREATE TABLE FC_MetaDatasetFiles (DatasetID INTEGER, FileID INTEGER, "
+                      "UNIQUE (DatasetID, FileID))")
+    self.conn.execute("CREATE TABLE FC_MetaDatasetCounters (DatasetID INTEGER PRIMARY KEY, "
+                      "NumberOfFiles INTEGER NOT NULL DEFAULT 0, TotalSize INTEGER NOT NULL DEFAULT 0, "
+                      "DatasetHash CHAR(36) NOT NULL DEFAULT '', LastUpdate DATETIME)")
+    self.conn.execute("INSERT INTO FC_MetaDatasets VALUES (1, 'ds', \"{'Run': 1}\", 1, 0, 0, 0, 0, 1, "
+                      "NULL, NULL, '', 509)")
+    for fileID in xrange(1, 6):
+      self.addFile(fileID)
+    self.selected = set([1, 2, 3])
+
+    self.transactionStart = MagicMock(return_value=S_OK())
+    self.transactionCommit = MagicMock(return_value=S_OK())
+    self.transactionRollback = MagicMock(return_value=S_OK())
+    self.fileManager = MagicMock()
+    self.fileManager._getStatusInt.return_value = S_OK(1)
+    self.fileManager._getIntStatus.return_value = S_OK('Dynamic')
+    self.fileManager._getFileLFNs.side_effect = \
+        lambda fileIDs: S_OK({'Successful': dict((fileID, self.lfn(fileID)) for fileID in fileIDs)})
+    self.fileManager._findFiles.side_effect = \
+        lambda lfns, _metadata: S_OK({'Successful': dict((lfn, {'FileID': int(lfn[7:])}) for lfn in lfns)})
+    self.ugManager = MagicMock()
+    self.ugManager.getUserName.side_effect = lambda uid: S_OK('user%d' % uid)
+    self.ugManager.getGroupName.side_effect = lambda gid: S_OK('group%d' % gid)
+    self.dtree = MagicMock()
+    self.dtree.findDirs.return_value = S_OK({'/vo': 1})
+    self.dmeta = MagicMock()
+    self.dmeta.getMetadataFields.return_value = S_OK({'Run': 'INT'})
+    self.fmeta = MagicMock()
+    self.fmeta.findFilesByMetadata.side_effect = self.findFilesByMetadata
+
+  @staticmethod
+  def lfn(fileID):
+    return '/vo/a/f%d' % fileID
+
+  def addFile(self, fileID):
+    self.conn.execute("INSERT INTO FC_Files VALUES (?, 1, ?)", (fileID, 10 * fileID))
+
+  def findFilesByMetadata(self, _metaDict, _path, _credDict, fileIDs=None):
+    selected = self.selected if fileIDs is None else self.selected & set(fileIDs)
+    return S_OK(dict((fileID, self.lfn(fileID)) for fileID in selected))
+
+  @staticmethod
+  def _getConnection():
+    return S_OK(None)
+
+  def _query(self, req, conn=None, args=None):
+    req = req.replace(' FOR UPDATE', '').replace('%s', '?')
+    return S_OK(tuple(self.conn.execute(req, args or ()).fetchall()))
+
+  def _update(self, req, conn=None, args=None):
+    req = req.replace('INSERT IGNORE', 'INSERT OR IGNORE').replace('UTC_TIMESTAMP()', "'now'").replace('%s', '?')
+    if 'INNER JOIN' in req:
+      # UPDATE with a join of __recordParameters
+      req = "UPDATE FC_MetaDatasets SET (NumberOfFiles, TotalSize, DatasetHash) = (SELECT NumberOfFiles, " \
+            "TotalSize, DatasetHash FROM FC_MetaDatasetCounters C WHERE C.DatasetID=?) WHERE DatasetID=?"
+      args = tuple(args) * 2
+    return S_OK(self.conn.execute(req, args or ()).rowcount)
+
+  def _queryInChunks(self, req, args, conn=None):
+    values = list(args[-1])
+    req = req.replace('IN %s', 'IN (%s)' % ','.join(['%s'] * len(values)))
+    return self._query(req, conn, list(args[:-1]) + values)
+
+  def _updateInChunks(self, req, args, conn=None):
+    values = list(args[-1])
+    req = req.replace('IN %s', 'IN (%s)' % ','.join(['%s'] * len(values)))
+    return self._update(req, conn, list(args[:-1]) + values)
+
+
+@pytest.fixture
+def catalog():
+  return SQLiteCatalog()
+
+
+@pytest.fixture
+def datasetManager(catalog):
+  datasetManager = DatasetManager()
+  datasetManager.db = catalog
+  return datasetManager
+
+
+def getCounters(datasetManager):
+  result = datasetManager.getDatasetFilesPage('/vo/ds', {}, maxFiles=100)
+  assert result['OK'], result
+  return result['Value']
+
+
+def test_datasetPages(datasetManager, catalog):
+  # The contents are materialised when first needed
+  result = datasetManager.getDatasetFilesPage('/vo/ds', {}, startAfter=0, maxFiles=2)
+  assert result['Value'] == {'Files': ['/vo/a/f1', '/vo/a/f2'], 'Cursor': 2, 'NumberOfFiles': 3,
+                             'TotalSize': 60, 'DatasetHash': '%032X' % getFilesDigest([1, 2, 3])}
+  result = datasetManager.getDatasetFilesPage('/vo/ds', {}, startAfter=2, maxFiles=2)
+  assert (result['Value']['Files'], result['Value']['Cursor']) == (['/vo/a/f3'], 0)
+  # The query is not evaluated again
+  assert catalog.fmeta.findFilesByMetadata.call_count == 1
+
+  result = datasetManager.getDatasetFiles(['/vo/ds'], {})
+  assert sorted(result['Value']['Successful']['/vo/ds']) == ['/vo/a/f1', '/vo/a/f2', '/vo/a/f3']
+  assert catalog.fmeta.findFilesByMetadata.call_count == 1
+
+
+def test_incrementalUpdates(datasetManager, catalog):
+  getCounters(datasetManager)
+
+  # A new file is evaluated alone
+  catalog.addFile(6)
+  catalog.selected.add(6)
+  assert datasetManager.updateDatasetsForFiles(['/vo/a/f6'], {})['OK']
+  assert catalog.fmeta.findFilesByMetadata.call_args[1]['fileIDs'] == [6]
+  assert catalog.fmeta.findFilesByMetadata.call_args[0][1] == '/vo/a'
+  counters = getCounters(datasetManager)
+  assert (counters['NumberOfFiles'], counters['TotalSize']) == (4, 120)
+
+  # A change of metadata not used by the query is ignored
+  catalog.selected.discard(2)
+  catalog.fmeta.findFilesByMetadata.reset_mock()
+  assert datasetManager.updateDatasetsForFiles(['/vo/a/f2'], {}, metaNames=['Other'])['OK']
+  assert not catalog.fmeta.findFilesByMetadata.called
+  assert datasetManager.updateDatasetsForFiles(['/vo/a/f2'], {}, metaNames=['Run'])['OK']
+  counters = getCounters(datasetManager)
+  assert (counters['NumberOfFiles'], counters['TotalSize']) == (3, 100)
+
+  # Removed files leave the dataset
+  assert datasetManager.removeFilesFromDatasets({3: 30, 5: 50})['OK']
+  counters = getCounters(datasetManager)
+  assert (counters['NumberOfFiles'], counters['TotalSize']) == (2, 70)
+  assert counters['Files'] == ['/vo/a/f1', '/vo/a/f6']
+  # The digest is the one of the files in the dataset, whatever the history
+  assert counters['DatasetHash'] == '%032X' % getFilesDigest([6, 1])
+
+
+def test_checkAndUpdateDataset(datasetManager, catalog):
+  result = datasetManager.checkDataset({'ds': True}, {})
+  assert result['Value']['Successful']['ds']['NumberOfFiles'] == (0, 3)
+  assert catalog.fmeta.findFilesByMetadata.call_count == 1
+
+  # The update evaluates the query in full and records the parameters
+  catalog.selected = set([4, 5])
+  assert datasetManager.updateDataset({'ds': True}, {})['OK']
+  assert catalog.fmeta.findFilesByMetadata.call_count == 2
+  assert datasetManager.checkDataset({'ds': True}, {})['Value']['Successful']['ds'] == {}
+  counters = getCounters(datasetManager)
+  assert (counters['Files'], counters['TotalSize']) == (['/vo/a/f4', '/vo/a/f5'], 90)
+  assert catalog.transactionCommit.called and not catalog.transactionRollback.called
+
+
+def test_pathAndOwner(datasetManager, catalog):
+  """ the datasets out of the path of the changes are skipped, the others are evaluated as their owner """
+  catalog.conn.execute("INSERT INTO FC_MetaDatasets VALUES (2, 'other', \"{'Run': 1, 'Path': '/vo/b'}\", 1, 0, 0, "
+                       "3, 4, 1, NULL, NULL, '', 509)")
+  catalog.conn.execute("INSERT INTO FC_MetaDatasetCounters (DatasetID) VALUES (2)")
+  catalog.dmeta.getMetadataFields.return_value = S_OK({'Run': 'MetaSet'})
+  catalog.dmeta.getMetadataSet.return_value = S_OK({'Run': 1})
+  getCounters(datasetManager)
+  catalog.fmeta.findFilesByMetadata.reset_mock()
+  catalog.dmeta.getMetadataSet.reset_mock()
+
+  catalog.addFile(6)
+  catalog.selected.add(6)
+  caller = {'username': 'caller', 'group': 'callergroup', 'properties': []}
+  assert datasetManager.updateDatasetsForFiles(['/vo/a/f6'], caller, metaNames=['Run'])['OK']
+  assert catalog.fmeta.findFilesByMetadata.call_count == 1
+  assert catalog.dmeta.getMetadataSet.call_count == 1
+  credDict = catalog.fmeta.findFilesByMetadata.call_args[0][2]
+  assert (credDict['username'], credDict['group']) == ('user0', 'group0')
+  assert catalog.dmeta.getMetadataSet.call_args[0][2]['username'] == 'user0'
+
+  # A directory in the path of a dataset changes it, a directory elsewhere does not
+  catalog.dtree.findDir.return_value = S_OK(7)
+  catalog.dtree.getSubdirectoriesByID.return_value = S_OK('7')
+  catalog.fmeta.findFilesByMetadata.reset_mock()
+  assert datasetManager.updateDatasetsForDirectory('/vo/c', caller)['OK']
+  assert datasetManager.updateDatasetsForDirectory('/vo/b/sub', caller)['OK']
+  assert [(call[0][1], call[0][2]['username']) for call in catalog.fmeta.findFilesByMetadata.call_args_list] == \
+      [('/vo/c', 'user0'), ('/vo/b/sub', 'user0'), ('/vo/b/sub', 'user3')]
+
+
+def test_failedUpdate(datasetManager, catalog):
+  """ a dataset which fails to be updated is evaluated anew at its next access, the others are still updated """
+  catalog.conn.execute("INSERT INTO FC_MetaDatasets VALUES (2, 'other', \"{'Run': 1}\", 1, 0, 0, "
+                       "3, 4, 1, NULL, NULL, '', 509)")
+  catalog.conn.execute("INSERT INTO FC_MetaDatasetCounters (DatasetID) VALUES (2)")
+  getCounters(datasetManager)
+
+  catalog.addFile(6)
+  catalog.selected.add(6)
+  findFilesByMetadata = catalog.findFilesByMetadata
+  catalog.fmeta.findFilesByMetadata.side_effect = \
+      lambda metaDict, path, credDict, fileIDs=None: S_ERROR('Query failed') if credDict['username'] == 'user0' \
+      else findFilesByMetadata(metaDict, path, credDict, fileIDs=fileIDs)
+  assert datasetManager.updateDatasetsForFiles(['/vo/a/f6'], {})['OK']
+  assert not catalog.conn.execute("SELECT * FROM FC_MetaDatasetCounters WHERE DatasetID=1").fetchall()
+  result = datasetManager.getDatasetFilesPage('/vo/other', {}, maxFiles=100)
+  assert (result['Value']['Files'], result['Value']['NumberOfFiles']) == (['/vo/a/f6'], 1)
+
+  # The invalidated dataset is evaluated in full
+  catalog.fmeta.findFilesByMetadata.side_effect = findFilesByMetadata
+  catalog.fmeta.findFilesByMetadata.reset_mock()
+  counters = getCounters(datasetManager)
+  assert (counters['Files'], counters['TotalSize']) == (['/vo/a/f1', '/vo/a/f2', '/vo/a/f3', '/vo/a/f6'], 120)
+  assert catalog.fmeta.findFilesByMetadata.call_args[1]['fileIDs'] is None
@@ -0,0 +1,74 @@
+""" Test the directory path <-> ID cache of the FileCatalog
+"""
+
+# pylint: disable=protected-access
+
+import time
+
+from mock import MagicMock
+
+from DIRAC import S_OK
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryCache import DirectoryCache
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryLevelTree import DirectoryLevelTree
+
+
+def test_lru():
+  cache = DirectoryCache(maxSize=2)
+  cache.add('/vo', 2, 1)
+  cache.add('/vo/data', 3, 2)
+  assert cache.getID('/vo') == (2, 1)
+  # /vo/data is the least recently used
+  cache.add('/vo/user', 4, 2)
+  assert cache.getIDs(['/vo', '/vo/data', '/vo/user']) == {'/vo': (2, 1), '/vo/user': (4, 2)}
+  assert cache.getPaths([2, 3, 4]) == {2: '/vo', 4: '/vo/user'}
+
+  cache.invalidate(dirID=4)
+  assert cache.getID('/vo/user') is None
+  cache.invalidate('/vo')
+  assert cache.getPath(2) is None
+
+  stats = cache.getStatistics()
+  assert (stats['Hits'], stats['Misses'], stats['Evictions'], stats['Size']) == (5, 4, 1, 0)
+
+
+def test_lifetime():
+  cache = DirectoryCache(lifetime=0.05)
+  cache.add('/vo', 2, 1)
+  assert cache.getID('/vo') == (2, 1)
+  time.sleep(0.1)
+  assert cache.getID('/vo') is None
+  assert cache.getPath(2) is None
+
+  # Disabled cache
+  cache.configure(maxSize=0)
+  cache.add('/vo', 2, 1)
+  assert cache.getStatistics()['Size'] == 0
+
+
+def test_levelTree():
+  dbMock = MagicMock()
+  dbMock._queryInChunks.return_value = S_OK((('/vo', 2, 1), ('/vo/data', 3, 2)))
+  dlt = DirectoryLevelTree(dbMock)
+
+  lfnDirs = ['/vo/data', '/vo/data/', '/vo', '/vo/missing']
+  assert dlt.findDirs(lfnDirs)['Value'] == {'/vo': 2, '/vo/data': 3}
+  assert dbMock._queryInChunks.call_count == 1
+  # Each distinct directory is looked up once
+  assert sorted(dbMock._queryInChunks.call_args[0][1][0]) == ['/vo', '/vo/data', '/vo/missing']
+
+  # The directories found are served by the cache, by path and by ID
+  dbMock._queryInChunks.return_value = S_OK(())
+  assert dlt.findDirs(lfnDirs)['Value'] == {'/vo': 2, '/vo/data': 3}
+  assert dbMock._queryInChunks.call_args[0][1][0] == ['/vo/missing']
+  result = dlt.findDir('/vo/data')
+  assert (result['Value'], result['Level']) == (3, 2)
+  assert dlt.getDirectoryPath(3)['Value'] == '/vo/data'
+  assert dlt.getDirectoryPaths([2, 3])['Value'] == {2: '/vo', 3: '/vo/data'}
+  assert not dbMock._query.called
+
+  # A removed directory is not in the cache anymore
+  dbMock._update.return_value = S_OK(1)
+  assert dlt.removeDir('/vo/data')['DirID'] == 3
+  dbMock._query.return_value = S_OK(())
+  assert dlt.findDir('/vo/data')['Value'] == ''
+  assert dlt.getDirectoryCacheStatistics()['Value']['Size'] == 1
@@ -0,0 +1,77 @@
+""" Test the paginated directory listings of the FileCatalog
+"""
+
+# pylint: disable=protected-access
+
+from mock import MagicMock
+
+from DIRAC import S_OK
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.FileManager import FileManager
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryLevelTree import DirectoryLevelTree
+
+
+def test_filesPage():
+  dbMock = MagicMock()
+  fileManager = FileManager(dbMock)
+  fileManager._getDirectoryFiles = MagicMock(return_value=S_OK({'a': {'FileID': 1}, 'b': {'FileID': 2}}))
+
+  dbMock._query.return_value = S_OK((('a',), ('b',)))
+  result = fileManager.getFilesInDirectoryPage(5, startAfter='', maxFiles=2)
+  assert sorted(result['Value']) == ['a', 'b']
+  # A full page, the next one starts after its last file
+  assert result['Cursor'] == 'b'
+  assert dbMock._query.call_args[1]['args'] == (5, '', 2)
+  assert fileManager._getDirectoryFiles.call_args[0][:2] == (5, ['a', 'b'])
+
+  dbMock._query.return_value = S_OK((('c',),))
+  fileManager._getDirectoryFiles.return_value = S_OK({'c': {'FileID': 3}})
+  result = fileManager.getFilesInDirectoryPage(5, startAfter='b', maxFiles=2)
+  assert list(result['Value']) == ['c']
+  assert result['Cursor'] == ''
+
+  # Past the last file, no metadata is looked up
+  fileManager._getDirectoryFiles.reset_mock()
+  dbMock._query.return_value = S_OK(())
+  result = fileManager.getFilesInDirectoryPage(5, startAfter='c', maxFiles=2)
+  assert (result['Value'], result['Cursor']) == ({}, '')
+  assert not fileManager._getDirectoryFiles.called
+
+
+def test_replicasPage():
+  dbMock = MagicMock()
+  dbMock.lfnPfnConvention = 'Weak'
+  fileManager = FileManager(dbMock)
+  dbMock._query.return_value = S_OK((('a',), ('b',)))
+  fileManager._getDirectoryFiles = MagicMock(return_value=S_OK({'a': {'FileID': 1}, 'b': {'FileID': 2}}))
+  fileManager._getFileReplicas = MagicMock(return_value=S_OK({1: {'SE-A': {'PFN': 'pfnA', 'Status': 'AprioriGood'}},
+                                                              2: {}}))
+  result = fileManager.getDirectoryReplicasPage(5, maxFiles=3)
+  # Files without visible replicas are not returned
+  assert result['Value'] == {'a': {'SE-A': 'pfnA'}}
+  assert result['Cursor'] == ''
+
+
+def test_listDirectoryPage():
+  dbMock = MagicMock()
+  dtree = DirectoryLevelTree(dbMock)
+  dtree.findDir = MagicMock(return_value=S_OK(5))
+  dtree.getChildren = MagicMock(return_value=S_OK([6]))
+  dtree.getDirectoryPath = MagicMock(return_value=S_OK('/vo/dir/sub'))
+  dbMock.datasetManager.getDatasetsInDirectory.return_value = S_OK({})
+  filesPage = S_OK({'a': {'MetaData': {}}})
+  filesPage['Cursor'] = 'a'
+  dbMock.fileManager.getFilesInDirectoryPage.return_value = filesPage
+
+  result = dtree.listDirectoryPage('/vo/dir', maxFiles=1)
+  assert result['Value'] == {'Files': {'a': {'MetaData': {}}}, 'SubDirs': {'/vo/dir/sub': True},
+                             'Links': {}, 'Datasets': {}, 'Cursor': 'a'}
+
+  # The subdirectories come with the first page only
+  dtree.getChildren.reset_mock()
+  result = dtree.listDirectoryPage('/vo/dir', startAfter='a', maxFiles=1)
+  assert result['Value']['SubDirs'] == {}
+  assert not dtree.getChildren.called
+  assert dbMock.fileManager.getFilesInDirectoryPage.call_args[1]['startAfter'] == 'a'
+
+  dtree.findDir.return_value = S_OK('')
+  assert not dtree.listDirectoryPage('/vo/missing')['OK']
@@ -0,0 +1,91 @@
+""" Test the incremental update and the verification of the directory usage of the FileCatalog
+"""
+
+# pylint: disable=protected-access
+
+from mock import MagicMock
+
+from DIRAC import S_OK, S_ERROR
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.FileManager import FileManager
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryLevelTree import DirectoryLevelTree
+
+
+def test_updateDirectoryUsage():
+  dbMock = MagicMock()
+  dbMock.dtree.getPathIDsByID.side_effect = lambda dirID: S_OK([1, 2, dirID])
+  dbMock._update.return_value = S_OK(1)
+  fileManager = FileManager(dbMock)
+
+  directorySEDict = {5: {0: {'Files': 1, 'Size': 10}, 3: {'Files': 1, 'Size': 10}},
+                     6: {0: {'Files': 2, 'Size': 5}}}
+  assert fileManager._updateDirectoryUsage(directorySEDict, '-')['OK']
+  # A single statement, the common parents being updated once
+  assert dbMock._update.call_count == 1
+  args = dbMock._update.call_args[1]['args']
+  rows = [tuple(args[i:i + 4]) for i in xrange(0, len(args), 4)]
+  assert rows == [(1, 0, -15, -3), (1, 3, -10, -1), (2, 0, -15, -3), (2, 3, -10, -1),
+                  (5, 0, -10, -1), (5, 3, -10, -1), (6, 0, -5, -2)]
+
+  dbMock._update.return_value = S_ERROR('Lock wait timeout exceeded')
+  assert not fileManager._updateDirectoryUsage(directorySEDict, '+')['OK']
+
+
+def test_updateWithDirectoryUsage():
+  dbMock = MagicMock()
+  dbMock.dtree.getPathIDsByID.return_value = S_OK([1, 5])
+  dbMock.transactionStart.return_value = S_OK()
+  dbMock.transactionCommit.return_value = S_OK()
+  fileManager = FileManager(dbMock)
+  directorySEDict = {5: {0: {'Files': 1, 'Size': 10}}}
+
+  dbMock._update.return_value = S_OK(1)
+  assert fileManager._updateWithDirectoryUsage(lambda: S_OK(2), directorySEDict, '+')['Value'] == 2
+  assert dbMock.transactionCommit.called and not dbMock.transactionRollback.called
+
+  # The change is rolled back with the failed usage update
+  dbMock.transactionCommit.reset_mock()
+  dbMock._update.return_value = S_ERROR('Deadlock found')
+  assert not fileManager._updateWithDirectoryUsage(lambda: S_OK(2), directorySEDict, '+')['OK']
+  assert dbMock.transactionRollback.called and not dbMock.transactionCommit.called
+
+  # The usage is not updated when the change fails
+  dbMock._update.reset_mock()
+  assert not fileManager._updateWithDirectoryUsage(lambda: S_ERROR('Failed'), directorySEDict, '+')['OK']
+  assert not dbMock._update.called
+
+
+def test_verifyDirectoryUsage():
+  dbMock = MagicMock()
+  dbMock.transactionStart.return_value = S_OK()
+  dbMock.seManager.getSEName.return_value = S_OK('SE-A')
+  dbMock.fileManager.addDirectoryUsage.return_value = S_OK()
+  dtree = DirectoryLevelTree(dbMock)
+  dtree.findDir = MagicMock(return_value=S_OK(2))
+  # /vo/data (2) with its subdirectories 3 and 4
+  dtree._getSubtreeParents = MagicMock(return_value=S_OK({2: 1, 3: 2, 4: 2}))
+  dtree.getDirectoryPaths = MagicMock(return_value=S_OK({2: '/vo/data', 3: '/vo/data/a'}))
+  dtree.getPathIDsByID = MagicMock(return_value=S_OK([1, 2]))
+
+  def queryInChunks(req, _args):
+    if 'FC_Replicas' in req:
+      return S_OK(((3, 7, 100, 2), (4, 7, 50, 1)))
+    if 'FC_DirectoryUsage' in req:
+      return S_OK(((2, 0, 150, 3), (2, 7, 120, 3), (3, 0, 100, 2), (3, 7, 100, 2), (3, 8, 0, 0),
+                   (4, 0, 50, 1), (4, 7, 50, 1)))
+    return S_OK(((3, 100, 2), (4, 50, 1)))
+  dbMock._queryInChunks.side_effect = queryInChunks
+
+  result = dtree.verifyDirectoryUsage('/vo/data')
+  assert result['Value'] == {'Directories': 3, 'Repaired': False,
+                             'Differences': [{'Path': '/vo/data', 'SE': 'SE-A', 'StoredSize': 120, 'StoredFiles': 3,
+                                              'Size': 150, 'Files': 3}]}
+  assert dbMock.transactionCommit.called
+  assert not dbMock.fileManager.addDirectoryUsage.called
+
+  # The parent of the subtree is corrected as well
+  result = dtree.verifyDirectoryUsage('/vo/data', repair=True)
+  assert result['Value']['Repaired']
+  assert dbMock.fileManager.addDirectoryUsage.call_args[0][0] == {(2, 7): [30, 0], (1, 7): [30, 0]}
+
+  dtree.findDir.return_value = S_OK(0)
+  assert not dtree.verifyDirectoryUsage('/vo/missing')['OK']
@@ -0,0 +1,135 @@
+""" Test the planning of the metadata queries of the FileCatalog
+"""
+
+# pylint: disable=protected-access,redefined-outer-name
+
+import sqlite3
+
+import pytest
+from mock import MagicMock
+
+from DIRAC import S_OK
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.MetaQueryPlanner import MetaQueryPlanner, \
+    estimateSelectivity
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryMetadata import DirectoryMetadata
+
+# /vo, /vo/mc, /vo/data, /vo/mc/run1, /vo/mc/run2, /vo/data/run1
+PARENTS = {1: 0, 2: 1, 3: 2, 4: 2, 5: 3, 6: 3, 7: 4}
+METADATA = {'Type': {3: 'MC', 4: 'Data'},
+            'Year': {2: 2017},
+            'Run': {5: 1, 6: 2, 7: 1}}
+
+
+class SQLiteCatalog(object):
+  """ Catalog DB with the directory metadata tables in SQLite, and a tree of directories in memory """
+
+  def __init__(self):
+    self.conn = sqlite3.connect(':memory:')
+    self.conn.execute("CREATE TABLE FC_MetaFields (MetaName VARCHAR(64), MetaType VARCHAR(32))")
+    self.conn.execute("CREATE TABLE Dirs (DirID INTEGER, ParentID INTEGER)")
+    self.conn.execute("CREATE TABLE Closure (ParentID INTEGER, ChildID INTEGER, Depth INTEGER)")
+    for meta, values in METADATA.items():
+      self.conn.execute("INSERT INTO FC_MetaFields VALUES (?, 'VARCHAR(128)')", (meta,))
+      self.conn.execute("CREATE TABLE FC_Meta_%s (DirID INTEGER, Value VARCHAR(128))" % meta)
+      self.conn.executemany("INSERT INTO FC_Meta_%s VALUES (?, ?)" % meta, values.items())
+    for dirID in PARENTS:
+      self.conn.execute("INSERT INTO Dirs VALUES (?, ?)", (dirID, PARENTS[dirID]))
+      for depth, parentID in enumerate(reversed(self.getPathIDs(dirID))):
+        self.conn.execute("INSERT INTO Closure VALUES (?, ?, ?)", (parentID, dirID, depth))
+    self.tableRows = dict(('FC_Meta_%s' % meta, len(values)) for meta, values in METADATA.items())
+    self.distinct = dict(('FC_Meta_%s' % meta, len(set(values.values()))) for meta, values in METADATA.items())
+    self.metaQueryPlanner = MetaQueryPlanner(self)
+    self.dtree = MagicMock()
+    self.dtree.getTreeTable.return_value = 'Dirs'
+    self.dtree.getPathIDsByID.side_effect = lambda dirID: S_OK(self.getPathIDs(dirID))
+    self.dtree.getSubdirectoriesByID.side_effect = self.getSubdirectories
+    self.dtree.getAllSubdirectoriesByID.side_effect = \
+        lambda dirIDs: S_OK([d for d in PARENTS if set(self.getPathIDs(d)[:-1]) & set(dirIDs)])
+    self.queries = []
+
+  @staticmethod
+  def getPathIDs(dirID):
+    pathIDs = []
+    while dirID:
+      pathIDs.insert(0, dirID)
+      dirID = PARENTS[dirID]
+    return pathIDs
+
+  @staticmethod
+  def getSubdirectories(dirID, requestString=False, includeParent=False):
+    assert requestString
+    req = "SELECT ChildID AS DirID FROM Closure WHERE ParentID = %d" % dirID
+    if not includeParent:
+      req += " AND Depth != 0"
+    return S_OK(req)
+
+  def _query(self, req, conn=None, args=None):
+    self.queries.append(req)
+    if 'information_schema.TABLES' in req:
+      return S_OK(tuple(self.tableRows.items()))
+    if 'information_schema.STATISTICS' in req:
+      return S_OK(tuple((table, 'Value', distinct) for table, distinct in self.distinct.items()))
+    return S_OK(tuple(self.conn.execute(req.replace('%%', '%'), args or ()).fetchall()))
+
+  def _queryInChunks(self, req, args, conn=None):
+    values = list(args[0])
+    req = req.replace('%s', '(%s)' % ','.join(['?'] * len(values)), 1)
+    return self._query(req, conn, values)
+
+
+@pytest.fixture
+def catalog():
+  return SQLiteCatalog()
+
+
+def test_estimateSelectivity():
+  assert estimateSelectivity('MC', 4) == 0.25
+  assert estimateSelectivity(['MC', 'Data'], 4) == 0.5
+  assert estimateSelectivity({'nin': ['MC']}, 4) == 0.75
+  assert estimateSelectivity({'>': 1, '<': 5}, 4) == pytest.approx(1. / 9)
+  assert estimateSelectivity('Any', 4) == estimateSelectivity('Missing', 4) == 1.
+  assert estimateSelectivity('run*', 0) == pytest.approx(1. / 3)
+
+
+def test_planConditions(catalog):
+  catalog.tableRows['FC_Meta_Run'] = 3000
+  catalog.distinct['FC_Meta_Run'] = 1000
+  conditions = [('Year', 2017, 'FC_Meta_Year', 'Value'), ('Run', 1, 'FC_Meta_Run', 'Value'),
+                ('Type', 'Missing', 'FC_Meta_Type', 'Value'), ('Type2', {'>': 1}, 'FC_Meta_Unknown', 'Value')]
+  steps = catalog.metaQueryPlanner.planConditions(conditions)['Value']
+  assert [(step['Meta'], step['EstimatedRows']) for step in steps] == [('Type2', 0), ('Year', 1),
+                                                                       ('Run', 3), ('Type', 2)]
+  # The statistics are cached
+  catalog.metaQueryPlanner.planConditions(conditions)
+  assert len(catalog.queries) == 2
+
+
+@pytest.mark.parametrize('queryDict, expected', [
+    ({'Type': 'MC'}, [3, 5, 6]),
+    ({'Type': 'MC', 'Run': 1}, [5]),
+    ({'Year': 2017, 'Run': 1}, [5, 7]),
+    ({'Year': 2017, 'Type': ['MC', 'Data'], 'Run': {'in': [1, 2]}}, [5, 6, 7]),
+    ({'Type': 'MC', 'Run': 'Missing'}, [3]),
+    ({'Type': 'Data', 'Run': 2}, []),
+])
+def test_findDirIDsByMetadata(catalog, queryDict, expected):
+  dmeta = DirectoryMetadata(catalog)
+  result = dmeta.findDirIDsByMetadata(queryDict, '/', {})
+  assert sorted(result['Value']) == expected
+  assert result['Selection'] == ('Done' if expected else 'None')
+
+
+def test_restrictRoots(catalog):
+  dmeta = DirectoryMetadata(catalog)
+  # The roots inheriting the metadata are kept, the directories defining it below them are added
+  for estimatedRows in [0, 100]:
+    result = dmeta._DirectoryMetadata__restrictRoots(set([2, 3]), 'Run', 1, estimatedRows)
+    assert result['Value'] == set([5, 7])
+    result = dmeta._DirectoryMetadata__restrictRoots(set([5, 4]), 'Type', 'MC', estimatedRows)
+    assert result['Value'] == set([5])
+
+  # The plan starts with the most selective condition
+  catalog.tableRows['FC_Meta_Year'] = 1000
+  steps = dmeta.planDirectoryQuery({'Year': 2017, 'Run': 1, 'Type': 'Missing'}, {})['Value']
+  assert [(step['Meta'], step['Strategy']) for step in steps] == [('Run', 'Scan'), ('Year', 'SemiJoin'),
+                                                                  ('Type', 'Exclude')]
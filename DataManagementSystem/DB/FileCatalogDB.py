@@ -6,6 +6,7 @@ from DIRAC import gLogger, S_OK, S_ERROR
 from DIRAC.Core.Base.DB import DB
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryMetadata import DirectoryMetadata
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.FileMetadata import FileMetadata
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.MetaQueryPlanner import MetaQueryPlanner
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectorySimpleTree import DirectorySimpleTree
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryNodeTree import DirectoryNodeTree
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryLevelTree import DirectoryLevelTree
@@ -13,6 +14,7 @@ from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryFlatTree impor
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.WithFkAndPs.DirectoryClosure import DirectoryClosure
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.FileManagerFlat import FileManagerFlat
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.FileManager import FileManager
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.FileManagerBase import FILESPAGESIZE
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.WithFkAndPs.FileManagerPs import FileManagerPs
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.SEManager import SEManagerCS, SEManagerDB
 
@@ -83,6 +85,10 @@ class FileCatalogDB(DB):
     except Exception as x:
       gLogger.fatal("Failed to create database objects", x)
       return S_ERROR("Failed to create database objects")
+    self.metaQueryPlanner = MetaQueryPlanner(self)
+
+    self.dtree.dirCache.configure(maxSize=databaseConfig.get('DirectoryCacheSize'),
+                                  lifetime=databaseConfig.get('DirectoryCacheLifetime'))
 
     return S_OK()
 
@@ -424,8 +430,23 @@ class FileCatalogDB(DB):
       return res
     failed.update(res['Value']['Failed'])
     successful = res['Value']['Successful']
+    self.__updateDatasets(successful, credDict)
     return S_OK({'Successful': successful, 'Failed': failed})
 
+  def __updateDatasets(self, lfns, credDict, metaNames=None):
+    """ Update the contents of the dynamic datasets after a change of files. The datasets which
+        fail to be updated are evaluated anew at their next access, the failure is only logged,
+        the change of the files being done
+
+        :param lfns: files added or modified
+        :param list metaNames: metadata modified, None for new files
+    """
+    if not lfns:
+      return
+    result = self.datasetManager.updateDatasetsForFiles(list(lfns), credDict, metaNames=metaNames)
+    if not result['OK']:
+      gLogger.error("Failed to update the dataset contents", result['Message'])
+
   def setFileStatus(self, lfns, credDict):
     """
       Set the status of a File
@@ -450,6 +471,7 @@ class FileCatalogDB(DB):
       return res
     failed.update(res['Value']['Failed'])
     successful = res['Value']['Successful']
+    self.__updateDatasets(successful, credDict, metaNames=['Status'])
     return S_OK({'Successful': successful, 'Failed': failed})
 
   def removeFile(self, lfns, credDict):
@@ -471,11 +493,22 @@ class FileCatalogDB(DB):
     if not res['Value']['Successful']:
       return S_OK({'Successful': {}, 'Failed': failed})
 
-    res = self.fileManager.removeFile(res['Value']['Successful'])
+    # The files are removed from the datasets after their removal, their IDs and sizes are needed
+    lfns = res['Value']['Successful']
+    res = self.fileManager._findFiles(list(lfns), ['FileID', 'Size'])
+    if not res['OK']:
+      return res
+    fileDicts = res['Value']['Successful']
+
+    res = self.fileManager.removeFile(lfns)
     if not res['OK']:
       return res
     failed.update(res['Value']['Failed'])
     successful = res['Value']['Successful']
+    result = self.datasetManager.removeFilesFromDatasets(dict((fileDicts[lfn]['FileID'], fileDicts[lfn]['Size'])
+                                                              for lfn in successful if lfn in fileDicts))
+    if not result['OK']:
+      gLogger.error("Failed to update the dataset contents", result['Message'])
     return S_OK({'Successful': successful, 'Failed': failed})
 
   def addReplica(self, lfns, credDict):
@@ -503,6 +536,7 @@ class FileCatalogDB(DB):
       return res
     failed.update(res['Value']['Failed'])
     successful = res['Value']['Successful']
+    self.__updateDatasets(successful, credDict, metaNames=['SE'])
     return S_OK({'Successful': successful, 'Failed': failed})
 
   def removeReplica(self, lfns, credDict):
@@ -530,6 +564,7 @@ class FileCatalogDB(DB):
       return res
     failed.update(res['Value']['Failed'])
     successful = res['Value']['Successful']
+    self.__updateDatasets(successful, credDict, metaNames=['SE'])
     return S_OK({'Successful': successful, 'Failed': failed})
 
   def setReplicaStatus(self, lfns, credDict):
@@ -962,6 +997,58 @@ class FileCatalogDB(DB):
     return S_OK({'Successful': successful, 'Failed': failed,
                  'SEPrefixes': res['Value'].get('SEPrefixes', {})})
 
+  def listDirectoryPage(self, lfn, credDict, verbose=False, startAfter='', maxFiles=FILESPAGESIZE):
+    """
+        List a page of a directory, the files being ordered by name
+
+        :param str lfn: directory
+        :param creDict: credential
+        :param bool verbose: if True, get the details of the entries
+        :param str startAfter: cursor returned with the previous page, '' for the first page
+        :param int maxFiles: maximum number of files in the page
+
+        :return: S_OK with a dictionary indexed "Files", "Datasets", "SubDirs", "Links" and "Cursor",
+           the cursor to give to get the next page, '' after the last page
+    """
+    res = self._checkPathPermissions('listDirectory', lfn, credDict)
+    if not res['OK']:
+      return res
+    if not res['Value']['Successful']:
+      return S_ERROR(res['Value']['Failed'].values()[0])
+    # The normalised path
+    lfn = res['Value']['Successful'].keys()[0]
+    return self.dtree.listDirectoryPage(lfn, verbose=verbose, startAfter=startAfter, maxFiles=maxFiles)
+
+  def getDirectoryReplicasPage(self, lfn, allStatus, credDict, startAfter='', maxFiles=FILESPAGESIZE):
+    """
+        Get the replicas of a page of the files of a directory, the files being ordered by name
+
+        :param str lfn: directory
+        :param bool allStatus: whether all replicas and file status are considered
+        :param creDict: credential
+        :param str startAfter: cursor returned with the previous page, '' for the first page
+        :param int maxFiles: maximum number of files in the page
+
+        :return: S_OK with a dictionary indexed "Replicas", { fileName : { SE : PFN } }, "Cursor",
+           the cursor to give to get the next page, '' after the last page, and "SEPrefixes"
+    """
+    res = self._checkPathPermissions('getDirectoryReplicas', lfn, credDict)
+    if not res['OK']:
+      return res
+    if not res['Value']['Successful']:
+      return S_ERROR(res['Value']['Failed'].values()[0])
+    # The normalised path
+    lfn = res['Value']['Successful'].keys()[0]
+    res = self.dtree.getDirectoryReplicasPage(lfn, allStatus=allStatus, startAfter=startAfter, maxFiles=maxFiles)
+    if not res['OK']:
+      return res
+    res['Value']['SEPrefixes'] = {}
+    if self.lfnPfnConvention:
+      resSE = self.seManager.getSEPrefixes()
+      if resSE['OK']:
+        res['Value']['SEPrefixes'] = resSE['Value']
+    return res
+
   def getDirectorySize(self, lfns, longOutput, fromFiles, credDict):
     """
         Get the sizes of a list of directories
@@ -1021,6 +1108,12 @@ class FileCatalogDB(DB):
     result = self.dtree._rebuildDirectoryUsage()
     return result
 
+  def verifyDirectoryUsage(self, path, repair=False):
+    """ Compare the DirectoryUsage counters of a directory and its subdirectories with
+        their content, and repair the counters found different if requested
+    """
+    return self.dtree.verifyDirectoryUsage(path, repair=repair)
+
   def repairCatalog(self, directoryFlag=True, credDict={}):
     """ Repair catalog inconsistencies
     """
@@ -1035,6 +1128,23 @@ class FileCatalogDB(DB):
   #  Catalog metadata methods
   #
 
+  def explainMetaQuery(self, metaDict, credDict):
+    """ Get the evaluation plan of a metadata query: the directory and the file conditions,
+        with their estimated number of selected rows, in the order they are evaluated
+
+        :param dict metaDict: metadata query
+        :param dict credDict: credential
+        :return: S_OK( { 'Directory' : list of steps, 'File' : list of steps } )
+    """
+    result = self.dmeta.planDirectoryQuery(metaDict, credDict)
+    if not result['OK']:
+      return result
+    directorySteps = result['Value']
+    result = self.fmeta.planFileQuery(metaDict, credDict)
+    if not result['OK']:
+      return result
+    return S_OK({'Directory': directorySteps, 'File': result['Value']})
+
   def setMetadata(self, path, metadataDict, credDict):
     """ Add metadata to the given path
     """
@@ -1051,12 +1161,16 @@ class FileCatalogDB(DB):
       return result
     if not result['Value']['Successful']:
       return S_ERROR('Failed to determine the path type')
-    if result['Value']['Successful'][path]:
+    isDirectory = result['Value']['Successful'][path]
+    if isDirectory:
       # This is a directory
-      return self.dmeta.setMetadata(path, metadataDict, credDict)
+      result = self.dmeta.setMetadata(path, metadataDict, credDict)
     else:
       # This is a file
-      return self.fmeta.setMetadata(path, metadataDict, credDict)
+      result = self.fmeta.setMetadata(path, metadataDict, credDict)
+    if result['OK']:
+      self.__updateDatasetsForMetadata(path, isDirectory, metadataDict.keys(), credDict)
+    return result
 
   def setMetadataBulk(self, pathMetadataDict, credDict):
     """  Add metadata for the given paths
@@ -1102,12 +1216,27 @@ class FileCatalogDB(DB):
       return result
     if not result['Value']['Successful']:
       return S_ERROR('Failed to determine the path type')
-    if result['Value']['Successful'][path]:
+    isDirectory = result['Value']['Successful'][path]
+    if isDirectory:
       # This is a directory
-      return self.dmeta.removeMetadata(path, metadata, credDict)
+      result = self.dmeta.removeMetadata(path, metadata, credDict)
     else:
       # This is a file
-      return self.fmeta.removeMetadata(path, metadata, credDict)
+      result = self.fmeta.removeMetadata(path, metadata, credDict)
+    if result['OK']:
+      self.__updateDatasetsForMetadata(path, isDirectory, list(metadata), credDict)
+    return result
+
+  def __updateDatasetsForMetadata(self, path, isDirectory, metaNames, credDict):
+    """ Update the contents of the dynamic datasets using the given metadata after
+        their change for a file or a directory subtree. A failure is only logged
+    """
+    if isDirectory:
+      result = self.datasetManager.updateDatasetsForDirectory(path, credDict, metaNames=metaNames)
+    else:
+      result = self.datasetManager.updateDatasetsForFiles([path], credDict, metaNames=metaNames)
+    if not result['OK']:
+      gLogger.error("Failed to update the dataset contents", result['Message'])
 
   #######################################################################
   #
@@ -1137,6 +1266,11 @@ class FileCatalogDB(DB):
     if not res['OK']:
       return res
     counterDict.update(res['Value'])
+    res = self.dtree.getDirectoryCacheStatistics()
+    if not res['OK']:
+      return res
+    for name in ('Hits', 'Misses', 'Evictions', 'Size'):
+      counterDict['Directory Cache %s' % name] = res['Value'][name]
     return S_OK(counterDict)
 
   ########################################################################
@@ -1179,3 +1313,15 @@ class FileCatalogDB(DB):
         :returns: S_OK with list of tuples (lfn, checksum, size)
     """
     return self.fileManager.getSEDump(seName)
+
+  def iterSEDump(self, seName):
+    """
+         Generator over the files at a given SE, together with checksum and size,
+         read from the DB by pages
+
+        :param seName: name of the StorageElement
+
+        :returns: generator of S_OK with a list of tuples (lfn, checksum, size) per page,
+                  the last value being S_ERROR if the dump failed
+    """
+    return self.fileManager.iterSEDump(seName)
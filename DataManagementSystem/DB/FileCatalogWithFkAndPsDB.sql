@@ -659,6 +659,64 @@ END //
 DELIMITER ;
 
 
+-- ps_get_replicas_for_files_in_dir_range : get replica information for the files in a given dir
+--                                          whose names are in a given range
+-- dir_id : directory id
+-- allStatus : if False, consider only the status defined in visibleFileStatus and visibleReplicaStatus
+-- visibleFileStatus : status of files to be considered
+-- visibleReplicaStatus : status of replicas to be considered
+-- name_after : the file names must be strictly after this one
+-- name_last : the file names must be before or equal to this one
+-- outputs : FileName, FileID, SEName, PFN
+
+DROP PROCEDURE IF EXISTS ps_get_replicas_for_files_in_dir_range;
+DELIMITER //
+CREATE PROCEDURE ps_get_replicas_for_files_in_dir_range
+(IN dir_id INT, IN allStatus BOOLEAN, IN visibleFileStatus VARCHAR(255), IN visibleReplicaStatus VARCHAR(255),
+ IN name_after VARCHAR(128), IN name_last VARCHAR(128))
+BEGIN
+
+  set @sql = 'select SQL_NO_CACHE f.FileName, f.FileID, s.SEName, r.PFN from FC_Replicas r join FC_Files f on f.FileID = r.FileID join FC_StorageElements s on s.SEID = r.SEID ';
+
+  IF not allStatus THEN
+    SET @sql = CONCAT(@sql, ' join FC_Statuses fst on f.Status = fst.StatusID join FC_Statuses rst on r.Status = rst.StatusID where DirID = ',dir_id ,' and fst.Status  in (',visibleFileStatus,') and rst.Status in (', visibleReplicaStatus, ')');
+  ELSE
+    SET @sql = CONCAT(@sql, 'where DirID = ',dir_id );
+  END IF;
+
+  SET @sql = CONCAT(@sql, ' and f.FileName > ? and f.FileName <= ?');
+  SET @name_after = name_after;
+  SET @name_last = name_last;
+
+  PREPARE stmt FROM @sql;
+  EXECUTE stmt USING @name_after, @name_last;
+  DEALLOCATE PREPARE stmt;
+
+END //
+DELIMITER ;
+
+
+-- ps_get_file_names_in_dir_page : get the names of the files of a directory following a given name
+-- dir_id : directory id
+-- name_after : the file names must be strictly after this one, '' for the first page
+-- page_size : maximum number of names returned
+-- outputs : FileName, in name order
+
+DROP PROCEDURE IF EXISTS ps_get_file_names_in_dir_page;
+DELIMITER //
+CREATE PROCEDURE ps_get_file_names_in_dir_page
+(IN dir_id INT, IN name_after VARCHAR(128), IN page_size INT)
+BEGIN
+
+  SELECT SQL_NO_CACHE FileName FROM FC_Files
+         WHERE DirID = dir_id AND FileName > name_after
+         ORDER BY FileName
+         LIMIT page_size;
+
+END //
+DELIMITER ;
+
+
 -- ps_get_file_id_from_lfn : get the file id from a given LFN ("dirName/fileName")
 -- dirName : name of the directory
 -- fileName : name of the file
@@ -1864,6 +1922,31 @@ DELIMITER ;
 
 
 
+-- ps_get_se_dump_page : dump a page of the lfns in an SE, with checksum and size,
+--                       in replica ID order so that the next page starts after the last replica returned
+-- se_id : storageElement's ID
+-- last_rep_id : ID of the last replica of the previous page, 0 for the first page
+-- page_size : maximum number of replicas returned
+-- output : RepID, LFN, Checksum, Size
+
+DROP PROCEDURE IF EXISTS ps_get_se_dump_page;
+DELIMITER //
+CREATE PROCEDURE ps_get_se_dump_page
+(IN se_id INT, IN last_rep_id INT, IN page_size INT)
+BEGIN
+
+  SELECT SQL_NO_CACHE r.RepID, CONCAT(d.Name, '/', f.FileName), f.Checksum, f.Size
+         FROM FC_Replicas r
+         JOIN FC_Files f on f.FileID = r.FileID
+         JOIN FC_DirectoryList d on d.DirID = f.DirID
+         WHERE r.SEID = se_id AND r.RepID > last_rep_id
+         ORDER BY r.RepID
+         LIMIT page_size;
+
+END //
+DELIMITER ;
+
+
 -- Consistency checks
 
 
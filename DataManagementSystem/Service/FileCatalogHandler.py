@@ -26,6 +26,9 @@ from DIRAC.DataManagementSystem.DB.FileCatalogDB import FileCatalogDB
 # This is a global instance of the FileCatalogDB class
 gFileCatalogDB = None
 
+# Maximum number of files per page of the paginated listings
+MAXFILESPAGESIZE = 100000
+
 
 def initializeFileCatalogHandler(serviceInfo):
   """ handler initialisation """
@@ -62,7 +65,9 @@ def initializeFileCatalogHandler(serviceInfo):
                    'ValidFileStatus': ['AprioriGood', 'Trash', 'Removing', 'Probing'],
                    'ValidReplicaStatus': ['AprioriGood', 'Trash', 'Removing', 'Probing'],
                    'VisibleFileStatus': ['AprioriGood'],
-                   'VisibleReplicaStatus': ['AprioriGood']}
+                   'VisibleReplicaStatus': ['AprioriGood'],
+                   'DirectoryCacheSize': 100000,
+                   'DirectoryCacheLifetime': 600}
   for configKey in sorted(defaultConfig.keys()):
     defaultValue = defaultConfig[configKey]
     configValue = getServiceOption(serviceInfo, configKey, defaultValue)
@@ -426,6 +431,27 @@ class FileCatalogHandler(RequestHandler):
     """ Get replicas for files in the supplied directory """
     return gFileCatalogDB.getDirectoryReplicas(lfns, allStatus, self.getRemoteCredentials())
 
+  types_listDirectoryPage = [StringTypes, BooleanType, StringTypes, [IntType, LongType]]
+
+  def export_listDirectoryPage(self, lfn, verbose, startAfter, maxFiles):
+    """ List a page of the contents of a directory, with at most maxFiles files following
+        the file name startAfter, '' for the first page
+    """
+    gMonitor.addMark('ListDirectory', 1)
+    return gFileCatalogDB.listDirectoryPage(lfn, self.getRemoteCredentials(), verbose=verbose,
+                                            startAfter=startAfter,
+                                            maxFiles=max(1, min(maxFiles, MAXFILESPAGESIZE)))
+
+  types_getDirectoryReplicasPage = [StringTypes, BooleanType, StringTypes, [IntType, LongType]]
+
+  def export_getDirectoryReplicasPage(self, lfn, allStatus, startAfter, maxFiles):
+    """ Get the replicas of a page of the files of a directory, with at most maxFiles files
+        following the file name startAfter, '' for the first page
+    """
+    return gFileCatalogDB.getDirectoryReplicasPage(lfn, allStatus, self.getRemoteCredentials(),
+                                                   startAfter=startAfter,
+                                                   maxFiles=max(1, min(maxFiles, MAXFILESPAGESIZE)))
+
   ########################################################################
   #
   # Administrative database operations
@@ -444,6 +470,13 @@ class FileCatalogHandler(RequestHandler):
     """ Rebuild DirectoryUsage table from scratch """
     return gFileCatalogDB.rebuildDirectoryUsage()
 
+  types_verifyDirectoryUsage = [StringTypes, BooleanType]
+
+  @staticmethod
+  def export_verifyDirectoryUsage(path, repair):
+    """ Verify, and optionally repair, the DirectoryUsage counters of a directory tree """
+    return gFileCatalogDB.verifyDirectoryUsage(path, repair)
+
   types_repairCatalog = []
 
   def export_repairCatalog(self):
@@ -628,6 +661,13 @@ class FileCatalogHandler(RequestHandler):
     result = S_OK({"TotalRecords": totalRecords, "Records": resultDetails['Value']})
     return result
 
+  types_explainMetaQuery = [DictType]
+
+  def export_explainMetaQuery(self, metaDict):
+    """ Get the evaluation plan of a metadata query
+    """
+    return gFileCatalogDB.explainMetaQuery(metaDict, self.getRemoteCredentials())
+
   types_getCompatibleMetadata = [DictType, StringTypes]
 
   def export_getCompatibleMetadata(self, metaDict, path='/'):
@@ -731,19 +771,20 @@ class FileCatalogHandler(RequestHandler):
     """
     return gFileCatalogDB.datasetManager.getDatasetFiles(datasets, self.getRemoteCredentials())
 
-  def getSEDump(self, seName):
-    """
-         Return all the files at a given SE, together with checksum and size
+  types_getDatasetFilesPage = [StringTypes, [IntType, LongType], [IntType, LongType]]
 
-        :param seName: name of the StorageElement
-
-        :returns: S_OK with list of tuples (lfn, checksum, size)
+  def export_getDatasetFilesPage(self, datasetName, startAfter, maxFiles):
+    """ Get a page of at most maxFiles files of a dataset following the file ID startAfter,
+        0 for the first page, with the counters of the dataset
     """
-    return gFileCatalogDB.getSEDump(seName)['Value']
+    return gFileCatalogDB.datasetManager.getDatasetFilesPage(datasetName, self.getRemoteCredentials(),
+                                                             startAfter=startAfter,
+                                                             maxFiles=max(1, min(maxFiles, MAXFILESPAGESIZE)))
 
   def transfer_toClient(self, seName, token, fileHelper):
     """ This method used to transfer the SEDump to the client,
-        formated as CSV with '|' separation
+        formated as CSV with '|' separation. The dump is read from the DB and
+        sent by pages, so that it is never held in memory as a whole
 
         :param seName: name of the se to dump
 
@@ -752,21 +793,19 @@ class FileCatalogHandler(RequestHandler):
 
     """
 
-    retVal = self.getSEDump(seName)
+    def csvPages():
+      """ Generator of the CSV text of each page of the dump """
+      for result in gFileCatalogDB.iterSEDump(seName):
+        if not result['OK']:
+          raise RuntimeError(result['Message'])
+        csvOutput = cStringIO.StringIO()
+        writer = csv.writer(csvOutput, delimiter='|')
+        writer.writerows(result['Value'])
+        yield csvOutput.getvalue()
+        csvOutput.close()
 
     try:
-      csvOutput = cStringIO.StringIO()
-      writer = csv.writer(csvOutput, delimiter='|')
-      for lfn in retVal:
-        writer.writerow(lfn)
-
-      csvOutput.seek(0)
-
-      ret = fileHelper.DataSourceToNetwork(csvOutput)
-      return ret
-
+      return fileHelper.IterableToNetwork(csvPages())
     except Exception as e:
       gLogger.exception("Exception while sending seDump", repr(e))
       return S_ERROR("Exception while sendind seDump: %s" % repr(e))
-    finally:
-      csvOutput.close()
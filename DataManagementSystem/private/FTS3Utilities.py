@@ -2,6 +2,7 @@
 """
 
 import json
+import time
 import datetime
 import random
 import threading
@@ -74,6 +75,98 @@ def selectUniqueRandomSource(ftsFiles, allowedSources=None):
 
   return S_OK(groupBySource)
 
+
+def selectSourceByThroughput(ftsFiles, linkModel, allowedSources=None):
+  """
+      For a list of FTS3files object, select the source of each file from the throughput
+      of the links observed by the linkModel, and group the files by source.
+
+      The files are taken from the biggest to the smallest, and each of them is assigned to
+      the source which would finish transferring it first, given the bytes already assigned
+      to that source. The fast sources thus get more files, without leaving the others idle.
+
+      :param ftsFiles: list of FTS3File object
+      :param linkModel: FTS3LinkModel instance
+      :param allowedSources: list of allowed sources
+
+      :return:  S_OK({ sourceSE: [ FTS3Files] })
+  """
+
+  _log = gLogger.getSubLogger("selectSourceByThroughput")
+
+  allowedSourcesSet = set(allowedSources) if allowedSources else set()
+
+  groupBySource = {}
+  # Bytes assigned to each source
+  assignedBytes = {}
+
+  res = _checkSourceReplicas(ftsFiles)
+  if not res['OK']:
+    return res
+
+  filteredReplicas = res['Value']
+
+  for ftsFile in sorted(ftsFiles, key=lambda ftsFile: ftsFile.size or 0, reverse=True):
+
+    if ftsFile.lfn in filteredReplicas['Failed']:
+      _log.error("Failed to get active replicas", "%s,%s" %
+                 (ftsFile.lfn, filteredReplicas['Failed'][ftsFile.lfn]))
+      continue
+
+    replicaDict = filteredReplicas['Successful'][ftsFile.lfn]
+    allowedReplicaSource = (set(replicaDict) & allowedSourcesSet) if allowedSourcesSet else set(replicaDict)
+    if not allowedReplicaSource:
+      continue
+
+    def completionTime(sourceSE):
+      """ Time for the source to transfer what it has been assigned, plus this file """
+      throughput = linkModel.getExpectedThroughput(sourceSE, ftsFile.targetSE)
+      return (assignedBytes.get(sourceSE, 0) + (ftsFile.size or 0)) / throughput
+
+    # Sort the sources so that the ties are broken always the same way
+    bestSource = min(sorted(allowedReplicaSource), key=completionTime)
+    assignedBytes[bestSource] = assignedBytes.get(bestSource, 0) + (ftsFile.size or 0)
+    groupBySource.setdefault(bestSource, []).append(ftsFile)
+
+  return S_OK(groupBySource)
+
+
+def packFilesInJobs(ftsFiles, sourceSE, targetSE, linkModel, maxFilesPerJob):
+  """
+      Split the files to transfer on a link into jobs lasting about linkModel.targetJobDuration,
+      given the throughput of the link. Without history for the link, the jobs are only limited
+      by the number of files.
+
+      :param ftsFiles: list of FTS3File object
+      :param sourceSE: source of the transfers
+      :param targetSE: target of the transfers
+      :param linkModel: FTS3LinkModel instance
+      :param maxFilesPerJob: maximum number of files in a job
+
+      :return: list of lists of FTS3Files
+  """
+
+  throughput = linkModel.getThroughput(sourceSE, targetSE)
+  maxBytesPerJob = throughput * linkModel.targetJobDuration if throughput else None
+
+  jobs = []
+  jobFiles = []
+  jobBytes = 0
+  for ftsFile in ftsFiles:
+    size = ftsFile.size or 0
+    if jobFiles and (len(jobFiles) >= maxFilesPerJob or
+                     (maxBytesPerJob is not None and jobBytes + size > maxBytesPerJob)):
+      jobs.append(jobFiles)
+      jobFiles = []
+      jobBytes = 0
+    jobFiles.append(ftsFile)
+    jobBytes += size
+  if jobFiles:
+    jobs.append(jobFiles)
+
+  return jobs
+
+
 def groupFilesByTarget(ftsFiles):
   """
         For a list of FTS3files object, group the Files by target
@@ -224,6 +317,146 @@ class FTS3JSONDecoder(json.JSONDecoder):
       return dataDict
 
 
+class FTS3LinkModel(object):
+  """
+  Rolling model of the transfers done through FTS, built from the finished FTS3Jobs.
+
+  For each link (source SE, target SE), it keeps the bytes transferred, the transfer time
+  and the number of successful and attempted files. For each FTS server, it keeps the number
+  of successful and attempted files, and the number of files submitted and not yet finished.
+  The history is weighted by its age, halved every halfLife seconds, so that the model
+  follows the changes of the links.
+
+  The model is shared by the threads of the FTS3Agent.
+  """
+
+  def __init__(self, halfLife=3600, targetJobDuration=3600):
+    """
+        :param halfLife: time in seconds after which the weight of the history is halved
+        :param targetJobDuration: expected duration in seconds of the jobs built by packFilesInJobs
+    """
+
+    self.halfLife = halfLife
+    self.targetJobDuration = targetJobDuration
+
+    # { (sourceSE, targetSE) : [ bytes, time, successful files, total files, time of last update ] }
+    self._links = {}
+    # { ftsServer : [ successful files, total files, time of last update ] }
+    self._servers = {}
+    # { ftsServer : number of files submitted and not yet finished }
+    self._activeFiles = {}
+    self._lock = threading.Lock()
+
+  def __getDecayedStats(self, statsDict, key, nbValues, now):
+    """ Returns the stats of the key, weighted for their age at the given time """
+
+    stats = statsDict.setdefault(key, [0.] * nbValues + [now])
+    factor = 0.5 ** (max(0., now - stats[-1]) / float(self.halfLife))
+    for i in xrange(nbValues):
+      stats[i] *= factor
+    stats[-1] = max(stats[-1], now)
+    return stats
+
+  def addTransfers(self, sourceSE, targetSE, ftsServer, transferSize, transferTime, nbSuccessful, nbTotal,
+                   timestamp=None):
+    """ Record the transfers of a finished job
+
+        :param sourceSE: source of the transfers
+        :param targetSE: target of the transfers
+        :param ftsServer: server of the job
+        :param transferSize: bytes transferred successfully
+        :param transferTime: time spent in the successful transfers, in seconds
+        :param nbSuccessful: number of successful transfers
+        :param nbTotal: number of transfers in the job
+        :param timestamp: time of the end of the job (default: now)
+    """
+
+    now = time.time() if timestamp is None else timestamp
+    with self._lock:
+      if sourceSE and targetSE:
+        stats = self.__getDecayedStats(self._links, (sourceSE, targetSE), 4, now)
+        stats[0] += transferSize
+        stats[1] += transferTime
+        stats[2] += nbSuccessful
+        stats[3] += nbTotal
+      if ftsServer:
+        stats = self.__getDecayedStats(self._servers, ftsServer, 2, now)
+        stats[0] += nbSuccessful
+        stats[1] += nbTotal
+        self._activeFiles[ftsServer] = max(0, self._activeFiles.get(ftsServer, 0) - nbTotal)
+
+  def addJob(self, ftsJob, timestamp=None):
+    """ Record the transfers of a job in a final state, from its accounting information
+
+        :param ftsJob: FTS3Job in a final state
+        :param timestamp: time of the end of the job (default: now)
+    """
+
+    accountingDict = ftsJob.accountingDict
+    if not accountingDict:
+      return
+    self.addTransfers(accountingDict['Source'], accountingDict['Destination'], ftsJob.ftsServer,
+                      accountingDict['TransferSize'], accountingDict['TransferTime'],
+                      accountingDict['TransferOK'], accountingDict['TransferTotal'], timestamp=timestamp)
+
+  def addSubmission(self, ftsServer, nbFiles):
+    """ Record the submission of files to a server
+
+        :param ftsServer: server of the job
+        :param nbFiles: number of files in the job
+    """
+
+    with self._lock:
+      self._activeFiles[ftsServer] = self._activeFiles.get(ftsServer, 0) + nbFiles
+
+  def getThroughput(self, sourceSE, targetSE, now=None):
+    """ Throughput in bytes/s of the transfers on the link, None if unknown """
+
+    now = time.time() if now is None else now
+    with self._lock:
+      if (sourceSE, targetSE) not in self._links:
+        return None
+      transferSize, transferTime, _nbSuccessful, _nbTotal, _last = self.__getDecayedStats(
+          self._links, (sourceSE, targetSE), 4, now)
+    if transferTime <= 0 or transferSize <= 0:
+      return None
+    return transferSize / transferTime
+
+  def getSuccessRate(self, sourceSE, targetSE, now=None):
+    """ Estimated probability for a transfer on the link to succeed.
+        A link without history has a rate of 0.5.
+    """
+
+    now = time.time() if now is None else now
+    with self._lock:
+      if (sourceSE, targetSE) not in self._links:
+        return 0.5
+      _transferSize, _transferTime, nbSuccessful, nbTotal, _last = self.__getDecayedStats(
+          self._links, (sourceSE, targetSE), 4, now)
+    return (nbSuccessful + 1.) / (nbTotal + 2.)
+
+  def getExpectedThroughput(self, sourceSE, targetSE, now=None):
+    """ Throughput of the link weighted by its success rate.
+        The links without history get the best throughput of the known links,
+        so that they are tried.
+    """
+
+    throughput = self.getThroughput(sourceSE, targetSE, now=now)
+    if throughput is None:
+      knownThroughputs = [self.getThroughput(source, target, now=now) for source, target in list(self._links)]
+      throughput = max([1.] + [knownThroughput for knownThroughput in knownThroughputs if knownThroughput])
+    return throughput * self.getSuccessRate(sourceSE, targetSE, now=now)
+
+  def getServerLoad(self, ftsServer, now=None):
+    """ Files waiting on the server, divided by the success rate of the server """
+
+    now = time.time() if now is None else now
+    with self._lock:
+      nbSuccessful, nbTotal, _last = self.__getDecayedStats(self._servers, ftsServer, 2, now)
+      activeFiles = self._activeFiles.get(ftsServer, 0)
+    return (activeFiles + 1.) * (nbTotal + 2.) / (nbSuccessful + 1.)
+
+
 threadLocal = threading.local()
 
 
@@ -232,9 +465,13 @@ class FTS3ServerPolicy(object):
   This class manages the policy for choosing a server
   """
 
-  def __init__(self, serverDict, serverPolicy="Random"):
+  def __init__(self, serverDict, serverPolicy="Random", linkModel=None):
     """
         Call the init of the parent, and initialize the list of FTS3 servers
+
+        :param serverDict: { server name : server url }
+        :param serverPolicy: Random, Sequence, Failover or Throughput
+        :param linkModel: FTS3LinkModel used by the Throughput policy
     """
 
     self.log = gLogger.getSubLogger("FTS3ServerPolicy")
@@ -244,6 +481,7 @@ class FTS3ServerPolicy(object):
     self._maxAttempts = len(self._serverList)
     self._nextServerID = 0
     self._resourceStatus = ResourceStatus()
+    self._linkModel = linkModel
 
     methName = "_%sServerPolicy" % serverPolicy.lower()
     if not hasattr(self, methName):
@@ -288,6 +526,19 @@ class FTS3ServerPolicy(object):
 
     return fts3Server
 
+  def _throughputServerPolicy(self, _attempt):
+    """
+      Return the server with the least files waiting, weighted by its failures,
+      as recorded by the link model. Without model, behave as the random policy
+    """
+
+    if self._linkModel is None:
+      return self._randomServerPolicy(_attempt)
+
+    sortedServers = sorted(self._serverList,
+                           key=lambda server: (self._linkModel.getServerLoad(self._serverDict[server]), server))
+    return sortedServers[_attempt]
+
   def _getFTSServerStatus(self, ftsServer):
     """ Fetch the status of the FTS server from RSS """
 
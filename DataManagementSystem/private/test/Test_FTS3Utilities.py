@@ -12,6 +12,9 @@ from DIRAC.DataManagementSystem.private.FTS3Utilities import FTS3JSONDecoder, \
     FTS3Serializable, \
     groupFilesByTarget, \
     selectUniqueRandomSource, \
+    selectSourceByThroughput, \
+    packFilesInJobs, \
+    FTS3LinkModel, \
     FTS3ServerPolicy
 
 
@@ -159,6 +162,104 @@ class TestFileGrouping(unittest.TestCase):
     self.assertTrue(self.f3 in filesInSrc4)
 
 
+# Recorded history of finished jobs:
+# (end time, source, target, server, bytes transferred, transfer time, successful files, total files)
+LINK_HISTORY = [(0, 'Src1', 'target1', 'fts1', 100e9, 1000, 100, 100),
+                (0, 'Src2', 'target1', 'fts2', 25e9, 1000, 90, 100),
+                # Src1 became slow
+                (7200, 'Src1', 'target1', 'fts1', 10e9, 1000, 100, 100),
+                (7200, 'Src3', 'target1', 'fts1', 50e9, 1000, 10, 100)]
+
+
+class TestFTS3LinkModel(unittest.TestCase):
+  """ Testing the link model and the decisions taken from it """
+
+  def setUp(self):
+    self.model = FTS3LinkModel(halfLife=3600, targetJobDuration=100)
+    for timestamp, source, target, server, size, transferTime, nbOK, nbTotal in LINK_HISTORY:
+      self.model.addTransfers(source, target, server, size, transferTime, nbOK, nbTotal, timestamp=timestamp)
+
+    self.files = []
+    for i, size in enumerate([5e9, 1e9, 3e9, 2e9, 4e9]):
+      ftsFile = FTS3File()
+      ftsFile.lfn = 'f%d' % i
+      ftsFile.size = size
+      ftsFile.targetSE = 'target1'
+      ftsFile.fakeAttr_possibleSources = ['Src1', 'Src2']
+      self.files.append(ftsFile)
+
+  def test_01_model(self):
+    """ The recent history weighs more """
+    now = 7200
+    # (100e9 / 4 + 10e9) / (1000 / 4 + 1000)
+    self.assertAlmostEqual(self.model.getThroughput('Src1', 'target1', now=now), 28e6)
+    self.assertAlmostEqual(self.model.getThroughput('Src2', 'target1', now=now), 25e6)
+    self.assertAlmostEqual(self.model.getSuccessRate('Src2', 'target1', now=now), (22.5 + 1) / (25 + 2))
+    self.assertAlmostEqual(self.model.getSuccessRate('Src3', 'target1', now=now), 11. / 102)
+    # The failures reduce the expected throughput
+    self.assertTrue(self.model.getExpectedThroughput('Src3', 'target1', now=now) <
+                    self.model.getExpectedThroughput('Src2', 'target1', now=now))
+
+    # Unknown links are not penalised
+    self.assertEqual(self.model.getThroughput('Src4', 'target1', now=now), None)
+    self.assertAlmostEqual(self.model.getExpectedThroughput('Src4', 'target1', now=now), 50e6 * 0.5)
+
+    # The old history fades away behind the new records
+    self.model.addTransfers('Src1', 'target1', 'fts1', 1e9, 1000, 10, 10, timestamp=7200 + 10 * 3600)
+    self.assertAlmostEqual(self.model.getThroughput('Src1', 'target1', now=7200 + 10 * 3600), 1e6, delta=5e4)
+
+  def test_02_addJob(self):
+    """ The jobs are recorded from their accounting information """
+    ftsJob = mock.MagicMock(ftsServer='fts3', accountingDict={'Source': 'Src1', 'Destination': 'target2',
+                                                              'TransferSize': 1e9, 'TransferTime': 10,
+                                                              'TransferOK': 1, 'TransferTotal': 2})
+    self.model.addSubmission('fts3', 5)
+    self.model.addJob(ftsJob, timestamp=7200)
+    self.assertEqual(self.model.getThroughput('Src1', 'target2', now=7200), 1e8)
+    self.assertEqual(self.model._activeFiles['fts3'], 3)
+
+  @mock.patch(
+      'DIRAC.DataManagementSystem.private.FTS3Utilities._checkSourceReplicas',
+      side_effect=mock__checkSourceReplicas)
+  def test_03_selectSourceByThroughput(self, _mk_checkSourceReplicas):
+    """ The files are spread on the sources according to their throughput """
+    with mock.patch('DIRAC.DataManagementSystem.private.FTS3Utilities.time.time', return_value=7200):
+      res = selectSourceByThroughput(self.files, self.model)
+    self.assertTrue(res['OK'])
+    filesBySource = dict((source, sorted(ftsFile.lfn for ftsFile in ftsFiles))
+                         for source, ftsFiles in res['Value'].iteritems())
+    # Src1 is expected to be faster than Src2: it gets 5 + 3 GB, Src2 4 + 2 + 1 GB
+    self.assertEqual(filesBySource, {'Src1': ['f0', 'f2'], 'Src2': ['f1', 'f3', 'f4']})
+
+    # The allowed sources are respected
+    with mock.patch('DIRAC.DataManagementSystem.private.FTS3Utilities.time.time', return_value=7200):
+      res = selectSourceByThroughput(self.files, self.model, allowedSources=['Src2'])
+    self.assertEqual(res['Value'].keys(), ['Src2'])
+
+  def test_04_packFilesInJobs(self):
+    """ The jobs last about targetJobDuration on known links """
+    with mock.patch('DIRAC.DataManagementSystem.private.FTS3Utilities.time.time', return_value=7200):
+      # Src2 does 25 MB/s, so 2.5 GB per job
+      jobs = packFilesInJobs(self.files, 'Src2', 'target1', self.model, maxFilesPerJob=100)
+      self.assertEqual([[ftsFile.lfn for ftsFile in job] for job in jobs], [['f0'], ['f1'], ['f2'], ['f3'], ['f4']])
+      self.model.targetJobDuration = 200
+      jobs = packFilesInJobs(self.files, 'Src2', 'target1', self.model, maxFilesPerJob=100)
+      self.assertEqual([[ftsFile.lfn for ftsFile in job] for job in jobs], [['f0'], ['f1', 'f2'], ['f3'], ['f4']])
+      # The number of files is still limited
+      jobs = packFilesInJobs(self.files, 'Unknown', 'target1', self.model, maxFilesPerJob=2)
+      self.assertEqual([len(job) for job in jobs], [2, 2, 1])
+
+  def test_05_throughputServerPolicy(self):
+    """ The servers with the least files waiting, weighted by their failures, are chosen first """
+    serverDict = {'server_1': 'fts1', 'server_2': 'fts2', 'server_3': 'fts3'}
+    obj = FTS3ServerPolicy(serverDict, "Throughput", linkModel=self.model)
+    with mock.patch('DIRAC.DataManagementSystem.private.FTS3Utilities.time.time', return_value=7200):
+      # fts2 had less failures than fts1, fts3 has no history
+      self.assertEqual([obj._throughputServerPolicy(i) for i in range(3)], ['server_2', 'server_1', 'server_3'])
+      self.model.addSubmission('fts2', 100)
+      self.assertEqual(obj._throughputServerPolicy(0), 'server_1')
+
+
 def mock__failoverServerPolicy(_attempt):
   return "server_0"
 
@@ -266,4 +367,5 @@ if __name__ == '__main__':
   suite = unittest.defaultTestLoader.loadTestsFromTestCase(TestFTS3Serialization)
   suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TestFileGrouping))
   suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TestFTS3ServerPolicy))
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TestFTS3LinkModel))
   unittest.TextTestRunner(verbosity=2).run(suite)
@@ -94,6 +94,8 @@ class RequestExecutingAgent(AgentModule):
   __requestClient = None
   # # Size of the bulk if use of getRequests. If 0, use getRequest
   __bulkRequest = 0
+  # # If True, the workers keep the proxies and operation handlers from one request to the next
+  __warmWorkers = False
 
   def __init__(self, *args, **kwargs):
     """ c'tor """
@@ -114,6 +116,8 @@ class RequestExecutingAgent(AgentModule):
     self.log.info("ProcessPool sleep time = %d seconds" % self.__poolSleep)
     self.__bulkRequest = self.am_getOption("BulkRequest", 0)
     self.log.info("Bulk request size = %d" % self.__bulkRequest)
+    self.__warmWorkers = self.am_getOption("WarmWorkers", self.__warmWorkers)
+    self.log.info("Warm workers = %s" % self.__warmWorkers)
 
     # # keep config path and agent name
     self.agentName = self.am_getModuleParam("fullName")
@@ -340,7 +344,8 @@ class RequestExecutingAgent(AgentModule):
                                                             kwargs={"requestJSON": requestJSON,
                                                                     "handlersDict": self.handlersDict,
                                                                     "csPath": self.__configPath,
-                                                                    "agentName": self.agentName},
+                                                                    "agentName": self.agentName,
+                                                                    "warmWorker": self.__warmWorkers},
                                                             taskID=taskID,
                                                             blocking=True,
                                                             usePoolCallbacks=True,
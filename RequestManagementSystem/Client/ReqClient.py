@@ -79,6 +79,17 @@ class ReqClient(Client):
     if not valid["OK"]:
       self.log.error("putRequest: request not valid", "%s" % valid["Message"])
       return valid
+
+    # # request read from the DB: only send what changed
+    changes = request.getChanges()
+    if changes["OK"] and changes["Value"]:
+      putChanges = self._getRPC().putRequestUpdates(json.dumps(changes["Value"]))
+      if putChanges["OK"]:
+        request._setPersisted()
+        return putChanges
+      self.log.verbose("putRequest: unable to put the changes of the request, putting it whole",
+                       "%s: %s" % (request.RequestName, putChanges["Message"]))
+
     # # dump to json
     requestJSON = request.toJSON()
     if not requestJSON["OK"]:
@@ -55,6 +55,9 @@ class Request( object ):
 
   FINAL_STATES = ( "Done", "Failed", "Canceled" )
 
+  # attributes of the files compared by getChanges
+  FILE_ATTRIBUTES = ( "Status", "LFN", "PFN", "ChecksumType", "Checksum", "GUID", "Attempt", "Size", "Error" )
+
   _datetimeFormat = '%Y-%m-%d %H:%M:%S'
 
 
@@ -65,6 +68,8 @@ class Request( object ):
     :param fromDict: if false, new request. Can be json string that represents the object, or the dictionary directly
     """
     self.__waiting = None
+    # state of the request as stored in the DB, if it was read from it
+    self.__persisted = None
 
     now = datetime.datetime.utcnow().replace( microsecond = 0 )
 
@@ -116,6 +121,72 @@ class Request( object ):
         setattr( self, key, value )
 
     self._notify()
+    self._setPersisted()
+
+  @classmethod
+  def __getFileValues( cls, opFile ):
+    """ values of the attributes of a file that can be changed once it is in the DB """
+    return tuple( getattr( opFile, attrName ) for attrName in cls.FILE_ATTRIBUTES )
+
+  def _setPersisted( self ):
+    """ keep the operations and the files of a request read from the DB, with the attributes of the files,
+        to find out which files were changed since
+    """
+    self.__persisted = None
+    if not getattr( self, 'RequestID', 0 ):
+      return
+    structure = []
+    files = {}
+    for op in self.__operations__:
+      if not getattr( op, 'OperationID', 0 ):
+        return
+      fileIDs = []
+      for opFile in op:
+        if not getattr( opFile, 'FileID', 0 ):
+          return
+        fileIDs.append( opFile.FileID )
+        files[opFile.FileID] = self.__getFileValues( opFile )
+      structure.append( ( op.OperationID, fileIDs ) )
+    self.__persisted = ( structure, files )
+
+  def getChanges( self ):
+    """ Returns the changes of a request read from the DB: the attributes of the request and of its operations,
+        and the attributes of the files that were changed
+
+    :return: S_OK( dict ), or S_OK( None ) if the request was not read from the DB or if operations
+             or files were added or removed since, in which case the whole request has to be put
+    """
+    persisted = getattr( self, '_Request__persisted', None )
+    if not persisted:
+      return S_OK( None )
+    structure, files = persisted
+    if structure != [ ( getattr( op, 'OperationID', 0 ), [ getattr( opFile, 'FileID', 0 ) for opFile in op ] )
+                      for op in self.__operations__ ]:
+      return S_OK( None )
+
+    self._notify()
+    requestData = self._getJSONData()
+    del requestData['Operations']
+    operationsData = {}
+    filesData = {}
+    for op in self.__operations__:
+      operationsData[op.OperationID] = op._getJSONData()
+      del operationsData[op.OperationID]['Files']
+      for opFile in op:
+        fileValues = self.__getFileValues( opFile )
+        persistedValues = files[opFile.FileID]
+        if fileValues != persistedValues:
+          filesData[opFile.FileID] = dict( ( attrName, value ) for attrName, value, persistedValue
+                                           in zip( self.FILE_ATTRIBUTES, fileValues, persistedValues )
+                                           if value != persistedValue )
+
+    # Attempts of the files of the waiting operation, used for the delay of the next execution
+    waitingOp = self.__waiting
+    attempts = [ opFile.Attempt for opFile in waitingOp if opFile.Status == 'Waiting' ] if waitingOp else []
+    return S_OK( {'Request': requestData,
+                  'Operations': operationsData,
+                  'Files': filesData,
+                  'MaxWaitingAttempt': max( attempts ) if attempts else None} )
 
 
   def _notify( self ):
@@ -27,6 +27,7 @@ __RCSID__ = "$Id$"
 # # imports
 import unittest
 import datetime
+import json
 # # from DIRAC
 from DIRAC.RequestManagementSystem.Client.Operation import Operation
 from DIRAC.RequestManagementSystem.Client.File import File
@@ -480,6 +481,49 @@ class RequestTests(unittest.TestCase):
         self.assertEqual(len(r[2]), 1, 'Wrong number of files: %d' % len(r[1]))
         self.assertEqual(len(r[3]), 2, 'Wrong number of files: %d' % len(r[1]))
 
+  def test_09Changes(self):
+    """ changes of a request read from the DB """
+    # A new request is put whole
+    req = Request({"RequestName": "changes"})
+    op = Operation({"Type": "ReplicateAndRegister", "TargetSE": "CERN-USER"})
+    for i in xrange(3):
+      op += File({"LFN": "/a/b/c/%d" % i})
+    req += op
+    self.assertEqual(req.getChanges(), {'OK': True, 'Value': None})
+
+    # As read from the DB, with the IDs set
+    reqDict = json.loads(req.toJSON()['Value'])
+    reqDict['RequestID'] = 1
+    reqDict['Operations'][0]['OperationID'] = 10
+    for i, fileDict in enumerate(reqDict['Operations'][0]['Files']):
+      fileDict['FileID'] = 100 + i
+      fileDict['OperationID'] = 10
+    req = Request(reqDict)
+    changes = req.getChanges()['Value']
+    self.assertEqual(changes['Files'], {})
+    self.assertEqual(changes['Operations'].keys(), [10])
+    self.assertNotIn('Files', changes['Operations'][10])
+    self.assertEqual(changes['Request']['RequestID'], 1)
+    self.assertNotIn('Operations', changes['Request'])
+
+    # Only the attributes of the files that changed are given
+    req[0][1].Status = 'Done'
+    req[0][2].Attempt = 3
+    req[0][2].Error = 'Some error'
+    changes = req.getChanges()['Value']
+    # A file set to Done gets its Error reset
+    self.assertEqual(changes['Files'], {101: {'Status': 'Done', 'Error': ''},
+                                        102: {'Attempt': 3, 'Error': 'Some error'}})
+    self.assertEqual(changes['MaxWaitingAttempt'], 3)
+
+    # Once put, the request has no more changed files
+    req._setPersisted()
+    self.assertEqual(req.getChanges()['Value']['Files'], {})
+
+    # Adding a file needs the whole request to be put
+    req[0].addFile(File({"LFN": "/a/b/c/new"}))
+    self.assertEqual(req.getChanges(), {'OK': True, 'Value': None})
+
 # # test execution
 if __name__ == "__main__":
 
@@ -22,9 +22,9 @@ import datetime
 
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.orm import relationship, backref, sessionmaker, joinedload_all, mapper
-from sqlalchemy.sql import update
+from sqlalchemy.sql import update, select, union_all
 from sqlalchemy import create_engine, func, Table, Column, MetaData, ForeignKey, \
-                       Integer, String, DateTime, Enum, BLOB, BigInteger, distinct
+                       Integer, String, DateTime, Enum, BLOB, BigInteger, distinct, Index
 
 # # from DIRAC
 from DIRAC import S_OK, S_ERROR, gLogger
@@ -37,6 +37,11 @@ from DIRAC.ConfigurationSystem.Client.Utilities import getDBParameters
 
 __RCSID__ = "$Id $"
 
+# Maximum number of FileIDs in a single UPDATE of putRequestUpdates
+UPDATE_FILES_CHUNK = 1000
+
+# Maximum number of owners whose requests are considered by claimRequests for each request to claim
+DISPATCH_OWNERS_FACTOR = 2
 
 # Metadata instance that is used to bind the engine, Object and tables
 metadata = MetaData()
@@ -126,6 +131,10 @@ requestTable = Table( 'Request', metadata,
                       Column( 'NotBefore', DateTime ),
                       mysql_engine = 'InnoDB' )
 
+# Path of the dispatch of the requests: owners having Waiting requests, and oldest Waiting requests of an owner
+Index( 'StatusOwnerLastUpdate', requestTable.c.Status, requestTable.c.OwnerDN, requestTable.c.OwnerGroup,
+       requestTable.c.LastUpdate )
+
 # Map the Request object to the requestTable, with a few special attributes
 
 mapper( Request, requestTable, properties = {'_CreationTime': requestTable.c.CreationTime,
@@ -263,6 +272,88 @@ class RequestDB( object ):
       session.close()
 
 
+  @staticmethod
+  def __getColumnValues( table, attrs, excluded ):
+    """ values of the columns of a table, from the attributes serialized to JSON of an object
+
+    :param table: Table of the object
+    :param dict attrs: attributes of the object
+    :param list excluded: columns that are never updated
+    """
+    values = {}
+    for attrName, value in attrs.iteritems():
+      if attrName in excluded or attrName not in table.c:
+        continue
+      if value and isinstance( table.c[attrName].type, DateTime ):
+        value = datetime.datetime.strptime( value.split( "." )[0], Request._datetimeFormat )
+      values[attrName] = value
+    return values
+
+  def putRequestUpdates( self, requestID, requestAttrs, operationsAttrs, filesAttrs ):
+    """ update a request already in the db: its row and the ones of its operations, and only the rows of the
+        files that changed, with one statement for all the files set to the same values
+
+    :param int requestID: RequestID of the request
+    :param dict requestAttrs: attributes of the request
+    :param dict operationsAttrs: attributes of the operations of the request, by OperationID
+    :param dict filesAttrs: changed attributes of the files, by FileID
+    """
+
+    session = self.DBSession()
+    try:
+      try:
+        status = session.query( Request._Status )\
+                        .filter( Request.RequestID == requestID )\
+                        .one()
+      except NoResultFound:
+        return S_ERROR( "putRequestUpdates: no request %s" % requestID )
+      if status[0] == 'Canceled':
+        self.log.info( "Request %s(%s) was canceled, don't put it back" % ( requestID,
+                                                                          requestAttrs.get( 'RequestName' ) ) )
+        return S_OK( requestID )
+
+      # The files of the same operation that changed the same way, e.g. to Done, are updated together
+      filesByValues = {}
+      for fileID, fileAttrs in filesAttrs.iteritems():
+        values = self.__getColumnValues( fileTable, fileAttrs, ( 'FileID', 'OperationID' ) )
+        if values:
+          filesByValues.setdefault( tuple( sorted( values.iteritems() ) ), [] ).append( fileID )
+
+      # The number of rows matched tells whether the operations and the files belong to the request
+      updated = session.execute( update( requestTable )
+                                 .where( requestTable.c.RequestID == requestID )
+                                 .values( self.__getColumnValues( requestTable, requestAttrs,
+                                                                  ( 'RequestID', 'OwnerDN', 'OwnerGroup' ) ) ) )
+      matched = updated.rowcount == 1
+      for operationID, operationAttrs in operationsAttrs.iteritems():
+        updated = session.execute( update( operationTable )
+                                   .where( operationTable.c.OperationID == operationID )
+                                   .where( operationTable.c.RequestID == requestID )
+                                   .values( self.__getColumnValues( operationTable, operationAttrs,
+                                                                    ( 'OperationID', 'RequestID' ) ) ) )
+        matched = matched and updated.rowcount == 1
+      for values, fileIDs in filesByValues.iteritems():
+        for start in xrange( 0, len( fileIDs ), UPDATE_FILES_CHUNK ):
+          chunk = fileIDs[start:start + UPDATE_FILES_CHUNK]
+          updated = session.execute( update( fileTable )
+                                     .where( fileTable.c.FileID.in_( chunk ) )
+                                     .where( fileTable.c.OperationID.in_( operationsAttrs.keys() ) )
+                                     .values( dict( values ) ) )
+          matched = matched and updated.rowcount == len( chunk )
+
+      if not matched:
+        session.rollback()
+        return S_ERROR( "putRequestUpdates: operations or files not belonging to request %s" % requestID )
+      session.commit()
+      return S_OK( requestID )
+
+    except Exception as e:
+      session.rollback()
+      self.log.exception( "putRequestUpdates: unexpected exception", lException = e )
+      return S_ERROR( "putRequestUpdates: unexpected exception %s" % e )
+    finally:
+      session.close()
+
   def getScheduledRequest( self, operationID ):
     session = self.DBSession()
     try:
@@ -449,6 +540,110 @@ class RequestDB( object ):
     return S_OK( requestDict )
 
 
+  def claimRequests( self, numberOfRequest = 10 ):
+    """ claim requests for execution without locking the candidates
+
+    The owners having Waiting requests are read from the (Status, OwnerDN, OwnerGroup, LastUpdate)
+    index, and the oldest Waiting requests of some of them, taken at random, are read without lock.
+    The candidates are grouped by owner and type of their current operation, and the groups are
+    served in turn, in a random order, so that a single owner or type cannot take all the slots
+    of an agent and so that the agents do not all try the same requests. Each request is claimed
+    with an update conditioned on its Waiting status, committed on its own: a request claimed
+    by another agent in the meantime is skipped instead of waiting for a lock.
+
+    :param int numberOfRequest: Number of Request we want (default 10)
+
+    :returns: a dictionary of Request objects indexed on the RequestID
+    """
+
+    # expire_on_commit is set to False so that we can still use the object after we close the session
+    session = self.DBSession( expire_on_commit = False )
+    log = self.log.getSubLogger( 'claimRequests' )
+
+    try:
+      now = datetime.datetime.utcnow().replace( microsecond = 0 )
+      owners = session.query( Request.OwnerDN, Request.OwnerGroup )\
+                      .filter( Request._Status == 'Waiting' )\
+                      .distinct()\
+                      .all()
+      if not owners:
+        session.commit()
+        return S_OK( {} )
+      random.shuffle( owners )
+
+      # Oldest requests of each owner, in a single statement
+      ownerQueries = []
+      for ownerDN, ownerGroup in owners[:DISPATCH_OWNERS_FACTOR * numberOfRequest]:
+        ownerQuery = select( [requestTable.c.RequestID, requestTable.c.OwnerDN, requestTable.c.OwnerGroup] )\
+                     .where( requestTable.c.Status == 'Waiting' )\
+                     .where( requestTable.c.OwnerDN == ownerDN )\
+                     .where( requestTable.c.OwnerGroup == ownerGroup )\
+                     .where( requestTable.c.NotBefore < now )\
+                     .order_by( requestTable.c.LastUpdate )\
+                     .limit( numberOfRequest )\
+                     .alias()
+        ownerQueries.append( select( [ownerQuery] ) )
+      candidates = session.execute( union_all( *ownerQueries ) ).fetchall()
+      session.commit()
+      if not candidates:
+        return S_OK( {} )
+
+      # Type of the operation to be executed for each request
+      opTypes = dict( session.query( Operation.RequestID, Operation.Type )\
+                             .filter( Operation.RequestID.in_( [candidate[0] for candidate in candidates] ) )\
+                             .filter( Operation._Status == 'Waiting' )\
+                             .all() )
+      session.commit()
+
+      groups = {}
+      for requestID, ownerDN, ownerGroup in candidates:
+        groups.setdefault( ( ownerDN, ownerGroup, opTypes.get( requestID ) ), [] ).append( requestID )
+      groups = groups.values()
+      random.shuffle( groups )
+      for group in groups:
+        random.shuffle( group )
+
+      claimedIDs = []
+      conflicts = 0
+      while groups and len( claimedIDs ) < numberOfRequest:
+        for group in list( groups ):
+          requestID = group.pop()
+          if not group:
+            groups.remove( group )
+          claimed = session.execute( update( Request )\
+                                     .where( Request.RequestID == requestID )\
+                                     .where( Request._Status == 'Waiting' )\
+                                     .values( {Request._Status : 'Assigned',
+                                               Request._LastUpdate : datetime.datetime.utcnow()\
+                                                                    .replace( microsecond = 0 )} ) )
+          session.commit()
+          if claimed.rowcount:
+            claimedIDs.append( requestID )
+            if len( claimedIDs ) == numberOfRequest:
+              break
+          else:
+            conflicts += 1
+      log.debug( "Claimed request ids %s, %s already claimed" % ( claimedIDs, conflicts ) )
+
+      requestDict = {}
+      if claimedIDs:
+        # the joinedload_all is to force the non-lazy loading of all the attributes, especially _parent
+        requests = session.query( Request )\
+                          .options( joinedload_all( '__operations__.__files__' ) )\
+                          .filter( Request.RequestID.in_( claimedIDs ) )\
+                          .all()
+        requestDict = dict( ( req.RequestID, req ) for req in requests )
+        session.commit()
+      session.expunge_all()
+      return S_OK( requestDict )
+
+    except Exception as e:
+      session.rollback()
+      log.exception( "unexpected exception", lException = e )
+      return S_ERROR( "claimRequests: unexpected exception : %s" % e )
+    finally:
+      session.close()
+
 
   def peekRequest( self, requestID ):
     """ get request (ro), no update on states
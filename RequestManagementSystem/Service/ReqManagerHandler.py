@@ -46,6 +46,8 @@ class ReqManagerHandler(RequestHandler):
 
     # If there is a constant delay to be applied to each request
     cls.constantRequestDelay = getServiceOption(serviceInfoDict, 'ConstantRequestDelay', 0)
+    # If the requests given to the agents are claimed without locking the other candidates
+    cls.claimDispatch = getServiceOption(serviceInfoDict, 'ClaimDispatch', False)
 
     # # create tables for empty db
     return cls.__requestDB.createTables()
@@ -111,30 +113,11 @@ class ReqManagerHandler(RequestHandler):
       return valid
 
     # If NotBefore is not set or user defined, we calculate its value
-
-    now = datetime.datetime.utcnow().replace(microsecond=0)
-    extraDelay = datetime.timedelta(0)
-    if request.Status not in Request.FINAL_STATES and (
-            not request.NotBefore or request.NotBefore < now):
-      # We don't delay if it is the first insertion
-      if getattr(request, 'RequestID', 0):
-        # If it is a constant delay, just set it
-        if self.constantRequestDelay:
-          extraDelay = datetime.timedelta(minutes=self.constantRequestDelay)
-        else:
-          # If there is a waiting Operation with Files
-          op = request.getWaiting().get('Value')
-          if op and len(op):
-            attemptList = [opFile.Attempt for opFile in op if opFile.Status == "Waiting"]
-            if attemptList:
-              maxWaitingAttempt = max(
-                  [opFile.Attempt for opFile in op if opFile.Status == "Waiting"])
-              # In case it is the first attempt, extraDelay is 0
-              # maxWaitingAttempt can be None if the operation has no File, like the ForwardDiset
-              extraDelay = datetime.timedelta(
-                  minutes=2 * math.log(maxWaitingAttempt) if maxWaitingAttempt else 0)
-
-        request.NotBefore = now + extraDelay
+    op = request.getWaiting().get('Value')
+    attemptList = [opFile.Attempt for opFile in op if opFile.Status == "Waiting"] if op else []
+    request.NotBefore, extraDelay = self.__getNotBefore(request.Status, request.NotBefore,
+                                                        bool(getattr(request, 'RequestID', 0)),
+                                                        max(attemptList) if attemptList else None)
 
     gLogger.info("putRequest: request %s not before %s (extra delay %s)" %
                  (request.RequestName, request.NotBefore, extraDelay))
@@ -143,6 +126,71 @@ class ReqManagerHandler(RequestHandler):
     gLogger.info("putRequest: Attempting to set request '%s'" % requestName)
     return self.__requestDB.putRequest(request)
 
+  @classmethod
+  def __getNotBefore(cls, status, notBefore, putBack, maxWaitingAttempt):
+    """ NotBefore of a request put into the RequestDB, and the delay it was given
+
+    :param str status: status of the request
+    :param notBefore: NotBefore of the request, as set by the client
+    :type notBefore: datetime.datetime or None
+    :param bool putBack: True if the request is already in the RequestDB
+    :param maxWaitingAttempt: highest Attempt of the Waiting files of the waiting operation, if any
+
+    :return: tuple (notBefore, extraDelay)
+    """
+    now = datetime.datetime.utcnow().replace(microsecond=0)
+    extraDelay = datetime.timedelta(0)
+    if status in Request.FINAL_STATES or (notBefore and notBefore >= now):
+      return notBefore, extraDelay
+    # We don't delay if it is the first insertion
+    if putBack:
+      # If it is a constant delay, just set it
+      if cls.constantRequestDelay:
+        extraDelay = datetime.timedelta(minutes=cls.constantRequestDelay)
+      # In case it is the first attempt, extraDelay is 0
+      # maxWaitingAttempt can be None if the operation has no File, like the ForwardDiset
+      elif maxWaitingAttempt:
+        extraDelay = datetime.timedelta(minutes=2 * math.log(maxWaitingAttempt))
+    return now + extraDelay, extraDelay
+
+  types_putRequestUpdates = [basestring]
+
+  def export_putRequestUpdates(self, changesJSON):
+    """ put the changes of a request read from the RequestDB: the attributes of the request and of its
+        operations, and only the attributes of the files that changed
+
+    :param str changesJSON: changes serialized to JSON format, as returned by Request.getChanges
+    """
+    changes = json.loads(changesJSON)
+    requestAttrs = changes['Request']
+    requestID = requestAttrs.get('RequestID')
+    if not requestID:
+      return S_ERROR("putRequestUpdates: the RequestID is missing")
+
+    # The owner of a request is not changed: the credentials are checked against the one in the DB
+    requestInfo = self.__requestDB.getRequestInfo(requestID)
+    if not requestInfo["OK"]:
+      return requestInfo
+    ownerDN, ownerGroup = requestInfo["Value"][4:6]
+    isAuthorized = RequestValidator.setAndCheckRequestOwner(Request({'OwnerDN': ownerDN, 'OwnerGroup': ownerGroup}),
+                                                            self.getRemoteCredentials())
+    if not isAuthorized:
+      return S_ERROR(DErrno.ENOAUTH, "Credentials in the requests are not allowed")
+
+    notBefore = requestAttrs.get('NotBefore')
+    if notBefore:
+      notBefore = datetime.datetime.strptime(notBefore, Request._datetimeFormat)
+    notBefore, extraDelay = self.__getNotBefore(requestAttrs.get('Status'), notBefore, True,
+                                                changes.get('MaxWaitingAttempt'))
+    requestAttrs['NotBefore'] = notBefore.strftime(Request._datetimeFormat) if notBefore else None
+
+    gLogger.info("putRequestUpdates: request %s not before %s (extra delay %s), %s files changed" %
+                 (requestAttrs.get('RequestName'), notBefore, extraDelay, len(changes['Files'])))
+    # JSON keys are strings
+    operationsAttrs = dict((int(opID), opAttrs) for opID, opAttrs in changes['Operations'].iteritems())
+    filesAttrs = dict((int(fileID), fileAttrs) for fileID, fileAttrs in changes['Files'].iteritems())
+    return self.__requestDB.putRequestUpdates(requestID, requestAttrs, operationsAttrs, filesAttrs)
+
   types_getScheduledRequest = [(int, long)]
 
   @classmethod
@@ -171,7 +219,12 @@ class ReqManagerHandler(RequestHandler):
   @classmethod
   def export_getRequest(cls, requestID=0):
     """ Get a request of given type from the database """
-    getRequest = cls.__requestDB.getRequest(requestID)
+    if not requestID and cls.claimDispatch:
+      getRequest = cls.__requestDB.claimRequests(numberOfRequest=1)
+      if getRequest["OK"]:
+        getRequest["Value"] = getRequest["Value"].values()[0] if getRequest["Value"] else None
+    else:
+      getRequest = cls.__requestDB.getRequest(requestID)
     if not getRequest["OK"]:
       gLogger.error("getRequest: %s" % getRequest["Message"])
       return getRequest
@@ -192,8 +245,11 @@ class ReqManagerHandler(RequestHandler):
         :param numberOfRequest: size of the bulk (default 10)
         :return: S_OK( {Failed : message, Successful : list of Request.toJSON()} )
     """
-    getRequests = cls.__requestDB.getBulkRequests(
-        numberOfRequest=numberOfRequest, assigned=assigned)
+    if assigned and cls.claimDispatch:
+      getRequests = cls.__requestDB.claimRequests(numberOfRequest=numberOfRequest)
+    else:
+      getRequests = cls.__requestDB.getBulkRequests(
+          numberOfRequest=numberOfRequest, assigned=assigned)
     if not getRequests["OK"]:
       gLogger.error("getRequests: %s" % getRequests["Message"])
       return getRequests
@@ -26,6 +26,7 @@ __RCSID__ = "$Id $"
 # # imports
 import os
 import time
+from collections import OrderedDict
 # # from DIRAC
 from DIRAC import gLogger, S_OK, S_ERROR, gConfig
 from DIRAC.FrameworkSystem.Client.MonitoringClient import gMonitor
@@ -38,6 +39,13 @@ from DIRAC.ConfigurationSystem.Client.Helpers.Operations import Operations
 from DIRAC.Core.DISET.RPCClient import RPCClient
 from DIRAC.ConfigurationSystem.Client.Helpers import Registry
 
+# # remaining lifetime in seconds under which a proxy kept by a warm worker is downloaded again
+PROXY_MIN_LIFETIME = 1200
+# # time in seconds a warm worker keeps the shifter proxies before reading the shifters again
+SHIFTER_CACHE_TIME = 3600
+# # maximal number of operation handlers kept by a warm worker
+MAX_CACHED_HANDLERS = 50
+
 ########################################################################
 
 
@@ -46,7 +54,16 @@ class RequestTask(object):
   .. class:: RequestTask
 
   request's processing task
+
+  The tasks created with warmWorker=True share, within the worker process executing them,
+  the shifter proxies, the proxy files of the request owners and the operation handlers,
+  the latter being kept per owner and operation type.
   """
+  # # caches of the worker process, used by the tasks created with warmWorker=True
+  __workerShifters = {"Expiry": 0, "Managers": {}}
+  __workerProxies = {}
+  __workerHandlers = OrderedDict()
+  __workerMonitor = False
 
   def __init__(
           self,
@@ -55,12 +72,14 @@ class RequestTask(object):
           csPath,
           agentName,
           standalone=False,
-          requestClient=None):
+          requestClient=None,
+          warmWorker=False):
     """c'tor
 
     :param self: self reference
     :param str requestJSON: request serialized to JSON
     :param dict opHandlers: operation handlers
+    :param bool warmWorker: if True, use the caches of the worker process
     """
     self.request = Request(requestJSON)
     # # csPath
@@ -69,30 +88,35 @@ class RequestTask(object):
     self.agentName = agentName
     # # standalone flag
     self.standalone = standalone
+    # # warm worker flag
+    self.warmWorker = warmWorker
     # # handlers dict
     self.handlersDict = handlersDict
     # # handlers class def
     self.handlers = {}
     # # own sublogger
     self.log = gLogger.getSubLogger("pid_%s/%s" % (os.getpid(), self.request.RequestName))
-    # # get shifters info
+    # # get shifters info, done again by setupProxy anyway in a warm worker
     self.__managersDict = {}
-    shifterProxies = self.__setupManagerProxies()
-    if not shifterProxies["OK"]:
-      self.log.error("Cannot setup shifter proxies", shifterProxies["Message"])
-
-    # # initialize gMonitor
-    gMonitor.setComponentType(gMonitor.COMPONENT_AGENT)
-    gMonitor.setComponentName(self.agentName)
-    gMonitor.initialize()
-
-    # # own gMonitor activities
-    gMonitor.registerActivity("RequestAtt", "Requests processed",
-                              "RequestExecutingAgent", "Requests/min", gMonitor.OP_SUM)
-    gMonitor.registerActivity("RequestFail", "Requests failed",
-                              "RequestExecutingAgent", "Requests/min", gMonitor.OP_SUM)
-    gMonitor.registerActivity("RequestOK", "Requests done",
-                              "RequestExecutingAgent", "Requests/min", gMonitor.OP_SUM)
+    if not self.warmWorker:
+      shifterProxies = self.__setupManagerProxies()
+      if not shifterProxies["OK"]:
+        self.log.error("Cannot setup shifter proxies", shifterProxies["Message"])
+
+    if not self.warmWorker or not RequestTask.__workerMonitor:
+      # # initialize gMonitor
+      gMonitor.setComponentType(gMonitor.COMPONENT_AGENT)
+      gMonitor.setComponentName(self.agentName)
+      gMonitor.initialize()
+
+      # # own gMonitor activities
+      gMonitor.registerActivity("RequestAtt", "Requests processed",
+                                "RequestExecutingAgent", "Requests/min", gMonitor.OP_SUM)
+      gMonitor.registerActivity("RequestFail", "Requests failed",
+                                "RequestExecutingAgent", "Requests/min", gMonitor.OP_SUM)
+      gMonitor.registerActivity("RequestOK", "Requests done",
+                                "RequestExecutingAgent", "Requests/min", gMonitor.OP_SUM)
+      RequestTask.__workerMonitor = self.warmWorker
 
     if requestClient is None:
       self.requestClient = ReqClient()
@@ -143,13 +167,62 @@ class RequestTask(object):
                                       "ProxyFile": fileName}
     return S_OK()
 
+  @staticmethod
+  def __getProxyExpiry(chain):
+    """ time until which a warm worker can use a proxy
+
+    :param chain: X509Chain of the proxy
+    """
+    remainingSecs = chain.getRemainingSecs()
+    if not remainingSecs["OK"]:
+      return 0
+    return time.time() + remainingSecs["Value"] - PROXY_MIN_LIFETIME
+
+  def __setupWorkerManagerProxies(self):
+    """ setup the shifter proxies, keeping them in the worker until one of them is about to expire """
+    if time.time() < self.__workerShifters["Expiry"]:
+      self.__managersDict = self.__workerShifters["Managers"]
+      return S_OK()
+    self.__managersDict = {}
+    shifterProxies = self.__setupManagerProxies()
+    if not shifterProxies["OK"]:
+      return shifterProxies
+    expiry = time.time() + SHIFTER_CACHE_TIME
+    for creds in self.__managersDict.itervalues():
+      expiry = min(expiry, self.__getProxyExpiry(creds["Chain"]))
+    self.__workerShifters.update({"Expiry": expiry, "Managers": self.__managersDict})
+    return S_OK()
+
+  def __downloadWorkerProxy(self, ownerDN, ownerGroup):
+    """ download the owner proxy to file, or reuse the file downloaded by a previous task of the worker
+
+    :param str ownerDN: owner DN
+    :param str ownerGroup: owner group
+    """
+    proxyFile, expiry = self.__workerProxies.get((ownerDN, ownerGroup), (None, 0))
+    if time.time() < expiry and os.path.exists(proxyFile):
+      return S_OK(proxyFile)
+    ownerProxyFile = gProxyManager.downloadVOMSProxyToFile(ownerDN, ownerGroup)
+    if ownerProxyFile["OK"] and ownerProxyFile["Value"]:
+      if proxyFile and proxyFile != ownerProxyFile["Value"]:
+        try:
+          os.unlink(proxyFile)
+        except OSError:
+          pass
+      self.__workerProxies[(ownerDN, ownerGroup)] = (ownerProxyFile["Value"],
+                                                     self.__getProxyExpiry(ownerProxyFile["chain"]))
+    return ownerProxyFile
+
   def setupProxy(self):
     """ download and dump request owner proxy to file and env
 
     :return: S_OK with name of newly created owner proxy file and shifter name if any
     """
-    self.__managersDict = {}
-    shifterProxies = self.__setupManagerProxies()
+    if self.warmWorker:
+      shifterProxies = self.__setupWorkerManagerProxies()
+    else:
+      self.__managersDict = {}
+      shifterProxies = self.__setupManagerProxies()
     if not shifterProxies["OK"]:
       self.log.error(shifterProxies["Message"])
 
@@ -165,7 +238,10 @@ class RequestTask(object):
       return S_OK({"Shifter": isShifter, "ProxyFile": proxyFile})
 
     # # if we're here owner is not a shifter at all
-    ownerProxyFile = gProxyManager.downloadVOMSProxyToFile(ownerDN, ownerGroup)
+    if self.warmWorker:
+      ownerProxyFile = self.__downloadWorkerProxy(ownerDN, ownerGroup)
+    else:
+      ownerProxyFile = gProxyManager.downloadVOMSProxyToFile(ownerDN, ownerGroup)
     if not ownerProxyFile["OK"] or not ownerProxyFile["Value"]:
       reason = ownerProxyFile.get("Message", "No valid proxy found in ProxyManager.")
       return S_ERROR("Change proxy error for '%s'@'%s': %s" % (ownerDN, ownerGroup, reason))
@@ -228,13 +304,17 @@ class RequestTask(object):
 
   def getHandler(self, operation):
     """ return instance of a handler for a given operation type on demand
-        all created handlers are kept in self.handlers dict for further use
+        all created handlers are kept in self.handlers dict for further use,
+        and in a warm worker for the next requests of the same owner
 
     :param ~Operation.Operation operation: Operation instance
     """
     if operation.Type not in self.handlersDict:
       return S_ERROR("handler for operation '%s' not set" % operation.Type)
     handler = self.handlers.get(operation.Type, None)
+    handlerKey = (self.request.OwnerDN, self.request.OwnerGroup, operation.Type)
+    if not handler and self.warmWorker and handlerKey in self.__workerHandlers:
+      handler = self.handlers[operation.Type] = self.__workerHandlers[handlerKey]
     if not handler:
       try:
         handlerCls = self.loadHandler(self.handlersDict[operation.Type])
@@ -244,6 +324,12 @@ class RequestTask(object):
       except (ImportError, TypeError) as error:
         self.log.exception("Error getting Handler", "%s" % error, lException=error)
         return S_ERROR(str(error))
+    if self.warmWorker:
+      # # most recently used last
+      self.__workerHandlers.pop(handlerKey, None)
+      self.__workerHandlers[handlerKey] = handler
+      while len(self.__workerHandlers) > MAX_CACHED_HANDLERS:
+        self.__workerHandlers.popitem(last=False)
     # # set operation for this handler
     handler.setOperation(operation)
     # # and return
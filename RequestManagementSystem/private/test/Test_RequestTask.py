@@ -0,0 +1,100 @@
+""" Test the caches of the warm workers of the RequestTask
+"""
+
+# pylint: disable=protected-access,redefined-outer-name
+
+import pytest
+from mock import MagicMock, patch
+
+from DIRAC import S_OK
+from DIRAC.RequestManagementSystem.Client.Request import Request
+from DIRAC.RequestManagementSystem.Client.Operation import Operation
+from DIRAC.RequestManagementSystem.private import RequestTask as RequestTaskModule
+from DIRAC.RequestManagementSystem.private.RequestTask import RequestTask
+
+
+def makeRequestJSON(ownerDN, opType='RemoveFile'):
+  request = Request()
+  request.RequestName = 'req'
+  request.OwnerDN = ownerDN
+  request.OwnerGroup = 'user'
+  request.addOperation(Operation({'Type': opType}))
+  return request.toJSON()['Value']
+
+
+@pytest.fixture
+def workerEnv():
+  """ Shifters, proxy manager and handler of the tasks, and empty worker caches """
+  operations = MagicMock()
+  operations.getSections.return_value = S_OK(['DataManager'])
+  operations.getOptionsDict.return_value = S_OK({'User': 'shifter', 'Group': 'prod'})
+  registry = MagicMock()
+  registry.getDNForUsername.return_value = S_OK(['/DN/shifter'])
+  registry.getVOMSAttributeForGroup.return_value = '/vo/Role=production'
+  chain = MagicMock()
+  chain.getRemainingSecs.return_value = S_OK(86400)
+  proxyManager = MagicMock()
+  proxyManager.downloadVOMSProxyToFile.side_effect = \
+      lambda userDN, _group, **_kwargs: {'OK': True, 'Value': '/tmp/proxy_%s' % userDN[4:], 'chain': chain}
+  handlerCls = MagicMock()
+  handlerCls.return_value.return_value = S_OK()
+
+  with patch.object(RequestTaskModule, 'Operations', return_value=operations), \
+      patch.object(RequestTaskModule, 'Registry', registry), \
+      patch.object(RequestTaskModule, 'gProxyManager', proxyManager), \
+      patch.object(RequestTaskModule, 'gMonitor', MagicMock()), \
+      patch.object(RequestTaskModule.os.path, 'exists', return_value=True), \
+      patch.object(RequestTask, 'loadHandler', return_value=handlerCls), \
+      patch.dict(RequestTask._RequestTask__workerShifters, {'Expiry': 0, 'Managers': {}}), \
+      patch.dict(RequestTask._RequestTask__workerProxies, clear=True), \
+      patch.dict(RequestTask._RequestTask__workerHandlers, clear=True), \
+      patch.dict(RequestTaskModule.os.environ):
+    yield proxyManager, handlerCls
+
+
+def runTask(ownerDN, warmWorker, opType='RemoveFile'):
+  task = RequestTask(makeRequestJSON(ownerDN, opType), {'RemoveFile': 'RemoveFile', 'RemoveReplica': 'RemoveReplica'},
+                     'csPath', 'RequestManagement/RequestExecutingAgent', requestClient=MagicMock(),
+                     warmWorker=warmWorker)
+  result = task()
+  assert result['OK'], result
+  return task
+
+
+def test_coldWorker(workerEnv):
+  proxyManager, handlerCls = workerEnv
+  for _ in xrange(2):
+    runTask('/DN/owner', False)
+  # The shifter proxy is downloaded twice per task, the owner proxy once
+  assert proxyManager.downloadVOMSProxyToFile.call_count == 6
+  assert handlerCls.call_count == 2
+
+
+def test_warmWorker(workerEnv):
+  proxyManager, handlerCls = workerEnv
+  for _ in xrange(3):
+    runTask('/DN/owner', True)
+  assert [call[0][0] for call in proxyManager.downloadVOMSProxyToFile.call_args_list] == ['/DN/shifter', '/DN/owner']
+  assert handlerCls.call_count == 1
+  assert RequestTaskModule.os.environ['X509_USER_PROXY'] == '/tmp/proxy_owner'
+
+  # The handlers and proxies are kept per owner, and the handlers per operation type
+  runTask('/DN/other', True)
+  runTask('/DN/owner', True, opType='RemoveReplica')
+  assert proxyManager.downloadVOMSProxyToFile.call_count == 3
+  assert RequestTaskModule.os.environ['X509_USER_PROXY'] == '/tmp/proxy_owner'
+  assert handlerCls.call_count == 3
+  assert len(RequestTask._RequestTask__workerHandlers) == 3
+
+
+def test_warmWorkerExpiry(workerEnv):
+  proxyManager, _handlerCls = workerEnv
+  runTask('/DN/owner', True)
+  # Proxies expiring soon are downloaded again
+  RequestTask._RequestTask__workerShifters['Expiry'] = 0
+  RequestTask._RequestTask__workerProxies[('/DN/owner', 'user')] = ('/tmp/proxy_owner', 0)
+  with patch.object(RequestTaskModule.os, 'unlink') as unlink:
+    runTask('/DN/owner', True)
+  assert proxyManager.downloadVOMSProxyToFile.call_count == 4
+  # The file is the same one in the test: it is not removed
+  assert not unlink.called
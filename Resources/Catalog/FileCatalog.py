@@ -42,9 +42,27 @@
     For the actual methods that can be called vie the File Catalog object, see
     the documentation of the respective FileCatalog plug-ins ( client classes )
 
+    When the ParallelCalls option of the Operations /Services/Catalogs section is set
+    ( or the parallelCalls argument of the constructor ), the plug-ins are called
+    concurrently by at most MaxParallelCalls threads started for each call. The Master
+    plug-in is still called first, alone, for the "write" methods, and the other plug-ins
+    are then called together. For the "read" methods all the plug-ins are called together
+    and the results are merged in the same order as in the serial mode, returning as soon
+    as no LFN can be changed by the plug-ins which did not answer yet. The time spent in
+    each plug-in is returned in the CatalogLatency key of the bulk results.
+
+    In the parallel mode, a plug-in call is given up after the timeout counted from the
+    moment a thread takes it. If the plug-in was still busy with a previous call, the
+    call is not executed and fails with EBUSY. If it was executing the call, the call
+    fails with ETIMEDOUT but it goes on: a "write" method can then still complete later.
+
 """
 
 import re
+import time
+import errno
+import threading
+from collections import deque
 
 from DIRAC                                               import gLogger, gConfig, S_OK, S_ERROR
 from DIRAC.Core.Utilities                                import DErrno
@@ -54,12 +72,33 @@ from DIRAC.Resources.Catalog.Utilities                   import checkArgumentFor
 from DIRAC.Resources.Catalog.FileCatalogFactory          import FileCatalogFactory
 from DIRAC.Resources.Catalog.FCConditionParser           import FCConditionParser
 
+# Default maximum number of catalog calls executed at the same time for a FileCatalog call
+MAXPARALLELCALLS = 5
+
+class CatalogCall( object ):
+  """ Call of a method of a catalog object, executed by one of the threads of a FileCatalog call """
+
+  def __init__( self, catalogName, oCatalog, args ):
+    self.catalogName = catalogName
+    self.oCatalog = oCatalog
+    self.args = args
+    # Time at which a thread took the call
+    self.startTime = None
+    # Protects the change of the call to running or cancelled
+    self.stateLock = threading.Lock()
+    self.running = False
+    self.cancelled = False
+    self.result = None
+    self.latency = None
+    self.done = threading.Event()
 
 class FileCatalog( object ):
 
 
-  def __init__( self, catalogs = None, vo = None ):
+  def __init__( self, catalogs = None, vo = None, parallelCalls = None ):
     """ Default constructor
+
+        :param parallelCalls: call the catalogs concurrently, the default is taken from the CS
     """
     self.valid = True
     self.timeout = 180
@@ -76,6 +115,13 @@ class FileCatalog( object ):
 
     self.opHelper = Operations( vo = self.vo )
 
+    if parallelCalls is None:
+      parallelCalls = self.opHelper.getValue( '/Services/Catalogs/ParallelCalls', False )
+    self.parallelCalls = parallelCalls
+    self.maxParallelCalls = self.opHelper.getValue( '/Services/Catalogs/MaxParallelCalls', MAXPARALLELCALLS )
+    # Locks serialising the concurrent calls to the same catalog object
+    self.__catalogLocks = {}
+
     catalogList = []
     if isinstance( catalogs, basestring ):
       catalogList = [catalogs]
@@ -181,10 +227,12 @@ class FileCatalog( object ):
 
 
     """
+    call = self.call
     successful = {}
     failed = {}
     failedCatalogs = {}
     successfulCatalogs = {}
+    latency = {}
 
 
     specialConditions = kws.pop( 'fcConditions' ) if 'fcConditions' in kws else None
@@ -193,7 +241,7 @@ class FileCatalog( object ):
     lfnMapDict = {}
     masterResult = {}
     parms1 = []
-    if self.call not in self.no_lfn_methods:
+    if call not in self.no_lfn_methods:
       fileInfo = parms[0]
       result = checkArgumentFormat( fileInfo, generateMap = True )
       if not result['OK']:
@@ -204,26 +252,26 @@ class FileCatalog( object ):
       allLfns = fileInfo.keys()
       parms1 = parms[1:]
 
+    # The calls to the non master catalogs, executed once the master has been called
+    catalogCalls = []
     for catalogName, oCatalog, master in self.writeCatalogs:
 
       # Skip if the method is not implemented in this catalog
       # NOTE: it is impossible for the master since the write method list is populated
       # only from the master catalog, and if the method is not there, __getattr__
       # would raise an exception
-      if not oCatalog.hasCatalogMethod( self.call ):
+      if not oCatalog.hasCatalogMethod( call ):
         continue
 
-      method = getattr( oCatalog, self.call )
-
-      if self.call in self.no_lfn_methods:
-        result = method( *parms, **kws )
+      if call in self.no_lfn_methods:
+        args = parms
       else:
         if isinstance( specialConditions, dict ):
           condition = specialConditions.get( catalogName )
         else:
           condition = specialConditions
         # Check whether this catalog should be used for this method
-        res = self.condParser( catalogName, self.call, fileInfo, condition = condition )
+        res = self.condParser( catalogName, call, fileInfo, condition = condition )
         # condParser never returns S_ERROR
         condEvals = res['Value']['Successful']
         # For a master catalog, ALL the lfns should be valid
@@ -243,39 +291,49 @@ class FileCatalog( object ):
         invalidLFNs = [lfn for lfn in condEvals if not condEvals[lfn]]
 
         if invalidLFNs:
-          gLogger.debug( "Some LFNs are not valid for operation '%s' on catalog '%s' : %s" % ( self.call, catalogName,
+          gLogger.debug( "Some LFNs are not valid for operation '%s' on catalog '%s' : %s" % ( call, catalogName,
                                                                                                invalidLFNs ) )
 
+        args = ( validLFNs, ) + tuple( parms1 )
 
-        result = method( validLFNs, *parms1, **kws )
+      if not master:
+        catalogCalls.append( ( catalogName, oCatalog, args ) )
+        continue
 
+      result, latency[catalogName] = self.__callCatalog( catalogName, oCatalog, call, args, kws )
+      masterResult = result
 
-      if master:
-        masterResult = result
+      if not result['OK']:
+        # If this is the master catalog and it fails we don't want to continue with the other catalogs
+        self.log.error( "Failed to execute call on master catalog",
+                        "%s on %s: %s" % ( call, catalogName, result['Message'] ) )
+        return result
+      successfulCatalogs[catalogName] = result['Value']
 
+      if allLfns:
+        for lfn, message in result['Value']['Failed'].items():
+          # Save the error message for the failed operations
+          failed.setdefault( lfn, {} )[catalogName] = message
+          # If this is the master catalog then we should not attempt the operation on other catalogs
+          fileInfo.pop( lfn, None )
+          for _catalogName, _oCatalog, args in catalogCalls:
+            args[0].pop( lfn, None )
+        for lfn, result in result['Value']['Successful'].items():
+          # Save the result return for each file for the successful operations
+          successful.setdefault( lfn, {} )[catalogName] = result
+
+    for catalogName, result in self.__executeCalls( call, catalogCalls, kws, latency ):
       if not result['OK']:
-        if master:
-          # If this is the master catalog and it fails we don't want to continue with the other catalogs
-          self.log.error( "Failed to execute call on master catalog",
-                          "%s on %s: %s" % ( self.call, catalogName, result['Message'] ) )
-          return result
-        else:
-          # Otherwise we keep the failed catalogs so we can update their state later
-          failedCatalogs[catalogName] = result['Message']
-      else:
-        successfulCatalogs[catalogName] = result['Value']
+        # We keep the failed catalogs so we can update their state later
+        failedCatalogs[catalogName] = result['Message']
+        continue
+      successfulCatalogs[catalogName] = result['Value']
 
       if allLfns:
-        if result['OK']:
-          for lfn, message in result['Value']['Failed'].items():
-            # Save the error message for the failed operations
-            failed.setdefault( lfn, {} )[catalogName] = message
-            if master:
-              # If this is the master catalog then we should not attempt the operation on other catalogs
-              fileInfo.pop( lfn, None )
-          for lfn, result in result['Value']['Successful'].items():
-            # Save the result return for each file for the successful operations
-            successful.setdefault( lfn, {} )[catalogName] = result
+        for lfn, message in result['Value']['Failed'].items():
+          failed.setdefault( lfn, {} )[catalogName] = message
+        for lfn, result in result['Value']['Successful'].items():
+          successful.setdefault( lfn, {} )[catalogName] = result
 
     if allLfns:
       # This recovers the states of the files that completely failed i.e. when S_ERROR is returned by a catalog
@@ -289,7 +347,10 @@ class FileCatalog( object ):
         for lfn in successful.keys():
           successful[lfnMapDict.get( lfn, lfn )] = successful.pop( lfn )
       resDict = {'Failed':failed, 'Successful':successful}
-      return S_OK( resDict )
+      result = S_OK( resDict )
+      if self.parallelCalls:
+        result['CatalogLatency'] = latency
+      return result
     else:
       # FIXME: Return just master result here. This is temporary as more detailed
       # per catalog result needs multiple fixes in various client calls
@@ -299,16 +360,15 @@ class FileCatalog( object ):
   def r_execute( self, *parms, **kws ):
     """ Read method executor.
     """
+    call = self.call
     successful = {}
     failed = {}
-    for _catalogName, oCatalog, _master in self.readCatalogs:
-
-      # Skip if the method is not implemented in this catalog
-      if not oCatalog.hasCatalogMethod( self.call ):
-        continue
+    latency = {}
+    # Skip the catalogs which do not implement the method
+    catalogCalls = [( catalogName, oCatalog, parms ) for catalogName, oCatalog, _master in self.readCatalogs
+                    if oCatalog.hasCatalogMethod( call )]
 
-      method = getattr( oCatalog, self.call )
-      res = method( *parms, **kws )
+    for _catalogName, res in self.__executeCalls( call, catalogCalls, kws, latency ):
       if res['OK']:
         if 'Successful' in res['Value']:
           for key, item in res['Value']['Successful'].items():
@@ -317,11 +377,132 @@ class FileCatalog( object ):
           for key, item in res['Value']['Failed'].items():
             if key not in successful:
               failed[key] = item
+          # The next catalogs can only resolve the failed LFNs, so there is
+          # no need to wait for them if there are none
+          if self.parallelCalls and successful and not failed:
+            break
         else:
           return res
     if not successful and not failed:
-      return S_ERROR( DErrno.EFCERR, "Failed to perform %s from any catalog" % self.call )
-    return S_OK( {'Failed':failed, 'Successful':successful} )
+      return S_ERROR( DErrno.EFCERR, "Failed to perform %s from any catalog" % call )
+    result = S_OK( {'Failed':failed, 'Successful':successful} )
+    if self.parallelCalls:
+      result['CatalogLatency'] = latency
+    return result
+
+  def __callCatalog( self, catalogName, oCatalog, call, args, kws ):
+    """ Call a method of a catalog object
+
+        :return: tuple ( result of the method, time spent in seconds )
+    """
+    if self.parallelCalls:
+      # The catalog clients keep the name of the method called, so the same object
+      # can only execute one call at a time
+      with self.__getCatalogLock( catalogName ):
+        return self.__timeCatalogCall( catalogName, oCatalog, call, args, kws )
+    return self.__timeCatalogCall( catalogName, oCatalog, call, args, kws )
+
+  def __getCatalogLock( self, catalogName ):
+    """ Lock serialising the calls to a catalog object in the parallel mode
+    """
+    return self.__catalogLocks.setdefault( catalogName, threading.Lock() )
+
+  def __timeCatalogCall( self, catalogName, oCatalog, call, args, kws ):
+    """ Call a method of a catalog object, measuring the time spent
+
+        :return: tuple ( result of the method, time spent in seconds )
+    """
+    start = time.time()
+    result = getattr( oCatalog, call )( *args, **kws )
+    elapsed = time.time() - start
+    self.log.debug( "Catalog call latency", "%s on %s: %.3f s" % ( call, catalogName, elapsed ) )
+    return result, elapsed
+
+  def __executeCalls( self, call, catalogCalls, kws, latency ):
+    """ Execute a method on several catalogs, concurrently in the parallel mode
+
+        :param list catalogCalls: ( catalogName, catalog object, arguments ) tuples
+        :param dict latency: filled with the time spent in each catalog
+        :return: generator of ( catalogName, result ) in the order of catalogCalls
+    """
+    if not self.parallelCalls or len( catalogCalls ) < 2:
+      for catalogName, oCatalog, args in catalogCalls:
+        result, latency[catalogName] = self.__callCatalog( catalogName, oCatalog, call, args, kws )
+        yield catalogName, result
+      return
+
+    catalogCallList = [CatalogCall( catalogName, oCatalog, args ) for catalogName, oCatalog, args in catalogCalls]
+    callQueue = deque( catalogCallList )
+    for _i in xrange( min( max( 1, self.maxParallelCalls ), len( catalogCallList ) ) ):
+      self.__startCallThread( call, callQueue, kws )
+    try:
+      for catalogCall in catalogCallList:
+        yield catalogCall.catalogName, self.__waitForCall( call, catalogCall, callQueue, kws, latency )
+    finally:
+      # The calls not needed anymore, as for the reads answered by the first catalogs, are not started
+      for catalogCall in catalogCallList:
+        with catalogCall.stateLock:
+          if not catalogCall.running:
+            catalogCall.cancelled = True
+
+  def __startCallThread( self, call, callQueue, kws ):
+    """ Start a thread executing the catalog calls of a queue until it is empty
+    """
+    thread = threading.Thread( target = self.__runCalls, args = ( call, callQueue, kws ) )
+    thread.setDaemon( True )
+    thread.start()
+
+  def __runCalls( self, call, callQueue, kws ):
+    """ Execute the catalog calls of a queue until it is empty
+    """
+    while True:
+      try:
+        catalogCall = callQueue.popleft()
+      except IndexError:
+        return
+      catalogCall.startTime = time.time()
+      with self.__getCatalogLock( catalogCall.catalogName ):
+        with catalogCall.stateLock:
+          catalogCall.running = not catalogCall.cancelled
+        if catalogCall.running:
+          try:
+            catalogCall.result, catalogCall.latency = self.__timeCatalogCall( catalogCall.catalogName,
+                                                                              catalogCall.oCatalog,
+                                                                              call, catalogCall.args, kws )
+          except Exception as excp:  # pylint: disable=broad-except
+            self.log.exception( "Exception in catalog call", "%s on %s" % ( call, catalogCall.catalogName ),
+                                lException = excp )
+            catalogCall.result = S_ERROR( DErrno.EFCERR, "%s on %s: %s" % ( call, catalogCall.catalogName,
+                                                                            repr( excp ) ) )
+      catalogCall.done.set()
+
+  def __waitForCall( self, call, catalogCall, callQueue, kws, latency ):
+    """ Wait for the result of a catalog call, at most the timeout after a thread took it
+
+        :return: result of the call
+    """
+    while not catalogCall.done.is_set():
+      if catalogCall.startTime is None:
+        # Still queued behind the calls of the other catalogs
+        catalogCall.done.wait( 1 )
+        continue
+      remaining = catalogCall.startTime + self.timeout - time.time()
+      if remaining > 0:
+        catalogCall.done.wait( remaining )
+        continue
+      with catalogCall.stateLock:
+        if not catalogCall.running:
+          catalogCall.cancelled = True
+      # The thread stays busy with this call, another one takes the calls still queued
+      if callQueue:
+        self.__startCallThread( call, callQueue, kws )
+      if catalogCall.cancelled:
+        return S_ERROR( errno.EBUSY, "%s on %s not executed: the catalog was busy with another call for %s seconds" %
+                        ( call, catalogCall.catalogName, self.timeout ) )
+      return S_ERROR( errno.ETIMEDOUT, "%s on %s did not complete in %s seconds, it may still complete later" %
+                      ( call, catalogCall.catalogName, self.timeout ) )
+    latency[catalogCall.catalogName] = catalogCall.latency
+    return catalogCall.result
 
   ###########################################################################################
   #
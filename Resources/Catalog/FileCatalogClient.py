@@ -2,6 +2,7 @@
 """
 
 import os
+import csv
 
 from DIRAC import S_OK, S_ERROR
 from DIRAC.Core.DISET.TransferClient import TransferClient
@@ -13,6 +14,9 @@ from DIRAC.Resources.Catalog.FileCatalogClientBase import FileCatalogClientBase
 
 __RCSID__ = "$Id$"
 
+# Default number of files per page of the paginated listings
+FILESPAGESIZE = 10000
+
 
 class FileCatalogClient(FileCatalogClientBase):
   """ Client code to the DIRAC File Catalogue
@@ -27,7 +31,8 @@ class FileCatalogClient(FileCatalogClientBase):
        'findDirectoriesByMetadata', 'getReplicasByMetadata', 'findFilesByMetadataDetailed',
        'findFilesByMetadataWeb', 'getCompatibleMetadata', 'getMetadataSet', 'getDatasets',
        'getFileDescendents', 'getFileAncestors', 'getDirectoryUserMetadata', 'getFileUserMetadata',
-       'checkDataset', 'getDatasetParameters', 'getDatasetFiles', 'getDatasetAnnotation']
+       'checkDataset', 'getDatasetParameters', 'getDatasetFiles', 'getDatasetAnnotation',
+       'explainMetaQuery']
 
   WRITE_METHODS = [
       'createLink',
@@ -64,10 +69,12 @@ class FileCatalogClient(FileCatalogClientBase):
       'addGroup',
       'deleteGroup',
       'repairCatalog',
-      'rebuildDirectoryUsage']
+      'rebuildDirectoryUsage',
+      'verifyDirectoryUsage']
 
   NO_LFN_METHODS = [
       'findFilesByMetadata',
+      'explainMetaQuery',
       'addMetadataField',
       'deleteMetadataField',
       'getMetadataFields',
@@ -89,10 +96,11 @@ class FileCatalogClient(FileCatalogClientBase):
       'addGroup',
       'deleteGroup',
       'repairCatalog',
-      'rebuildDirectoryUsage']
+      'rebuildDirectoryUsage',
+      'verifyDirectoryUsage']
 
   ADMIN_METHODS = ['addUser', 'deleteUser', 'addGroup', 'deleteGroup', 'getUsers', 'getGroups',
-                   'getCatalogCounters', 'repairCatalog', 'rebuildDirectoryUsage']
+                   'getCatalogCounters', 'repairCatalog', 'rebuildDirectoryUsage', 'verifyDirectoryUsage']
 
   def __init__(self, url=None, **kwargs):
     """ Constructor function.
@@ -267,6 +275,66 @@ class FileCatalogClient(FileCatalogClientBase):
         pathDict[lfn] = detailsDict
     return result
 
+  def iterDirectory(self, lfn, verbose=False, pageSize=FILESPAGESIZE, timeout=120):
+    """ Generator over the contents of a directory, listed by pages of at most pageSize files,
+        so that large directories are neither held in memory nor sent in a single reply
+
+        :param str lfn: directory
+        :param bool verbose: if True, get the details of the entries
+        :param int pageSize: maximum number of files per page
+
+        :return: generator of S_OK with a dictionary indexed "Files", "SubDirs", "Links" and "Datasets"
+                 per page, the subdirectories and datasets coming with the first page. It stops after
+                 yielding an S_ERROR if a page cannot be obtained
+    """
+    rpcClient = self._getRPC(timeout=timeout)
+    cursor = ''
+    while True:
+      result = rpcClient.listDirectoryPage(lfn, verbose, cursor, pageSize)
+      if not result['OK']:
+        yield result
+        return
+      pageDict = result['Value']
+      cursor = pageDict.pop('Cursor')
+      # Force returned directory entries to be LFNs
+      for entryType in ['Files', 'SubDirs', 'Links']:
+        entryDict = pageDict[entryType]
+        for fname in entryDict.keys():
+          entryDict[os.path.join(lfn, os.path.basename(fname))] = entryDict.pop(fname)
+      yield S_OK(pageDict)
+      if not cursor:
+        return
+
+  def iterDirectoryReplicas(self, lfn, allStatus=False, pageSize=FILESPAGESIZE, timeout=120):
+    """ Generator over the replicas of the files of a directory, obtained by pages of at most pageSize files
+
+        :param str lfn: directory
+        :param bool allStatus: whether all replicas and file status are considered
+        :param int pageSize: maximum number of files per page
+
+        :return: generator of S_OK with a dictionary { lfn : { SE : PFN } } per page.
+                 It stops after yielding an S_ERROR if a page cannot be obtained
+    """
+    rpcClient = self._getRPC(timeout=timeout)
+    cursor = ''
+    while True:
+      result = rpcClient.getDirectoryReplicasPage(lfn, allStatus, cursor, pageSize)
+      if not result['OK']:
+        yield result
+        return
+      cursor = result['Value']['Cursor']
+      seDict = result['Value'].get('SEPrefixes', {})
+      replicas = {}
+      for fname, detailsDict in result['Value']['Replicas'].iteritems():
+        fileLFN = '%s/%s' % (lfn.rstrip('/'), os.path.basename(fname))
+        for se in detailsDict:
+          if not detailsDict[se] and se in seDict:
+            detailsDict[se] = seDict[se] + fileLFN
+        replicas[fileLFN] = detailsDict
+      yield S_OK(replicas)
+      if not cursor:
+        return
+
   def findFilesByMetadata(self, metaDict, path='/', timeout=120):
     """ Find files given the meta data query and the path
     """
@@ -513,6 +581,10 @@ class FileCatalogClient(FileCatalogClientBase):
     """ Rebuild DirectoryUsage table from scratch """
     return self._getRPC(timeout=timeout).rebuildDirectoryUsage()
 
+  def verifyDirectoryUsage(self, path, repair=False, timeout=120):
+    """ Compare the DirectoryUsage counters of a directory tree with its content, optionally repair them """
+    return self._getRPC(timeout=timeout).verifyDirectoryUsage(path, repair)
+
   def repairCatalog(self, timeout=120):
     """ Repair the catalog inconsistencies """
     return self._getRPC(timeout=timeout).repairCatalog()
@@ -576,6 +648,11 @@ class FileCatalogClient(FileCatalogClientBase):
     """
     return self._getRPC(timeout=timeout).findFilesByMetadataWeb(metaDict, path, startItem, maxItems)
 
+  def explainMetaQuery(self, metaDict, timeout=120):
+    """ Get the evaluation plan of a metadata query
+    """
+    return self._getRPC(timeout=timeout).explainMetaQuery(metaDict)
+
   def getCompatibleMetadata(self, metaDict, path='/', timeout=120):
     """ Get metadata values compatible with the given metadata subset
     """
@@ -663,6 +740,30 @@ class FileCatalogClient(FileCatalogClientBase):
     """
     return self._getRPC(timeout=timeout).getDatasetFiles(datasets)
 
+  def iterDatasetFiles(self, datasetName, pageSize=FILESPAGESIZE, timeout=120):
+    """ Generator over the files of a dataset, obtained by pages of at most pageSize files
+        from the contents materialised by the catalog
+
+        :param str datasetName: dataset name
+        :param int pageSize: maximum number of files per page
+
+        :return: generator of S_OK with a dictionary indexed "Files", the list of LFNs of the page,
+                 "NumberOfFiles", "TotalSize" and "DatasetHash" of the dataset, per page.
+                 It stops after yielding an S_ERROR if a page cannot be obtained
+    """
+    rpcClient = self._getRPC(timeout=timeout)
+    cursor = 0
+    while True:
+      result = rpcClient.getDatasetFilesPage(datasetName, cursor, pageSize)
+      if not result['OK']:
+        yield result
+        return
+      pageDict = result['Value']
+      cursor = pageDict.pop('Cursor')
+      yield S_OK(pageDict)
+      if not cursor:
+        return
+
   #############################################################################
 
   def getSEDump(self, seName, outputFilename):
@@ -679,3 +780,28 @@ class FileCatalogClient(FileCatalogClientBase):
 
     dfc = TransferClient(self.serverURL)
     return dfc.receiveFile(outputFilename, seName)
+
+  def iterSEDump(self, seName):
+    """
+        Generator over the content of an SE, streamed from the service as it is read
+        from the DB instead of being written to a file
+
+        :param seName: name of the StorageElement
+
+        :returns: generator of S_OK with a list of tuples (lfn, checksum, size) for each
+                  block of data received. The dump is incomplete if the last value is an S_ERROR
+    """
+
+    dfc = TransferClient(self.serverURL)
+    remainder = ''
+    for result in dfc.receiveIterable(seName):
+      if not result['OK']:
+        yield result
+        return
+      # Only the complete lines are parsed, the last one may continue in the next block
+      lines = (remainder + result['Value']).split('\n')
+      remainder = lines.pop()
+      if lines:
+        yield S_OK([(lfn, checksum, int(size)) for lfn, checksum, size in csv.reader(lines, delimiter='|')])
+    if remainder.strip():
+      yield S_OK([(lfn, checksum, int(size)) for lfn, checksum, size in csv.reader([remainder], delimiter='|')])
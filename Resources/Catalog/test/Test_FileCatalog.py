@@ -3,6 +3,8 @@
 """
 
 import sys
+import time
+import threading
 import unittest
 import mock
 
@@ -409,9 +411,150 @@ class TestRead( unittest.TestCase ):
     self.assertEqual( ['c1'], res['Value']['Successful'][lfn].keys() )
     self.assertEqual( ['c2'], res['Value']['Failed'][lfn].keys() )
 
+def blockingMethod( catalog, started, release ):
+  """ Replace the methods of a dummy catalog by one signaling its start and
+      waiting for the release event before answering
+  """
+  genericMethod = catalog.generic
+  def generic( *args, **kwargs ):
+    started.release()
+    if not release.wait( 10 ):
+      return S_ERROR( "%s was not released" % catalog.name )
+    return genericMethod( *args, **kwargs )
+  catalog.generic = generic
+
+
+class TestParallel( unittest.TestCase ):
+  """ Tests of the concurrent calls to the catalogs """
+
+  @mock.patch.object( DIRAC.Resources.Catalog.FileCatalog.FileCatalog, '_getSelectedCatalogs',
+                      side_effect = mock_fc_getSelectedCatalogs, autospec = True )  # autospec is for the binding of the method...
+  @mock.patch.object( DIRAC.Resources.Catalog.FileCatalog.FileCatalog, '_getEligibleCatalogs',
+                      side_effect = mock_fc_getEligibleCatalogs, autospec = True )  # autospec is for the binding of the method...
+  def test_01_sameResults( self, mk_getSelectedCatalogs, mk_getEligibleCatalogs ):
+    """ The results are the same as with the serial calls """
+
+    catalogs = ['c1_True_True_True_2_0_2_1', 'c2_False_True_True_3_0_2_1', 'c3_False_True_True_3_0_1_0']
+    serialFc = FileCatalog( catalogs = catalogs, parallelCalls = False )
+    parallelFc = FileCatalog( catalogs = catalogs, parallelCalls = True )
+
+    lfns = ['/lhcb/toto', '/lhcb/c1/Failed', '/lhcb/c2/Failed', '/lhcb/c3/Failed']
+    for lfn in lfns + ['/lhcb/c1/Error', '/lhcb/c2/Error', '/lhcb/c3/Error']:
+      for method in ['write1', 'write2', 'read1', 'read2']:
+        serialRes = getattr( serialFc, method )( lfn )
+        parallelRes = getattr( parallelFc, method )( lfn )
+        self.assertEqual( serialRes['OK'], parallelRes['OK'] )
+        self.assertEqual( serialRes.get( 'Value' ), parallelRes.get( 'Value' ) )
+
+    res = parallelFc.write1( lfns )
+    self.assertTrue( res['OK'] )
+    self.assertEqual( res['Value'], serialFc.write1( lfns )['Value'] )
+    self.assertEqual( sorted( res['CatalogLatency'] ), ['c1', 'c2', 'c3'] )
+    self.assertNotIn( 'CatalogLatency', serialFc.write1( lfns ) )
+    self.assertNotIn( 'CatalogLatency', serialFc.read1( lfns ) )
+
+  @mock.patch.object( DIRAC.Resources.Catalog.FileCatalog.FileCatalog, '_getSelectedCatalogs',
+                      side_effect = mock_fc_getSelectedCatalogs, autospec = True )  # autospec is for the binding of the method...
+  @mock.patch.object( DIRAC.Resources.Catalog.FileCatalog.FileCatalog, '_getEligibleCatalogs',
+                      side_effect = mock_fc_getEligibleCatalogs, autospec = True )  # autospec is for the binding of the method...
+  def test_02_concurrentWrites( self, mk_getSelectedCatalogs, mk_getEligibleCatalogs ):
+    """ The non master catalogs are called at the same time """
+
+    fc = FileCatalog( catalogs = ['c1_True_True_True_2_0_2_0', 'c2_False_True_True_3_0_1_0',
+                                  'c3_False_True_True_3_0_1_0'], parallelCalls = True )
+    started = threading.Semaphore( 0 )
+    release = threading.Event()
+    for _catalogName, oCatalog, master in fc.getWriteCatalogs():
+      if not master:
+        blockingMethod( oCatalog, started, release )
+
+    def releaseWhenAllStarted():
+      # Only released if both catalogs are executing the call
+      if started.acquire() and started.acquire():
+        release.set()
+    releaser = threading.Thread( target = releaseWhenAllStarted )
+    releaser.start()
+
+    lfn = '/lhcb/c2/Failed'
+    res = fc.write1( lfn )
+    releaser.join()
+    self.assertTrue( res['OK'] )
+    self.assertEqual( sorted( res['Value']['Successful'][lfn] ), ['c1', 'c3'] )
+    self.assertEqual( ['c2'], res['Value']['Failed'][lfn].keys() )
+
+  @mock.patch.object( DIRAC.Resources.Catalog.FileCatalog.FileCatalog, '_getSelectedCatalogs',
+                      side_effect = mock_fc_getSelectedCatalogs, autospec = True )  # autospec is for the binding of the method...
+  @mock.patch.object( DIRAC.Resources.Catalog.FileCatalog.FileCatalog, '_getEligibleCatalogs',
+                      side_effect = mock_fc_getEligibleCatalogs, autospec = True )  # autospec is for the binding of the method...
+  def test_03_hedgedReads( self, mk_getSelectedCatalogs, mk_getEligibleCatalogs ):
+    """ The reads do not wait for the catalogs which can not change the result """
+
+    fc = FileCatalog( catalogs = ['c1_True_True_True_2_0_2_0', 'c2_False_True_True_3_0_1_0'], parallelCalls = True )
+    started = threading.Semaphore( 0 )
+    release = threading.Event()
+    blockingMethod( fc.getReadCatalogs()[1][1], started, release )
+
+    # All the LFNs are found in the master
+    lfn = '/lhcb/toto'
+    res = fc.read1( [lfn] )
+    self.assertTrue( res['OK'] )
+    self.assertEqual( res['Value']['Successful'].keys(), [lfn] )
+    self.assertEqual( res['CatalogLatency'].keys(), ['c1'] )
+    self.assertTrue( started.acquire() )
+
+    # The LFN failed in the master is looked up in the other catalog
+    release.set()
+    lfn = '/lhcb/c1/Failed'
+    res = fc.read1( [lfn] )
+    self.assertTrue( res['OK'] )
+    self.assertEqual( res['Value']['Successful'].keys(), [lfn] )
+    self.assertEqual( sorted( res['CatalogLatency'] ), ['c1', 'c2'] )
+
+  @mock.patch.object( DIRAC.Resources.Catalog.FileCatalog.FileCatalog, '_getSelectedCatalogs',
+                      side_effect = mock_fc_getSelectedCatalogs, autospec = True )  # autospec is for the binding of the method...
+  @mock.patch.object( DIRAC.Resources.Catalog.FileCatalog.FileCatalog, '_getEligibleCatalogs',
+                      side_effect = mock_fc_getEligibleCatalogs, autospec = True )  # autospec is for the binding of the method...
+  def test_04_timeouts( self, mk_getSelectedCatalogs, mk_getEligibleCatalogs ):
+    """ The timeout only counts from the start of the call, and the calls not started are not executed """
+
+    fc = FileCatalog( catalogs = ['c1_True_True_True_2_0_2_0', 'c2_False_True_True_3_0_1_0',
+                                  'c3_False_True_True_3_0_1_0'], parallelCalls = True )
+    fc.maxParallelCalls = 1
+    fc.timeout = 0.5
+    catalogs = dict( ( catalogName, oCatalog ) for catalogName, oCatalog, _master in fc.getWriteCatalogs() )
+
+    # The calls queued behind the other ones have their own timeout
+    for oCatalog in ( catalogs['c2'], catalogs['c3'] ):
+      genericMethod = oCatalog.generic
+      oCatalog.generic = lambda *args, **kwargs: time.sleep( 0.3 ) or genericMethod( *args, **kwargs )
+    lfn = '/lhcb/toto'
+    res = fc.write1( lfn )
+    self.assertTrue( res['OK'] )
+    self.assertEqual( sorted( res['Value']['Successful'][lfn] ), ['c1', 'c2', 'c3'] )
+
+    # A call not completing in time fails, the next calls are taken by another thread
+    started = threading.Semaphore( 0 )
+    release = threading.Event()
+    blockingMethod( catalogs['c2'], started, release )
+    res = fc.write1( lfn )
+    self.assertTrue( res['OK'] )
+    self.assertEqual( sorted( res['Value']['Successful'][lfn] ), ['c1', 'c3'] )
+    self.assertIn( 'may still complete', res['Value']['Failed'][lfn]['c2'] )
+
+    # The catalog is still busy: the next call is not executed
+    res = fc.write1( lfn )
+    self.assertTrue( res['OK'] )
+    self.assertIn( 'not executed', res['Value']['Failed'][lfn]['c2'] )
+    release.set()
+    self.assertTrue( started.acquire() )
+    time.sleep( 0.2 )
+    self.assertFalse( started.acquire( False ) )
+
+
 if __name__ == '__main__':
   suite = unittest.defaultTestLoader.loadTestsFromTestCase( TestInitialization )
   suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( TestWrite ) )
   suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( TestRead ) )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( TestParallel ) )
 
   unittest.TextTestRunner( verbosity = 2 ).run( suite )
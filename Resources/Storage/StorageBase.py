@@ -94,6 +94,19 @@ class StorageBase(object):
   def setStorageElement(self, se):
     self.se = se
 
+  def clone(self):
+    """ Create another instance of the plugin with the same parameters. The plugins keep the
+        state of their protocol client (e.g. the gfal2 context), so an instance can not be
+        used by several threads at the same time.
+    """
+    storage = self.__class__(self.name, self._allProtocolParameters)
+    storage.pluginName = self.pluginName
+    storage.protocolParameters = dict(self.protocolParameters)
+    storage.basePath = self.basePath
+    storage.cwd = self.basePath
+    storage.setStorageElement(self.se)
+    return storage
+
   def setParameters(self, parameterDict):
     """ Set standard parameters, method can be overriden in subclasses
         to process specific parameters
@@ -6,6 +6,7 @@
 import copy
 import datetime
 import errno
+import functools
 import os
 import re
 import sys
@@ -39,16 +40,27 @@ from DIRAC.Core.Utilities.ObjectLoader import ObjectLoader
 __RCSID__ = "$Id$"
 
 DEFAULT_OCCUPANCY_FILE = 'occupancy.json'
+# Default maximum number of instances of each storage plugin of a StorageElement
+MAX_PLUGIN_CONTEXTS = 10
+# Interval in seconds between the purges of the StorageElement cache
+CACHE_PURGE_INTERVAL = 300
 
 
 class StorageElementCache(object):
+  """ Cache of the StorageElementItem objects, shared by all the threads of the process
+  """
 
   def __init__(self):
     self.seCache = DictCache()
+    self.lastPurge = time.time()
+    self.creationLock = threading.Lock()
 
   def __call__(self, name, plugins=None, vo=None, hideExceptions=False):
-    self.seCache.purgeExpired(expiredInSeconds=60)
-    tId = threading.current_thread().ident
+    # The entries about to expire are not returned by the cache,
+    # so the others only need to be purged from time to time
+    if time.time() - self.lastPurge > CACHE_PURGE_INTERVAL:
+      self.lastPurge = time.time()
+      self.seCache.purgeExpired()
 
     if not vo:
       result = getVOfromProxyGroup()
@@ -66,17 +78,69 @@ class StorageElementCache(object):
     if isinstance(plugins, list):
       plugins = tuple(plugins)
 
-    argTuple = (tId, name, plugins, vo, proxyLoc)
-    seObj = self.seCache.get(argTuple)
+    # The StorageElementItem objects are thread safe, they can be shared by all the threads
+    argTuple = (name, plugins, vo, proxyLoc)
+    seObj = self.seCache.get(argTuple, validSeconds=60)
 
     if not seObj:
-      seObj = StorageElementItem(name, plugins, vo, hideExceptions=hideExceptions)
-      # Add the StorageElement to the cache for 1/2 hour
-      self.seCache.add(argTuple, 1800, seObj)
+      # The threads asking for a missing StorageElement at the same time wait for the first one to create it
+      with self.creationLock:
+        seObj = self.seCache.get(argTuple, validSeconds=60)
+        if not seObj:
+          seObj = StorageElementItem(name, plugins, vo, hideExceptions=hideExceptions)
+          # Add the StorageElement to the cache for 1/2 hour
+          self.seCache.add(argTuple, 1800, seObj)
 
     return seObj
 
 
+class StoragePluginPool(object):
+  """ Bounded pool of instances of a storage plugin
+
+      The plugins keep the state of their protocol client, e.g. the gfal2 context, so an instance
+      is only used by one thread at a time. The instance created by the StorageFactory is the first
+      of the pool, the others are cloned from it when all the existing ones are checked out.
+  """
+
+  def __init__(self, plugin, maxInstances=MAX_PLUGIN_CONTEXTS):
+    """ c'tor
+
+    :param plugin: storage plugin instance
+    :param int maxInstances: maximum number of instances, the threads wait for an instance beyond it
+    """
+    self.plugin = plugin
+    self.maxInstances = max(1, maxInstances)
+    self.instances = 1
+    self.__idle = [plugin]
+    self.__condition = threading.Condition()
+
+  def checkout(self):
+    """ Get an instance of the plugin for the exclusive use of the calling thread,
+        it has to be given back with checkin()
+    """
+    with self.__condition:
+      while not self.__idle and self.instances >= self.maxInstances:
+        self.__condition.wait()
+      if self.__idle:
+        return self.__idle.pop()
+      self.instances += 1
+
+    try:
+      return self.plugin.clone()
+    except Exception:
+      with self.__condition:
+        self.instances -= 1
+        self.__condition.notify()
+      raise
+
+  def checkin(self, plugin):
+    """ Give back an instance of the plugin obtained with checkout()
+    """
+    with self.__condition:
+      self.__idle.append(plugin)
+      self.__condition.notify()
+
+
 class StorageElementItem(object):
   """
   .. class:: StorageElement
@@ -92,6 +156,10 @@ class StorageElementItem(object):
     self.remotePlugins is a list of the remote protocols that were created by StorageFactory
     self.protocolOptions is a list of dictionaries containing the options found in the CS. (should be removed)
 
+    The objects can be used by several threads at the same time: each operation checks out
+    the storage plugins it uses from a pool of at most /Resources/StorageElements/MaxPluginContexts
+    instances per plugin.
+
 
 
   dynamic method::
@@ -164,7 +232,11 @@ class StorageElementItem(object):
 
     """
 
+    # Name of the last method requested, kept for backward compatibility:
+    # the method to execute is given explicitly to __executeMethod
     self.methodName = None
+    self.__pluginPools = {}
+    self.maxPluginContexts = gConfig.getValue('/Resources/StorageElements/MaxPluginContexts', MAX_PLUGIN_CONTEXTS)
 
     if plugins is None:
       plugins = []
@@ -417,7 +489,12 @@ class StorageElementItem(object):
     for storage in filteredPlugins:
 
       # The result of the plugin is always in B
-      res = storage.getOccupancy(**kwargs)
+      pluginPool = self.__getPluginPool(storage)
+      plugin = pluginPool.checkout()
+      try:
+        res = plugin.getOccupancy(**kwargs)
+      finally:
+        pluginPool.checkin(plugin)
       if res['OK']:
         occupancyDict = res['Value']
         result = self.checkOccupancy(occupancyDict, unit)
@@ -939,7 +1016,7 @@ class StorageElementItem(object):
       protocols = [protocol]
 
     self.methodName = "getTransportURL"
-    result = self.__executeMethod(lfn, protocols=protocols)
+    result = self.__executeMethod("getTransportURL", lfn, protocols=protocols)
     return result
 
   def __isLocalSE(self):
@@ -1056,7 +1133,8 @@ class StorageElementItem(object):
             log.debug("Plugin %s can generate compatible protocol" % plugin.pluginName)
             pluginsToUse.append(plugin)
       else:
-        pluginsToUse = self.storages
+        # A copy, since the list is sorted and self.storages is shared by the threads
+        pluginsToUse = list(self.storages)
 
       # The closest list for "OK" methods is the AccessProtocol preference, so we sort based on that
       pluginsToUse.sort(
@@ -1117,10 +1195,17 @@ class StorageElementItem(object):
 
     return pluginsToUse
 
-  def __executeMethod(self, lfn, *args, **kwargs):
+  def __getPluginPool(self, storage):
+    """ Get the pool of instances of a storage plugin """
+    pluginPool = self.__pluginPools.get(storage)
+    if pluginPool is None:
+      pluginPool = self.__pluginPools.setdefault(storage, StoragePluginPool(storage, self.maxPluginContexts))
+    return pluginPool
+
+  def __executeMethod(self, methodName, lfn, *args, **kwargs):
     """ Forward the call to each storage in turn until one works.
-        The method to be executed is stored in self.methodName
 
+        :param str methodName: name of the method to be executed
         :param lfn: string, list or dictionary
         :param *args: variable amount of non-keyword arguments. SHOULD BE EMPTY
         :param **kwargs: keyword arguments
@@ -1140,13 +1225,13 @@ class StorageElementItem(object):
 
     removedArgs = {}
     log = self.log.getSubLogger('__executeMethod')
-    log.verbose("preparing the execution of %s" % (self.methodName))
+    log.verbose("preparing the execution of %s" % (methodName))
 
     # args should normaly be empty to avoid problem...
     if args:
       log.verbose("args should be empty!%s" % args)
       # because there is normally only one kw argument, I can move it from args to kwargs
-      methDefaultArgs = StorageElementItem.__defaultsArguments.get(self.methodName, {}).keys()
+      methDefaultArgs = StorageElementItem.__defaultsArguments.get(methodName, {}).keys()
       if methDefaultArgs:
         kwargs[methDefaultArgs[0]] = args[0]
         args = args[1:]
@@ -1162,11 +1247,11 @@ class StorageElementItem(object):
         del kwargs[depArg]
 
     # Set default argument if any
-    methDefaultArgs = StorageElementItem.__defaultsArguments.get(self.methodName, {})
+    methDefaultArgs = StorageElementItem.__defaultsArguments.get(methodName, {})
     for argName in methDefaultArgs:
       if argName not in kwargs:
         log.debug("default argument %s for %s not present.\
-         Setting value %s." % (argName, self.methodName, methDefaultArgs[argName]))
+         Setting value %s." % (argName, methodName, methDefaultArgs[argName]))
         kwargs[argName] = methDefaultArgs[argName]
 
     res = checkArgumentFormat(lfn)
@@ -1178,9 +1263,9 @@ class StorageElementItem(object):
 
     log.verbose(
         "Attempting to perform '%s' operation with %s lfns." %
-        (self.methodName, len(lfnDict)))
+        (methodName, len(lfnDict)))
 
-    res = self.isValid(operation=self.methodName)
+    res = self.isValid(operation=methodName)
     if not res['OK']:
       return res
     else:
@@ -1195,16 +1280,16 @@ class StorageElementItem(object):
     # the 'protocols' parameter is only given to the plugin when calling getTransportURL.
     # The other methods do not expect it.
     protocols = kwargs.get('protocols')
-    if self.methodName != 'getTransportURL':
+    if methodName != 'getTransportURL':
       kwargs.pop('protocols', None)
 
     successful = {}
     failed = {}
-    filteredPlugins = self.__filterPlugins(self.methodName, protocols, inputProtocol)
+    filteredPlugins = self.__filterPlugins(methodName, protocols, inputProtocol)
     if not filteredPlugins:
       return S_ERROR(errno.EPROTONOSUPPORT, "No storage plugins matching the requirements\
                                            (operation %s protocols %s inputProtocol %s)" %
-                     (self.methodName, protocols, inputProtocol))
+                     (methodName, protocols, inputProtocol))
     # Try all of the storages one by one
     for storage in filteredPlugins:
       # Determine whether to use this storage object
@@ -1228,11 +1313,8 @@ class StorageElementItem(object):
       else:
         log.verbose(
             "Attempting to perform '%s' for %s physical files" %
-            (self.methodName, len(urlDict)))
-        fcn = None
-        if hasattr(storage, self.methodName) and callable(getattr(storage, self.methodName)):
-          fcn = getattr(storage, self.methodName)
-        if not fcn:
+            (methodName, len(urlDict)))
+        if not callable(getattr(storage, methodName, None)):
           return S_ERROR(
               DErrno.ENOMETH,
               "SE.__executeMethod: unable to invoke %s, it isn't a member function of storage")
@@ -1242,13 +1324,19 @@ class StorageElementItem(object):
 
         startDate = datetime.datetime.utcnow()
         startTime = time.time()
-        res = fcn(urlsToUse, *args, **kwargs)
+        pluginPool = self.__getPluginPool(storage)
+        plugin = pluginPool.checkout()
+        try:
+          res = getattr(plugin, methodName)(urlsToUse, *args, **kwargs)
+        finally:
+          pluginPool.checkin(plugin)
         elapsedTime = time.time() - startTime
 
-        self.addAccountingOperation(urlsToUse, startDate, elapsedTime, storageParameters, res)
+        self.addAccountingOperation(urlsToUse, startDate, elapsedTime, storageParameters, res,
+                                    methodName=methodName)
 
         if not res['OK']:
-          errStr = "Completely failed to perform %s." % self.methodName
+          errStr = "Completely failed to perform %s." % methodName
           log.verbose(errStr, 'with plugin %s: %s' % (pluginName, res['Message']))
           for lfn in urlDict.values():
             if lfn not in failed:
@@ -1263,7 +1351,7 @@ class StorageElementItem(object):
               if url in res['Value']['Failed']:
                 self.log.verbose(
                     "Failure in plugin to perform %s" %
-                    self.methodName, "Plugin: %s lfn: %s error %s" %
+                    methodName, "Plugin: %s lfn: %s error %s" %
                     (pluginName, lfn, res['Value']['Failed'][url]))
                 failed[lfn] = "%s %s" % (failed[lfn], res['Value']['Failed'][url]
                                          ) if failed[lfn] else res['Value']['Failed'][url]
@@ -1283,14 +1371,15 @@ class StorageElementItem(object):
   def __getattr__(self, name):
     """ Forwards the equivalent Storage calls to __executeMethod"""
     # We take either the equivalent name, or the name itself
-    self.methodName = StorageElementItem.__equivalentMethodNames.get(name, None)
+    methodName = StorageElementItem.__equivalentMethodNames.get(name, None)
 
-    if self.methodName:
-      return self.__executeMethod
+    if methodName:
+      self.methodName = methodName
+      return functools.partial(self.__executeMethod, methodName)
 
     raise AttributeError("StorageElement does not have a method '%s'" % name)
 
-  def addAccountingOperation(self, lfns, startDate, elapsedTime, storageParameters, callRes):
+  def addAccountingOperation(self, lfns, startDate, elapsedTime, storageParameters, callRes, methodName=None):
     """
         Generates a DataOperation accounting if needs to be, and adds it to the DataStore client cache
 
@@ -1299,6 +1388,7 @@ class StorageElementItem(object):
         :param elapsedTime: time (seconds) the operation took
         :param storageParameters: the parameters of the plugins used to perform the operation
         :param callRes: the return of the method call, S_OK or S_ERROR
+        :param methodName: name of the method called, by default self.methodName
 
         The operation is generated with the OperationType "se.methodName"
         The TransferSize and TransferTotal for directory methods actually take into
@@ -1308,18 +1398,20 @@ class StorageElementItem(object):
 
     """
 
-    if self.methodName not in (self.readMethods + self.writeMethods + self.removeMethods):
+    if not methodName:
+      methodName = self.methodName
+    if methodName not in (self.readMethods + self.writeMethods + self.removeMethods):
       return
 
     baseAccountingDict = {}
-    baseAccountingDict['OperationType'] = 'se.%s' % self.methodName
+    baseAccountingDict['OperationType'] = 'se.%s' % methodName
     baseAccountingDict['User'] = getProxyInfo().get('Value', {}).get('username', 'unknown')
     baseAccountingDict['RegistrationTime'] = 0.0
     baseAccountingDict['RegistrationOK'] = 0
     baseAccountingDict['RegistrationTotal'] = 0
 
     # if it is a get method, then source and destination of the transfer should be inverted
-    if self.methodName == 'getFile':
+    if methodName == 'getFile':
       baseAccountingDict['Destination'] = siteName()
       baseAccountingDict['Source'] = self.name
     else:
@@ -1353,12 +1445,12 @@ class StorageElementItem(object):
       # separate entries in case of few failures
       totalSucc = len(succ)
 
-      if self.methodName in ('putFile', 'getFile'):
+      if methodName in ('putFile', 'getFile'):
         # putFile and getFile return for each entry
         # in the successful dir the size of the corresponding file
         totalSize = sum(succ.values())
 
-      elif self.methodName in ('putDirectory', 'getDirectory'):
+      elif methodName in ('putDirectory', 'getDirectory'):
         # putDirectory and getDirectory return for each dir name
         # a dictionnary with the keys 'Files' and 'Size'
         totalSize = sum(val.get('Size', 0) for val in succ.values() if isinstance(val, dict))
@@ -2,14 +2,16 @@
 """
 
 import os
+import time
 import tempfile
+import threading
 import mock
 import unittest
 import itertools
 
 
 from DIRAC import S_OK
-from DIRAC.Resources.Storage.StorageElement import StorageElementItem
+from DIRAC.Resources.Storage.StorageElement import StorageElementItem, StorageElementCache, StoragePluginPool
 from DIRAC.Resources.Storage.StorageBase import StorageBase
 
 
@@ -647,6 +649,110 @@ class TestBase(unittest.TestCase):
 
     self.assertTupleEqual(urlPair, ('root:%s' % lfn, 'srm:%s' % lfn))
 
+  @mock.patch('DIRAC.Resources.Storage.StorageElement.StorageElementItem._StorageElementItem__isLocalSE',
+              return_value=S_OK(True))  # Pretend it's local
+  @mock.patch('DIRAC.Resources.Storage.StorageElement.StorageElementItem.addAccountingOperation',
+              return_value=None)  # Don't send accounting
+  def test_09_concurrentOperations(self, _mk_isLocalSE, _mk_addAccounting):
+    """
+      Test case of operations done at the same time by several threads:
+      each of them uses its own instance of the plugin
+    """
+
+    nbThreads = 3
+    plugins = []
+    condition = threading.Condition()
+
+    def putFile(plugin, lfns, sourceSize=0):
+      """ Wait for all the threads to be in the plugin """
+      with condition:
+        plugins.append(plugin)
+        condition.notifyAll()
+        deadline = time.time() + 10
+        while len(plugins) < nbThreads and time.time() < deadline:
+          condition.wait(1)
+      return S_OK({'Successful': dict.fromkeys(lfns, "srm:putFile"), 'Failed': {}})
+
+    results = []
+    with mock.patch.object(fake_SRM2Plugin, 'putFile', autospec=True, side_effect=putFile):
+      threads = [threading.Thread(target=lambda i=i: results.append(self.seB.putFile({'/lhcb/f%d' % i: '/tmp/f'})))
+                 for i in xrange(nbThreads)]
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+
+    self.assertEqual(len(results), nbThreads)
+    for res in results:
+      self.assertTrue(res['OK'], res)
+      self.assertEqual(res['Value']['Successful'].values(), ["srm:putFile"])
+    self.assertEqual(len(set(plugins)), nbThreads)
+    self.assertTrue(self.seB.storages[0] in plugins)
+    for plugin in plugins:
+      self.assertEqual(plugin.protocolParameters, self.seB.storages[0].protocolParameters)
+      self.assertTrue(plugin.se is self.seB)
+
+    # The instances are reused
+    plugins[:] = []
+    results[:] = []
+    with mock.patch.object(fake_SRM2Plugin, 'putFile', autospec=True, side_effect=putFile):
+      threads[0] = threading.Thread(target=lambda: results.append(self.seB.putFile({'/lhcb/f': '/tmp/f'})))
+      nbThreads = 1
+      threads[0].start()
+      threads[0].join()
+    self.assertTrue(results[0]['OK'], results[0])
+    self.assertEqual(self.seB._StorageElementItem__getPluginPool(self.seB.storages[0]).instances, 3)
+
+
+class TestSharing(unittest.TestCase):
+  """ Tests of the sharing of the StorageElement objects by the threads
+  """
+
+  def test_01_pluginPool(self):
+    """ The number of instances of a plugin is bounded """
+    plugin = mock.MagicMock()
+    plugin.clone.side_effect = mock.MagicMock
+    pool = StoragePluginPool(plugin, maxInstances=2)
+
+    first = pool.checkout()
+    second = pool.checkout()
+    self.assertTrue(first is plugin)
+    self.assertFalse(second is plugin)
+
+    # The next thread waits for an instance to be given back
+    checkedOut = []
+    thread = threading.Thread(target=lambda: checkedOut.append(pool.checkout()))
+    thread.start()
+    thread.join(0.2)
+    self.assertTrue(thread.is_alive())
+    pool.checkin(second)
+    thread.join(10)
+    self.assertEqual(checkedOut, [second])
+    self.assertEqual(pool.instances, 2)
+
+    # A failed creation does not count
+    pool = StoragePluginPool(plugin, maxInstances=2)
+    plugin.clone.side_effect = RuntimeError
+    pool.checkout()
+    self.assertRaises(RuntimeError, pool.checkout)
+    self.assertEqual(pool.instances, 1)
+
+  @mock.patch('DIRAC.Resources.Storage.StorageElement.StorageElementItem')
+  @mock.patch('DIRAC.Resources.Storage.StorageElement.getProxyLocation', return_value='/tmp/x509up')
+  def test_02_sharedCache(self, _mk_getProxyLocation, mk_StorageElementItem):
+    """ The threads get the same StorageElement object """
+    cache = StorageElementCache()
+    seObjects = []
+    threads = [threading.Thread(target=lambda: seObjects.append(cache('StorageA', vo='lhcb'))) for _ in xrange(3)]
+    for thread in threads:
+      thread.start()
+      thread.join()
+
+    self.assertEqual(seObjects, [mk_StorageElementItem.return_value] * 3)
+    self.assertEqual(mk_StorageElementItem.call_count, 1)
+    self.assertTrue(cache('StorageA', vo='other') is mk_StorageElementItem.return_value)
+    self.assertEqual(mk_StorageElementItem.call_count, 2)
+
 
 class TestSameSE(unittest.TestCase):
   """ Tests to compare two SEs together.
@@ -845,5 +951,6 @@ if __name__ == '__main__':
   from DIRAC import gLogger
   gLogger.setLevel('DEBUG')
   suite = unittest.defaultTestLoader.loadTestsFromTestCase(TestBase)
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TestSharing))
 
   unittest.TextTestRunner(verbosity=2).run(suite)
@@ -665,20 +665,17 @@ class TransformationDB(DB):
     return S_OK(countDict)
 
   def __addFilesToTransformation(self, transID, fileIDs, connection=False):
-    req = "SELECT FileID from TransformationFiles"
-    req = req + " WHERE TransformationID = %d AND FileID IN (%s);" % (transID, intListToString(fileIDs))
-    res = self._query(req, connection)
+    req = "SELECT FileID from TransformationFiles WHERE TransformationID = %s AND FileID IN %s;"
+    res = self._queryInChunks(req, [transID, fileIDs], connection)
     if not res['OK']:
       return res
     for tupleIn in res['Value']:
       fileIDs.remove(tupleIn[0])
     if not fileIDs:
       return S_OK([])
-    req = "INSERT INTO TransformationFiles (TransformationID,FileID,LastUpdate,InsertedTime) VALUES"
-    for fileID in fileIDs:
-      req = "%s (%d,%d,UTC_TIMESTAMP(),UTC_TIMESTAMP())," % (req, transID, fileID)
-    req = req.rstrip(',')
-    res = self._update(req, connection)
+    req = "INSERT INTO TransformationFiles (TransformationID,FileID,LastUpdate,InsertedTime) VALUES %s" % \
+        ','.join(["(%s,%s,UTC_TIMESTAMP(),UTC_TIMESTAMP())"] * len(fileIDs))
+    res = self._update(req, connection, args=[value for fileID in fileIDs for value in (transID, fileID)])
     if not res['OK']:
       return res
     return S_OK(fileIDs)
@@ -720,30 +717,28 @@ class TransformationDB(DB):
   def __assignTransformationFile(self, transID, taskID, se, fileIDs, connection=False):
     """ Make necessary updates to the TransformationFiles table for the newly created task
     """
-    req = "UPDATE TransformationFiles SET TaskID='%d',UsedSE='%s',Status='Assigned',LastUpdate=UTC_TIMESTAMP()"
-    req = (req + " WHERE TransformationID = %d AND FileID IN (%s);") % (taskID, se, transID, intListToString(fileIDs))
-    res = self._update(req, connection)
+    req = "UPDATE TransformationFiles SET TaskID=%s,UsedSE=%s,Status='Assigned',LastUpdate=UTC_TIMESTAMP()"
+    req += " WHERE TransformationID = %s AND FileID IN %s;"
+    res = self._updateInChunks(req, [taskID, se, transID, fileIDs], connection)
     if not res['OK']:
       gLogger.error("Failed to assign file to task", res['Message'])
-    fileTuples = []
-    for fileID in fileIDs:
-      fileTuples.append(("(%d,%d,%d)" % (transID, fileID, taskID)))
-    req = "INSERT INTO TransformationFileTasks (TransformationID,FileID,TaskID) VALUES %s" % ','.join(fileTuples)
-    res = self._update(req, connection)
+    req = "INSERT INTO TransformationFileTasks (TransformationID,FileID,TaskID) VALUES %s" % \
+        ','.join(["(%s,%s,%s)"] * len(fileIDs))
+    res = self._update(req, connection, args=[value for fileID in fileIDs for value in (transID, fileID, taskID)])
     if not res['OK']:
       gLogger.error("Failed to assign file to task", res['Message'])
     return res
 
   def __setTransformationFileStatus(self, fileIDs, status, connection=False):
-    req = "UPDATE TransformationFiles SET Status = '%s' WHERE FileID IN (%s);" % (status, intListToString(fileIDs))
-    res = self._update(req, connection)
+    req = "UPDATE TransformationFiles SET Status = %s WHERE FileID IN %s;"
+    res = self._updateInChunks(req, [status, fileIDs], connection)
     if not res['OK']:
       gLogger.error("Failed to update file status", res['Message'])
     return res
 
   def __setTransformationFileUsedSE(self, fileIDs, usedSE, connection=False):
-    req = "UPDATE TransformationFiles SET UsedSE = '%s' WHERE FileID IN (%s);" % (usedSE, intListToString(fileIDs))
-    res = self._update(req, connection)
+    req = "UPDATE TransformationFiles SET UsedSE = %s WHERE FileID IN %s;"
+    res = self._updateInChunks(req, [usedSE, fileIDs], connection)
     if not res['OK']:
       gLogger.error("Failed to update file usedSE", res['Message'])
     return res
@@ -1208,8 +1203,7 @@ class TransformationDB(DB):
     """ Get file IDs for the given list of lfns
         warning: if the file is not present, we'll see no errors
     """
-    req = "SELECT LFN,FileID FROM DataFiles WHERE LFN in (%s);" % (stringListToString(lfns))
-    res = self._query(req, connection)
+    res = self._queryInChunks("SELECT LFN,FileID FROM DataFiles WHERE LFN in %s;", [lfns], connection)
     if not res['OK']:
       return res
     lfns = dict(res['Value'])
@@ -1220,8 +1214,7 @@ class TransformationDB(DB):
   def __getLfnsForFileIDs(self, fileIDs, connection=False):
     """ Get lfns for the given list of fileIDs
     """
-    req = "SELECT LFN,FileID FROM DataFiles WHERE FileID in (%s);" % stringListToString(fileIDs)
-    res = self._query(req, connection)
+    res = self._queryInChunks("SELECT LFN,FileID FROM DataFiles WHERE FileID in %s;", [fileIDs], connection)
     if not res['OK']:
       return res
     fids = dict(res['Value'])
@@ -1238,8 +1231,7 @@ class TransformationDB(DB):
     # Insert only files not found, and assume the LFN is unique in the table
     lfnFileIDs = res['Value'][1]
     for lfn in set(lfns) - set(lfnFileIDs):
-      req = "INSERT INTO DataFiles (LFN,Status) VALUES ('%s','New');" % lfn
-      res = self._update(req, connection)
+      res = self._update("INSERT INTO DataFiles (LFN,Status) VALUES (%s,'New');", connection, args=[lfn])
       # If the LFN is duplicate we get an error and ignore it
       if res['OK']:
         lfnFileIDs[lfn] = res['lastRowId']
@@ -1248,8 +1240,8 @@ class TransformationDB(DB):
   def __setDataFileStatus(self, fileIDs, status, connection=False):
     """ Set the status of the supplied files
     """
-    req = "UPDATE DataFiles SET Status = '%s' WHERE FileID IN (%s);" % (status, intListToString(fileIDs))
-    return self._update(req, connection)
+    return self._updateInChunks("UPDATE DataFiles SET Status = %s WHERE FileID IN %s;", [status, fileIDs],
+                                connection)
 
   ###########################################################################
   #
@@ -0,0 +1,192 @@
+""" On-disk cache of the replicas of the transformation files, used by the TransformationAgent
+
+    The replicas are kept in a local sqlite file, one row per transformation and LFN with the
+    time it was cached, and the SE names are interned as integer IDs. Only the replicas of the
+    LFNs looked up are loaded, and each update only writes the files added or removed, so the
+    memory used and the time spent writing do not grow with the total number of cached files.
+"""
+
+import os
+import time
+import pickle
+import sqlite3
+import calendar
+import threading
+
+from DIRAC import gLogger, S_OK, S_ERROR
+from DIRAC.Core.Utilities.List import breakListIntoChunks
+
+__RCSID__ = "$Id$"
+
+# sqlite limits the number of parameters of a statement to 999
+CHUNKSIZE = 500
+
+
+class ReplicaCache(object):
+  """ Replicas of the files of the transformations, expiring after a number of days
+  """
+
+  def __init__(self, fileName, validity=2):
+    """ c'tor
+
+        :param str fileName: path of the sqlite file, created if it does not exist
+        :param validity: number of days after which the cached replicas expire
+    """
+    self.fileName = fileName
+    self.validity = validity
+    self.log = gLogger.getSubLogger('ReplicaCache')
+    self.__lock = threading.Lock()
+    self.__seIDs = {}
+    self.__seNames = {}
+    self.__connection = sqlite3.connect(fileName, check_same_thread=False)
+    self.__connection.text_factory = str
+    with self.__connection:
+      self.__connection.execute("PRAGMA journal_mode = WAL")
+      self.__connection.execute("PRAGMA synchronous = NORMAL")
+      self.__connection.execute("CREATE TABLE IF NOT EXISTS SEs (SEID INTEGER PRIMARY KEY, SEName TEXT UNIQUE)")
+      self.__connection.execute("CREATE TABLE IF NOT EXISTS Replicas (TransID INTEGER, LFN TEXT, SEIDs TEXT, "
+                                "UpdateTime INTEGER, PRIMARY KEY (TransID, LFN))")
+      self.__connection.execute("CREATE INDEX IF NOT EXISTS UpdateTimeIndex ON Replicas (TransID, UpdateTime)")
+    for seID, seName in self.__connection.execute("SELECT SEID, SEName FROM SEs"):
+      self.__seIDs[seName] = seID
+      self.__seNames[seID] = seName
+
+  def close(self):
+    """ Close the sqlite file
+    """
+    with self.__lock:
+      self.__connection.close()
+
+  def __seIDString(self, ses, newSEIDs):
+    """ Get the string of the IDs of a list of SEs, interning the new ones. Must be called with the lock held,
+        in the transaction adding the new SEs
+
+        :param dict newSEIDs: { SE name : SE ID } of the SEs added in the transaction, only known once it is committed
+    """
+    for seName in ses:
+      if seName not in self.__seIDs and seName not in newSEIDs:
+        newSEIDs[seName] = self.__connection.execute("INSERT INTO SEs (SEName) VALUES (?)", (seName,)).lastrowid
+    return ','.join(str(self.__seIDs[seName] if seName in self.__seIDs else newSEIDs[seName]) for seName in ses)
+
+  def getReplicas(self, transID, lfns):
+    """ Get the cached replicas of some files of a transformation
+
+        :param int transID: transformation ID
+        :param list lfns: LFNs to look up
+        :return: S_OK( { lfn : [ SE names ] } ) for the LFNs found in the cache
+    """
+    replicas = {}
+    try:
+      with self.__lock:
+        for lfnChunk in breakListIntoChunks(list(lfns), CHUNKSIZE):
+          rows = self.__connection.execute("SELECT LFN, SEIDs FROM Replicas WHERE TransID = ? AND LFN IN (%s)" %
+                                           ','.join('?' * len(lfnChunk)), [transID] + lfnChunk)
+          for lfn, seIDs in rows:
+            replicas[lfn] = [self.__seNames[int(seID)] for seID in seIDs.split(',')]
+    except sqlite3.Error as e:
+      return S_ERROR("Failed to read the replica cache: %s" % repr(e))
+    return S_OK(replicas)
+
+  def addReplicas(self, transID, replicaDict, updateTime=None):
+    """ Add or replace the replicas of files of a transformation
+
+        :param int transID: transformation ID
+        :param dict replicaDict: { lfn : [ SE names ] }
+        :param updateTime: epoch time the replicas were obtained, now by default
+        :return: S_OK( number of files added )
+    """
+    updateTime = int(updateTime if updateTime is not None else time.time())
+    try:
+      with self.__lock:
+        newSEIDs = {}
+        with self.__connection:
+          self.__connection.executemany("INSERT OR REPLACE INTO Replicas (TransID, LFN, SEIDs, UpdateTime) "
+                                        "VALUES (?, ?, ?, ?)",
+                                        [(transID, lfn, self.__seIDString(ses, newSEIDs), updateTime)
+                                         for lfn, ses in replicaDict.iteritems() if ses])
+        # The new SEs are only known once committed, they are rolled back with the replicas otherwise
+        for seName, seID in newSEIDs.iteritems():
+          self.__seIDs[seName] = seID
+          self.__seNames[seID] = seName
+    except sqlite3.Error as e:
+      return S_ERROR("Failed to write the replica cache: %s" % repr(e))
+    return S_OK(len(replicaDict))
+
+  def removeFiles(self, transID, lfns):
+    """ Remove files of a transformation from the cache
+
+        :return: S_OK( number of files removed )
+    """
+    removed = 0
+    try:
+      with self.__lock, self.__connection:
+        for lfnChunk in breakListIntoChunks(list(lfns), CHUNKSIZE):
+          removed += self.__connection.execute("DELETE FROM Replicas WHERE TransID = ? AND LFN IN (%s)" %
+                                               ','.join('?' * len(lfnChunk)), [transID] + lfnChunk).rowcount
+    except sqlite3.Error as e:
+      return S_ERROR("Failed to remove files from the replica cache: %s" % repr(e))
+    return S_OK(removed)
+
+  def clearTransformation(self, transID):
+    """ Remove all the files of a transformation from the cache
+
+        :return: S_OK( number of files removed )
+    """
+    try:
+      with self.__lock, self.__connection:
+        removed = self.__connection.execute("DELETE FROM Replicas WHERE TransID = ?", (transID,)).rowcount
+    except sqlite3.Error as e:
+      return S_ERROR("Failed to clear the replica cache: %s" % repr(e))
+    return S_OK(removed)
+
+  def cleanCache(self, transID=None):
+    """ Remove the replicas cached for longer than the validity, for a transformation or all of them
+
+        :return: S_OK( number of files removed )
+    """
+    timeLimit = int(time.time() - self.validity * 86400)
+    try:
+      with self.__lock, self.__connection:
+        if transID is None:
+          cursor = self.__connection.execute("DELETE FROM Replicas WHERE UpdateTime < ?", (timeLimit,))
+        else:
+          cursor = self.__connection.execute("DELETE FROM Replicas WHERE TransID = ? AND UpdateTime < ?",
+                                             (transID, timeLimit))
+    except sqlite3.Error as e:
+      return S_ERROR("Failed to clean the replica cache: %s" % repr(e))
+    return S_OK(cursor.rowcount)
+
+  def countFiles(self, transID=None):
+    """ Get the number of files in the cache, for a transformation or all of them
+    """
+    try:
+      with self.__lock:
+        if transID is None:
+          row = self.__connection.execute("SELECT COUNT(*) FROM Replicas").fetchone()
+        else:
+          row = self.__connection.execute("SELECT COUNT(*) FROM Replicas WHERE TransID = ?", (transID,)).fetchone()
+    except sqlite3.Error as e:
+      return S_ERROR("Failed to count the files in the replica cache: %s" % repr(e))
+    return S_OK(row[0])
+
+  def importPickleFile(self, transID, pickleFile):
+    """ Import the replicas of a transformation from a cache file written with pickle by the previous
+        versions of the TransformationAgent, { datetime : { lfn : [ SE names ] } }, and remove the file
+
+        :return: S_OK( number of files imported )
+    """
+    try:
+      with open(pickleFile, 'r') as fd:
+        replicaSets = pickle.load(fd)
+    except Exception as e:  # pylint: disable=broad-except
+      return S_ERROR("Failed to load the replica cache file %s: %s" % (pickleFile, repr(e)))
+    imported = 0
+    # Oldest first, so that the most recent replicas of a file are the ones kept
+    for updateTime in sorted(replicaSets):
+      result = self.addReplicas(transID, replicaSets[updateTime],
+                                updateTime=calendar.timegm(updateTime.utctimetuple()))
+      if not result['OK']:
+        return result
+      imported += result['Value']
+    os.remove(pickleFile)
+    return S_OK(imported)
@@ -0,0 +1,82 @@
+""" Test the on-disk replica cache of the TransformationAgent
+"""
+
+# pylint: disable=redefined-outer-name
+
+import os
+import time
+import pickle
+import datetime
+
+import pytest
+
+from DIRAC.TransformationSystem.Utilities.ReplicaCache import ReplicaCache
+
+__RCSID__ = "$Id$"
+
+
+@pytest.fixture
+def cacheFile(tmpdir):
+  return str(tmpdir.join('ReplicaCache.sqlite'))
+
+
+def test_replicas(cacheFile):
+  cache = ReplicaCache(cacheFile)
+  lfns = ['/vo/file%d' % i for i in xrange(1200)]
+  assert cache.addReplicas(1, dict((lfn, ['SE-A', 'SE-B']) for lfn in lfns))['Value'] == 1200
+  assert cache.addReplicas(2, {lfns[0]: ['SE-C']})['OK']
+  # The replicas of a file are replaced
+  assert cache.addReplicas(1, {lfns[1]: ['SE-C']})['OK']
+
+  replicas = cache.getReplicas(1, lfns[:3] + ['/vo/notCached'])['Value']
+  assert replicas == {lfns[0]: ['SE-A', 'SE-B'], lfns[1]: ['SE-C'], lfns[2]: ['SE-A', 'SE-B']}
+  assert len(cache.getReplicas(1, lfns)['Value']) == 1200
+
+  assert cache.removeFiles(1, lfns[:1000] + ['/vo/notCached'])['Value'] == 1000
+  assert cache.countFiles(1)['Value'] == 200
+  assert cache.clearTransformation(1)['Value'] == 200
+  assert cache.getReplicas(2, lfns[:1])['Value'] == {lfns[0]: ['SE-C']}
+  cache.close()
+
+  # The content and the SE names are persistent
+  cache = ReplicaCache(cacheFile)
+  assert cache.countFiles()['Value'] == 1
+  assert cache.addReplicas(2, {lfns[1]: ['SE-A', 'SE-D']})['OK']
+  assert cache.getReplicas(2, lfns[:2])['Value'] == {lfns[0]: ['SE-C'], lfns[1]: ['SE-A', 'SE-D']}
+
+
+def test_rollback(cacheFile):
+  cache = ReplicaCache(cacheFile)
+  # The SE interned by a failed update is rolled back with it, and not kept in memory
+  assert not cache.addReplicas(1, {object(): ['SE-NEW']})['OK']
+  assert cache.addReplicas(1, {'/vo/b': ['SE-OTHER']})['OK']
+  assert cache.addReplicas(1, {'/vo/c': ['SE-NEW', 'SE-OTHER']})['OK']
+  expected = {'/vo/b': ['SE-OTHER'], '/vo/c': ['SE-NEW', 'SE-OTHER']}
+  assert cache.getReplicas(1, ['/vo/b', '/vo/c'])['Value'] == expected
+  cache.close()
+  assert ReplicaCache(cacheFile).getReplicas(1, ['/vo/b', '/vo/c'])['Value'] == expected
+
+
+def test_expiry(cacheFile):
+  cache = ReplicaCache(cacheFile, validity=1)
+  cache.addReplicas(1, {'/vo/old': ['SE-A']}, updateTime=time.time() - 2 * 86400)
+  cache.addReplicas(1, {'/vo/new': ['SE-A']})
+  cache.addReplicas(2, {'/vo/old': ['SE-A']}, updateTime=time.time() - 2 * 86400)
+  assert cache.cleanCache(1)['Value'] == 1
+  assert cache.getReplicas(1, ['/vo/old', '/vo/new'])['Value'] == {'/vo/new': ['SE-A']}
+  assert cache.cleanCache()['Value'] == 1
+  assert cache.countFiles()['Value'] == 1
+
+
+def test_importPickleFile(cacheFile, tmpdir):
+  pickleFile = str(tmpdir.join('ReplicaCache_5.pkl'))
+  now = datetime.datetime.utcnow()
+  with open(pickleFile, 'w') as fd:
+    pickle.dump({now - datetime.timedelta(days=3): {'/vo/a': ['SE-A'], '/vo/b': ['SE-A']},
+                 now: {'/vo/b': ['SE-B']}}, fd)
+  cache = ReplicaCache(cacheFile)
+  assert cache.importPickleFile(5, pickleFile)['Value'] == 3
+  assert not os.path.exists(pickleFile)
+  assert cache.getReplicas(5, ['/vo/a', '/vo/b'])['Value'] == {'/vo/a': ['SE-A'], '/vo/b': ['SE-B']}
+  # The time the replicas were cached is kept
+  assert cache.cleanCache(5)['Value'] == 1
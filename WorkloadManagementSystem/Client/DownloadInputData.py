@@ -11,16 +11,23 @@
 __RCSID__ = "$Id$"
 
 import os
+import time
 import tempfile
 import random
+import threading
+from multiprocessing.pool import ThreadPool
 
 from DIRAC import S_OK, S_ERROR, gLogger
 from DIRAC.WorkloadManagementSystem.Client.JobStateUpdateClient import JobStateUpdateClient
 from DIRAC.Resources.Storage.StorageElement import StorageElement
 from DIRAC.Core.Utilities.Os import getDiskSpace
+from DIRAC.ConfigurationSystem.Client.Helpers.Operations import Operations
 from DIRAC.DataManagementSystem.Utilities.DMSHelpers import DMSHelpers
 
 COMPONENT_NAME = 'DownloadInputData'
+# Default number of files downloaded at the same time by a job, and from the same SE
+MAX_CONCURRENT_DOWNLOADS = 4
+MAX_CONCURRENT_DOWNLOADS_PER_SE = 2
 
 
 def _isCached(lfn, seName):
@@ -53,6 +60,10 @@ class DownloadInputData:
     self.jobID = None
     self.counter = 1
     self.availableSEs = DMSHelpers().getStorageElements()
+    self.maxDownloadsPerSE = MAX_CONCURRENT_DOWNLOADS_PER_SE
+    # Limit the concurrent downloads from each SE
+    self.seSemaphores = {}
+    self.lock = threading.Lock()
 
   #############################################################################
   def execute(self, dataToResolve=None):
@@ -65,6 +76,15 @@ class DownloadInputData:
     localSESet = set(self.configuration['LocalSEList'])
 
     self.jobID = self.configuration.get('JobID')
+    op = Operations()
+    maxDownloads = self.configuration.get('MaxConcurrentDownloads',
+                                          op.getValue('InputDataPolicy/MaxConcurrentDownloads',
+                                                      MAX_CONCURRENT_DOWNLOADS))
+    maxDownloadsPerSE = self.configuration.get('MaxConcurrentDownloadsPerSE',
+                                               op.getValue('InputDataPolicy/MaxConcurrentDownloadsPerSE',
+                                                           MAX_CONCURRENT_DOWNLOADS_PER_SE))
+    maxDownloads = max(1, int(maxDownloads))
+    self.maxDownloadsPerSE = max(1, int(maxDownloadsPerSE))
 
     if dataToResolve:
       self.log.verbose('Data to resolve passed directly to DownloadInputData module')
@@ -151,67 +171,29 @@ class DownloadInputData:
       self.__setJobParam(COMPONENT_NAME, report)
       return S_OK({'Failed': self.inputData, 'Successful': {}})
 
+    # Download the files concurrently, each download falling back to the other replicas if it fails
     resolvedData = {}
     localSECount = 0
-    for lfn, info in downloadReplicas.iteritems():
-      seName = info['SE']
-      guid = info['GUID']
-      reps = replicas.get(lfn, {})
-      if seName:
-        result = StorageElement(seName).getFileMetadata(lfn)
-        if not result['OK']:
-          self.log.error("Error getting metadata", result['Message'])
-          failedReplicas.add(lfn)
-          continue
-        if lfn in result['Value']['Failed']:
-          self.log.error('Could not get Storage Metadata for %s at %s: %s' %
-                         (lfn, seName, result['Value']['Failed'][lfn]))
-          failedReplicas.add(lfn)
-          continue
-        metadata = result['Value']['Successful'][lfn]
-        if metadata.get('Lost', False):
-          error = "PFN has been Lost by the StorageElement"
-        elif metadata.get('Unavailable', False):
-          error = "PFN is declared Unavailable by the StorageElement"
-        elif not metadata.get('Cached', metadata['Accessible']):
-          error = "PFN is no longer in StorageElement Cache"
-        else:
-          error = ''
-        if error:
-          self.log.error(error, lfn)
-          failedReplicas.add(lfn)
-          continue
-
-        self.log.info('Preliminary checks OK, download %s from %s:' % (lfn, seName))
-        result = self._downloadFromSE(lfn, seName, reps, guid)
-        if not result['OK']:
-          self.log.error("Download failed", "Tried downloading from SE %s: %s" % (seName, result['Message']))
-      else:
-        result = {'OK': False}
-
+    downloadedSize = 0
+    start = time.time()
+    pool = ThreadPool(min(maxDownloads, len(downloadReplicas)) or 1)
+    try:
+      downloads = pool.map(lambda lfn: self.__downloadFile(lfn, downloadReplicas[lfn], replicas.get(lfn, {})),
+                           sorted(downloadReplicas))
+    finally:
+      pool.close()
+      pool.join()
+    downloadTime = time.time() - start
+
+    for lfn, result, fromLocalSE in downloads:
       if not result['OK']:
-        reps.pop(seName, None)
-        # Check the other SEs
-        if reps:
-          self.log.info('Trying to download from any SE')
-          result = self._downloadFromBestSE(lfn, reps, guid)
-          if not result['OK']:
-            self.log.error("Download from best SE failed", "Tried downloading %s: %s" % (lfn, result['Message']))
-            failedReplicas.add(lfn)
-        else:
-          failedReplicas.add(lfn)
-      else:
+        failedReplicas.add(lfn)
+        continue
+      if fromLocalSE:
         localSECount += 1
-      if result['OK']:
-        # Rename file if downloaded FileName does not match the LFN... How can this happen?
-        lfnName = os.path.basename(lfn)
-        oldPath = result['Value']['path']
-        fileName = os.path.basename(oldPath)
-        if lfnName != fileName:
-          newPath = os.path.join(os.path.dirname(oldPath), lfnName)
-          os.rename(oldPath, newPath)
-          result['Value']['path'] = newPath
-        resolvedData[lfn] = result['Value']
+      if result['Value']['protocol'] == 'Downloaded':
+        downloadedSize += int(downloadReplicas[lfn].get('Size', 0))
+      resolvedData[lfn] = result['Value']
 
     # Report datasets that could not be downloaded
     report = ''
@@ -228,17 +210,97 @@ class DownloadInputData:
       report += '\nFailed to download %d LFN(s):\n' % len(failedReplicas)
       report += '\n'.join(failedReplicas)
 
+    parameters = []
     if report:
-      self.__setJobParam(COMPONENT_NAME, report)
+      parameters.append((COMPONENT_NAME, report))
+    if downloadedSize:
+      throughput = downloadedSize / (1024. * 1024.) / max(downloadTime, 0.001)
+      self.log.info('Downloaded %d bytes in %.1f seconds (%.2f MB/s)' % (downloadedSize, downloadTime, throughput))
+      parameters += [('InputDataDownloadedSize', str(downloadedSize)),
+                     ('InputDataDownloadTime', '%.1f' % downloadTime),
+                     ('InputDataDownloadThroughput', '%.2f' % throughput)]
+    if parameters:
+      self.__setJobParams(parameters)
 
     return S_OK({'Successful': resolvedData, 'Failed': failedReplicas})
 
+  #############################################################################
+  def __downloadFile(self, lfn, info, reps):
+    """ Download a file from the SE selected for it or, if it fails, from any other SE having a replica.
+        This is executed by the threads of the download pool.
+
+        :param str lfn: LFN of the file
+        :param dict info: SE, Size and GUID of the file
+        :param dict reps: replicas of the file, {SE: PFN}
+
+        :return: tuple (lfn, result of the download, True if downloaded from the selected SE)
+    """
+    seName = info['SE']
+    guid = info['GUID']
+    if seName:
+      result = self.__checkReplica(lfn, seName)
+      if result['OK']:
+        self.log.info('Preliminary checks OK, download %s from %s:' % (lfn, seName))
+        result = self._downloadFromSE(lfn, seName, reps, guid)
+        if not result['OK']:
+          self.log.error("Download failed", "Tried downloading from SE %s: %s" % (seName, result['Message']))
+    else:
+      result = S_ERROR('No local replica')
+
+    fromLocalSE = result['OK']
+    if not result['OK']:
+      reps.pop(seName, None)
+      # Check the other SEs
+      if not reps:
+        return lfn, result, False
+      self.log.info('Trying to download from any SE', lfn)
+      result = self._downloadFromBestSE(lfn, reps, guid)
+      if not result['OK']:
+        self.log.error("Download from best SE failed", "Tried downloading %s: %s" % (lfn, result['Message']))
+        return lfn, result, False
+
+    # Rename file if downloaded FileName does not match the LFN... How can this happen?
+    lfnName = os.path.basename(lfn)
+    oldPath = result['Value']['path']
+    fileName = os.path.basename(oldPath)
+    if lfnName != fileName:
+      newPath = os.path.join(os.path.dirname(oldPath), lfnName)
+      os.rename(oldPath, newPath)
+      result['Value']['path'] = newPath
+    return lfn, result, fromLocalSE
+
+  #############################################################################
+  def __checkReplica(self, lfn, seName):
+    """ Check that the replica of the file at the SE is accessible
+    """
+    result = StorageElement(seName).getFileMetadata(lfn)
+    if not result['OK']:
+      self.log.error("Error getting metadata", result['Message'])
+      return result
+    if lfn in result['Value']['Failed']:
+      self.log.error('Could not get Storage Metadata for %s at %s: %s' %
+                     (lfn, seName, result['Value']['Failed'][lfn]))
+      return S_ERROR(result['Value']['Failed'][lfn])
+    metadata = result['Value']['Successful'][lfn]
+    if metadata.get('Lost', False):
+      error = "PFN has been Lost by the StorageElement"
+    elif metadata.get('Unavailable', False):
+      error = "PFN is declared Unavailable by the StorageElement"
+    elif not metadata.get('Cached', metadata['Accessible']):
+      error = "PFN is no longer in StorageElement Cache"
+    else:
+      return S_OK()
+    self.log.error(error, lfn)
+    return S_ERROR(error)
+
   #############################################################################
   def __checkDiskSpace(self, totalSize):
     """Compare available disk space to the file size reported from the catalog
        result.
     """
-    diskSpace = getDiskSpace(self.__getDownloadDir(False))  # MB
+    # The per file directories are created in the current directory
+    downloadDir = os.getcwd() if self.inputDataDirectory == 'PerFile' else self.__getDownloadDir(False)
+    diskSpace = getDiskSpace(downloadDir)  # MB
     availableBytes = diskSpace * 1024 * 1024  # bytes
     # below can be a configuration option sent via the job wrapper in the future
     # Moved from 3 to 5 GB (PhC 130822) for standard output file
@@ -255,9 +317,11 @@ class DownloadInputData:
 
   def __getDownloadDir(self, incrementCounter=True):
     if self.inputDataDirectory == "PerFile":
-      if incrementCounter:
-        self.counter += 1
-      return tempfile.mkdtemp(prefix='InputData_%s' % (self.counter), dir=os.getcwd())
+      with self.lock:
+        if incrementCounter:
+          self.counter += 1
+        counter = self.counter
+      return tempfile.mkdtemp(prefix='InputData_%s' % (counter), dir=os.getcwd())
     elif self.inputDataDirectory == "CWD":
       return os.getcwd()
     else:
@@ -314,7 +378,8 @@ class DownloadInputData:
         return S_OK(fileDict)
 
     localFile = os.path.join(downloadDir, fileName)
-    result = StorageElement(seName).getFile(lfn, localPath=downloadDir)
+    with self.__getSESemaphore(seName):
+      result = StorageElement(seName).getFile(lfn, localPath=downloadDir)
     if not result['OK']:
       self.log.warn('Problem getting %s from %s:\n%s' % (lfn, seName, result['Message']))
       return result
@@ -338,6 +403,29 @@ class DownloadInputData:
       self.log.warn('File does not exist in local directory after download')
       return S_ERROR('OK download result but file missing in current directory')
 
+  #############################################################################
+  def __getSESemaphore(self, seName):
+    """ Get the semaphore limiting the number of concurrent downloads from an SE
+    """
+    with self.lock:
+      return self.seSemaphores.setdefault(seName, threading.BoundedSemaphore(self.maxDownloadsPerSE))
+
+  #############################################################################
+  def __setJobParams(self, parameters):
+    """Wraps around setJobParameters of state update client
+
+       :param list parameters: list of (name, value) tuples
+    """
+    if not self.jobID:
+      return S_ERROR('JobID not defined')
+
+    jobParams = JobStateUpdateClient().setJobParameters(int(self.jobID), parameters)
+    self.log.verbose('setJobParameters(%s,%s)' % (self.jobID, parameters))
+    if not jobParams['OK']:
+      self.log.warn(jobParams['Message'])
+
+    return jobParams
+
   #############################################################################
   def __setJobParam(self, name, value):
     """Wraps around setJobParameter of state update client
@@ -27,8 +27,10 @@ class Matcher(object):
   """ Logic for matching
   """
 
-  def __init__(self, pilotAgentsDB=None, jobDB=None, tqDB=None, jlDB=None, opsHelper=None):
+  def __init__(self, pilotAgentsDB=None, jobDB=None, tqDB=None, jlDB=None, opsHelper=None, tqIndex=None):
     """ c'tor
+
+        :param tqIndex: optional TaskQueueIndex used to find the task queues matching the resources
     """
     if pilotAgentsDB:
       self.pilotAgentsDB = pilotAgentsDB
@@ -52,6 +54,8 @@ class Matcher(object):
     else:
       self.opsHelper = Operations()
 
+    self.tqIndex = tqIndex
+
     self.log = gLogger.getSubLogger("Matcher")
 
     self.limiter = Limiter(jobDB=self.jobDB, opsHelper=self.opsHelper)
@@ -65,24 +69,10 @@ class Matcher(object):
     startTime = time.time()
 
     resourceDict = self._getResourceDict(resourceDescription, credDict)
-
-    # Make a nice print of the resource matching parameters
-    toPrintDict = dict(resourceDict)
-    if "MaxRAM" in resourceDescription:
-      toPrintDict['MaxRAM'] = resourceDescription['MaxRAM']
-    if "NumberOfProcessors" in resourceDescription:
-      toPrintDict['NumberOfProcessors'] = resourceDescription['NumberOfProcessors']
-    toPrintDict['Tag'] = []
-    if "Tag" in resourceDict:
-      for tag in resourceDict['Tag']:
-        if not tag.endswith('GB') and not tag.endswith('Processors'):
-          toPrintDict['Tag'].append(tag)
-    if not toPrintDict['Tag']:
-      toPrintDict.pop('Tag')
-    self.log.info('Resource description for matching', printDict(toPrintDict))
+    self._printResourceDict(resourceDict, resourceDescription)
 
     negativeCond = self.limiter.getNegativeCondForSite(resourceDict['Site'])
-    result = self.tqDB.matchAndGetJob(resourceDict, negativeCond=negativeCond)
+    result = self.tqDB.matchAndGetJob(resourceDict, negativeCond=negativeCond, tqIndex=self.tqIndex)
 
     if not result['OK']:
       raise RuntimeError(result['Message'])
@@ -143,6 +133,94 @@ class Matcher(object):
 
     return resultDict
 
+  def selectJobs(self, resourceDescription, credDict, numJobs):
+    """ Find up to numJobs of the highest priority jobs matching the resource capacity,
+        for the pilots filling several slots at once. The jobs are taken out of the task
+        queues in one go and their attributes, JDLs and optimizer parameters are retrieved
+        with bulk queries.
+
+        :param resourceDescription: resource description as for selectJob
+        :param dict credDict: credentials of the caller
+        :param int numJobs: maximum number of jobs to select
+        :returns: list of dictionaries as returned by selectJob, empty if no job matched
+    """
+    startTime = time.time()
+
+    resourceDict = self._getResourceDict(resourceDescription, credDict)
+    self._printResourceDict(resourceDict, resourceDescription)
+
+    negativeCond = self.limiter.getNegativeCondForSite(resourceDict['Site'])
+    result = self.tqDB.matchAndGetJobs(resourceDict, numJobs, negativeCond=negativeCond, tqIndex=self.tqIndex)
+    if not result['OK']:
+      raise RuntimeError(result['Message'])
+    if not result['Value']['matchFound']:
+      self.log.info("No match found")
+      return []
+    jobIDs = [jobID for jobID, _tqID in result['Value']['jobs']]
+
+    resAtt = self.jobDB.getAttributesForJobList(jobIDs, ['OwnerDN', 'OwnerGroup', 'Status'])
+    if not resAtt['OK']:
+      raise RuntimeError('Could not retrieve job attributes')
+    jobAttributes = resAtt['Value']
+    # The jobs are already out of the task queues: do not fail for all of them because of one
+    for jobID in list(jobIDs):
+      if jobAttributes.get(jobID, {}).get('Status') != 'Waiting':
+        self.log.error('Job matched by the TQ is not in Waiting state', str(jobID))
+        jobIDs.remove(jobID)
+    if not jobIDs:
+      raise RuntimeError("Jobs %s are not in Waiting state" % ','.join(str(jobID) for jobID in jobAttributes))
+
+    self._reportStatus(resourceDict, jobIDs)
+
+    result = self.jobDB.getJobsJDL(jobIDs)
+    if not result['OK']:
+      raise RuntimeError("Failed to get the job JDLs")
+    jdls = result['Value']
+
+    matchTime = time.time() - startTime
+    self.log.info("Match time", "[%s] for %d jobs" % (str(matchTime), len(jobIDs)))
+    gMonitor.addMark("matchTime", matchTime)
+
+    result = self.jobDB.getJobsOptParameters(jobIDs)
+    optParameters = result['Value'] if result['OK'] else {}
+
+    if self.opsHelper.getValue("JobScheduling/CheckMatchingDelay", True):
+      for jobID in jobIDs:
+        self.limiter.updateDelayCounters(resourceDict['Site'], jobID)
+
+    if not resourceDict.get('PilotInfoReportedFlag', False):
+      self._updatePilotInfo(resourceDict)
+
+    resultList = []
+    for jobID in jobIDs:
+      self._updatePilotJobMapping(resourceDict, jobID)
+      resultDict = dict(optParameters.get(jobID, {}))
+      resultDict['JDL'] = jdls.get(jobID, '')
+      resultDict['JobID'] = jobID
+      resultDict['DN'] = jobAttributes[jobID]['OwnerDN']
+      resultDict['Group'] = jobAttributes[jobID]['OwnerGroup']
+      resultDict['PilotInfoReportedFlag'] = True
+      resultList.append(resultDict)
+
+    return resultList
+
+  def _printResourceDict(self, resourceDict, resourceDescription):
+    """ Make a nice print of the resource matching parameters
+    """
+    toPrintDict = dict(resourceDict)
+    if "MaxRAM" in resourceDescription:
+      toPrintDict['MaxRAM'] = resourceDescription['MaxRAM']
+    if "NumberOfProcessors" in resourceDescription:
+      toPrintDict['NumberOfProcessors'] = resourceDescription['NumberOfProcessors']
+    toPrintDict['Tag'] = []
+    if "Tag" in resourceDict:
+      for tag in resourceDict['Tag']:
+        if not tag.endswith('GB') and not tag.endswith('Processors'):
+          toPrintDict['Tag'].append(tag)
+    if not toPrintDict['Tag']:
+      toPrintDict.pop('Tag')
+    self.log.info('Resource description for matching', printDict(toPrintDict))
+
   def _getResourceDict(self, resourceDescription, credDict):
     """ from resourceDescription to resourceDict (just various mods)
     """
@@ -223,7 +301,7 @@ class Matcher(object):
     return resourceDict
 
   def _reportStatus(self, resourceDict, jobID):
-    """ Reports the status of the matched job in jobDB and jobLoggingDB
+    """ Reports the status of the matched job (or list of jobs) in jobDB and jobLoggingDB
 
         Do not fail if errors happen here
     """
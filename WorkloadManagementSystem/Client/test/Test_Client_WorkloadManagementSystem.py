@@ -4,14 +4,18 @@
 
 from __future__ import print_function
 import os
+import time
+import shutil
+import tempfile
 import unittest
 import importlib
+import threading
 import StringIO
 
-from mock import MagicMock
+from mock import MagicMock, patch
 
 from DIRAC.DataManagementSystem.Client.test.mock_DM import dm_mock
-from DIRAC import S_OK
+from DIRAC import S_OK, S_ERROR
 from DIRAC.WorkloadManagementSystem.Client.DownloadInputData import DownloadInputData
 from DIRAC.WorkloadManagementSystem.Client.Matcher import Matcher
 from DIRAC.WorkloadManagementSystem.Client.SandboxStoreClient import SandboxStoreClient
@@ -86,6 +90,63 @@ class DownloadInputDataSuccess(ClientsTestCase):
 
     # I can't figure out how to simulate a real download here
 
+  def test_DLIConcurrentDownloads(self):
+    """ The files are downloaded concurrently, within the limit per SE, falling back to other replicas
+    """
+    lfns = ['/a/lfn/f%d.txt' % i for i in range(6)]
+    downloadDir = tempfile.mkdtemp()
+    running = {'SE1': 0, 'SE2': 0}
+    maxRunning = dict(running)
+    lock = threading.Lock()
+
+    def getFile(seName, lfn, localPath=None):
+      if seName == 'SE1' and lfn == lfns[0]:
+        return S_ERROR('Transfer failed')
+      with lock:
+        running[seName] += 1
+        maxRunning[seName] = max(maxRunning[seName], running[seName])
+      time.sleep(0.05)
+      open(os.path.join(localPath, os.path.basename(lfn)), 'w').close()
+      with lock:
+        running[seName] -= 1
+      return S_OK({'Successful': {lfn: 10}, 'Failed': {}})
+
+    def getStorageElement(seName):
+      storageElement = MagicMock()
+      storageElement.status.return_value = {'Read': True, 'DiskSE': True, 'TapeSE': False}
+      storageElement.getFileMetadata.side_effect = lambda lfn: S_OK({'Successful': {lfn: {'Accessible': True}},
+                                                                     'Failed': {}})
+      storageElement.getFile.side_effect = lambda lfn, localPath=None: getFile(seName, lfn, localPath)
+      return storageElement
+
+    replicas = dict((lfn, {'SE1': 'pfn1', 'SE2': 'pfn2', 'Size': 10, 'GUID': 'aGuid'}) for lfn in lfns)
+    dli = DownloadInputData({'InputData': lfns,
+                             'Configuration': {'LocalSEList': ['SE1'], 'JobID': 123,
+                                               'MaxConcurrentDownloads': 4, 'MaxConcurrentDownloadsPerSE': 2},
+                             'FileCatalog': S_OK({'Successful': replicas}),
+                             'InputDataDirectory': downloadDir})
+    dli.availableSEs = ['SE1', 'SE2']
+    jobStateUpdateClient = MagicMock()
+    try:
+      with patch('DIRAC.WorkloadManagementSystem.Client.DownloadInputData.StorageElement',
+                 side_effect=getStorageElement), \
+          patch('DIRAC.WorkloadManagementSystem.Client.DownloadInputData.getDiskSpace', return_value=100000), \
+          patch('DIRAC.WorkloadManagementSystem.Client.DownloadInputData.JobStateUpdateClient',
+                return_value=jobStateUpdateClient):
+        res = dli.execute()
+    finally:
+      shutil.rmtree(downloadDir)
+
+    self.assertTrue(res['OK'])
+    self.assertEqual(sorted(res['Value']['Successful']), lfns)
+    self.assertFalse(res['Value']['Failed'])
+    self.assertEqual(res['Value']['Successful'][lfns[0]]['se'], 'SE2')
+    self.assertEqual(set(res['Value']['Successful'][lfn]['se'] for lfn in lfns[1:]), set(['SE1']))
+    self.assertEqual(maxRunning['SE1'], 2)
+    parameters = dict(jobStateUpdateClient.setJobParameters.call_args[0][1])
+    self.assertEqual(parameters['InputDataDownloadedSize'], '60')
+    self.assertIn('InputDataDownloadThroughput', parameters)
+
   def test_DLIDownloadFromBestSE(self):
     ourDLI = importlib.import_module('DIRAC.WorkloadManagementSystem.Client.DownloadInputData')
     ourDLI.StorageElement = self.mockSE
@@ -148,6 +209,36 @@ class MatcherTestCase(ClientsTestCase):
 
     self.assertEqual(res, resExpected)
 
+  def test_selectJobs(self):
+
+    resourceDict = {'Setup': 'LHCb-Certification', 'CPUTime': 1080000, 'Site': 'DIRAC.Jenkins.ch',
+                    'PilotReference': 'somePilotReference', 'PilotInfoReportedFlag': True}
+    self.matcher._getResourceDict = MagicMock(return_value=resourceDict)
+    self.matcher.limiter = MagicMock()
+    self.matcher.limiter.getNegativeCondForSite.return_value = {}
+    self.opsHelperMock.getValue.return_value = False
+    self.tqDBMock.matchAndGetJobs.return_value = S_OK({'matchFound': True, 'jobs': [(1, 10), (2, 10), (3, 11)]})
+    self.jobDBMock.getAttributesForJobList.return_value = S_OK({
+        1: {'OwnerDN': '/my/DN', 'OwnerGroup': 'user', 'Status': 'Waiting'},
+        2: {'OwnerDN': '/my/DN', 'OwnerGroup': 'user', 'Status': 'Killed'},
+        3: {'OwnerDN': '/other/DN', 'OwnerGroup': 'prod', 'Status': 'Waiting'}})
+    self.jobDBMock.getJobsJDL.return_value = S_OK({1: '[jdl1]', 3: '[jdl3]'})
+    self.jobDBMock.getJobsOptParameters.return_value = S_OK({3: {'Opt': 'value'}})
+
+    res = self.matcher.selectJobs({}, {}, 3)
+    self.assertEqual([(jobDict['JobID'], jobDict['JDL'], jobDict['DN'], jobDict.get('Opt')) for jobDict in res],
+                     [(1, '[jdl1]', '/my/DN', None), (3, '[jdl3]', '/other/DN', 'value')])
+    self.tqDBMock.matchAndGetJobs.assert_called_once_with(resourceDict, 3, negativeCond={}, tqIndex=None)
+    # The status is reported at once for the jobs in Waiting
+    self.jobDBMock.setJobAttributes.assert_called_once_with([1, 3], ['Status', 'MinorStatus', 'ApplicationStatus',
+                                                                     'Site'],
+                                                            ['Matched', 'Assigned', 'Unknown', 'DIRAC.Jenkins.ch'])
+    self.assertEqual(self.jlDBMock.addLoggingRecord.call_args[0][0], [1, 3])
+    self.assertEqual(self.pilotAgentsDBMock.setJobForPilot.call_count, 2)
+
+    self.tqDBMock.matchAndGetJobs.return_value = S_OK({'matchFound': False, 'jobs': []})
+    self.assertEqual(self.matcher.selectJobs({}, {}, 3), [])
+
 #############################################################################
 
 
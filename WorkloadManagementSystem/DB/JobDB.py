@@ -14,6 +14,8 @@
     getAllJobParameters()
     getInputData()
     getJobJDL()
+    getJobsJDL()
+    getJobsOptParameters()
 
     selectJobs()
     selectJobsWithStatus()
@@ -22,6 +24,8 @@
     setJobAttributes()
     setJobParameter()
     setJobParameters()
+    setJobAttributesBulk()
+    setJobParametersBulk()
     setJobJDL()
     setJobStatus()
     setInputData()
@@ -53,6 +57,7 @@ from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR
 from DIRAC.Core.Utilities import Time
 from DIRAC.Core.Utilities.DErrno import EWMSSUBM
 from DIRAC.Core.Utilities.Decorators import deprecated
+from DIRAC.Core.Utilities.List import breakListIntoChunks
 from DIRAC.Core.Utilities.ObjectLoader import ObjectLoader
 from DIRAC.ConfigurationSystem.Client.Config import gConfig
 from DIRAC.ConfigurationSystem.Client.Helpers.Registry import getVOForGroup
@@ -139,10 +144,8 @@ class JobDB(DB):
     else:
       attrNames = ','.join(self.jobAttributeNames)
       attr_tmp_list = self.jobAttributeNames
-    jobList = ','.join([str(x) for x in jobIDList])
-
-    cmd = 'SELECT JobID,%s FROM Jobs WHERE JobID in ( %s )' % (attrNames, jobList)
-    res = self._query(cmd)
+    cmd = 'SELECT JobID,%s FROM Jobs WHERE JobID IN %%s' % attrNames
+    res = self._queryInChunks(cmd, [jobIDList])
     if not res['OK']:
       return res
     try:
@@ -286,28 +289,14 @@ class JobDB(DB):
     if isinstance(jobID, (basestring, int, long)):
       jobID = [jobID]
 
-    jobIDList = []
-    for jID in jobID:
-      ret = self._escapeString(str(jID))
-      if not ret['OK']:
-        return ret
-      jobIDList.append(ret['Value'])
-
     # self.log.debug('JobDB.getParameters: Getting Parameters for jobs %s' % ','.join(jobIDList))
 
     resultDict = {}
     if paramList:
       if isinstance(paramList, basestring):
         paramList = paramList.split(',')
-      paramNameList = []
-      for pn in paramList:
-        ret = self._escapeString(pn)
-        if not ret['OK']:
-          return ret
-        paramNameList.append(ret['Value'])
-      cmd = "SELECT JobID, Name, Value FROM JobParameters WHERE JobID IN (%s) AND Name IN (%s)" % \
-            (','.join(jobIDList), ','.join(paramNameList))
-      result = self._query(cmd)
+      cmd = "SELECT JobID, Name, Value FROM JobParameters WHERE JobID IN %s AND Name IN %s"
+      result = self._queryInChunks(cmd, [jobID, paramList])
       if result['OK']:
         if result['Value']:
           for res_jobID, res_name, res_value in result['Value']:
@@ -387,23 +376,11 @@ class JobDB(DB):
         return an empty dictionary if matching job found
     """
 
-    ret = self._escapeString(jobID)
-    if not ret['OK']:
-      return ret
-    jobID = ret['Value']
-
-    attrNameList = []
-    for x in attrList if attrList else self.jobAttributeNames:
-      ret = self._escapeString(x)
-      if not ret['OK']:
-        return ret
-      x = "`" + ret['Value'][1:-1] + "`"
-      attrNameList.append(x)
-    attrNames = ','.join(attrNameList)
+    attrNames = ','.join("`%s`" % x.replace('`', '') for x in (attrList if attrList else self.jobAttributeNames))
     # self.log.debug('JobDB.getAllJobAttributes: Getting Attributes for job = %s.' % jobID)
 
-    cmd = 'SELECT %s FROM Jobs WHERE JobID=%s' % (attrNames, jobID)
-    res = self._query(cmd)
+    cmd = 'SELECT %s FROM Jobs WHERE JobID=%%s' % attrNames
+    res = self._query(cmd, args=[jobID])
     if not res['OK']:
       return res
 
@@ -459,26 +436,15 @@ class JobDB(DB):
         empty, get all the parameters then
     """
 
-    ret = self._escapeString(jobID)
-    if not ret['OK']:
-      return ret
-    jobID = ret['Value']
-
     resultDict = {}
 
+    args = [jobID]
+    cmd = "SELECT Name, Value from OptimizerParameters WHERE JobID=%s"
     if paramList:
-      paramNameList = []
-      for x in paramList:
-        ret = self._escapeString(x)
-        if not ret['OK']:
-          return ret
-        paramNameList.append(ret['Value'])
-      paramNames = ','.join(paramNameList)
-      cmd = "SELECT Name, Value from OptimizerParameters WHERE JobID=%s and Name in (%s)" % (jobID, paramNames)
-    else:
-      cmd = "SELECT Name, Value from OptimizerParameters WHERE JobID=%s" % jobID
+      cmd += " and Name in %s"
+      args.append(paramList)
 
-    result = self._query(cmd)
+    result = self._query(cmd, args=args)
     if result['OK']:
       if result['Value']:
         for name, value in result['Value']:
@@ -492,17 +458,40 @@ class JobDB(DB):
     else:
       return S_ERROR('JobDB.getJobOptParameters: failed to retrieve parameters')
 
+#############################################################################
+  def getJobsOptParameters(self, jobIDList, paramList=None):
+    """ Get optimizer parameters for the jobs in jobIDList with a single query. If the list
+        of parameter names is empty, get all the parameters then
+
+        :returns: S_OK( { jobID : { name : value } } ), jobs without parameters are not in the dictionary
+    """
+    if not jobIDList:
+      return S_OK({})
+    args = [jobIDList]
+    cmd = "SELECT JobID, Name, Value from OptimizerParameters WHERE JobID in %s"
+    if paramList:
+      cmd += " and Name in %s"
+      args.append(paramList)
+
+    result = self._queryInChunks(cmd, args)
+    if not result['OK']:
+      return S_ERROR('JobDB.getJobsOptParameters: failed to retrieve parameters')
+    resultDict = {}
+    for jobID, name, value in result['Value']:
+      try:
+        value = value.tostring()
+      except BaseException:
+        pass
+      resultDict.setdefault(int(jobID), {})[name] = value
+    return S_OK(resultDict)
+
 #############################################################################
 
   def getInputData(self, jobID):
     """Get input data for the given job
     """
-    ret = self._escapeString(jobID)
-    if not ret['OK']:
-      return ret
-    jobID = ret['Value']
-    cmd = 'SELECT LFN FROM InputData WHERE JobID=%s' % jobID
-    res = self._query(cmd)
+    cmd = 'SELECT LFN FROM InputData WHERE JobID=%s'
+    res = self._query(cmd, args=[jobID])
     if not res['OK']:
       return res
 
@@ -622,25 +611,17 @@ class JobDB(DB):
     if attrName not in self.jobAttributeNames:
       return S_ERROR(EWMSSUBM, 'Request to set non-existing job attribute')
 
-    ret = self._escapeString(jobID)
-    if not ret['OK']:
-      return ret
-    jobID = ret['Value']
-
-    ret = self._escapeString(attrValue)
-    if not ret['OK']:
-      return ret
-    value = ret['Value']
-
+    args = [attrValue, jobID]
     if update:
-      cmd = "UPDATE Jobs SET %s=%s,LastUpdateTime=UTC_TIMESTAMP() WHERE JobID=%s" % (attrName, value, jobID)
+      cmd = "UPDATE Jobs SET %s=%%s,LastUpdateTime=UTC_TIMESTAMP() WHERE JobID=%%s" % attrName
     else:
-      cmd = "UPDATE Jobs SET %s=%s WHERE JobID=%s" % (attrName, value, jobID)
+      cmd = "UPDATE Jobs SET %s=%%s WHERE JobID=%%s" % attrName
 
     if myDate:
-      cmd += ' AND LastUpdateTime < %s' % myDate
+      cmd += ' AND LastUpdateTime < %s'
+      args.append(myDate)
 
-    res = self._update(cmd)
+    res = self._update(cmd, args=args)
     if res['OK']:
       return res
     return S_ERROR('JobDB.setAttribute: failed to set attribute')
@@ -664,13 +645,6 @@ class JobDB(DB):
     if not isinstance(jobID, (list, tuple)):
       jobIDList = [jobID]
 
-    jIDList = []
-    for jID in jobIDList:
-      ret = self._escapeString(jID)
-      if not ret['OK']:
-        return ret
-      jIDList.append(ret['Value'])
-
     if len(attrNames) != len(attrValues):
       return S_ERROR('JobDB.setAttributes: incompatible Argument length')
 
@@ -678,23 +652,20 @@ class JobDB(DB):
       if attrName not in self.jobAttributeNames:
         return S_ERROR(EWMSSUBM, 'Request to set non-existing job attribute')
 
-    attr = []
-    for name, value in zip(attrNames, attrValues):
-      ret = self._escapeString(value)
-      if not ret['OK']:
-        return ret
-      attr.append("%s=%s" % (name, ret['Value']))
+    attr = ["%s=%%s" % name for name in attrNames]
+    args = list(attrValues) + [jobIDList]
     if update:
       attr.append("LastUpdateTime=UTC_TIMESTAMP()")
     if not attr:
       return S_ERROR('JobDB.setAttributes: Nothing to do')
 
-    cmd = 'UPDATE Jobs SET %s WHERE JobID in ( %s )' % (', '.join(attr), ', '.join(jIDList))
+    cmd = 'UPDATE Jobs SET %s WHERE JobID in %%s' % ', '.join(attr)
 
     if myDate:
-      cmd += ' AND LastUpdateTime < %s' % myDate
+      cmd += ' AND LastUpdateTime < %s'
+      args.append(myDate)
 
-    return self._transaction([cmd])
+    return self._transaction([(cmd, args)])
 
 #############################################################################
   def setJobStatus(self, jobID, status='', minor='', application=''):
@@ -769,17 +740,8 @@ class JobDB(DB):
     """ Set a parameter specified by name,value pair for the job JobID
     """
 
-    ret = self._escapeString(key)
-    if not ret['OK']:
-      return ret
-    e_key = ret['Value']
-    ret = self._escapeString(value)
-    if not ret['OK']:
-      return ret
-    e_value = ret['Value']
-
-    cmd = 'REPLACE JobParameters (JobID,Name,Value) VALUES (%d,%s,%s)' % (int(jobID), e_key, e_value)
-    return self._update(cmd)
+    cmd = 'REPLACE JobParameters (JobID,Name,Value) VALUES (%s,%s,%s)'
+    return self._update(cmd, args=[int(jobID), key, value])
 
 #############################################################################
   def setJobParameters(self, jobID, parameters):
@@ -789,20 +751,92 @@ class JobDB(DB):
     if not parameters:
       return S_OK()
 
-    insertValueList = []
+    args = []
     for name, value in parameters:
-      ret = self._escapeString(name)
-      if not ret['OK']:
-        return ret
-      e_name = ret['Value']
-      ret = self._escapeString(value)
-      if not ret['OK']:
-        return ret
-      e_value = ret['Value']
-      insertValueList.append('(%s,%s,%s)' % (jobID, e_name, e_value))
+      args.extend([jobID, name, value])
 
-    cmd = 'REPLACE JobParameters (JobID,Name,Value) VALUES %s' % ', '.join(insertValueList)
-    return self._update(cmd)
+    cmd = 'REPLACE JobParameters (JobID,Name,Value) VALUES %s' % ', '.join(['(%s,%s,%s)'] * len(parameters))
+    return self._update(cmd, args=args)
+
+#############################################################################
+  def __insertOnDuplicateKeyUpdate(self, table, fields, rowList, updateList):
+    """ Insert the rows in chunks with INSERT IGNORE ... ON DUPLICATE KEY UPDATE: the existing
+        rows are updated and the rows breaking a foreign key (e.g. deleted jobs) are skipped
+
+        :param list rowList: lists of values, bound as arguments of the statements
+        :param list updateList: assignments of the ON DUPLICATE KEY UPDATE clause
+        :return: S_OK( number of affected rows ) / S_ERROR
+    """
+    affected = 0
+    rowPlaceholders = '(%s)' % ','.join(['%s'] * len(fields))
+    for rowChunk in breakListIntoChunks(rowList, 1000):
+      args = [value for row in rowChunk for value in row]
+      cmd = 'INSERT IGNORE INTO %s (%s) VALUES %s ON DUPLICATE KEY UPDATE %s' % (table, ','.join(fields),
+                                                                                 ','.join([rowPlaceholders] *
+                                                                                          len(rowChunk)),
+                                                                                 ','.join(updateList))
+      result = self._update(cmd, args=args)
+      if not result['OK']:
+        return result
+      affected += result['Value']
+    return S_OK(affected)
+
+#############################################################################
+  def setJobAttributesBulk(self, jobAttrDict):
+    """ Set attributes of several jobs at once, with one statement for all the jobs
+        updating the same attributes. As with setStartExecTime and setEndExecTime, the
+        StartExecTime and EndExecTime attributes are only set if they were not set yet.
+
+        :param dict jobAttrDict: { jobID : { attrName : value } }
+        :return: S_OK( number of affected rows ) / S_ERROR
+    """
+    jobsForAttrNames = {}
+    for jobID, attrDict in jobAttrDict.items():
+      jobsForAttrNames.setdefault(tuple(sorted(attrDict)), []).append(jobID)
+
+    affected = 0
+    for attrNames, jobIDList in jobsForAttrNames.items():
+      if not attrNames:
+        continue
+      missingAttr = [repr(x) for x in attrNames if x not in self.jobAttributeNames]
+      if missingAttr:
+        return S_ERROR(EWMSSUBM, "Request to set non-existing job attribute(s): %s" % ", ".join(missingAttr))
+      updateList = []
+      for name in attrNames:
+        if name in ('StartExecTime', 'EndExecTime'):
+          updateList.append('%s=IFNULL(%s,VALUES(%s))' % (name, name, name))
+        else:
+          updateList.append('%s=VALUES(%s)' % (name, name))
+      rowList = [[int(jobID)] + [jobAttrDict[jobID][name] for name in attrNames] for jobID in jobIDList]
+      result = self.__insertOnDuplicateKeyUpdate('Jobs', ['JobID'] + list(attrNames), rowList, updateList)
+      if not result['OK']:
+        return result
+      affected += result['Value']
+    return S_OK(affected)
+
+#############################################################################
+  def setJobParametersBulk(self, jobParamDict):
+    """ Set parameters of several jobs at once
+
+        :param dict jobParamDict: { jobID : { name : value } }
+        :return: S_OK( number of affected rows ) / S_ERROR
+    """
+    rowList = [[int(jobID), name, value] for jobID, paramDict in jobParamDict.items()
+               for name, value in paramDict.items()]
+    return self.__insertOnDuplicateKeyUpdate('JobParameters', ['JobID', 'Name', 'Value'], rowList,
+                                             ['Value=VALUES(Value)'])
+
+#############################################################################
+  def addHeartBeatRecords(self, recordList):
+    """ Add heart beat data items of several jobs at once, as done by setHeartBeatData
+        for the dynamic data
+
+        :param list recordList: ( jobID, name, value, heartBeatTime ) tuples
+        :return: S_OK( number of affected rows ) / S_ERROR
+    """
+    rowList = [[int(jobID), name, value, hbTime] for jobID, name, value, hbTime in recordList]
+    return self.__insertOnDuplicateKeyUpdate('HeartBeatLoggingInfo', ['JobID', 'Name', 'Value', 'HeartBeatTime'],
+                                             rowList, ['Value=VALUES(Value)'])
 
 #############################################################################
   def setJobOptParameter(self, jobID, name, value):
@@ -980,6 +1014,21 @@ class JobDB(DB):
       return S_OK(result['Value'][0][0])
     return result
 
+#############################################################################
+  def getJobsJDL(self, jobIDList, original=False):
+    """ Get the JDLs of the jobs in jobIDList with a single query. By default the current
+        job JDLs are returned. If 'original' argument is True, original JDLs are returned
+
+        :returns: S_OK( { jobID : jdl } ), jobs without JDL are not in the dictionary
+    """
+    if not jobIDList:
+      return S_OK({})
+    cmd = "SELECT JobID, %s FROM JobJDLs WHERE JobID in %%s" % ('OriginalJDL' if original else 'JDL')
+    result = self._queryInChunks(cmd, [jobIDList])
+    if not result['OK']:
+      return result
+    return S_OK(dict((int(jobID), jdl) for jobID, jdl in result['Value']))
+
 #############################################################################
   def insertNewJobIntoDB(self, jdl, owner, ownerDN, ownerGroup, diracSetup,
                          initialStatus="Received",
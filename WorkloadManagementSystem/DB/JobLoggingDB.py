@@ -2,6 +2,7 @@
     The following methods are provided
 
     addLoggingRecord()
+    addLoggingRecords()
     getJobLoggingInfo()
     deleteJob()
     getWMSTimeStamps()
@@ -44,11 +45,45 @@ class JobLoggingDB(DB):
         be provided in a form of a string in a format '%Y-%m-%d %H:%M:%S' or
         as datetime.datetime object. If the time stamp is not provided the current
         UTC time is used.
+        A list of job IDs can be given to add the same record for all of them at once.
     """
 
     event = 'status/minor/app=%s/%s/%s' % (status, minor, application)
     self.log.info("Adding record for job ", str(jobID) + ": '" + event + "' from " + source)
+    jobIDList = jobID if isinstance(jobID, (list, tuple)) else [jobID]
 
+    _date, time_order = self.__getStatusTime(date)
+    cmd = "INSERT INTO LoggingInfo (JobId, Status, MinorStatus, ApplicationStatus, " + \
+          "StatusTime, StatusTimeOrder, StatusSource) VALUES " + \
+        ','.join("(%d,'%s','%s','%s','%s',%f,'%s')" % (int(jID), status, minor, application[:255],
+                                                      str(_date), time_order, source)
+                 for jID in jobIDList)
+
+    return self._update(cmd)
+
+#############################################################################
+  def addLoggingRecords(self, recordList):
+    """ Add several entries to the JobLoggingDB table with a single statement
+
+        :param list recordList: ( jobID, status, minor, application, date, source ) tuples, with the same
+                                meaning as the addLoggingRecord arguments
+    """
+    if not recordList:
+      return S_OK(0)
+    valueList = []
+    for jobID, status, minor, application, date, source in recordList:
+      _date, time_order = self.__getStatusTime(date)
+      valueList.append("(%d,'%s','%s','%s','%s',%f,'%s')" % (int(jobID), status, minor, application[:255],
+                                                            str(_date), time_order, source))
+    self.log.info("Adding logging records", "for %d jobs" % len(set(record[0] for record in recordList)))
+    cmd = "INSERT INTO LoggingInfo (JobId, Status, MinorStatus, ApplicationStatus, " + \
+          "StatusTime, StatusTimeOrder, StatusSource) VALUES " + ','.join(valueList)
+    return self._update(cmd)
+
+#############################################################################
+  def __getStatusTime(self, date):
+    """ Get the status time and its ordering number from the date given to addLoggingRecord
+    """
     if not date:
       # Make the UTC datetime string and float
       _date = Time.dateTime()
@@ -76,13 +111,7 @@ class JobLoggingDB(DB):
         _date = Time.dateTime()
         epoc = time.mktime(_date.timetuple()) - MAGIC_EPOC_NUMBER
         time_order = round(epoc, 3)
-
-    cmd = "INSERT INTO LoggingInfo (JobId, Status, MinorStatus, ApplicationStatus, " + \
-          "StatusTime, StatusTimeOrder, StatusSource) VALUES (%d,'%s','%s','%s','%s',%f,'%s')" % \
-        (int(jobID), status, minor, application[:255],
-         str(_date), time_order, source)
-
-    return self._update(cmd)
+    return _date, time_order
 
 #############################################################################
   def getJobLoggingInfo(self, jobID):
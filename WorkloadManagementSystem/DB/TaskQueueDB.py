@@ -303,16 +303,15 @@ class TaskQueueDB(DB):
     orphanedTQs = result['Value']
     if not orphanedTQs:
       return S_OK()
-    orphanedTQs = [str(otq[0]) for otq in orphanedTQs]
+    orphanedTQs = [otq[0] for otq in orphanedTQs]
 
     for mvField in multiValueDefFields:
-      result = self._update(
-          "DELETE FROM `tq_TQTo%s` WHERE TQId in ( %s )" % (mvField, ','.join(orphanedTQs)), conn=connObj)
+      result = self._updateInChunks("DELETE FROM `tq_TQTo%s` WHERE TQId in %%s" % mvField, [orphanedTQs],
+                                    conn=connObj)
       if not result['OK']:
         return result
 
-    result = self._update(
-        "DELETE FROM `tq_TaskQueues` WHERE TQId in ( %s )" % ','.join(orphanedTQs), conn=connObj)
+    result = self._updateInChunks("DELETE FROM `tq_TaskQueues` WHERE TQId in %s", [orphanedTQs], conn=connObj)
     if not result['OK']:
       return result
     return S_OK()
@@ -505,14 +504,17 @@ ORDER BY COUNT( `tq_Jobs`.JobID ) ASC" % (sqlCmd, result['Value'])
       return S_OK({'found': False})
     return S_OK({'found': True, 'tqId': data[0][1], 'enabled': data[0][2], 'jobs': data[0][0]})
 
-  def matchAndGetJob(self, tqMatchDict, numJobsPerTry=50, numQueuesPerTry=10, negativeCond=None):
+  def matchAndGetJob(self, tqMatchDict, numJobsPerTry=50, numQueuesPerTry=10, negativeCond=None, tqIndex=None):
     """ Match a job based on requirements
 
         :param dict tqDefDict: dict for TQ definition
+        :param tqIndex: TaskQueueIndex to find the matching TQs instead of querying the DB
         :returns: S_OK() / S_ERROR
     """
     if negativeCond is None:
       negativeCond = {}
+    # The index works on the values before escaping
+    rawMatchDict = tqMatchDict
     # Make a copy to avoid modification of original if escaping needs to be done
     tqMatchDict = dict(tqMatchDict)
     retVal = self._checkMatchDefinition(tqMatchDict)
@@ -537,6 +539,10 @@ WHERE `tq_Jobs`.TQId = %s ORDER BY RAND() / `tq_Jobs`.RealPriority ASC LIMIT 1"
                                            skipMatchDictDef=True,
                                            connObj=connObj)
         preJobSQL = "%s AND `tq_Jobs`.JobId = %s " % (preJobSQL, tqMatchDict['JobID'])
+      elif tqIndex:
+        retVal = tqIndex.matchTaskQueues(rawMatchDict,
+                                         numQueuesToGet=numQueuesPerTry,
+                                         negativeCond=negativeCond)
       else:
         retVal = self.matchAndGetTaskQueue(tqMatchDict,
                                            numQueuesToGet=numQueuesPerTry,
@@ -586,6 +592,117 @@ WHERE `tq_Jobs`.TQId = %s ORDER BY RAND() / `tq_Jobs`.RealPriority ASC LIMIT 1"
     self.log.info("Could not find a match after %s match retries" % self.__maxMatchRetry)
     return S_ERROR("Could not find a match after %s match retries" % self.__maxMatchRetry)
 
+  def matchAndGetJobs(self, tqMatchDict, numJobs, numQueuesPerTry=10, negativeCond=None, tqIndex=None):
+    """ Match up to numJobs jobs based on requirements and take them out of the task queues
+
+        The candidate jobs are chosen in the matching TQs in the same random order weighted by
+        the priority than for matchAndGetJob, and extracted in a single transaction: the rows
+        still present are locked with SELECT ... FOR UPDATE and deleted together.
+
+        :param dict tqMatchDict: dict of the resource requirements
+        :param int numJobs: maximum number of jobs to extract
+        :param int numQueuesPerTry: number of matching TQs considered in each try
+        :param negativeCond: dict or list of dicts with the conditions to exclude
+        :param tqIndex: TaskQueueIndex to find the matching TQs instead of querying the DB
+        :returns: S_OK( { 'matchFound' : bool, 'jobs' : [ ( jobId, tqId ), ... ], 'tqMatch' : dict } ) / S_ERROR
+    """
+    if numJobs <= 1 or 'JobID' in tqMatchDict:
+      retVal = self.matchAndGetJob(tqMatchDict, numQueuesPerTry=numQueuesPerTry,
+                                   negativeCond=negativeCond, tqIndex=tqIndex)
+      if not retVal['OK']:
+        return retVal
+      matchDict = retVal['Value']
+      matchDict['jobs'] = [(matchDict.pop('jobId'), matchDict.pop('taskQueueId'))] if matchDict['matchFound'] else []
+      return S_OK(matchDict)
+
+    if negativeCond is None:
+      negativeCond = {}
+    rawMatchDict = tqMatchDict
+    tqMatchDict = dict(tqMatchDict)
+    retVal = self._checkMatchDefinition(tqMatchDict)
+    if not retVal['OK']:
+      self.log.error("TQ match request check failed", retVal['Message'])
+      return retVal
+    retVal = self._getConnection()
+    if not retVal['OK']:
+      return S_ERROR("Can't connect to DB: %s" % retVal['Message'])
+    connObj = retVal['Value']
+
+    jobTQList = []
+    triedTQs = set()
+    for _ in xrange(self.__maxMatchRetry):
+      if tqIndex:
+        retVal = tqIndex.matchTaskQueues(rawMatchDict,
+                                         numQueuesToGet=numQueuesPerTry,
+                                         negativeCond=negativeCond)
+      else:
+        retVal = self.matchAndGetTaskQueue(tqMatchDict,
+                                           numQueuesToGet=numQueuesPerTry,
+                                           skipMatchDictDef=True,
+                                           negativeCond=negativeCond,
+                                           connObj=connObj)
+      if not retVal['OK']:
+        return retVal
+      tqList = [tqData for tqData in retVal['Value'] if tqData[0] not in triedTQs]
+      if not tqList:
+        break
+      triedTQs.update(tqData[0] for tqData in tqList)
+      retVal = self.__extractJobsFromTaskQueues(tqList, numJobs - len(jobTQList), connObj)
+      if not retVal['OK']:
+        return retVal
+      jobTQList.extend(retVal['Value'])
+      if len(jobTQList) >= numJobs:
+        break
+
+    if not jobTQList:
+      self.log.info("No TQ matches requirements")
+    return S_OK({'matchFound': bool(jobTQList), 'jobs': jobTQList, 'tqMatch': tqMatchDict})
+
+  def __extractJobsFromTaskQueues(self, tqList, numJobs, connObj):
+    """ Take out up to numJobs jobs from the task queues in tqList, in a single transaction
+
+        :param list tqList: ( tqId, tqOwnerDN, tqOwnerGroup ) tuples in the matching order
+        :returns: S_OK( [ ( jobId, tqId ), ... ] ) / S_ERROR
+    """
+    candidateSQL = "SELECT `tq_Jobs`.JobId FROM `tq_Jobs` WHERE `tq_Jobs`.TQId = %s \
+ORDER BY RAND() / `tq_Jobs`.RealPriority ASC LIMIT %s"
+    retVal = self.transactionStart()
+    if not retVal['OK']:
+      return S_ERROR("Can't begin transaction for matching jobs: %s" % retVal['Message'])
+    jobTQList = []
+    for tqId, tqOwnerDN, tqOwnerGroup in tqList:
+      self.log.info("Trying to extract jobs from TQ", tqId)
+      retVal = self._query(candidateSQL, conn=connObj, args=[tqId, numJobs - len(jobTQList)])
+      if not retVal['OK']:
+        self.transactionRollback()
+        return S_ERROR("Can't retrieve candidate jobs for matching: %s" % retVal['Message'])
+      jobIds = [row[0] for row in retVal['Value']]
+      if jobIds:
+        # Only lock the candidates, the ones taken in the meantime are not returned anymore
+        retVal = self._query("SELECT JobId FROM `tq_Jobs` WHERE JobId IN %s FOR UPDATE", conn=connObj,
+                             args=[jobIds])
+        if not retVal['OK']:
+          self.transactionRollback()
+          return S_ERROR("Can't lock jobs for matching: %s" % retVal['Message'])
+        jobIds = [row[0] for row in retVal['Value']]
+      if jobIds:
+        retVal = self._update("DELETE FROM `tq_Jobs` WHERE JobId IN %s", conn=connObj, args=[jobIds])
+        if not retVal['OK']:
+          self.transactionRollback()
+          return S_ERROR("Could not take jobs out from the TQ %s: %s" % (tqId, retVal['Message']))
+        self.log.info("Extracted jobs from TQ", "%s : %s" % (tqId, len(jobIds)))
+        jobTQList.extend((jobId, tqId) for jobId in jobIds)
+      else:
+        self.log.info("Task queue seems to be empty, triggering a cleaning of", tqId)
+      self.__deleteTQWithDelay.add(tqId, 300, (tqId, tqOwnerDN, tqOwnerGroup))
+      if len(jobTQList) >= numJobs:
+        break
+    retVal = self.transactionCommit()
+    if not retVal['OK']:
+      self.transactionRollback()
+      return S_ERROR("Can't commit the extraction of matched jobs: %s" % retVal['Message'])
+    return S_OK(jobTQList)
+
   def matchAndGetTaskQueue(self, tqMatchDict, numQueuesToGet=1, skipMatchDictDef=False,
                            negativeCond=None, connObj=False):
     """ Get a queue that matches the requirements
@@ -932,8 +1049,7 @@ WHERE j.JobId = %s AND t.TQId = j.TQId" %
         return retVal
       connObj = retVal['Value']
 
-    jobString = ','.join([str(x) for x in jobIDs])
-    retVal = self._query('SELECT JobId,TQId FROM `tq_Jobs` WHERE JobId in (%s) ' % jobString, conn=connObj)
+    retVal = self._queryInChunks('SELECT JobId,TQId FROM `tq_Jobs` WHERE JobId in %s', [jobIDs], conn=connObj)
 
     if not retVal['OK']:
       return retVal
@@ -1052,6 +1168,40 @@ WHERE j.JobId = %s AND t.TQId = j.TQId" %
       return result
     return self.retrieveTaskQueues([tqTuple[0] for tqTuple in result['Value']])
 
+  def getTaskQueuePriorities(self):
+    """
+    Get the priorities of all the task queues
+    Return S_OK( { TQId : Priority } ) / S_ERROR
+    """
+    retVal = self._query("SELECT TQId, Priority FROM `tq_TaskQueues`")
+    if not retVal['OK']:
+      return retVal
+    return S_OK(dict((row[0], row[1]) for row in retVal['Value']))
+
+  def getTaskQueueDefinitions(self, tqIdList):
+    """
+    Get the definitions of some task queues, without the number of jobs they contain
+    Return S_OK( { TQId : tqDefDict } ) / S_ERROR
+    """
+    tqDefs = {}
+    if not tqIdList:
+      return S_OK(tqDefs)
+    tqIdList = [int(tqId) for tqId in tqIdList]
+    sqlCmd = "SELECT TQId, Priority, %s FROM `tq_TaskQueues` WHERE TQId IN %%s" % ", ".join(singleValueDefFields)
+    retVal = self._queryInChunks(sqlCmd, [tqIdList])
+    if not retVal['OK']:
+      return retVal
+    for record in retVal['Value']:
+      tqDefs[record[0]] = dict(zip(('Priority',) + singleValueDefFields, record[1:]))
+    for field in multiValueDefFields:
+      retVal = self._queryInChunks("SELECT TQId, Value FROM `tq_TQTo%s` WHERE TQId IN %%s" % field, [tqIdList])
+      if not retVal['OK']:
+        return retVal
+      for tqId, value in retVal['Value']:
+        if tqId in tqDefs:
+          tqDefs[tqId].setdefault(field, []).append(value)
+    return S_OK(tqDefs)
+
   def getNumTaskQueues(self):
     """
      Get the number of task queues in the system
@@ -1285,9 +1435,8 @@ FROM `tq_TaskQueues` t, `tq_Jobs` j WHERE "
 
     # Execute updates
     for prio in prioDict:
-      tqList = ", ".join([str(tqId) for tqId in prioDict[prio]])
-      updateSQL = "UPDATE `tq_TaskQueues` SET Priority=%.4f WHERE TQId in ( %s )" % (prio, tqList)
-      self._update(updateSQL, conn=connObj)
+      updateSQL = "UPDATE `tq_TaskQueues` SET Priority=%.4f WHERE TQId in %%s" % prio
+      self._updateInChunks(updateSQL, [prioDict[prio]], conn=connObj)
     return S_OK()
 
   @staticmethod
@@ -16,17 +16,24 @@ __RCSID__ = "$Id$"
 import time
 
 from DIRAC import S_OK, S_ERROR
-from DIRAC.Core.DISET.RequestHandler import RequestHandler
+from DIRAC.Core.DISET.RequestHandler import RequestHandler, getServiceOption
 from DIRAC.Core.Utilities import Time
+from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
+from DIRAC.FrameworkSystem.Client.MonitoringClient import gMonitor
 from DIRAC.ConfigurationSystem.Client.Helpers.Operations import Operations
 from DIRAC.WorkloadManagementSystem.DB.JobDB import JobDB
 from DIRAC.WorkloadManagementSystem.DB.ElasticJobDB import ElasticJobDB
 from DIRAC.WorkloadManagementSystem.DB.JobLoggingDB import JobLoggingDB
+from DIRAC.WorkloadManagementSystem.private.JobStateUpdateBuffer import JobStateUpdateBuffer
 
 # This is a global instance of the JobDB class
 jobDB = False
 logDB = False
 elasticJobDB = False
+# Where the updates are written: the DBs, or the buffer coalescing them if MaxUpdateStaleness is set
+updateBuffer = None
+jobUpdateDB = False
+logUpdateDB = False
 
 JOB_FINAL_STATES = ['Done', 'Completed', 'Failed']
 
@@ -35,8 +42,25 @@ def initializeJobStateUpdateHandler(serviceInfo):
 
   global jobDB
   global logDB
+  global updateBuffer
+  global jobUpdateDB
+  global logUpdateDB
   jobDB = JobDB()
   logDB = JobLoggingDB()
+  jobUpdateDB = jobDB
+  logUpdateDB = logDB
+
+  maxStaleness = getServiceOption(serviceInfo, "MaxUpdateStaleness", 0)
+  if maxStaleness > 0:
+    updateBuffer = JobStateUpdateBuffer(jobDB, logDB,
+                                        maxUpdates=getServiceOption(serviceInfo, "MaxBufferedUpdates", 10000))
+    jobUpdateDB = updateBuffer
+    logUpdateDB = updateBuffer
+    gMonitor.registerActivity('flushTime', "Time to write the buffered job updates",
+                              'JobStateUpdate', "secs", gMonitor.OP_MEAN, 300)
+    gMonitor.registerActivity('flushedUpdates', "Buffered job updates written",
+                              'JobStateUpdate', "updates", gMonitor.OP_SUM, 300)
+    gThreadScheduler.addPeriodicTask(maxStaleness, updateBuffer.flush)
   return S_OK()
 
 
@@ -75,7 +99,7 @@ class JobStateUpdateHandler(RequestHandler):
     infoStr = None
     trials = 10
     for i in range(trials):
-      result = jobDB.getJobAttributes(jobID, ['Status'])
+      result = self.__getJobAttributes(jobID, ['Status'])
       if not result['OK']:
         return result
       if not result['Value']:
@@ -120,19 +144,29 @@ class JobStateUpdateHandler(RequestHandler):
       self.__setJobStatus(int(jobID), status, minorStatus, source, datetime)
     return S_OK()
 
+  @staticmethod
+  def __getJobAttributes(jobID, attrList):
+    """ Get job attributes from the JobDB, including the values not written yet by the buffer """
+    result = jobDB.getJobAttributes(jobID, attrList)
+    if not result['OK'] or not result['Value'] or not updateBuffer:
+      return result
+    pendingDict = updateBuffer.getPendingAttributes(jobID)
+    result['Value'].update((name, pendingDict[name]) for name in attrList if name in pendingDict)
+    return result
+
   def __setJobStatus(self, jobID, status, minorStatus, source, datetime):
     """ update the job status. """
-    result = jobDB.setJobStatus(jobID, status, minorStatus)
+    result = jobUpdateDB.setJobStatus(jobID, status, minorStatus)
     if not result['OK']:
       return result
 
     if status in JOB_FINAL_STATES:
-      result = jobDB.setEndExecTime(jobID)
+      result = jobUpdateDB.setEndExecTime(jobID)
 
     if status == 'Running' and minorStatus == 'Application':
-      result = jobDB.setStartExecTime(jobID)
+      result = jobUpdateDB.setStartExecTime(jobID)
 
-    result = jobDB.getJobAttributes(jobID, ['Status', 'MinorStatus'])
+    result = self.__getJobAttributes(jobID, ['Status', 'MinorStatus'])
     if not result['OK']:
       return result
     if not result['Value']:
@@ -141,9 +175,9 @@ class JobStateUpdateHandler(RequestHandler):
     status = result['Value']['Status']
     minorStatus = result['Value']['MinorStatus']
     if datetime:
-      result = logDB.addLoggingRecord(jobID, status, minorStatus, datetime, source)
+      result = logUpdateDB.addLoggingRecord(jobID, status, minorStatus, datetime, source)
     else:
-      result = logDB.addLoggingRecord(jobID, status, minorStatus, source=source)
+      result = logUpdateDB.addLoggingRecord(jobID, status, minorStatus, source=source)
     return result
 
   ###########################################################################
@@ -165,7 +199,7 @@ class JobStateUpdateHandler(RequestHandler):
     startFlag = ''
     jobID = int(jobID)
 
-    result = jobDB.getJobAttributes(jobID, ['Status'])
+    result = self.__getJobAttributes(jobID, ['Status'])
     if not result['OK']:
       return result
 
@@ -218,14 +252,14 @@ class JobStateUpdateHandler(RequestHandler):
     if appCounter:
       attrNames.append('ApplicationCounter')
       attrValues.append(appCounter)
-    result = jobDB.setJobAttributes(jobID, attrNames, attrValues, update=True)
+    result = jobUpdateDB.setJobAttributes(jobID, attrNames, attrValues, update=True)
     if not result['OK']:
       return result
 
     if endDate:
-      result = jobDB.setEndExecTime(jobID, endDate)
+      result = jobUpdateDB.setEndExecTime(jobID, endDate)
     if startDate:
-      result = jobDB.setStartExecTime(jobID, startDate)
+      result = jobUpdateDB.setStartExecTime(jobID, startDate)
 
     # Update the JobLoggingDB records
     for date in dates:
@@ -240,7 +274,7 @@ class JobStateUpdateHandler(RequestHandler):
       if not application:
         application = 'idem'
       source = sDict['Source']
-      result = logDB.addLoggingRecord(jobID, status, minor, application, date, source)
+      result = logUpdateDB.addLoggingRecord(jobID, status, minor, application, date, source)
       if not result['OK']:
         return result
 
@@ -252,7 +286,7 @@ class JobStateUpdateHandler(RequestHandler):
   def export_setJobSite(self, jobID, site):
     """Allows the site attribute to be set for a job specified by its jobID.
     """
-    result = jobDB.setJobAttribute(int(jobID), 'Site', site)
+    result = jobUpdateDB.setJobAttribute(int(jobID), 'Site', site)
     return result
 
   ###########################################################################
@@ -261,7 +295,7 @@ class JobStateUpdateHandler(RequestHandler):
   def export_setJobFlag(self, jobID, flag):
     """ Set job flag for job with jobID
     """
-    result = jobDB.setJobAttribute(int(jobID), flag, 'True')
+    result = jobUpdateDB.setJobAttribute(int(jobID), flag, 'True')
     return result
 
   ###########################################################################
@@ -270,7 +304,7 @@ class JobStateUpdateHandler(RequestHandler):
   def export_unsetJobFlag(self, jobID, flag):
     """ Unset job flag for job with jobID
     """
-    result = jobDB.setJobAttribute(int(jobID), flag, 'False')
+    result = jobUpdateDB.setJobAttribute(int(jobID), flag, 'False')
     return result
 
   ###########################################################################
@@ -280,7 +314,7 @@ class JobStateUpdateHandler(RequestHandler):
     """ Set the application status for job specified by its JobId.
     """
 
-    result = jobDB.getJobAttributes(int(jobID), ['Status', 'MinorStatus'])
+    result = self.__getJobAttributes(int(jobID), ['Status', 'MinorStatus'])
     if not result['OK']:
       return result
 
@@ -295,11 +329,11 @@ class JobStateUpdateHandler(RequestHandler):
       newStatus = status
     minorStatus = result['Value']['MinorStatus']
 
-    result = jobDB.setJobStatus(int(jobID), status=newStatus, minor=minorStatus, application=appStatus)
+    result = jobUpdateDB.setJobStatus(int(jobID), status=newStatus, minor=minorStatus, application=appStatus)
     if not result['OK']:
       return result
 
-    result = logDB.addLoggingRecord(int(jobID), newStatus, minorStatus, appStatus, source=source)
+    result = logUpdateDB.addLoggingRecord(int(jobID), newStatus, minorStatus, appStatus, source=source)
     return result
 
   ###########################################################################
@@ -313,7 +347,7 @@ class JobStateUpdateHandler(RequestHandler):
     if elasticJobDB:
       return elasticJobDB.setJobParameter(int(jobID), name, value)
 
-    return jobDB.setJobParameter(int(jobID), name, value)
+    return jobUpdateDB.setJobParameter(int(jobID), name, value)
 
   ###########################################################################
   types_setJobsParameter = [dict]
@@ -332,9 +366,9 @@ class JobStateUpdateHandler(RequestHandler):
           self.log.error('Failed to add Job Parameter to elasticJobDB', res['Message'])
 
       else:
-        res = jobDB.setJobParameter(jobID,
-                                    str(jobsParameterDict[jobID][0]),
-                                    str(jobsParameterDict[jobID][1]))
+        res = jobUpdateDB.setJobParameter(jobID,
+                                          str(jobsParameterDict[jobID][0]),
+                                          str(jobsParameterDict[jobID][1]))
         if not res['OK']:
           self.log.error('Failed to add Job Parameter to MySQL', res['Message'])
 
@@ -348,7 +382,7 @@ class JobStateUpdateHandler(RequestHandler):
         for job specified by its JobId
     """
 
-    result = jobDB.setJobParameters(int(jobID), parameters)
+    result = jobUpdateDB.setJobParameters(int(jobID), parameters)
     if not result['OK']:
       return S_ERROR('Failed to store some of the parameters')
 
@@ -361,12 +395,12 @@ class JobStateUpdateHandler(RequestHandler):
     """ Send a heart beat sign of life for a job jobID
     """
 
-    result = jobDB.setHeartBeatData(int(jobID), staticData, dynamicData)
+    result = jobUpdateDB.setHeartBeatData(int(jobID), staticData, dynamicData)
     if not result['OK']:
       self.log.warn('Failed to set the heart beat data', 'for job %d ' % int(jobID))
 
     # Restore the Running status if necessary
-    result = jobDB.getJobAttributes(jobID, ['Status'])
+    result = self.__getJobAttributes(jobID, ['Status'])
     if not result['OK']:
      return result
 
@@ -375,7 +409,7 @@ class JobStateUpdateHandler(RequestHandler):
 
     status = result['Value']['Status']
     if status == "Stalled" or status == "Matched":
-     result = jobDB.setJobAttribute(jobID, 'Status', 'Running', True)
+     result = jobUpdateDB.setJobAttribute(jobID, 'Status', 'Running', True)
      if not result['OK']:
        self.log.warn('Failed to restore the job status to Running')
 
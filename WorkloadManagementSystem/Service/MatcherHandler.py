@@ -10,7 +10,7 @@ from DIRAC import gLogger, S_OK, S_ERROR
 
 from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
 from DIRAC.Core.Utilities.Decorators import deprecated
-from DIRAC.Core.DISET.RequestHandler import RequestHandler
+from DIRAC.Core.DISET.RequestHandler import RequestHandler, getServiceOption
 
 from DIRAC.FrameworkSystem.Client.MonitoringClient import gMonitor
 
@@ -21,10 +21,12 @@ from DIRAC.WorkloadManagementSystem.DB.PilotAgentsDB import PilotAgentsDB
 
 from DIRAC.WorkloadManagementSystem.Client.Matcher import Matcher
 from DIRAC.WorkloadManagementSystem.Client.Limiter import Limiter
+from DIRAC.WorkloadManagementSystem.private.TaskQueueIndex import TaskQueueIndex
 from DIRAC.ConfigurationSystem.Client.Helpers.Operations import Operations
 
 gJobDB = False
 gTaskQueueDB = False
+gTaskQueueIndex = None
 
 
 def initializeMatcherHandler(serviceInfo):
@@ -33,6 +35,7 @@ def initializeMatcherHandler(serviceInfo):
 
   global gJobDB
   global gTaskQueueDB
+  global gTaskQueueIndex
   global jlDB
   global pilotAgentsDB
 
@@ -54,6 +57,14 @@ def initializeMatcherHandler(serviceInfo):
   gThreadScheduler.addPeriodicTask(120, gTaskQueueDB.recalculateTQSharesForAll)
   gThreadScheduler.addPeriodicTask(60, sendNumTaskQueues)
 
+  if getServiceOption(serviceInfo, "UseTaskQueueIndex", False):
+    gTaskQueueIndex = TaskQueueIndex(gTaskQueueDB)
+    result = gTaskQueueIndex.refresh()
+    if not result['OK']:
+      return result
+    gThreadScheduler.addPeriodicTask(getServiceOption(serviceInfo, "TaskQueueIndexRefreshTime", 5),
+                                     refreshTaskQueueIndex)
+
   sendNumTaskQueues()
 
   return S_OK()
@@ -67,6 +78,12 @@ def sendNumTaskQueues():
     gLogger.error("Cannot get the number of task queues", result['Message'])
 
 
+def refreshTaskQueueIndex():
+  result = gTaskQueueIndex.refresh()
+  if not result['OK']:
+    gLogger.error("Cannot refresh the task queue index", result['Message'])
+
+
 class MatcherHandler(RequestHandler):
 
   def initialize(self):
@@ -89,7 +106,8 @@ class MatcherHandler(RequestHandler):
                         jobDB=gJobDB,
                         tqDB=gTaskQueueDB,
                         jlDB=jlDB,
-                        opsHelper=opsHelper)
+                        opsHelper=opsHelper,
+                        tqIndex=gTaskQueueIndex)
       result = matcher.selectJob(resourceDescription, credDict)
     except RuntimeError as rte:
       self.log.error("Error requesting job: ", rte)
@@ -103,6 +121,38 @@ class MatcherHandler(RequestHandler):
     # FIXME: This is correctly interpreted by the JobAgent, but DErrno should be used instead
     return S_ERROR("No match found")
 
+##############################################################################
+  types_requestJobs = [[basestring, dict], (int, long)]
+
+  def export_requestJobs(self, resourceDescription, numJobs):
+    """ Serve up to numJobs jobs in a single call to an agent filling several slots,
+        the highest priority ones matching the agent's site capacity
+
+        :return: S_OK( list of dictionaries as returned by requestJob ) / S_ERROR
+    """
+
+    resourceDescription['Setup'] = self.serviceInfoDict['clientSetup']
+    credDict = self.getRemoteCredentials()
+
+    try:
+      opsHelper = Operations(group=credDict['group'])
+      matcher = Matcher(pilotAgentsDB=pilotAgentsDB,
+                        jobDB=gJobDB,
+                        tqDB=gTaskQueueDB,
+                        jlDB=jlDB,
+                        opsHelper=opsHelper,
+                        tqIndex=gTaskQueueIndex)
+      result = matcher.selectJobs(resourceDescription, credDict, numJobs)
+    except RuntimeError as rte:
+      self.log.error("Error requesting jobs: ", rte)
+      return S_ERROR("Error requesting jobs")
+
+    gMonitor.addMark("matchesDone")
+    if result:
+      gMonitor.addMark("matchesOK", len(result))
+      return S_OK(result)
+    return S_ERROR("No match found")
+
 ##############################################################################
   types_getActiveTaskQueues = []
 
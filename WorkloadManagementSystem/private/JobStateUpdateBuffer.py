@@ -0,0 +1,231 @@
+""" Write coalescing of the job state updates received by the JobStateUpdate service
+
+    The status, attribute, parameter and heart beat updates of the jobs are kept in memory
+    for at most the configured staleness and flushed together: the attributes and parameters
+    set several times for the same job are merged so that only the last value is written,
+    and each table is updated with a few multi-row statements instead of one per update.
+"""
+
+__RCSID__ = "$Id$"
+
+import time
+import threading
+
+from DIRAC import gLogger, S_OK, S_ERROR
+from DIRAC.Core.Utilities import Time
+from DIRAC.Core.Utilities.DErrno import EWMSSUBM
+from DIRAC.FrameworkSystem.Client.MonitoringClient import gMonitor
+
+# As for JobDB.setStartExecTime and JobDB.setEndExecTime, the first value set is kept
+FIRST_VALUE_ATTRIBUTES = ('StartExecTime', 'EndExecTime')
+
+
+class JobStateUpdateBuffer(object):
+  """ Buffer of the pending job updates, flushed periodically and when it is full
+  """
+
+  def __init__(self, jobDB, logDB, maxUpdates=10000):
+    """ c'tor
+
+        :param jobDB: JobDB where the attributes, parameters and heart beat data are written
+        :param logDB: JobLoggingDB where the logging records are written
+        :param int maxUpdates: number of buffered updates triggering a flush
+    """
+    self.__jobDB = jobDB
+    self.__logDB = logDB
+    self.__maxUpdates = maxUpdates
+    self.__log = gLogger.getSubLogger("JobStateUpdateBuffer")
+    self.__lock = threading.Lock()
+    self.__flushLock = threading.Lock()
+    self.__attributes = {}
+    self.__parameters = {}
+    self.__heartBeatRecords = []
+    self.__loggingRecords = []
+    self.__numUpdates = 0
+    self.__firstUpdateTime = None
+    self.__stats = {'Flushes': 0, 'Updates': 0, 'MergedUpdates': 0, 'FailedFlushes': 0,
+                    'LastFlushTime': 0., 'MaxFlushTime': 0., 'MaxStaleness': 0.}
+
+  # The methods below have the same signatures as the JobDB and JobLoggingDB ones they replace
+
+  def setJobAttributes(self, jobID, attrNames, attrValues, update=False, myDate=None):
+    """ Buffer attribute values for a job, as JobDB.setJobAttributes (myDate is ignored,
+        the last value received is the one written)
+    """
+    for attrName in attrNames:
+      if attrName not in self.__jobDB.jobAttributeNames:
+        return S_ERROR(EWMSSUBM, 'Request to set non-existing job attribute')
+    attrDict = dict(zip(attrNames, attrValues))
+    if update:
+      attrDict['LastUpdateTime'] = str(Time.dateTime())
+    with self.__lock:
+      self.__mergeValues(self.__attributes, int(jobID), attrDict)
+    return self.__addedUpdates(1)
+
+  def setJobAttribute(self, jobID, attrName, attrValue, update=False, myDate=None):
+    """ Buffer an attribute value for a job, as JobDB.setJobAttribute
+    """
+    return self.setJobAttributes(jobID, [attrName], [attrValue], update=update, myDate=myDate)
+
+  def setJobStatus(self, jobID, status='', minor='', application=''):
+    """ Buffer the status of a job, as JobDB.setJobStatus
+    """
+    attrDict = {'Status': status, 'MinorStatus': minor, 'ApplicationStatus': application[:255]}
+    attrNames = [name for name in ('Status', 'MinorStatus', 'ApplicationStatus') if attrDict[name]]
+    return self.setJobAttributes(jobID, attrNames, [attrDict[name] for name in attrNames],
+                                 update=status != 'Stalled')
+
+  def setStartExecTime(self, jobID, startDate=None):
+    """ Buffer the StartExecTime of a job, as JobDB.setStartExecTime
+    """
+    return self.setJobAttribute(jobID, 'StartExecTime', startDate or str(Time.dateTime()))
+
+  def setEndExecTime(self, jobID, endDate=None):
+    """ Buffer the EndExecTime of a job, as JobDB.setEndExecTime
+    """
+    return self.setJobAttribute(jobID, 'EndExecTime', endDate or str(Time.dateTime()))
+
+  def setJobParameter(self, jobID, key, value):
+    """ Buffer a parameter for a job, as JobDB.setJobParameter
+    """
+    return self.setJobParameters(jobID, [(key, value)])
+
+  def setJobParameters(self, jobID, parameters):
+    """ Buffer parameters for a job, as JobDB.setJobParameters
+
+        :param list parameters: ( name, value ) tuples
+    """
+    with self.__lock:
+      self.__mergeValues(self.__parameters, int(jobID), dict(parameters))
+    return self.__addedUpdates(1)
+
+  def setHeartBeatData(self, jobID, staticDataDict, dynamicDataDict):
+    """ Buffer the heart beat data of a job, as JobDB.setHeartBeatData
+    """
+    now = str(Time.dateTime())
+    with self.__lock:
+      self.__mergeValues(self.__attributes, int(jobID), {'HeartBeatTime': now, 'Status': 'Running'})
+      if staticDataDict:
+        self.__mergeValues(self.__parameters, int(jobID), staticDataDict)
+      self.__heartBeatRecords.extend((int(jobID), key, value, now) for key, value in dynamicDataDict.items())
+    return self.__addedUpdates(1)
+
+  def addLoggingRecord(self, jobID, status='idem', minor='idem', application='idem', date='', source='Unknown'):
+    """ Buffer a logging record, as JobLoggingDB.addLoggingRecord. The time stamp of the
+        record is the time of the call if it is not given
+    """
+    if not date:
+      date = Time.dateTime()
+    with self.__lock:
+      self.__loggingRecords.append((int(jobID), status, minor, application, date, source))
+    return self.__addedUpdates(1)
+
+  def getPendingAttributes(self, jobID):
+    """ Get the attribute values of a job not written yet, to be applied on top of the ones
+        read from the JobDB
+    """
+    with self.__lock:
+      return dict(self.__attributes.get(int(jobID), {}))
+
+  def getStatistics(self):
+    """ Get the counters of the flushes and their time
+    """
+    with self.__lock:
+      stats = dict(self.__stats)
+      stats['PendingUpdates'] = self.__numUpdates
+    return S_OK(stats)
+
+  def __mergeValues(self, pendingDict, jobID, valueDict):
+    """ Merge the values of a job in the pending ones, must be called with the lock held
+    """
+    jobValues = pendingDict.setdefault(jobID, {})
+    for name, value in valueDict.items():
+      if name in jobValues:
+        self.__stats['MergedUpdates'] += 1
+        if pendingDict is self.__attributes and name in FIRST_VALUE_ATTRIBUTES:
+          continue
+      jobValues[name] = value
+
+  def __addedUpdates(self, numUpdates):
+    """ Count the buffered updates and flush if the buffer is full
+    """
+    with self.__lock:
+      if not self.__numUpdates:
+        self.__firstUpdateTime = time.time()
+      self.__numUpdates += numUpdates
+      full = self.__numUpdates >= self.__maxUpdates
+    if full:
+      return self.flush()
+    return S_OK()
+
+  def flush(self):
+    """ Write all the pending updates. The updates which could not be written are
+        kept for the next flush
+    """
+    with self.__flushLock:
+      with self.__lock:
+        if not self.__numUpdates:
+          return S_OK(0)
+        attributes, self.__attributes = self.__attributes, {}
+        parameters, self.__parameters = self.__parameters, {}
+        heartBeatRecords, self.__heartBeatRecords = self.__heartBeatRecords, []
+        loggingRecords, self.__loggingRecords = self.__loggingRecords, []
+        numUpdates, self.__numUpdates = self.__numUpdates, 0
+        staleness = time.time() - self.__firstUpdateTime
+
+      start = time.time()
+      failed = False
+      result = self.__jobDB.setJobAttributesBulk(attributes)
+      if not result['OK']:
+        self.__log.error("Failed to write the job attributes", result['Message'])
+        failed = True
+      else:
+        attributes = {}
+      result = self.__jobDB.setJobParametersBulk(parameters)
+      if not result['OK']:
+        self.__log.error("Failed to write the job parameters", result['Message'])
+        failed = True
+      else:
+        parameters = {}
+      result = self.__jobDB.addHeartBeatRecords(heartBeatRecords)
+      if not result['OK']:
+        self.__log.error("Failed to write the heart beat data", result['Message'])
+        failed = True
+      else:
+        heartBeatRecords = []
+      result = self.__logDB.addLoggingRecords(loggingRecords)
+      if not result['OK']:
+        self.__log.error("Failed to write the logging records", result['Message'])
+        failed = True
+      else:
+        loggingRecords = []
+      flushTime = time.time() - start
+
+      with self.__lock:
+        if failed:
+          # The values received in the meantime are more recent than the ones not written
+          for pendingDict, notWritten in ((self.__attributes, attributes), (self.__parameters, parameters)):
+            for jobID, valueDict in notWritten.items():
+              jobValues = pendingDict.setdefault(jobID, {})
+              for name, value in valueDict.items():
+                jobValues.setdefault(name, value)
+          self.__heartBeatRecords[:0] = heartBeatRecords
+          self.__loggingRecords[:0] = loggingRecords
+          if not self.__numUpdates:
+            self.__firstUpdateTime = time.time() - staleness
+          self.__numUpdates += numUpdates
+          self.__stats['FailedFlushes'] += 1
+        else:
+          self.__stats['Updates'] += numUpdates
+        self.__stats['Flushes'] += 1
+        self.__stats['LastFlushTime'] = flushTime
+        self.__stats['MaxFlushTime'] = max(self.__stats['MaxFlushTime'], flushTime)
+        self.__stats['MaxStaleness'] = max(self.__stats['MaxStaleness'], staleness + flushTime)
+
+    gMonitor.addMark('flushTime', flushTime)
+    gMonitor.addMark('flushedUpdates', 0 if failed else numUpdates)
+    self.__log.verbose("Flushed job updates", "%d updates in %.3f s, oldest one was %.3f s old" %
+                       (numUpdates, flushTime, staleness))
+    if failed:
+      return S_OK(0)
+    return S_OK(numUpdates)
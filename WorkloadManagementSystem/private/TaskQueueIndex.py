@@ -0,0 +1,313 @@
+""" In memory index of the task queue definitions, used by the Matcher to find the
+    task queues matching a resource without querying the TaskQueueDB
+
+    The definitions of the task queues never change once created, so the index is refreshed
+    incrementally: only the priorities of all the task queues and the definitions of the new
+    ones are read from the DB. The matching reproduces the conditions of the SQL generated
+    by TaskQueueDB (including the case insensitive comparisons of MySQL).
+"""
+
+__RCSID__ = "$Id$"
+
+import bisect
+import heapq
+import random
+import string
+import threading
+
+from DIRAC import gLogger, S_OK, S_ERROR
+from DIRAC.Core.Security import Properties
+from DIRAC.ConfigurationSystem.Client.Helpers import Registry
+from DIRAC.WorkloadManagementSystem.DB.TaskQueueDB import multiValueMatchFields, bannedJobMatchFields
+
+
+def _isAny(value):
+  """ Check if a match value means "anything" """
+  return value.lower().translate(None, string.punctuation) == 'any'
+
+
+def _toList(value):
+  if isinstance(value, (list, tuple)):
+    return value
+  return [value]
+
+
+def _lower(values):
+  return set(str(value).strip().lower() for value in values)
+
+
+class TaskQueueIndex(object):
+  """ Task queue definitions kept in memory, grouped by setup, owner, CPU time and
+      by the values of the multi value fields
+  """
+
+  def __init__(self, tqDB):
+    """ c'tor
+
+        :param tqDB: TaskQueueDB to read the task queues from
+    """
+    self.__tqDB = tqDB
+    self.__log = gLogger.getSubLogger("TaskQueueIndex")
+    self.__refreshLock = threading.Lock()
+    # All the lookup structures are replaced at once by refresh
+    self.__index = self.__buildIndex({})
+
+  @staticmethod
+  def __buildIndex(tqDefs):
+    """ Build the lookup structures for a dict of task queue definitions
+    """
+    index = {'TQs': tqDefs,
+             'Setup': {},
+             'OwnerGroup': {},
+             'Owner': {},
+             'CPUTime': {},
+             'BannedSites': {},
+             'Values': dict((field, {}) for field in multiValueMatchFields),
+             'NoValues': dict((field, set()) for field in multiValueMatchFields)}
+    for tqId, tqDef in tqDefs.iteritems():
+      index['Setup'].setdefault(tqDef['SetupKey'], set()).add(tqId)
+      index['OwnerGroup'].setdefault(tqDef['OwnerGroupKey'], set()).add(tqId)
+      index['Owner'].setdefault((tqDef['OwnerDNKey'], tqDef['OwnerGroupKey']), set()).add(tqId)
+      index['CPUTime'].setdefault(tqDef['CPUTime'], set()).add(tqId)
+      for site in tqDef['BannedSites']:
+        index['BannedSites'].setdefault(site, set()).add(tqId)
+      for field in multiValueMatchFields:
+        values = tqDef['%ss' % field]
+        if not values:
+          index['NoValues'][field].add(tqId)
+        for value in values:
+          index['Values'][field].setdefault(value, set()).add(tqId)
+    index['CPUSegments'] = sorted(index['CPUTime'])
+    return index
+
+  def refresh(self):
+    """ Synchronize the index with the TaskQueueDB
+
+        :return: S_OK(number of task queues)/S_ERROR
+    """
+    with self.__refreshLock:
+      result = self.__tqDB.getTaskQueuePriorities()
+      if not result['OK']:
+        return result
+      priorities = result['Value']
+      knownTQs = self.__index['TQs']
+      newTQIds = [tqId for tqId in priorities if tqId not in knownTQs]
+      newDefs = {}
+      if newTQIds:
+        result = self.__tqDB.getTaskQueueDefinitions(newTQIds)
+        if not result['OK']:
+          return result
+        newDefs = result['Value']
+      tqDefs = {}
+      for tqId, priority in priorities.iteritems():
+        if tqId in knownTQs:
+          tqDef = knownTQs[tqId]
+        elif tqId in newDefs:
+          tqDef = self.__normalizeDefinition(newDefs[tqId])
+        else:
+          # Deleted while reading the definitions
+          continue
+        if tqDef['Priority'] != priority:
+          tqDef = dict(tqDef)
+          tqDef['Priority'] = priority
+        tqDefs[tqId] = tqDef
+      if len(tqDefs) != len(knownTQs) or newDefs:
+        self.__log.verbose("Task queue index refreshed",
+                           "%d task queues, %d new" % (len(tqDefs), len(newDefs)))
+        self.__index = self.__buildIndex(tqDefs)
+      else:
+        self.__index = dict(self.__index, TQs=tqDefs)
+      return S_OK(len(tqDefs))
+
+  @staticmethod
+  def __normalizeDefinition(tqDef):
+    """ Task queue definition as used for matching
+    """
+    normDef = {'OwnerDN': tqDef['OwnerDN'],
+               'OwnerGroup': tqDef['OwnerGroup'],
+               'CPUTime': int(tqDef['CPUTime']),
+               'Priority': tqDef.get('Priority', 1)}
+    # Lower case keys for the comparisons
+    for field in ('OwnerDN', 'OwnerGroup', 'Setup'):
+      normDef['%sKey' % field] = tqDef[field].strip().lower()
+    for field in multiValueMatchFields:
+      normDef['%ss' % field] = frozenset(_lower(tqDef.get('%ss' % field, [])))
+    normDef['BannedSites'] = frozenset(_lower(tqDef.get('BannedSites', [])))
+    return normDef
+
+  def getNumTaskQueues(self):
+    return len(self.__index['TQs'])
+
+  def matchTaskQueues(self, tqMatchDict, numQueuesToGet=1, negativeCond=None):
+    """ Get the task queues that match a resource, as TaskQueueDB.matchAndGetTaskQueue
+
+        :param dict tqMatchDict: match definition (not escaped)
+        :param int numQueuesToGet: maximum number of task queues to return, 0 for all
+        :param negativeCond: dict or list of dicts of conditions the task queues must not fulfill
+        :return: S_OK(list of (TQId, OwnerDN, OwnerGroup)) ordered by weighted random priority
+    """
+    index = self.__index
+    tqDefs = index['TQs']
+
+    candidates = None
+    if 'Setup' in tqMatchDict:
+      candidates = self.__union(index['Setup'], _lower(_toList(tqMatchDict['Setup'])))
+    if 'CPUTime' in tqMatchDict:
+      maxCPUTime = max(int(cpuTime) for cpuTime in _toList(tqMatchDict['CPUTime']))
+      segments = index['CPUSegments'][:bisect.bisect_right(index['CPUSegments'], maxCPUTime)]
+      candidates = self.__intersect(candidates, self.__union(index['CPUTime'], segments))
+    candidates = self.__intersect(candidates, self.__ownerCandidates(index, tqMatchDict))
+
+    # Multi value fields other than tags: the TQ must not have any requirement or accept one of the values
+    for field in multiValueMatchFields:
+      if field == 'Tag' or not tqMatchDict.get(field):
+        continue
+      values = _toList(tqMatchDict[field])
+      if any(_isAny(value) for value in values):
+        continue
+      allowed = set(index['NoValues'][field])
+      allowed.update(self.__union(index['Values'][field], _lower(values)))
+      candidates = self.__intersect(candidates, allowed)
+
+    if candidates is None:
+      candidates = set(tqDefs)
+
+    result = self.__getTagConditions(tqMatchDict)
+    if not result['OK']:
+      return result
+    tags, requiredTags = result['Value']
+    if tags is not None:
+      # Only the task queues whose tags are all provided by the resource
+      allowed = set(index['NoValues']['Tag'])
+      allowed.update(tqId for tqId in self.__union(index['Values']['Tag'], tags)
+                     if tqDefs[tqId]['Tags'] <= tags)
+      candidates &= allowed
+    for tag in requiredTags:
+      candidates &= index['Values']['Tag'].get(tag, set())
+
+    # Task queues banning all the sites of the resource
+    if 'Site' in bannedJobMatchFields and tqMatchDict.get('Site'):
+      sites = _toList(tqMatchDict['Site'])
+      if not any(_isAny(site) for site in sites):
+        candidates -= self.__intersection(index['BannedSites'], _lower(sites))
+    # Task queues requiring all the values banned by the resource
+    for field in multiValueMatchFields:
+      values = tqMatchDict.get("Banned%s" % field)
+      if not values:
+        continue
+      values = _toList(values)
+      if any(_isAny(value) for value in values):
+        continue
+      candidates -= self.__intersection(index['Values'][field], _lower(values))
+
+    if negativeCond is None:
+      negativeCond = {}
+    if isinstance(negativeCond, dict):
+      negativeCond = [negativeCond] if negativeCond else []
+    if negativeCond:
+      candidates = [tqId for tqId in candidates
+                    if any(self.__checkNegativeCond(tqDefs[tqId], cond) for cond in negativeCond)]
+
+    # Same as ORDER BY RAND() / tq.Priority
+    rand = random.random
+    weighted = []
+    for tqId in candidates:
+      priority = tqDefs[tqId]['Priority']
+      weighted.append((rand() / priority if priority > 0 else float('inf'), tqId))
+    if numQueuesToGet:
+      weighted = heapq.nsmallest(numQueuesToGet, weighted)
+    else:
+      weighted.sort()
+    return S_OK([(tqId, tqDefs[tqId]['OwnerDN'], tqDefs[tqId]['OwnerGroup']) for _, tqId in weighted])
+
+  @staticmethod
+  def __intersection(valueIndex, values):
+    """ Task queues having all the values """
+    tqIds = None
+    for value in values:
+      valueTQIds = valueIndex.get(value, set())
+      tqIds = set(valueTQIds) if tqIds is None else tqIds & valueTQIds
+      if not tqIds:
+        break
+    return tqIds or set()
+
+  @staticmethod
+  def __union(valueIndex, values):
+    tqIds = set()
+    for value in values:
+      tqIds.update(valueIndex.get(value, ()))
+    return tqIds
+
+  @staticmethod
+  def __intersect(candidates, tqIds):
+    if tqIds is None:
+      return candidates
+    if candidates is None:
+      return set(tqIds)
+    return candidates & tqIds
+
+  def __ownerCandidates(self, index, tqMatchDict):
+    """ Task queues allowed by the OwnerDN/OwnerGroup of the match definition, None if any
+    """
+    if 'OwnerDN' in tqMatchDict and 'OwnerGroup' in tqMatchDict:
+      tqIds = set()
+      for group in _toList(tqMatchDict['OwnerGroup']):
+        if Properties.JOB_SHARING in Registry.getPropertiesForGroup(group):
+          tqIds.update(index['OwnerGroup'].get(group.strip().lower(), ()))
+        else:
+          for dn in _toList(tqMatchDict['OwnerDN']):
+            tqIds.update(index['Owner'].get((dn.strip().lower(), group.strip().lower()), ()))
+      return tqIds
+    tqIds = None
+    if 'OwnerGroup' in tqMatchDict:
+      tqIds = self.__union(index['OwnerGroup'], _lower(_toList(tqMatchDict['OwnerGroup'])))
+    if 'OwnerDN' in tqMatchDict:
+      dns = _lower(_toList(tqMatchDict['OwnerDN']))
+      tqIds = self.__intersect(tqIds, set(tqId for tqId, tqDef in index['TQs'].iteritems()
+                                          if tqDef['OwnerDNKey'] in dns))
+    return tqIds
+
+  @staticmethod
+  def __getTagConditions(tqMatchDict):
+    """ Tags the task queues can require (None if any) and tags they must all have
+    """
+    tagList = tqMatchDict.get('Tag')
+    if tagList is None and 'RequiredTag' not in tqMatchDict:
+      tagList = []
+    tagList = _toList(tagList) if tagList is not None else []
+    if 'Tag' in tqMatchDict or 'RequiredTag' not in tqMatchDict:
+      if any(_isAny(tag) for tag in tagList):
+        tags = None
+      elif tagList:
+        tags = _lower(tagList)
+      else:
+        # Only task queues not requiring any tag (an empty tag does not count)
+        tags = set([''])
+    else:
+      tags = None
+    requiredTags = _toList(tqMatchDict.get('RequiredTag', []))
+    if not requiredTags or any(_isAny(tag) for tag in requiredTags):
+      requiredTags = set()
+    elif not set(requiredTags).issubset(set(tagList)):
+      return S_ERROR('Wrong conditions')
+    else:
+      requiredTags = _lower(requiredTags)
+    return S_OK((tags, requiredTags))
+
+  @staticmethod
+  def __checkNegativeCond(tqDef, negativeCond):
+    """ True if the task queue is eligible according to one negative condition dict
+    """
+    if not negativeCond:
+      return False
+    for field, values in negativeCond.iteritems():
+      if field in multiValueMatchFields:
+        if not _lower(_toList(values)) & tqDef['%ss' % field]:
+          return True
+      elif field in ('OwnerDN', 'OwnerGroup', 'Setup'):
+        if any(str(value).strip().lower() != tqDef['%sKey' % field] for value in _toList(values)):
+          return True
+      elif field == 'CPUTime':
+        if any(int(value) != tqDef['CPUTime'] for value in _toList(values)):
+          return True
+    return False
@@ -0,0 +1,89 @@
+""" Test the coalescing of the job state updates
+"""
+
+# pylint: disable=redefined-outer-name
+
+import mock
+import pytest
+
+from DIRAC import S_OK, S_ERROR
+from DIRAC.WorkloadManagementSystem.private.JobStateUpdateBuffer import JobStateUpdateBuffer
+
+
+@pytest.fixture
+def dbs():
+  jobDB = mock.MagicMock()
+  jobDB.jobAttributeNames = ['JobID', 'Status', 'MinorStatus', 'ApplicationStatus', 'Site', 'StartExecTime',
+                             'LastUpdateTime', 'HeartBeatTime']
+  logDB = mock.MagicMock()
+  for method in (jobDB.setJobAttributesBulk, jobDB.setJobParametersBulk, jobDB.addHeartBeatRecords,
+                 logDB.addLoggingRecords):
+    method.return_value = S_OK(1)
+  return jobDB, logDB
+
+
+def test_merge(dbs):
+  jobDB, logDB = dbs
+  buf = JobStateUpdateBuffer(jobDB, logDB)
+  buf.setJobStatus(1, 'Running', 'Application')
+  buf.setStartExecTime(1, '2020-01-01 10:00:00')
+  buf.setJobStatus(1, 'Completed', 'Uploading')
+  buf.setStartExecTime(1, '2020-01-01 11:00:00')
+  buf.setJobParameter(1, 'CPU', '1')
+  buf.setJobParameters(1, [('CPU', '2'), ('Memory', '3')])
+  buf.setHeartBeatData(2, {'Node': 'wn1'}, {'LoadAverage': '0.5'})
+  buf.addLoggingRecord(1, 'Running', 'Application', source='JobWrapper')
+  buf.addLoggingRecord(1, 'Completed', 'Uploading', source='JobWrapper')
+
+  assert buf.getPendingAttributes(1)['Status'] == 'Completed'
+  assert buf.getPendingAttributes(2)['Status'] == 'Running'
+  assert buf.flush()['Value'] == 9
+
+  attributes = jobDB.setJobAttributesBulk.call_args[0][0]
+  assert attributes[1]['Status'] == 'Completed'
+  assert attributes[1]['MinorStatus'] == 'Uploading'
+  # The first StartExecTime is kept, as done by the JobDB
+  assert attributes[1]['StartExecTime'] == '2020-01-01 10:00:00'
+  assert 'LastUpdateTime' in attributes[1]
+  assert set(attributes[2]) == {'Status', 'HeartBeatTime'}
+  jobDB.setJobParametersBulk.assert_called_once_with({1: {'CPU': '2', 'Memory': '3'}, 2: {'Node': 'wn1'}})
+  assert [record[:3] for record in jobDB.addHeartBeatRecords.call_args[0][0]] == [(2, 'LoadAverage', '0.5')]
+  assert [record[1] for record in logDB.addLoggingRecords.call_args[0][0]] == ['Running', 'Completed']
+
+  # Nothing left to write
+  assert buf.getPendingAttributes(1) == {}
+  assert buf.flush()['Value'] == 0
+  assert jobDB.setJobAttributesBulk.call_count == 1
+  stats = buf.getStatistics()['Value']
+  assert stats['Flushes'] == 1
+  assert stats['Updates'] == 9
+  assert stats['MergedUpdates'] == 5
+
+
+def test_failedFlush(dbs):
+  jobDB, logDB = dbs
+  buf = JobStateUpdateBuffer(jobDB, logDB)
+  buf.setJobStatus(1, 'Running', 'Application')
+  buf.addLoggingRecord(1, 'Running', 'Application')
+  jobDB.setJobAttributesBulk.return_value = S_ERROR('DB down')
+  assert buf.flush()['Value'] == 0
+  # The logging record was written, the attributes are kept with the newer values received
+  assert logDB.addLoggingRecords.call_count == 1
+  buf.setJobStatus(1, 'Done', 'Execution Complete')
+  assert buf.getPendingAttributes(1)['Status'] == 'Done'
+  assert buf.getPendingAttributes(1)['MinorStatus'] == 'Execution Complete'
+
+  jobDB.setJobAttributesBulk.return_value = S_OK(1)
+  assert buf.flush()['Value'] == 3
+  assert jobDB.setJobAttributesBulk.call_args[0][0][1]['Status'] == 'Done'
+  assert buf.getStatistics()['Value']['FailedFlushes'] == 1
+
+
+def test_flushWhenFull(dbs):
+  jobDB, logDB = dbs
+  buf = JobStateUpdateBuffer(jobDB, logDB, maxUpdates=3)
+  for jobID in range(1, 4):
+    buf.setJobAttribute(jobID, 'Site', 'Site.A.ch')
+  assert set(jobDB.setJobAttributesBulk.call_args[0][0]) == {1, 2, 3}
+  assert buf.getStatistics()['Value']['PendingUpdates'] == 0
+  assert not buf.setJobAttribute(1, 'NotAnAttribute', 'True')['OK']
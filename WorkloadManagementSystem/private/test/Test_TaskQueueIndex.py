@@ -0,0 +1,85 @@
+""" Test the in memory matching of the task queues
+"""
+
+# pylint: disable=protected-access,redefined-outer-name
+
+import mock
+import pytest
+
+from DIRAC import S_OK
+from DIRAC.WorkloadManagementSystem.private.TaskQueueIndex import TaskQueueIndex
+
+TQ_DEFS = {1: {'OwnerDN': '/my/DN', 'OwnerGroup': 'user', 'Setup': 'aSetup', 'CPUTime': 3600, 'Priority': 1.},
+           2: {'OwnerDN': '/my/DN', 'OwnerGroup': 'user', 'Setup': 'aSetup', 'CPUTime': 86400, 'Priority': 1.,
+               'Sites': ['Site.A.ch'], 'Platforms': ['centos7']},
+           3: {'OwnerDN': '/other/DN', 'OwnerGroup': 'prod', 'Setup': 'aSetup', 'CPUTime': 3600, 'Priority': 2.,
+               'BannedSites': ['Site.B.fr'], 'Tags': ['MultiProcessor', '4Processors']},
+           4: {'OwnerDN': '/other/DN', 'OwnerGroup': 'prod', 'Setup': 'otherSetup', 'CPUTime': 360, 'Priority': 2.}}
+
+
+@pytest.fixture
+def tqIndex():
+  tqDB = mock.MagicMock()
+  tqDB.getTaskQueuePriorities.return_value = S_OK(dict((tqId, tqDef['Priority']) for tqId, tqDef in TQ_DEFS.items()))
+  tqDB.getTaskQueueDefinitions.side_effect = lambda tqIds: S_OK(dict((tqId, TQ_DEFS[tqId]) for tqId in tqIds))
+  index = TaskQueueIndex(tqDB)
+  assert index.refresh()['Value'] == 4
+  return index
+
+
+def matchedTQs(tqIndex, tqMatchDict, negativeCond=None):
+  result = tqIndex.matchTaskQueues(tqMatchDict, numQueuesToGet=0, negativeCond=negativeCond)
+  assert result['OK'], result['Message']
+  return set(tq[0] for tq in result['Value'])
+
+
+@pytest.mark.parametrize("tqMatchDict, expected", [
+    ({'Setup': 'aSetup', 'CPUTime': 100000}, {1, 2}),
+    ({'Setup': 'ASETUP', 'CPUTime': 3600}, {1}),
+    ({'Setup': 'aSetup', 'CPUTime': 100000, 'Site': 'Site.C.it'}, {1}),
+    ({'Setup': 'aSetup', 'CPUTime': 100000, 'Site': ['Site.A.ch', 'Site.C.it'], 'Platform': 'centos7'}, {1, 2}),
+    ({'Setup': 'aSetup', 'CPUTime': 100000, 'Site': 'Site.A.ch', 'Platform': 'slc6'}, {1}),
+    ({'Setup': 'aSetup', 'CPUTime': 100000, 'Tag': ['MultiProcessor', '4Processors', 'GPU']}, {1, 2, 3}),
+    ({'Setup': 'aSetup', 'CPUTime': 100000, 'Tag': ['MultiProcessor']}, {1, 2}),
+    ({'Setup': 'aSetup', 'CPUTime': 100000, 'Tag': 'Any', 'Site': 'Site.B.fr'}, {1}),
+    ({'Setup': 'aSetup', 'CPUTime': 100000, 'Tag': ['MultiProcessor', '4Processors'],
+      'RequiredTag': ['MultiProcessor']}, {3}),
+    ({'Setup': 'aSetup', 'CPUTime': 100000, 'Tag': ['MultiProcessor', '4Processors'], 'BannedSite': 'Site.B.fr'},
+     {1, 2, 3}),
+    ({'Setup': 'aSetup', 'CPUTime': 100000, 'BannedSite': ['Site.A.ch']}, {1}),
+    ({'Setup': 'aSetup', 'CPUTime': 100000, 'OwnerGroup': 'prod', 'Tag': 'any'}, {3}),
+    ({'Setup': ['aSetup', 'otherSetup'], 'CPUTime': 1000, 'OwnerDN': '/OTHER/DN', 'OwnerGroup': 'prod'}, {4}),
+])
+def test_match(tqIndex, tqMatchDict, expected):
+  with mock.patch("DIRAC.WorkloadManagementSystem.private.TaskQueueIndex.Registry.getPropertiesForGroup",
+                  return_value=[]):
+    assert matchedTQs(tqIndex, tqMatchDict) == expected
+
+
+def test_negativeCond(tqIndex):
+  tqMatchDict = {'Setup': 'aSetup', 'CPUTime': 100000, 'Tag': 'any'}
+  assert matchedTQs(tqIndex, tqMatchDict, {'Site': 'Site.A.ch'}) == {1, 3}
+  assert matchedTQs(tqIndex, tqMatchDict, {'OwnerGroup': ['user']}) == {3}
+  assert matchedTQs(tqIndex, tqMatchDict, [{'OwnerGroup': ['user']}, {'Platform': ['centos7']}]) == {1, 3}
+
+
+def test_wrongTags(tqIndex):
+  result = tqIndex.matchTaskQueues({'Setup': 'aSetup', 'CPUTime': 100, 'Tag': ['GPU'], 'RequiredTag': ['WholeNode']})
+  assert not result['OK']
+
+
+def test_refresh(tqIndex):
+  result = tqIndex.matchTaskQueues({'Setup': 'aSetup', 'CPUTime': 100000}, numQueuesToGet=1)
+  assert len(result['Value']) == 1
+  assert result['Value'][0][1:] == ('/my/DN', 'user')
+
+  # Task queue 1 deleted and 5 created
+  tqDB = tqIndex._TaskQueueIndex__tqDB
+  TQ_DEFS[5] = dict(TQ_DEFS[1], CPUTime=60)
+  tqDB.getTaskQueuePriorities.return_value = S_OK({2: 1., 3: 2., 4: 2., 5: 3.})
+  try:
+    assert tqIndex.refresh()['Value'] == 4
+  finally:
+    del TQ_DEFS[5]
+  tqDB.getTaskQueueDefinitions.assert_called_with([5])
+  assert matchedTQs(tqIndex, {'Setup': 'aSetup', 'CPUTime': 100000}) == {2, 5}
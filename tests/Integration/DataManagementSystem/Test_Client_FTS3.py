@@ -359,6 +359,59 @@ class TestClientFTS3(unittest.TestCase):
     filesToSubmit = op._getFilesToSubmit()
     self.assertEquals(filesToSubmit, [])
 
+  def test_05_bulk_monitoring(self):
+    """ The status of the files of several jobs are updated in bulk.
+        Only the files attached to the job, not in a final state and whose status changed are written.
+    """
+    db = FTS3DB()
+    opIDs = []
+    for jobGUID in ('05-bulk-job1', '05-bulk-job2'):
+      op = self.generateOperation('Transfer', 2, ['Target1'])
+      job = FTS3Job()
+      job.ftsGUID = jobGUID
+      job.ftsServer = 'fts3'
+      job.username = "Pink"
+      job.userGroup = "Floyd"
+      op.ftsJobs.append(job)
+      for ftsFile in op.ftsFiles:
+        ftsFile.ftsGUID = jobGUID
+      res = db.persistOperation(op)
+      self.assertTrue(res['OK'], res)
+      opIDs.append(res['Value'])
+
+    ops = [db.getOperation(opID)['Value'] for opID in opIDs]
+    file1ID, file2ID = sorted(ftsFile.fileID for ftsFile in ops[0].ftsFiles)
+    file3ID, file4ID = sorted(ftsFile.fileID for ftsFile in ops[1].ftsFiles)
+
+    fileStatusDict = {'05-bulk-job1': {file1ID: {'status': 'Finished', 'error': '', 'ftsGUID': None},
+                                       file2ID: {'status': 'Active', 'error': ''}},
+                      '05-bulk-job2': {file3ID: {'status': 'Active', 'error': ''},
+                                       # Not attached to this job
+                                       file1ID: {'status': 'Failed', 'error': 'Wrong job'}}}
+    res = db.updateFileStatusBulk(fileStatusDict)
+    self.assertTrue(res['OK'], res)
+    self.assertEqual(res['Value'], 3)
+
+    # Nothing changed, nothing is written
+    fileStatusDict['05-bulk-job1'].pop(file1ID)
+    res = db.updateFileStatusBulk(fileStatusDict)
+    self.assertTrue(res['OK'], res)
+    self.assertEqual(res['Value'], 0)
+
+    filesStatus = dict((ftsFile.fileID, (ftsFile.status, ftsFile.ftsGUID))
+                       for opID in opIDs for ftsFile in db.getOperation(opID)['Value'].ftsFiles)
+    self.assertEqual(filesStatus, {file1ID: ('Finished', None), file2ID: ('Active', '05-bulk-job1'),
+                                   file3ID: ('Active', '05-bulk-job2'), file4ID: ('New', '05-bulk-job2')})
+
+    jobIDs = [fts3Op.ftsJobs[0].jobID for fts3Op in ops]
+    res = db.updateJobStatusBulk({jobIDs[0]: {'status': 'Active', 'error': '', 'completeness': 50},
+                                  jobIDs[1]: {'status': 'Failed', 'error': 'Boom', 'completeness': 100}})
+    self.assertTrue(res['OK'], res)
+    jobs = [db.getOperation(opID)['Value'].ftsJobs[0] for opID in opIDs]
+    self.assertEqual([(ftsJob.status, ftsJob.error, ftsJob.completeness) for ftsJob in jobs],
+                     [('Active', None, 50), ('Failed', 'Boom', 100)])
+    self.assertTrue(all(ftsJob.lastMonitor for ftsJob in jobs))
+
   def _perf(self):
 
     db = FTS3DB()
@@ -219,6 +219,87 @@ class ReqDBMix(ReqDBTestCase):
     delete = db.deleteRequest(reqID)
     self.assertEqual(delete["OK"], True, delete['Message'] if 'Message' in delete else 'OK')
 
+  def test04ClaimRequests(self):
+    """ claim of the requests, in turn per owner and operation type """
+    db = RequestDB()
+
+    reqIDs = []
+    owners = {}
+    for i in xrange(40):
+      # A first owner has most of the requests, all of the same type
+      owner = "/DN/first" if i < 30 else "/DN/second"
+      request = Request({"RequestName": "claim-%d" % i, "OwnerDN": owner, "OwnerGroup": "group"})
+      op = Operation({"Type": "RemoveReplica" if i < 35 else "ReplicateAndRegister", "TargetSE": "CERN-USER"})
+      op += File({"LFN": "/a/b/claim/%d" % i})
+      request += op
+      put = db.putRequest(request)
+      self.assertEqual(put["OK"], True, put['Message'] if 'Message' in put else 'OK')
+      reqIDs.append(put['Value'])
+      owners[put['Value']] = owner
+
+    time.sleep(1)
+
+    # The groups (owner, operation type) are served in turn: the 6 oldest requests of each owner
+    # are the candidates, making 3 groups of 6, 5 and 1 requests
+    claim = db.claimRequests(6)
+    self.assertEqual(claim["OK"], True, claim['Message'] if 'Message' in claim else 'OK')
+    claimed = claim["Value"]
+    self.assertEqual(len(claimed), 6)
+    self.assertIn(sum(owners[reqID] == "/DN/first" for reqID in claimed), (2, 3))
+    self.assertIn("ReplicateAndRegister", [req[0].Type for req in claimed.values()])
+
+    # A request is claimed only once
+    claim = db.claimRequests(100)
+    self.assertEqual(claim["OK"], True, claim['Message'] if 'Message' in claim else 'OK')
+    self.assertFalse(set(claimed) & set(claim["Value"]))
+    self.assertEqual(len(claimed) + len(claim["Value"]), len(reqIDs))
+    self.assertEqual(db.claimRequests(10), {'OK': True, 'Value': {}})
+
+    for reqID in reqIDs:
+      delete = db.deleteRequest(reqID)
+      self.assertEqual(delete["OK"], True, delete['Message'] if 'Message' in delete else 'OK')
+
+  def test05RequestUpdates(self):
+    """ put of the changes of a request """
+    db = RequestDB()
+
+    request = Request({"RequestName": "updates"})
+    for i in xrange(2):
+      op = Operation({"Type": "ReplicateAndRegister", "TargetSE": "CERN-USER"})
+      for j in xrange(10):
+        op += File({"LFN": "/a/b/updates/%d/%d" % (i, j)})
+      request += op
+    put = db.putRequest(request)
+    self.assertEqual(put["OK"], True, put['Message'] if 'Message' in put else 'OK')
+    reqID = put['Value']
+
+    # The request as received by the clients
+    peek = db.peekRequest(reqID)
+    self.assertEqual(peek["OK"], True, peek['Message'] if 'Message' in peek else 'OK')
+    request = Request(peek["Value"].toJSON()["Value"])
+    for opFile in request[0]:
+      opFile.Status = "Done"
+    request[1][0].Attempt = 2
+    request[1][0].Error = "Some error"
+    changes = request.getChanges()["Value"]
+    self.assertEqual(len(changes["Files"]), 11)
+
+    put = db.putRequestUpdates(reqID, changes["Request"], changes["Operations"], changes["Files"])
+    self.assertEqual(put["OK"], True, put['Message'] if 'Message' in put else 'OK')
+    peek = db.peekRequest(reqID)
+    self.assertEqual(peek["OK"], True, peek['Message'] if 'Message' in peek else 'OK')
+    request = peek["Value"]
+    self.assertEqual([operation.Status for operation in request], ["Done", "Waiting"])
+    self.assertEqual([opFile.Status for opFile in request[0]], ["Done"] * 10)
+    self.assertEqual((request[1][0].Attempt, request[1][0].Error), (2, "Some error"))
+
+    # The files must belong to the operations of the request
+    put = db.putRequestUpdates(reqID, changes["Request"], changes["Operations"], {0: {"Status": "Done"}})
+    self.assertEqual(put["OK"], False)
+
+    delete = db.deleteRequest(reqID)
+    self.assertEqual(delete["OK"], True, delete['Message'] if 'Message' in delete else 'OK')
+
 
 if __name__ == '__main__':
   suite = unittest.defaultTestLoader.loadTestsFromTestCase(ReqDBTestCase)
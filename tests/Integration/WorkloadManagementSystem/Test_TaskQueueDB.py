@@ -985,3 +985,35 @@ def test_TQ():
 
   result = tqDB.deleteTaskQueueIfEmpty(tq)
   assert result['OK'] is True
+
+
+def test_matchAndGetJobs():
+  """ several jobs taken out of several task queues at once
+  """
+  tqDefDict = {'OwnerDN': '/my/DN', 'OwnerGroup': 'myGroup', 'Setup': 'aSetup', 'CPUTime': 50000}
+  for jobId in (201, 202, 203):
+    result = tqDB.insertJob(jobId, tqDefDict, 10)
+    assert result['OK'] is True
+  result = tqDB.insertJob(204, dict(tqDefDict, Sites=['Site_1']), 10)
+  assert result['OK'] is True
+
+  result = tqDB.matchAndGetJobs({'Setup': 'aSetup', 'CPUTime': 300000, 'Site': 'Site_1'}, 3)
+  assert result['OK'] is True
+  assert result['Value']['matchFound'] is True
+  jobs = dict(result['Value']['jobs'])
+  assert len(jobs) == 3
+  assert set(jobs) < {201, 202, 203, 204}
+
+  # Only the remaining job is left
+  result = tqDB.matchAndGetJobs({'Setup': 'aSetup', 'CPUTime': 300000, 'Site': 'Site_1'}, 3)
+  assert result['OK'] is True
+  assert len(result['Value']['jobs']) == 1
+  assert result['Value']['jobs'][0][0] not in jobs
+  jobs.update(result['Value']['jobs'])
+
+  result = tqDB.matchAndGetJobs({'Setup': 'aSetup', 'CPUTime': 300000, 'Site': 'Site_1'}, 3)
+  assert result['OK'] is True
+  assert result['Value']['matchFound'] is False
+  for tqId in set(jobs.values()):
+    result = tqDB.deleteTaskQueueIfEmpty(tqId)
+    assert result['OK'] is True
@@ -0,0 +1,134 @@
+"""
+Benchmark of the insertion of the records waiting in the IN table of a type of the AccountingDB.
+
+A backlog of Job records, as left by an outage, is inserted by slots of records, as the
+DataStore does with the records it loads from the IN table:
+
+  * one by one: each record is inserted in the type table, split in buckets written in a
+    transaction of its own, and deleted from the IN table,
+  * in bulk: the buckets of all the records of the slot are computed with array arithmetic, the
+    contributions to the same bucket are summed, and the slot is written with a few multi-row
+    statements in one transaction.
+
+The DB is replaced by a stub counting the statements and the rows they write. The time spent in
+the AccountingDB is measured, and the time the DB would take is estimated from a round trip time
+per statement and a time per row written.
+
+Usage::
+
+  python benchmark.py [nbRecords] [recordsPerSlot]
+"""
+
+from __future__ import print_function
+import sys
+import time
+import random
+
+import mock
+
+from DIRAC import S_OK, gLogger
+from DIRAC.AccountingSystem.Client.Types.Job import Job
+from DIRAC.AccountingSystem.DB import AccountingDB as AccountingDBModule
+
+# Time in seconds of the round trip of a statement, and of the write of a row
+ROUNDTRIP = 0.0003
+ROWTIME = 0.00002
+TYPENAME = 'Benchmark_Job'
+
+
+class StubDB(object):
+  """ Count the statements and the rows they write """
+
+  def __init__(self):
+    self.statements = 0
+    self.rows = 0
+
+  def query(self, cmd, conn=None, args=None):  # pylint: disable=unused-argument
+    self.statements += 1
+    if cmd.startswith('SELECT `id`'):
+      return S_OK(((random.randint(1, 1000),),))
+    return S_OK(())
+
+  def update(self, cmd, conn=None, args=None):  # pylint: disable=unused-argument
+    self.statements += 1
+    if cmd.startswith('INSERT') and args:
+      # Parametrised insert: as many rows as sets of values for the fields
+      self.rows += len(args) / (cmd.split('(', 1)[1].split(')', 1)[0].count('`') / 2)
+    elif cmd.startswith('INSERT'):
+      # Each row is written as ( value, ... ) and the values as (value*proportion)
+      self.rows += cmd.split('VALUES', 1)[1].count('( ')
+    elif cmd.startswith('DELETE'):
+      self.rows += 1
+    return S_OK(1)
+
+  def updateInChunks(self, cmd, args, conn=None):  # pylint: disable=unused-argument
+    self.statements += 1
+    self.rows += len(args[0])
+    return S_OK(len(args[0]))
+
+
+def createDB(bulkInsertion):
+  """ AccountingDB with the Job type, on the stub DB """
+  with mock.patch.object(AccountingDBModule.DB, '__init__'), \
+          mock.patch.object(AccountingDBModule, 'ThreadPool'), \
+          mock.patch.object(AccountingDBModule.AccountingDB, '_createTables', return_value=S_OK()), \
+          mock.patch.object(AccountingDBModule.AccountingDB, '_AccountingDB__loadCatalogFromDB'), \
+          mock.patch.object(AccountingDBModule.AccountingDB, '_AccountingDB__registerTypes'), \
+          mock.patch.object(AccountingDBModule.AccountingDB, 'getCSOption',
+                            side_effect=lambda option, default: bulkInsertion
+                            if option == 'BulkRecordInsertion' else default):
+    accountingDB = AccountingDBModule.AccountingDB()
+  accountingDB.log = gLogger.getSubLogger('AccountingDB')
+  definition = Job().getDefinition()
+  keyFields = [field[0] for field in definition[1]]
+  valueFields = [field[0] for field in definition[2]]
+  accountingDB._AccountingDB__addToCatalog(TYPENAME, keyFields, valueFields, sorted(definition[3]))
+  stub = StubDB()
+  accountingDB._query = stub.query
+  accountingDB._update = stub.update
+  accountingDB._updateInChunks = stub.updateInChunks
+  accountingDB._escapeString = lambda value: S_OK("'%s'" % value)
+  accountingDB._getConnection = lambda: S_OK(mock.MagicMock())
+  return accountingDB, stub
+
+
+def makeRecords(nbRecords):
+  """ Job records of the last days, of a few users, sites and statuses """
+  random.seed(0)
+  now = int(time.time())
+  records = []
+  for iD in xrange(nbRecords):
+    endTime = now - random.randint(0, 3 * 86400)
+    execTime = random.randint(60, 2 * 86400)
+    keys = ['user%d' % random.randint(0, 20), 'group', 'jobGroup%d' % random.randint(0, 50), 'User', 'Normal',
+            'processing', 'site%d' % random.randint(0, 30), 'Done', random.choice(['Execution Complete', 'Failed'])]
+    values = [execTime * 0.9, execTime * 10, execTime] + [random.randint(0, 10 ** 9) for _ in xrange(8)]
+    records.append((iD, TYPENAME, endTime - execTime, endTime, keys + values, now))
+  return records
+
+
+def runMode(bulkInsertion, records, recordsPerSlot):
+  """ Insert the records by slots, as the DataStore threads do """
+  accountingDB, stub = createDB(bulkInsertion)
+  start = time.time()
+  with mock.patch.object(AccountingDBModule, 'gMonitor'):
+    for slotStart in xrange(0, len(records), recordsPerSlot):
+      # The records are changed by the insertion one by one
+      slot = [record[:4] + (list(record[4]),) + record[5:] for record in records[slotStart:slotStart + recordsPerSlot]]
+      accountingDB._AccountingDB__insertFromINTable(slot)
+  return time.time() - start, stub.statements, stub.rows
+
+
+def runBenchmark(nbRecords=20000, recordsPerSlot=100):
+  gLogger.setLevel('FATAL')
+  records = makeRecords(nbRecords)
+  print("%d Job records inserted by slots of %d" % (nbRecords, recordsPerSlot))
+  for name, bulkInsertion in [('one by one', False), ('in bulk', True)]:
+    elapsed, statements, rows = runMode(bulkInsertion, records, recordsPerSlot)
+    dbTime = statements * ROUNDTRIP + rows * ROWTIME
+    print("  %-11s %6.1fs in AccountingDB  %7d statements  %7d rows written  estimated %6.1fs in the DB  "
+          "%6.0f records/s" % (name + ':', elapsed, statements, rows, dbTime, nbRecords / (elapsed + dbTime)))
+
+
+if __name__ == '__main__':
+  runBenchmark(*[int(arg) for arg in sys.argv[1:3]])
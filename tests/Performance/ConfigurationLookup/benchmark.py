@@ -0,0 +1,84 @@
+"""
+Benchmark of the option lookups done by gConfig.getValue on a large configuration.
+
+It compares the lookups served by the snapshot of the merged CFG with the walk of the
+CFG tree under the danger zone (what is done for any CFG other than the merged one),
+with several threads doing lookups at the same time.
+
+Usage::
+
+  python benchmark.py [nbThreads] [nbLookupsPerThread]
+"""
+
+from __future__ import print_function
+import sys
+import time
+import random
+import threading
+
+from DIRAC.Core.Utilities.CFG import CFG
+from DIRAC.ConfigurationSystem.private.ConfigurationData import ConfigurationData
+
+
+def buildConfigurationData(nbSites=500, nbSystems=20):
+  """ ConfigurationData with a remote CFG shaped like a production CS """
+  lines = ["DIRAC", "{", "  Setup = Production", "  Configuration", "  {", "    Version = 1", "  }", "}"]
+  lines += ["Resources", "{", "  Sites", "  {", "    LCG", "    {"]
+  for site in xrange(nbSites):
+    lines += ["      LCG.Site%d.org" % site, "      {", "        Name = Site%d" % site,
+              "        CE = ce%d.site%d.org" % (site, site), "        SE = SE%d-DST, SE%d-USER" % (site, site),
+              "        Country = c%d" % (site % 40), "      }"]
+  lines += ["    }", "  }", "}", "Systems", "{"]
+  for system in xrange(nbSystems):
+    lines += ["  System%d" % system, "  {", "    Production", "    {", "      Services", "      {"]
+    for service in xrange(10):
+      lines += ["        Service%d" % service, "        {", "          Port = %d" % (9100 + service),
+                "          LogLevel = INFO", "        }"]
+    lines += ["      }", "    }", "  }"]
+  lines += ["}"]
+  confData = ConfigurationData(False)
+  confData.loadRemoteCFGFromMem("\n".join(lines))
+  paths = ["/Resources/Sites/LCG/LCG.Site%d.org/%s" % (site, option)
+           for site in xrange(nbSites) for option in ('Name', 'CE', 'SE', 'Country')]
+  paths += ["/Systems/System%d/Production/Services/Service%d/%s" % (system, service, option)
+            for system in xrange(nbSystems) for service in xrange(10) for option in ('Port', 'LogLevel')]
+  paths += ["/Operations/Defaults/Missing%d" % i for i in xrange(100)]
+  return confData, paths
+
+
+def lookups(confData, paths, nbLookups, cfg):
+  """ Do nbLookups random option lookups """
+  rand = random.Random(1)
+  nbPaths = len(paths)
+  for _ in xrange(nbLookups):
+    confData.extractOptionFromCFG(paths[rand.randrange(nbPaths)], cfg)
+
+
+def timeThreads(confData, paths, nbThreads, nbLookups, cfg):
+  """ Time nbThreads threads each doing nbLookups lookups """
+  threads = [threading.Thread(target=lookups, args=(confData, paths, nbLookups, cfg)) for _ in xrange(nbThreads)]
+  start = time.time()
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  return time.time() - start
+
+
+def runBenchmark(nbThreads=8, nbLookups=50000):
+  confData, paths = buildConfigurationData()
+  # Same contents as the merged CFG but not the snapshot one: every lookup walks the tree
+  walkedCFG = CFG().loadFromBuffer(str(confData.mergedCFG))
+  for path in paths:
+    assert confData.extractOptionFromCFG(path) == confData.extractOptionFromCFG(path, walkedCFG)
+  total = nbThreads * nbLookups
+  print("%d paths, %d threads x %d lookups" % (len(paths), nbThreads, nbLookups))
+  for threads in sorted(set([1, nbThreads])):
+    walked = timeThreads(confData, paths, threads, total // threads, walkedCFG)
+    snapshot = timeThreads(confData, paths, threads, total // threads, False)
+    print("  %2d threads: walk %.0f lookups/s  snapshot %.0f lookups/s  speedup x%.1f" %
+          (threads, total / walked, total / snapshot, walked / snapshot))
+
+
+if __name__ == '__main__':
+  runBenchmark(*[int(arg) for arg in sys.argv[1:3]])
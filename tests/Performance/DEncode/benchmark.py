@@ -0,0 +1,95 @@
+"""
+Benchmark of the DEncode codec on payloads typical of DIRAC services.
+
+It compares the codec used by encode/decode with the reference per type functions
+(g_dEncodeFunctions/g_dDecodeFunctions), and measures the StreamDecoder fed in
+transport sized chunks.
+
+Usage::
+
+  python benchmark.py [nbEntries] [repeat]
+"""
+
+from __future__ import print_function
+import sys
+import time
+import datetime
+
+from DIRAC.Core.Utilities import DEncode
+
+
+def replicaPayload(nbEntries):
+  """ Reply of FileCatalog getReplicas: {Successful: {lfn: {se: pfn}}, Failed: {}} """
+  ses = ['CERN-DST-EOS', 'CNAF-DST', 'GRIDKA-DST', 'IN2P3-DST', 'PIC-DST', 'RAL-DST']
+  successful = {}
+  for i in xrange(nbEntries):
+    lfn = '/lhcb/LHCb/Collision18/DST/00071234/%04d/00071234_%08d_1.dst' % (i // 1000, i)
+    successful[lfn] = dict((se, 'root://%s.example.org//eos%s' % (se.lower(), lfn))
+                           for se in ses[i % 3:i % 3 + 3])
+  return {'OK': True, 'Value': {'Successful': successful, 'Failed': {}}}
+
+
+def jobAttributesPayload(nbEntries):
+  """ Reply of JobMonitoring getJobsSummary like calls: list of attribute lists """
+  now = datetime.datetime.utcnow().replace(microsecond=0)
+  records = []
+  for i in xrange(nbEntries):
+    records.append([i + 1000000, 'Running', 'Application', 'LCG.CERN.cern', 'lhcb_user',
+                    '/lhcb/user', 1, 2.5 * i, now, None, True])
+  return {'OK': True, 'Value': {'ParameterNames': ['JobID', 'Status', 'MinorStatus', 'Site', 'Owner',
+                                                   'OwnerGroup', 'UserPriority', 'CPUTime',
+                                                   'LastUpdateTime', 'RescheduleTime', 'Verified'],
+                                'Records': records}}
+
+
+def referenceEncode(uObject):
+  """ Encode with the per type functions """
+  eList = []
+  DEncode.g_dEncodeFunctions[type(uObject)](uObject, eList)
+  return "".join(eList)
+
+
+def referenceDecode(data):
+  """ Decode with the per type functions """
+  return DEncode.g_dDecodeFunctions[data[0]](data, 0)
+
+
+def streamDecode(data, chunkSize=16384):
+  """ Decode the data fed in chunks like BaseTransport does """
+  decoder = DEncode.StreamDecoder()
+  for index in xrange(0, len(data), chunkSize):
+    decoder.feed(data[index:index + chunkSize])
+  return decoder.getResult()
+
+
+def timeIt(func, arg, repeat):
+  """ Best time over repeat executions """
+  best = None
+  for _ in xrange(repeat):
+    start = time.time()
+    func(arg)
+    elapsed = time.time() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return best
+
+
+def runBenchmark(nbEntries=100000, repeat=3):
+  """ Run and print the benchmark for every payload """
+  for name, payload in (('replicas', replicaPayload(nbEntries)),
+                        ('jobAttributes', jobAttributesPayload(nbEntries))):
+    encoded = DEncode.encode(payload)
+    assert encoded == referenceEncode(payload)
+    assert DEncode.decode(encoded) == streamDecode(encoded)
+    print("%s: %d entries, %.1f MB" % (name, nbEntries, len(encoded) / 1024. / 1024.))
+    refEncode = timeIt(referenceEncode, payload, repeat)
+    newEncode = timeIt(DEncode.encode, payload, repeat)
+    print("  encode  reference %.3fs  fast %.3fs  speedup x%.2f" % (refEncode, newEncode, refEncode / newEncode))
+    refDecode = timeIt(referenceDecode, encoded, repeat)
+    newDecode = timeIt(DEncode.decode, encoded, repeat)
+    print("  decode  reference %.3fs  fast %.3fs  speedup x%.2f" % (refDecode, newDecode, refDecode / newDecode))
+    newStream = timeIt(streamDecode, encoded, repeat)
+    print("  stream  reference %.3fs  fast %.3fs  speedup x%.2f" % (refDecode, newStream, refDecode / newStream))
+
+
+if __name__ == '__main__':
+  runBenchmark(*[int(arg) for arg in sys.argv[1:3]])
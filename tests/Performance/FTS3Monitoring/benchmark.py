@@ -0,0 +1,234 @@
+"""
+Benchmark of the monitoring of the FTS3 jobs by the FTS3Agent, offline.
+
+The FTS server is replaced by MockFTS3Server, which keeps the state of the jobs in memory,
+makes their files progress at each query and answers each request after a fixed latency,
+standing for the round trip to a real server. It implements the single job query used by
+FTS3Job.monitor and the bulk query of the REST interface used by FTS3Job.monitorJobs.
+The FTS3DB tables are created in an SQLite DB, each statement and commit being delayed to
+stand for the round trip to the MySQL server.
+
+The same jobs are monitored with the per job mode and the bulk mode of the agent, and the
+number of jobs monitored per second and of DB statements are reported.
+
+Usage::
+
+  python benchmark.py [nbJobs] [nbFilesPerJob] [jobBulkSize] [maxThreads]
+"""
+
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import threading
+from multiprocessing.pool import ThreadPool
+
+import mock
+from sqlalchemy import create_engine, event
+
+from DIRAC import S_OK, gLogger
+from DIRAC.DataManagementSystem.Agent.FTS3Agent import FTS3Agent
+from DIRAC.DataManagementSystem.Client.FTS3File import FTS3File
+from DIRAC.DataManagementSystem.Client.FTS3Job import FTS3Job
+from DIRAC.DataManagementSystem.Client.FTS3Operation import FTS3TransferOperation
+from DIRAC.DataManagementSystem.DB import FTS3DB as FTS3DBModule
+from DIRAC.DataManagementSystem.private.FTS3Utilities import FTS3LinkModel
+
+# Latency in seconds of a request to the FTS server, and of a statement on the DB
+REQUESTLATENCY = 0.03
+STATEMENTLATENCY = 0.001
+# Probability for a file to move to the next state at each query
+PROGRESS = 0.2
+
+
+class MockFTS3Server(object):
+  """ In memory FTS server """
+
+  def __init__(self, seed=1):
+    self.jobs = {}
+    self.lock = threading.Lock()
+    self.random = random.Random(seed)
+    self.requests = 0
+
+  def addJob(self, ftsGUID, fileIDs):
+    self.jobs[ftsGUID] = {'job_id': ftsGUID, 'job_state': 'SUBMITTED', 'reason': '',
+                          'job_metadata': {'sourceSE': 'Source', 'targetSE': 'Target'},
+                          'files': [{'file_metadata': fileID, 'file_state': 'SUBMITTED', 'reason': '',
+                                     'filesize': 1000, 'tx_duration': 1} for fileID in fileIDs]}
+
+  def __progress(self, job):
+    """ Move some of the files to the next state, and compute the state of the job """
+    for fileDict in job['files']:
+      if fileDict['file_state'] in ('FINISHED', 'FAILED') or self.random.random() > PROGRESS:
+        continue
+      if fileDict['file_state'] == 'SUBMITTED':
+        fileDict['file_state'] = 'ACTIVE'
+      elif self.random.random() < 0.9:
+        fileDict['file_state'] = 'FINISHED'
+      else:
+        fileDict['file_state'] = 'FAILED'
+        fileDict['reason'] = 'Transfer failed'
+    states = set(fileDict['file_state'] for fileDict in job['files'])
+    if states <= set(['FINISHED']):
+      job['job_state'] = 'FINISHED'
+    elif states <= set(['FINISHED', 'FAILED']):
+      job['job_state'] = 'FINISHEDDIRTY' if 'FINISHED' in states else 'FAILED'
+    elif 'ACTIVE' in states:
+      job['job_state'] = 'ACTIVE'
+
+  def query(self, ftsGUIDs):
+    """ Returns the status of the jobs, after the latency of a request """
+    time.sleep(REQUESTLATENCY)
+    with self.lock:
+      self.requests += 1
+      statuses = []
+      for ftsGUID in ftsGUIDs:
+        job = self.jobs.get(ftsGUID)
+        if not job:
+          statuses.append({'job_id': ftsGUID, 'http_status': '404 Not Found'})
+          continue
+        self.__progress(job)
+        statuses.append(json.loads(json.dumps(job)))
+      return statuses
+
+  # Interface of fts3.rest.client.easy used by FTS3Job
+
+  def get_job_status(self, _context, ftsGUID, list_files=False):
+    return self.query([ftsGUID])[0]
+
+
+class MockContext(object):
+  """ Context of the REST client, sending the requests to the mock server """
+
+  def __init__(self, server):
+    self.server = server
+
+  def get(self, path):
+    # /jobs/<id1>,<id2>?files=<fields>
+    ftsGUIDs = path.split('?')[0][len('/jobs/'):].split(',')
+    statuses = self.server.query(ftsGUIDs)
+    return json.dumps(statuses[0] if len(statuses) == 1 else statuses)
+
+
+def createDB(dbFile, counter):
+  """ FTS3DB on an SQLite DB, counting the statements """
+  engine = create_engine('sqlite:///%s' % dbFile, connect_args={'timeout': 60})
+
+  @event.listens_for(engine, 'connect')
+  def connect(dbapiConnection, _connectionRecord):
+    dbapiConnection.create_function('utc_timestamp', 0,
+                                    lambda: time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()))
+    # The latency of the MySQL server is simulated, not the one of the disk
+    dbapiConnection.execute('PRAGMA journal_mode=WAL')
+    dbapiConnection.execute('PRAGMA synchronous=OFF')
+
+  @event.listens_for(engine, 'before_cursor_execute')
+  def beforeExecute(*_args):
+    counter['statements'] += 1
+    time.sleep(STATEMENTLATENCY)
+
+  @event.listens_for(engine, 'commit')
+  def commit(_connection):
+    time.sleep(STATEMENTLATENCY)
+
+  fts3db = FTS3DBModule.FTS3DB.__new__(FTS3DBModule.FTS3DB)
+  fts3db.log = gLogger.getSubLogger('FTS3DB')
+  fts3db.engine = engine
+  FTS3DBModule.metadata.bind = engine
+  fts3db.dbSession = FTS3DBModule.sessionmaker(bind=engine)
+  return fts3db
+
+
+def fillDB(fts3db, server, nbJobs, nbFilesPerJob):
+  """ Create one operation per job, with the files assigned to the job """
+  fts3db.createTables()
+  session = fts3db.dbSession()
+  for jobNumber in xrange(nbJobs):
+    operation = FTS3TransferOperation()
+    operation.username = 'user'
+    operation.userGroup = 'group'
+    ftsJob = FTS3Job()
+    ftsJob.ftsGUID = 'job-%d' % jobNumber
+    ftsJob.ftsServer = 'https://fts.example.org:8446'
+    ftsJob.username = 'user'
+    ftsJob.userGroup = 'group'
+    operation.ftsJobs.append(ftsJob)
+    for fileNumber in xrange(nbFilesPerJob):
+      ftsFile = FTS3File()
+      ftsFile.lfn = '/vo/file%d_%d' % (jobNumber, fileNumber)
+      ftsFile.targetSE = 'Target'
+      ftsFile.ftsGUID = ftsJob.ftsGUID
+      ftsFile.status = 'Submitted'
+      operation.ftsFiles.append(ftsFile)
+    session.add(operation)
+  session.commit()
+  for ftsGUID, fileID in session.query(FTS3File.ftsGUID, FTS3File.fileID):
+    server.jobs.setdefault(ftsGUID, []).append(fileID)
+  session.close()
+  for ftsGUID, fileIDs in server.jobs.items():
+    server.addJob(ftsGUID, fileIDs)
+
+
+def runMode(bulkMonitoring, nbJobs, nbFilesPerJob, jobBulkSize, maxThreads):
+  """ Monitor the jobs until they are all in a final state """
+  tmpDir = tempfile.mkdtemp()
+  counter = {'statements': 0}
+  server = MockFTS3Server()
+  try:
+    fts3db = createDB(os.path.join(tmpDir, 'FTS3DB.sqlite'), counter)
+    fillDB(fts3db, server, nbJobs, nbFilesPerJob)
+
+    agent = FTS3Agent.__new__(FTS3Agent)
+    agent.fts3db = fts3db
+    agent._globalContextCache = {}
+    agent._linkModel = FTS3LinkModel()
+    agent.assignmentTag = 'benchmark'
+    agent.jobBulkSize = jobBulkSize
+    agent.bulkMonitoring = bulkMonitoring
+    agent.monitoringBulkSize = jobBulkSize
+    agent.jobsThreadPool = ThreadPool(maxThreads)
+
+    counter['statements'] = 0
+    monitored = 0
+    start = time.time()
+    with mock.patch('DIRAC.DataManagementSystem.Client.FTS3Job.fts3', server), \
+        mock.patch.object(FTS3Agent, 'getFTS3Context', return_value=S_OK(MockContext(server))), \
+        mock.patch.object(FTS3Agent, '_FTS3Agent__sendAccounting'):
+      while True:
+        # Jobs to be monitored by the cycle, without assigning them
+        result = fts3db.getActiveJobs(limit=jobBulkSize, jobAssignmentTag=None)
+        if not result['Value']:
+          break
+        monitored += len(result['Value'])
+        agent.monitorJobsLoop()
+    elapsed = time.time() - start
+    agent.jobsThreadPool.close()
+
+    # The files are in the final state given by the server, and released from their job
+    session = fts3db.dbSession()
+    fileStates = dict((fileDict['file_metadata'], fileDict['file_state'].capitalize())
+                      for job in server.jobs.itervalues() for fileDict in job['files'])
+    for fileID, status, ftsGUID in session.query(FTS3File.fileID, FTS3File.status, FTS3File.ftsGUID):
+      assert (status, ftsGUID) == (fileStates[fileID], None), (fileID, status, ftsGUID)
+    session.close()
+    return elapsed, monitored, server.requests, counter['statements']
+  finally:
+    shutil.rmtree(tmpDir)
+
+
+def runBenchmark(nbJobs=400, nbFilesPerJob=20, jobBulkSize=100, maxThreads=10):
+  gLogger.setLevel('FATAL')
+  print("%d jobs of %d files, %d jobs per cycle, %d threads" % (nbJobs, nbFilesPerJob, jobBulkSize, maxThreads))
+  for name, bulkMonitoring in [('per job', False), ('bulk', True)]:
+    elapsed, monitored, requests, statements = runMode(bulkMonitoring, nbJobs, nbFilesPerJob,
+                                                       jobBulkSize, maxThreads)
+    print("  %-9s %.1fs  %.0f jobs monitored/s  %d FTS requests  %d DB statements" %
+          (name + ':', elapsed, monitored / elapsed, requests, statements))
+
+
+if __name__ == '__main__':
+  runBenchmark(*[int(arg) for arg in sys.argv[1:5]])
@@ -0,0 +1,117 @@
+"""
+Load benchmark of the task queue matching with synthetic pilots.
+
+By default synthetic task queues are generated in memory and the benchmark measures the
+matches per second of the TaskQueueIndex. With the "db" argument it uses the TaskQueueDB
+defined in the local configuration and compares TaskQueueDB.matchAndGetTaskQueue with the
+index built from the same DB, for the same synthetic pilots.
+
+Usage::
+
+  python benchmark.py [nbTaskQueues] [nbPilots] [nbThreads]
+  python benchmark.py db [nbPilots] [nbThreads]
+"""
+
+from __future__ import print_function
+import sys
+import time
+import random
+import threading
+
+from DIRAC import S_OK
+from DIRAC.WorkloadManagementSystem.private.TaskQueueIndex import TaskQueueIndex
+
+SITES = ['LCG.Site%d.org' % i for i in xrange(100)]
+PLATFORMS = ['x86_64-slc6', 'x86_64-centos7', 'x86_64-el9']
+TAGS = ['MultiProcessor', '2Processors', '4Processors', '8Processors', 'GPU', 'WholeNode']
+GROUPS = ['prod', 'user', 'mc', 'sgm']
+CPU_SEGMENTS = [360, 1800, 3600, 6 * 3600, 12 * 3600, 86400, 2 * 86400, 3 * 86400]
+
+
+class SyntheticTaskQueues(object):
+  """ Provides the methods of TaskQueueDB used by TaskQueueIndex """
+
+  def __init__(self, nbTaskQueues):
+    rand = random.Random(1)
+    self.tqDefs = {}
+    for tqId in xrange(1, nbTaskQueues + 1):
+      group = rand.choice(GROUPS)
+      tqDef = {'OwnerDN': '/DC=org/CN=user%d' % rand.randrange(200), 'OwnerGroup': group, 'Setup': 'Production',
+               'CPUTime': rand.choice(CPU_SEGMENTS), 'Priority': rand.uniform(0.1, 10)}
+      if rand.random() < 0.3:
+        tqDef['Sites'] = rand.sample(SITES, rand.randint(1, 5))
+      if rand.random() < 0.2:
+        tqDef['BannedSites'] = rand.sample(SITES, rand.randint(1, 3))
+      if rand.random() < 0.5:
+        tqDef['Platforms'] = rand.sample(PLATFORMS, rand.randint(1, 2))
+      if rand.random() < 0.2:
+        tqDef['Tags'] = rand.sample(TAGS, rand.randint(1, 2))
+      self.tqDefs[tqId] = tqDef
+
+  def getTaskQueuePriorities(self):
+    return S_OK(dict((tqId, tqDef['Priority']) for tqId, tqDef in self.tqDefs.iteritems()))
+
+  def getTaskQueueDefinitions(self, tqIdList):
+    return S_OK(dict((tqId, self.tqDefs[tqId]) for tqId in tqIdList))
+
+
+def syntheticPilots(nbPilots):
+  """ Resource descriptions like the ones built by Matcher._processResourceDescription """
+  rand = random.Random(2)
+  pilots = []
+  for _ in xrange(nbPilots):
+    pilot = {'Setup': 'Production', 'CPUTime': rand.choice(CPU_SEGMENTS) + 100,
+             'Site': rand.choice(SITES), 'Platform': rand.choice(PLATFORMS), 'OwnerGroup': GROUPS}
+    nProcessors = rand.choice([1, 1, 4, 8])
+    if nProcessors > 1:
+      pilot['Tag'] = ['MultiProcessor'] + ['%dProcessors' % n for n in xrange(2, nProcessors + 1)]
+    pilots.append(pilot)
+  return pilots
+
+
+def runPilots(matchFunc, pilots, nbThreads):
+  """ Match all the pilots from nbThreads threads, return the matches per second """
+  def worker(pilotSlice):
+    for pilot in pilotSlice:
+      result = matchFunc(pilot)
+      assert result['OK'], result['Message']
+
+  threads = [threading.Thread(target=worker, args=(pilots[i::nbThreads],)) for i in xrange(nbThreads)]
+  start = time.time()
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  return len(pilots) / (time.time() - start)
+
+
+def runBenchmark(args):
+  if args and args[0] == 'db':
+    from DIRAC.Core.Base.Script import parseCommandLine
+    parseCommandLine(ignoreErrors=True)
+    from DIRAC.WorkloadManagementSystem.DB.TaskQueueDB import TaskQueueDB
+    tqDB = TaskQueueDB()
+    nbPilots, nbThreads = [int(arg) for arg in args[1:3]] + [2000, 10][len(args[1:3]):]
+  else:
+    nbTaskQueues, nbPilots, nbThreads = [int(arg) for arg in args[:3]] + [2000, 20000, 10][len(args[:3]):]
+    tqDB = SyntheticTaskQueues(nbTaskQueues)
+  tqIndex = TaskQueueIndex(tqDB)
+  start = time.time()
+  result = tqIndex.refresh()
+  assert result['OK'], result['Message']
+  print("%d task queues indexed in %.3fs, %d pilots, %d threads" % (result['Value'], time.time() - start,
+                                                                    nbPilots, nbThreads))
+  pilots = syntheticPilots(nbPilots)
+  start = time.time()
+  tqIndex.refresh()
+  print("  incremental refresh %.4fs" % (time.time() - start))
+  indexRate = runPilots(lambda pilot: tqIndex.matchTaskQueues(pilot, numQueuesToGet=10), pilots, nbThreads)
+  print("  index: %.0f matches/s" % indexRate)
+  if isinstance(tqDB, SyntheticTaskQueues):
+    return
+  dbRate = runPilots(lambda pilot: tqDB.matchAndGetTaskQueue(pilot, numQueuesToGet=10), pilots, nbThreads)
+  print("  DB:    %.0f matches/s  (index speedup x%.1f)" % (dbRate, indexRate / dbRate))
+
+
+if __name__ == '__main__':
+  runBenchmark(sys.argv[1:])
@@ -0,0 +1,166 @@
+"""
+Benchmark of the directory metadata queries of the FileCatalog on a synthetic catalog.
+
+The directory tree and the metadata tables are generated in an SQLite DB in memory, following
+the usual production layout /vo/<Type>/<Year>/<Run>/<Stream>/<Chunk>: few types and years,
+runs of very different sizes, a data quality flag mostly 'Good' and a stream name defined
+at the lowest levels. The queries are evaluated with DirectoryMetadata, which plans them
+from the table statistics, and with the evaluation of each condition on the whole catalog
+followed by the intersection of the selected directories, as done before the planner.
+The SQL is run by SQLite, so only the ratios are meaningful.
+
+Usage::
+
+  python benchmark.py [nbRuns] [nbQueries]
+"""
+
+from __future__ import print_function
+import sys
+import time
+import random
+import sqlite3
+
+from DIRAC import S_OK
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.MetaQueryPlanner import MetaQueryPlanner
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryMetadata import DirectoryMetadata
+
+TYPES = ['MC', 'Data', 'Calibration']
+YEARS = range(2010, 2020)
+STREAMS = ['EW', 'Dimuon', 'Charm', 'Leptonic', 'Minibias', 'Radiative']
+QUALITIES = ['Good'] * 9 + ['Bad']
+
+
+class SyntheticCatalog(object):
+  """ Provides the methods of FileCatalogDB and of its directory tree used by DirectoryMetadata """
+
+  def __init__(self, nbRuns):
+    rand = random.Random(1)
+    self.conn = sqlite3.connect(':memory:')
+    self.conn.execute("CREATE TABLE FC_MetaFields (MetaName VARCHAR(64), MetaType VARCHAR(32))")
+    self.conn.execute("CREATE TABLE Dirs (DirID INTEGER PRIMARY KEY, Parent INTEGER)")
+    self.conn.execute("CREATE TABLE Closure (ParentID INTEGER, ChildID INTEGER, Depth INTEGER)")
+    self.conn.execute("CREATE INDEX ClosureParent ON Closure (ParentID, Depth)")
+    self.conn.execute("CREATE INDEX ClosureChild ON Closure (ChildID)")
+    self.metadata = {'Type': [], 'Year': [], 'Run': [], 'Quality': [], 'Stream': []}
+    for meta in self.metadata:
+      self.conn.execute("INSERT INTO FC_MetaFields VALUES (?, 'VARCHAR(128)')", (meta,))
+      self.conn.execute("CREATE TABLE FC_Meta_%s (DirID INTEGER PRIMARY KEY, Value VARCHAR(128))" % meta)
+      self.conn.execute("CREATE INDEX %sValue ON FC_Meta_%s (Value)" % (meta, meta))
+
+    self.nbDirs = 0
+    self.pathIDs = {}
+    voID = self.__addDir([])
+    run = 0
+    for typeName in TYPES:
+      typeID = self.__addDir([voID], 'Type', typeName)
+      for year in YEARS:
+        yearID = self.__addDir([voID, typeID], 'Year', year)
+        for _i in xrange(nbRuns // (len(TYPES) * len(YEARS))):
+          run += 1
+          runID = self.__addDir([voID, typeID, yearID], 'Run', run)
+          self.metadata['Quality'].append((runID, rand.choice(QUALITIES)))
+          # Few runs are much bigger than the others
+          for stream in rand.sample(STREAMS, min(len(STREAMS), int(rand.paretovariate(1.5)))):
+            streamID = self.__addDir([voID, typeID, yearID, runID], 'Stream', stream)
+            for _chunk in xrange(int(rand.paretovariate(1.2))):
+              self.__addDir([voID, typeID, yearID, runID, streamID])
+    for meta, rows in self.metadata.items():
+      self.conn.executemany("INSERT INTO FC_Meta_%s VALUES (?, ?)" % meta, rows)
+    self.nbRuns = run
+
+    self.metaQueryPlanner = MetaQueryPlanner(self)
+    self.dtree = self
+
+  def __addDir(self, parents, meta=None, value=None):
+    self.nbDirs += 1
+    dirID = self.nbDirs
+    pathIDs = parents + [dirID]
+    self.pathIDs[dirID] = pathIDs
+    self.conn.execute("INSERT INTO Dirs VALUES (?, ?)", (dirID, parents[-1] if parents else 0))
+    self.conn.executemany("INSERT INTO Closure VALUES (?, ?, ?)",
+                          [(parentID, dirID, len(pathIDs) - 1 - i) for i, parentID in enumerate(pathIDs)])
+    if meta:
+      self.metadata[meta].append((dirID, value))
+    return dirID
+
+  # FileCatalogDB
+
+  def _query(self, req, conn=None, args=None):
+    if 'information_schema.TABLES' in req:
+      return S_OK(tuple(('FC_Meta_%s' % meta, len(rows)) for meta, rows in self.metadata.items()))
+    if 'information_schema.STATISTICS' in req:
+      return S_OK(tuple(('FC_Meta_%s' % meta, 'Value', len(set(row[1] for row in rows)))
+                        for meta, rows in self.metadata.items()))
+    return S_OK(tuple(self.conn.execute(req.replace('%%', '%'), args or ()).fetchall()))
+
+  def _queryInChunks(self, req, args, conn=None):
+    rows = []
+    values = list(args[0])
+    for start in xrange(0, len(values), 500):
+      chunk = values[start:start + 500]
+      result = self._query(req.replace('%s', '(%s)' % ','.join(['?'] * len(chunk)), 1), conn, chunk)
+      rows.extend(result['Value'])
+    return S_OK(tuple(rows))
+
+  # Directory tree
+
+  @staticmethod
+  def getTreeTable():
+    return 'Dirs'
+
+  def getPathIDsByID(self, dirID):
+    return S_OK(self.pathIDs[dirID])
+
+  @staticmethod
+  def getSubdirectoriesByID(dirID, requestString=False, includeParent=False):
+    req = "SELECT ChildID AS DirID FROM Closure WHERE ParentID = %d" % dirID
+    if not includeParent:
+      req += " AND Depth != 0"
+    return S_OK(req)
+
+  def getAllSubdirectoriesByID(self, dirIDs):
+    result = self._queryInChunks("SELECT ChildID FROM Closure WHERE Depth > 0 AND ParentID IN %s", [dirIDs])
+    return S_OK([row[0] for row in result['Value']])
+
+
+def findDirIDsWithoutPlan(catalog, queryDict):
+  """ Evaluate each condition on the whole catalog and intersect the selected directories """
+  dirIDs = None
+  for meta, value in queryDict.items():
+    req = "SELECT DirID FROM FC_Meta_%s WHERE Value = ?" % meta
+    selected = [row[0] for row in catalog._query(req, args=(value,))['Value']]
+    selected += catalog.getAllSubdirectoriesByID(selected)['Value']
+    dirIDs = set(selected) if dirIDs is None else dirIDs & set(selected)
+  return dirIDs
+
+
+def runBenchmark(args):
+  nbRuns, nbQueries = [int(arg) for arg in args[:2]] + [3000, 50][len(args[:2]):]
+  start = time.time()
+  catalog = SyntheticCatalog(nbRuns)
+  print("%d directories, %d runs generated in %.1fs" % (catalog.nbDirs, catalog.nbRuns, time.time() - start))
+
+  rand = random.Random(2)
+  queries = []
+  for _i in xrange(nbQueries):
+    queries.append({'Type': rand.choice(TYPES), 'Quality': 'Good', 'Stream': rand.choice(STREAMS),
+                    'Run': rand.randint(1, catalog.nbRuns)})
+    queries.append({'Year': rand.choice(YEARS), 'Quality': 'Good', 'Stream': rand.choice(STREAMS)})
+
+  dmeta = DirectoryMetadata(catalog)
+  timings = {}
+  for name, function in [('without plan', lambda query: findDirIDsWithoutPlan(catalog, query)),
+                         ('planned', lambda query: set(dmeta.findDirIDsByMetadata(query, '/', {})['Value']))]:
+    start = time.time()
+    results = [function(query) for query in queries]
+    timings[name] = (time.time() - start) / len(queries)
+    if name == 'without plan':
+      expected = results
+    else:
+      assert results == expected
+    print("  %-13s %.4fs/query" % (name + ':', timings[name]))
+  print("  speedup x%.1f" % (timings['without plan'] / timings['planned']))
+
+
+if __name__ == '__main__':
+  runBenchmark(sys.argv[1:])
@@ -0,0 +1,72 @@
+"""
+Benchmark of the selections by long lists of values, it requires access to a MySQL DB.
+
+A table of nbRows rows is filled and selected by lists of nbValues string keys, comparing
+the condition built by buildCondition, where each value is escaped with a call to the server
+connection, with getFields, where the list is bound as the arguments of the query and split in
+chunks of MAXINLISTSIZE values.
+
+Usage::
+
+  python benchmark.py [nbRows] [nbValues] [nbQueries] [host] [user] [password] [db]
+"""
+
+from __future__ import print_function
+import sys
+import time
+
+from DIRAC.Core.Utilities.MySQL import MySQL
+
+TABLE = 'BenchmarkQueryBuilder'
+
+
+def fillTable(mysql, nbRows):
+  """ (Re)create the table and fill it with nbRows rows """
+  result = mysql._update('DROP TABLE IF EXISTS `%s`' % TABLE)
+  assert result['OK'], result['Message']
+  result = mysql._createTables({TABLE: {'Fields': {'ID': 'INTEGER NOT NULL AUTO_INCREMENT',
+                                                   'LFN': 'VARCHAR(255) NOT NULL',
+                                                   'Status': "VARCHAR(32) NOT NULL DEFAULT 'New'"},
+                                        'PrimaryKey': 'ID',
+                                        'UniqueIndexes': {'LFN': ['LFN']}}})
+  assert result['OK'], result['Message']
+  for start in xrange(0, nbRows, 1000):
+    rows = xrange(start, min(start + 1000, nbRows))
+    result = mysql._update('INSERT INTO `%s` (LFN) VALUES %s' % (TABLE, ','.join(['(%s)'] * len(rows))),
+                           args=['/vo/data/file_%d' % row for row in rows])
+    assert result['OK'], result['Message']
+
+
+def timeQueries(function, lfnLists):
+  """ Run the selection for all the lists, return the time per query """
+  start = time.time()
+  for lfns in lfnLists:
+    result = function(lfns)
+    assert result['OK'], result['Message']
+    assert len(result['Value']) == len(lfns)
+  return (time.time() - start) / len(lfnLists)
+
+
+def runBenchmark(args):
+  nbRows, nbValues, nbQueries = [int(arg) for arg in args[:3]] + [100000, 5000, 20][len(args[:3]):]
+  host, user, passwd, dbName = args[3:7] + ['127.0.0.1', 'Dirac', 'Dirac', 'AccountingDB'][len(args[3:7]):]
+  mysql = MySQL(host, user, passwd, dbName)
+  fillTable(mysql, nbRows)
+  step = max(1, nbRows // nbValues)
+  lfnLists = [['/vo/data/file_%d' % ((row + query) % nbRows) for row in xrange(0, nbRows, step)][:nbValues]
+              for query in xrange(nbQueries)]
+  print("%d rows, %d queries of %d values" % (nbRows, nbQueries, nbValues))
+
+  def escaped(lfns):
+    condition = mysql.buildCondition({'LFN': lfns})
+    return mysql._query('SELECT `ID`, `Status` FROM `%s` %s' % (TABLE, condition))
+
+  escapedTime = timeQueries(escaped, lfnLists)
+  boundTime = timeQueries(lambda lfns: mysql.getFields(TABLE, ['ID', 'Status'], {'LFN': lfns}), lfnLists)
+  print("  escaped values: %.4fs/query" % escapedTime)
+  print("  bound values:   %.4fs/query  (speedup x%.1f)" % (boundTime, escapedTime / boundTime))
+  mysql._update('DROP TABLE `%s`' % TABLE)
+
+
+if __name__ == '__main__':
+  runBenchmark(sys.argv[1:])
@@ -0,0 +1,136 @@
+"""
+Benchmark of the queries of a dashboard refreshing the plots of the last day of accounting data.
+
+The plots over time of the last 24 hours are refreshed every few minutes, each of them grouped by a
+different field, as done by the accounting pages of a web portal left open:
+
+  * without cache: each refresh queries the buckets of the whole window,
+  * with cache: the rows of the buckets over for more than the settle time (1 hour) are kept, and only the
+    buckets after them are queried.
+
+The DB is replaced by a stub returning the rows of the buckets within the time conditions of the queries,
+for a number of values of the grouping field. The time spent in the AccountingDB is measured, and the time the
+DB would take is estimated from a round trip time per query and a time per bucket row aggregated.
+The measured time includes the generation of the rows by the stub.
+
+Usage::
+
+  python benchmark.py [hours] [refreshMinutes] [groups]
+"""
+
+from __future__ import print_function
+import re
+import sys
+import time
+
+import mock
+
+from DIRAC import S_OK, gLogger
+from DIRAC.AccountingSystem.DB import AccountingDB as AccountingDBModule
+from DIRAC.AccountingSystem.private import BucketedDataCache as BucketedDataCacheModule
+
+# Time in seconds of the round trip of a query, and of the aggregation of a bucket row
+ROUNDTRIP = 0.0005
+ROWTIME = 0.00002
+# Bucket rows aggregated in each row returned: the records of the other key values
+ROWS_PER_GROUP = 20
+TYPENAME = 'Benchmark_Job'
+GROUPINGS = ['Site', 'User', 'UserGroup', 'FinalMajorStatus']
+
+
+class Clock(object):
+  """ Time of the simulation, in place of the Time utilities of the AccountingDB """
+
+  def __init__(self, now):
+    self.now = now
+
+  def dateTime(self):
+    return None
+
+  def toEpoch(self, _dateTime=None):
+    return float(self.now)
+
+  def time(self):
+    return float(self.now)
+
+
+class StubDB(object):
+  """ Rows of the buckets within the time conditions of the queries """
+
+  def __init__(self, groups):
+    self.groups = groups
+    self.queries = 0
+    self.rows = 0
+
+  def query(self, cmd, conn=None):  # pylint: disable=unused-argument
+    self.queries += 1
+    first = int(re.search(r"`startTime` >= (\d+)", cmd).group(1))
+    last = int(re.search(r"`startTime` <= (\d+)", cmd).group(1))
+    rows = tuple(('value%d' % group, bucketStart, 900, float(bucketStart % 1000 + group))
+                 for bucketStart in xrange(first, last + 1, 900)
+                 for group in xrange(self.groups))
+    self.rows += len(rows) * ROWS_PER_GROUP
+    return S_OK(rows)
+
+
+def createDB(cacheEnabled, groups):
+  """ AccountingDB with the Job type, on the stub DB """
+  with mock.patch.object(AccountingDBModule.DB, '__init__'), \
+          mock.patch.object(AccountingDBModule, 'ThreadPool'), \
+          mock.patch.object(AccountingDBModule.AccountingDB, '_createTables', return_value=S_OK()), \
+          mock.patch.object(AccountingDBModule.AccountingDB, '_AccountingDB__loadCatalogFromDB'), \
+          mock.patch.object(AccountingDBModule.AccountingDB, 'getCSOption',
+                            side_effect=lambda option, default: (100000 if cacheEnabled else 0)
+                            if option == 'BucketCacheMaxRows' else default):
+    accountingDB = AccountingDBModule.AccountingDB()
+  accountingDB.log = gLogger.getSubLogger('AccountingDB')
+  keyFields = ['User', 'UserGroup', 'Site', 'FinalMajorStatus']
+  accountingDB._AccountingDB__addToCatalog(TYPENAME, keyFields, ['CPUTime'],
+                                           [(86400 * 3, 900), (86400 * 8, 3600), (15552000, 86400)])
+  stub = StubDB(groups)
+  accountingDB._query = stub.query
+  accountingDB._escapeString = lambda value: S_OK("'%s'" % value)
+  return accountingDB, stub
+
+
+def runMode(cacheEnabled, hours, refreshMinutes, groups):
+  """ Refresh the plots of the last day during some hours """
+  clock = Clock(1500000000)
+  accountingDB, stub = createDB(cacheEnabled, groups)
+  elapsed = 0.
+  results = []
+  with mock.patch.object(AccountingDBModule, 'Time', clock), \
+          mock.patch.object(BucketedDataCacheModule, 'time', clock), \
+          mock.patch.object(AccountingDBModule, 'gMonitor'):
+    for refresh in xrange(hours * 60 / refreshMinutes):
+      clock.now += refreshMinutes * 60
+      for grouping in GROUPINGS:
+        start = time.time()
+        result = accountingDB.retrieveBucketedData(TYPENAME, clock.now - 86400, clock.now,
+                                                   ('%s, %s, %s, SUM(%s)',
+                                                    [grouping, 'startTime', 'bucketLength', 'CPUTime']),
+                                                   {}, ('%s, %s', ['startTime', grouping]), ('%s', ['startTime']))
+        elapsed += time.time() - start
+        assert result['OK'], result
+        results.append(result['Value'])
+  return elapsed, stub.queries, stub.rows, accountingDB.getBucketCacheStats()['Value'], results
+
+
+def runBenchmark(hours=4, refreshMinutes=5, groups=100):
+  gLogger.setLevel('FATAL')
+  print("Plots of the last day grouped by %d fields, refreshed every %d minutes during %d hours, %d values per field" %
+        (len(GROUPINGS), refreshMinutes, hours, groups))
+  allResults = []
+  for name, cacheEnabled in [('no cache', False), ('cache', True)]:
+    elapsed, queries, rows, stats, results = runMode(cacheEnabled, hours, refreshMinutes, groups)
+    allResults.append(results)
+    dbTime = queries * ROUNDTRIP + rows * ROWTIME
+    print("  %-10s %6.2fs in AccountingDB  %5d queries  %9d bucket rows  estimated %7.1fs in the DB  "
+          "hit rate %3.0f%%  %6d rows kept" % (name + ':', elapsed, queries, rows, dbTime,
+                                               stats['HitRate'] * 100, stats['Rows']))
+  # Both modes give the same data
+  assert allResults[0] == allResults[1]
+
+
+if __name__ == '__main__':
+  runBenchmark(*[int(arg) for arg in sys.argv[1:4]])
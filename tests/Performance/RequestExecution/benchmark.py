@@ -0,0 +1,134 @@
+"""
+Benchmark of the execution of the requests by a worker process of the RequestExecutingAgent.
+
+The requests, with one operation each, belong to a few owners and are executed one after the
+other by RequestTask objects, as done by a worker of the ProcessPool, without and with the
+caches of the warm workers. The ProxyManager is replaced by a stub which, as the real client,
+downloads a proxy once, with the latency of the server, and then only writes it to a new file.
+The operation handler is replaced by a class whose construction costs the time of the creation
+of its DataManager and FileCatalog, and whose execution costs a fixed time.
+
+Usage::
+
+  python benchmark.py [nbRequests] [nbOwners]
+"""
+
+from __future__ import print_function
+import sys
+import time
+
+import mock
+
+from DIRAC import S_OK, gLogger
+from DIRAC.RequestManagementSystem.Client.Request import Request
+from DIRAC.RequestManagementSystem.Client.Operation import Operation
+from DIRAC.RequestManagementSystem.Client.File import File
+from DIRAC.RequestManagementSystem.private import RequestTask as RequestTaskModule
+from DIRAC.RequestManagementSystem.private.RequestTask import RequestTask
+from DIRAC.RequestManagementSystem.private.OperationHandlerBase import OperationHandlerBase
+
+# Time in seconds of the download of a proxy, of its writing to file, of the creation of a handler,
+# and of its execution
+DOWNLOADTIME = 0.05
+DUMPTIME = 0.005
+HANDLERTIME = 0.03
+EXECUTIONTIME = 0.01
+SHIFTERS = ['DataManager', 'ProductionManager']
+
+
+class Chain(object):
+  """ Proxy valid for a day """
+
+  @staticmethod
+  def getRemainingSecs():
+    return S_OK(86400)
+
+
+class StubProxyManager(object):
+  """ ProxyManager keeping the downloaded proxies in memory """
+
+  def __init__(self):
+    self.downloaded = set()
+    self.files = 0
+
+  def downloadVOMSProxyToFile(self, userDN, userGroup, **_kwargs):
+    if (userDN, userGroup) not in self.downloaded:
+      time.sleep(DOWNLOADTIME)
+      self.downloaded.add((userDN, userGroup))
+    time.sleep(DUMPTIME)
+    self.files += 1
+    return {'OK': True, 'Value': '/tmp/x509up_%s' % userDN.replace('/', '_'), 'chain': Chain()}
+
+  downloadProxyToFile = downloadVOMSProxyToFile
+
+
+class StubHandler(OperationHandlerBase):
+  """ Operation handler with a costly construction """
+
+  instances = 0
+
+  def __init__(self, csPath=None):  # pylint: disable=super-init-not-called
+    time.sleep(HANDLERTIME)
+    StubHandler.instances += 1
+    self.operation = None
+    self.request = None
+
+  def __call__(self):
+    time.sleep(EXECUTIONTIME)
+    for opFile in self.operation:
+      opFile.Status = 'Done'
+    return S_OK()
+
+
+def makeRequests(nbRequests, nbOwners):
+  requests = []
+  for i in xrange(nbRequests):
+    request = Request()
+    request.RequestName = 'request-%d' % i
+    request.OwnerDN = '/DN/owner%d' % (i % nbOwners)
+    request.OwnerGroup = 'user'
+    operation = Operation({'Type': 'RemoveFile'})
+    operation.addFile(File({'LFN': '/vo/file%d' % i}))
+    request.addOperation(operation)
+    requests.append(request.toJSON()['Value'])
+  return requests
+
+
+def runMode(warmWorker, requests):
+  """ Execute the requests one after the other, as done by a worker """
+  proxyManager = StubProxyManager()
+  StubHandler.instances = 0
+  operations = mock.MagicMock()
+  operations.getSections.return_value = S_OK(SHIFTERS)
+  operations.getOptionsDict.side_effect = lambda path: S_OK({'User': path.split('/')[-1], 'Group': 'prod'})
+  registry = mock.MagicMock()
+  registry.getDNForUsername.side_effect = lambda userName: S_OK(['/DN/%s' % userName])
+  registry.getVOMSAttributeForGroup.return_value = '/vo/Role=production'
+  with mock.patch.object(RequestTaskModule, 'Operations', return_value=operations), \
+      mock.patch.object(RequestTaskModule, 'Registry', registry), \
+      mock.patch.object(RequestTaskModule, 'gProxyManager', proxyManager), \
+      mock.patch.object(RequestTaskModule, 'gMonitor', mock.MagicMock()), \
+      mock.patch.object(RequestTaskModule.os.path, 'exists', return_value=True), \
+      mock.patch.object(RequestTask, 'loadHandler', return_value=StubHandler), \
+      mock.patch.dict(RequestTaskModule.os.environ):
+    start = time.time()
+    for requestJSON in requests:
+      task = RequestTask(requestJSON, {'RemoveFile': 'RemoveFile'}, 'csPath', 'RequestManagement/RequestExecutingAgent',
+                         requestClient=mock.MagicMock(), warmWorker=warmWorker)
+      result = task()
+      assert result['OK'] and task.request.Status == 'Done', result
+    return time.time() - start, proxyManager.files, StubHandler.instances
+
+
+def runBenchmark(nbRequests=200, nbOwners=5):
+  gLogger.setLevel('FATAL')
+  requests = makeRequests(nbRequests, nbOwners)
+  print("%d requests of %d owners, executed by one worker" % (nbRequests, nbOwners))
+  for name, warmWorker in [('cold', False), ('warm', True)]:
+    elapsed, files, handlers = runMode(warmWorker, requests)
+    print("  %-6s %.1fs  %.1f requests/s  %d proxy files written  %d handlers created" %
+          (name + ':', elapsed, nbRequests / elapsed, files, handlers))
+
+
+if __name__ == '__main__':
+  runBenchmark(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,146 @@
+"""
+Benchmark of the StorageElement objects used by many threads, as in the agents and services
+doing data management operations.
+
+The storage plugin is a stub whose construction costs some time and memory, standing for the
+creation of a gfal2 context, and whose operations wait some milliseconds, standing for the
+round trip to the storage. Each thread does a number of operations with a StorageElement
+built for the thread, as done when the StorageElement cache was keyed by thread, and with
+the StorageElement shared by all the threads, which checks out the plugins from a pool.
+
+Usage::
+
+  python benchmark.py [nbThreads] [nbOperationsPerThread] [maxPluginContexts]
+"""
+
+from __future__ import print_function
+import os
+import sys
+import time
+import tempfile
+import threading
+
+import mock
+
+from DIRAC import S_OK
+from DIRAC.ConfigurationSystem.Client.ConfigurationData import gConfigurationData
+from DIRAC.ConfigurationSystem.private.ConfigurationClient import ConfigurationClient
+from DIRAC.Core.Utilities.CFG import CFG
+from DIRAC.Resources.Storage.StorageBase import StorageBase
+from DIRAC.Resources.Storage.StorageElement import StorageElementItem, StorageElementCache
+
+# Time in seconds and memory in bytes taken by the creation of a plugin
+CONTEXTTIME = 0.02
+CONTEXTSIZE = 4 * 1024 * 1024
+# Time in seconds of an operation
+OPERATIONTIME = 0.005
+
+CONFIGURATION = """
+Resources
+{
+  StorageElements
+  {
+    MaxPluginContexts = %d
+    StubSE
+    {
+      BackendType = Stub
+      ReadAccess = Active
+      WriteAccess = Active
+      AccessProtocol.0
+      {
+        Host = stub.example.org
+        PluginName = Stub
+        Protocol = stub
+        Path = /data
+        Access = remote
+      }
+    }
+  }
+}
+Operations
+{
+  Defaults
+  {
+    DataManagement
+    {
+      AccessProtocols = stub
+      WriteProtocols = stub
+    }
+  }
+}
+"""
+
+
+class StubStorage(StorageBase):
+  """ Storage plugin with a costly construction """
+
+  instances = 0
+  lock = threading.Lock()
+
+  def __init__(self, storageName, parameters):
+    StorageBase.__init__(self, storageName, parameters)
+    self.pluginName = 'Stub'
+    time.sleep(CONTEXTTIME)
+    self.context = bytearray(CONTEXTSIZE)
+    with StubStorage.lock:
+      StubStorage.instances += 1
+
+  def exists(self, urls):
+    time.sleep(OPERATIONTIME)
+    return S_OK({'Successful': dict.fromkeys(urls, True), 'Failed': {}})
+
+
+def generateStorageObject(storageName, _pluginName, parameters, hideExceptions=False):
+  return S_OK(StubStorage(storageName, parameters))
+
+
+def loadConfiguration(maxPluginContexts):
+  cfgFile = os.path.join(tempfile.mkdtemp(), 'benchmark.cfg')
+  with open(cfgFile, 'w') as fd:
+    fd.write(CONFIGURATION % maxPluginContexts)
+  gConfigurationData.localCFG = CFG()
+  gConfigurationData.remoteCFG = CFG()
+  gConfigurationData.mergedCFG = CFG()
+  gConfigurationData.generateNewVersion()
+  ConfigurationClient(fileToLoadList=[cfgFile])
+
+
+def operations(getStorageElement, nbOperations):
+  """ Do nbOperations operations with the StorageElement given by getStorageElement """
+  se = getStorageElement()
+  for i in xrange(nbOperations):
+    result = se.exists('/vo/file%d' % i)
+    assert result['OK'] and result['Value']['Successful'], result
+
+
+def timeThreads(getStorageElement, nbThreads, nbOperations):
+  """ Time nbThreads threads each doing nbOperations operations """
+  StubStorage.instances = 0
+  threads = [threading.Thread(target=operations, args=(getStorageElement, nbOperations))
+             for _ in xrange(nbThreads)]
+  start = time.time()
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  return time.time() - start, StubStorage.instances
+
+
+def runBenchmark(nbThreads=40, nbOperations=20, maxPluginContexts=10):
+  loadConfiguration(maxPluginContexts)
+  cache = StorageElementCache()
+  print("%d threads x %d operations, at most %d plugin contexts" % (nbThreads, nbOperations, maxPluginContexts))
+  with mock.patch('DIRAC.Resources.Storage.StorageFactory.StorageFactory._StorageFactory__generateStorageObject',
+                  side_effect=generateStorageObject), \
+      mock.patch('DIRAC.Resources.Storage.StorageElement.StorageElementItem._StorageElementItem__isLocalSE',
+                 return_value=S_OK(False)):
+    for name, getStorageElement in [('per thread', lambda: StorageElementItem('StubSE', vo='vo')),
+                                    ('shared', lambda: cache('StubSE', vo='vo'))]:
+      elapsed, instances = timeThreads(getStorageElement, nbThreads, nbOperations)
+      print("  %-11s %.2fs  %.0f operations/s  %d plugin instances  %d MB of contexts" %
+            (name + ':', elapsed, nbThreads * nbOperations / elapsed, instances,
+             instances * CONTEXTSIZE / (1024 * 1024)))
+
+
+if __name__ == '__main__':
+  runBenchmark(*[int(arg) for arg in sys.argv[1:4]])